@@ -5,11 +5,17 @@ This module loads trained models and scores at-risk/lapsed customers to generate
 personalized product recommendations for re-engagement campaigns.
 """
 
+import argparse
+import itertools
 import logging
+import os
 import sys
+import time
 from pathlib import Path
-from typing import Tuple
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
 import warnings
+from datetime import date, datetime, timezone
 
 import pandas as pd
 import numpy as np
@@ -18,8 +24,31 @@ import numpy as np
 sys.path.append(str(Path(__file__).parent.parent))
 
 from config import get_config, Config
+from compiled import CompiledForest
+from concurrent_scoring import ConcurrentModelScorer
+from data_sources import DataSource, create_data_source
+from distillation import DistilledModel
+from feature_store import FeatureStore
+from lookalike import LookalikeIndex
+from profiling import PipelineProfiler, dataframe_bytes
+from scheduler import MemoryScheduler
+from schemas import (
+    CLUSTERING,
+    LOOKALIKES,
+    PREDICTIONS,
+    PRODUCT_TYPES,
+    TOP_N,
+    features_schema,
+    scoring_data_schema
+)
+from sharding import (
+    ShardSpec,
+    merge_shards,
+    shard_mask,
+    shard_sql_predicate,
+    write_shard_outputs
+)
 from utils import (
-    BigQueryClient,
     DataProcessor,
     ModelPersistence,
     setup_logging,
@@ -37,20 +66,33 @@ class ProductRecommendationScorer:
     for at-risk and lapsed customers.
     """
 
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        data_source: Optional[DataSource] = None,
+        shard: Optional[ShardSpec] = None
+    ):
         """
         Initialize the scorer.
 
         Args:
             config: Application configuration object
+            data_source: Data source to use instead of the one selected by
+                config.data_source
+            shard: Score only the customers hashing to this shard and write
+                shard outputs instead of uploading
         """
         self.config = config
-        self.bq_client = BigQueryClient(
-            config.bigquery.credentials_path,
-            config.bigquery.project_id
-        )
+        self.data_source = data_source or create_data_source(config)
         self.data_processor = DataProcessor()
         self.model_persistence = ModelPersistence()
+        self.shard = shard
+        self.features_imputed = False
+        self.predictions_file = config.scoring.get_predictions_path(shard.name if shard else None)
+
+        pipeline = f"scoring.{shard.name}" if shard else 'scoring'
+        self.profiler = PipelineProfiler.from_config(pipeline, config.profiling)
+        self.scheduler = MemoryScheduler.from_config(config.processing)
 
         logger.info("ProductRecommendationScorer initialized")
 
@@ -58,6 +100,10 @@ class ProductRecommendationScorer:
         """
         Load scoring data from BigQuery.
 
+        The scoring and product type queries run concurrently. With the
+        feature store enabled only customer IDs are queried (unless the store
+        is being refreshed) and features are read from the snapshot.
+
         Returns:
             Tuple of (scoring_data, product_types) DataFrames
 
@@ -67,20 +113,41 @@ class ProductRecommendationScorer:
         logger.info("Loading scoring data from BigQuery...")
 
         try:
-            # Load scoring data
-            scoring_query = f"""
-                SELECT * FROM `{self.config.bigquery.dataset}.{self.config.scoring.scoring_data_table}`
-            """
-            scoring_data = self.bq_client.execute_query(scoring_query)
+            store = None
+            refresh = False
+            if self.config.feature_store.enabled:
+                store = FeatureStore(
+                    self.config.feature_store.root_dir,
+                    self.config.features.features,
+                    block_rows=self.config.feature_store.block_rows
+                )
+                refresh = self.config.feature_store.refresh or self.feature_snapshot(store) is None
+                if refresh and self.shard is not None:
+                    # Concurrent shards would race on the same snapshot
+                    raise ValueError(
+                        "Feature store refresh is not supported in sharded scoring; "
+                        "refresh it in an unsharded run first"
+                    )
+
+            columns = 'customer_id' if store is not None and not refresh else '*'
+            with self.profiler.stage('query_concurrent') as stage:
+                results = self.data_source.execute_queries(self.scoring_queries(columns))
+                stage.rows = sum(len(df) for df in results.values())
+                stage.bytes_transferred = sum(dataframe_bytes(df) for df in results.values())
+                stage.attributes['queries'] = {name: len(df) for name, df in results.items()}
+
+                scoring_data = self.restrict_to_shard(results['scoring_data'])
+                if store is None or refresh:
+                    scoring_data = scoring_data_schema(self.config.features.features).enforce(
+                        scoring_data, stage
+                    )
+
+            if store is not None:
+                scoring_data = self.load_store_features(store, scoring_data, refresh)
             logger.info(f"Loaded {len(scoring_data)} customers to score")
 
-            # Load product types
-            prod_types_query = f"""
-                SELECT * FROM `{self.config.bigquery.dataset}.{self.config.scoring.prod_types_table}`
-            """
-            prod_types = self.bq_client.execute_query(prod_types_query)
             # Skip first row as per original logic
-            prod_types = prod_types[1:]
+            prod_types = PRODUCT_TYPES.enforce(results['product_types'][1:])
             logger.info(f"Loaded {len(prod_types)} product types")
 
             return scoring_data, prod_types
@@ -89,6 +156,83 @@ class ProductRecommendationScorer:
             logger.error(f"Failed to load scoring data: {str(e)}")
             raise
 
+    def scoring_queries(self, columns: str = '*') -> Dict[str, str]:
+        """
+        Build the scoring pipeline's input queries.
+
+        Args:
+            columns: SELECT list of the scoring table query
+
+        Returns:
+            Query name to SQL, for execute_queries
+        """
+        scoring_query = f"""
+            SELECT {columns} FROM `{self.config.bigquery.dataset}.{self.config.scoring.scoring_data_table}`
+        """
+        if self.shard is not None and self.config.data_source.backend == 'bigquery':
+            # Let BigQuery drop other shards' customers before the transfer
+            scoring_query += f"WHERE {shard_sql_predicate('customer_id', self.shard)}\n"
+
+        prod_types_query = f"""
+            SELECT * FROM `{self.config.bigquery.dataset}.{self.config.scoring.prod_types_table}`
+        """
+        return {'scoring_data': scoring_query, 'product_types': prod_types_query}
+
+    def restrict_to_shard(self, scoring_data: pd.DataFrame) -> pd.DataFrame:
+        """Drop customers outside this scorer's shard (no-op when unsharded)."""
+        if self.shard is None:
+            return scoring_data
+        return scoring_data[shard_mask(scoring_data['customer_id'], self.shard)]
+
+    def feature_snapshot(self, store: FeatureStore) -> Optional[str]:
+        """Name of the snapshot to read (None if the store is empty)."""
+        return self.config.feature_store.snapshot or store.latest()
+
+    def load_store_features(
+        self,
+        store: FeatureStore,
+        queried: pd.DataFrame,
+        refresh: bool
+    ) -> pd.DataFrame:
+        """
+        Load imputed scoring features from the feature store.
+
+        Normally only customer IDs were queried and their features are read
+        from the memory-mapped snapshot. When refreshing, the full scoring rows
+        were queried; they are imputed and upserted first, so only new or
+        changed customers are rewritten.
+
+        Args:
+            store: Feature store
+            queried: Customer IDs, or full scoring rows when refreshing
+            refresh: Whether to upsert ``queried`` before reading
+
+        Returns:
+            DataFrame with customer_id and the imputed float32 features
+        """
+        snapshot = self.feature_snapshot(store)
+
+        if refresh:
+            X = self.prepare_features(queried)
+            snapshot = snapshot if self.config.feature_store.snapshot else date.today().isoformat()
+            with self.profiler.stage('feature_store_upsert', rows=len(X)):
+                store.upsert(snapshot, queried['customer_id'].values, X)
+
+        customer_ids = queried['customer_id']
+        with self.profiler.stage('feature_store_read', rows=len(customer_ids)):
+            scoring_data = store.open(snapshot).frame(customer_ids.values)
+
+        missing = len(customer_ids) - len(scoring_data)
+        if missing:
+            logger.warning(
+                f"{missing} customers are not in feature snapshot {snapshot} and will not "
+                f"be scored (set FEATURE_STORE_REFRESH=True to add them)"
+            )
+
+        self.features_imputed = True
+        logger.info(f"Features for {len(scoring_data)} customers read from snapshot {snapshot}")
+        return scoring_data
+
     def prepare_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Prepare features for model scoring.
@@ -101,12 +245,34 @@ class ProductRecommendationScorer:
         """
         logger.info("Preparing features for scoring...")
 
-        # Select and impute features
-        X = self.data_processor.apply_feature_imputation(
-            df,
-            self.config.features.features,
-            self.config.features.imputation_rules
-        )
+        if self.features_imputed:
+            # Feature store rows are stored imputed
+            return df[self.config.features.features]
+
+        # Select and impute features, in chunks that fit the memory budget.
+        # Chunks are written into one preallocated float32 matrix, so the
+        # result is never held twice as chunks and their concatenation
+        features = self.config.features.features
+        schema = features_schema(features)
+        output_bytes = len(df) * len(features) * np.dtype(np.float32).itemsize
+        with self.profiler.stage('impute', rows=len(df)) as stage:
+            X, values, chunks = None, None, 0
+            for rows in self.scheduler.chunks('impute', len(df), reserve_bytes=output_bytes):
+                chunk = self.data_processor.apply_feature_imputation(
+                    df.iloc[rows], features, self.config.features.imputation_rules
+                )
+                chunk = schema.enforce(chunk, stage if rows.start == 0 else None)
+                chunks += 1
+                if rows.start == 0 and rows.stop == len(df):
+                    X = chunk
+                    continue
+                if values is None:
+                    columns = chunk.columns
+                    values = np.empty((len(df), len(columns)), dtype=np.float32)
+                values[rows] = chunk[columns].to_numpy(dtype=np.float32)
+            if values is not None:
+                X = pd.DataFrame(values, index=df.index, columns=columns, copy=False)
+            stage.attributes['chunks'] = chunks
 
         if self.config.debug:
             logger.debug(f"Features shape: {X.shape}")
@@ -136,6 +302,15 @@ class ProductRecommendationScorer:
         logger.info("GENERATING PRODUCT RECOMMENDATIONS")
         logger.info("=" * 60)
 
+        if self.config.scoring.predictor == 'compiled':
+            return self.generate_compiled_predictions(scoring_data, product_types)
+
+        if self.config.scoring.predictor == 'distilled':
+            return self.generate_distilled_predictions(scoring_data, product_types)
+
+        if self.config.processing.concurrent_scoring:
+            return self.generate_concurrent_predictions(scoring_data, product_types)
+
         scoring_data = scoring_data.reset_index(drop=True)
         customers = scoring_data["customer_id"]
 
@@ -151,12 +326,16 @@ class ProductRecommendationScorer:
             try:
                 # Load model
                 model_path = self.config.scoring.get_model_path(prod_id)
-                model = self.model_persistence.load_model(model_path)
-
-                # Predict probabilities
-                prob = model.predict_proba(X)
+                with self.profiler.stage('load_model', product_id=prod_id):
+                    model = self.model_persistence.load_model(model_path)
+
+                # Predict probabilities, in chunks that fit the memory budget
+                with self.profiler.stage('predict_product', rows=len(X), product_id=prod_id):
+                    prob = np.empty(len(X), dtype=np.float32)
+                    for rows in self.scheduler.chunks('score', len(X), max_workers=1):
+                        prob[rows] = model.predict_proba(X.iloc[rows])[:, 1]
                 prob_df = pd.DataFrame(
-                    data=prob[:, 1],
+                    data=prob,
                     columns=['p'],
                     index=X.index.copy()
                 )
@@ -174,11 +353,12 @@ class ProductRecommendationScorer:
                 all_predictions = pd.concat([all_predictions, predictions])
 
                 # Save intermediate results
-                predictions_dir = Path(self.config.scoring.predictions_file).parent
+                predictions_dir = Path(self.predictions_file).parent
                 predictions_dir.mkdir(parents=True, exist_ok=True)
                 self.model_persistence.save_dataframe(
                     all_predictions,
-                    self.config.scoring.predictions_file
+                    self.predictions_file,
+                    codec=self.config.quantization.codec_for('checkpoints')
                 )
 
                 logger.info(f"✓ Generated predictions for product {prod_id}")
@@ -200,6 +380,270 @@ class ProductRecommendationScorer:
         logger.info(f"Total predictions: {len(all_predictions)}")
         return all_predictions
 
+    def generate_concurrent_predictions(
+        self,
+        scoring_data: pd.DataFrame,
+        product_types: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Generate predictions for all product types on a thread pool.
+
+        Args:
+            scoring_data: Customer data to score
+            product_types: DataFrame with product type IDs
+
+        Returns:
+            DataFrame with predictions for all customers and product types
+
+        Raises:
+            ValueError: If no models could be loaded
+        """
+        scoring_data = scoring_data.reset_index(drop=True)
+        customers = scoring_data["customer_id"]
+
+        X = self.prepare_features(scoring_data)
+
+        model_paths = {
+            int(prod_id): self.config.scoring.get_model_path(int(prod_id))
+            for prod_id in product_types['pdm_prod_type_id']
+        }
+        # Workers and rows per predict_proba call that fit the memory budget,
+        # after the output matrix is allocated
+        plan = self.scheduler.plan(
+            'score',
+            len(X),
+            reserve_bytes=len(X) * len(model_paths) * np.dtype(np.float32).itemsize
+        )
+        scorer = ConcurrentModelScorer(
+            plan.workers,
+            model_nthread=self.config.processing.model_nthread,
+            prefetch=self.config.processing.prefetch_models,
+            model_persistence=self.model_persistence,
+            chunk_rows=plan.chunk_rows
+        )
+        with self.profiler.stage('predict_concurrent', rows=len(X)) as stage:
+            stage.attributes['memory_plan'] = asdict(plan)
+            prob, product_ids = scorer.score(X, model_paths, skip_missing=True)
+
+        if not product_ids:
+            raise ValueError("No predictions generated. Check if models exist.")
+
+        all_predictions = self.data_processor.predictions_to_long(customers, prob, product_ids)
+        self.model_persistence.save_dataframe(
+            all_predictions,
+            self.predictions_file,
+            codec=self.config.quantization.codec_for('checkpoints')
+        )
+
+        logger.info(f"Total predictions: {len(all_predictions)}")
+        return all_predictions
+
+    def load_compiled_forest(self, product_types: pd.DataFrame) -> CompiledForest:
+        """
+        Load the compiled forest, recompiling it if models changed.
+
+        The saved forest is reused only if it covers exactly the product types
+        that have model files and is newer than all of them.
+
+        Args:
+            product_types: DataFrame with product type IDs
+
+        Returns:
+            Compiled forest for all available product-type models
+
+        Raises:
+            ValueError: If no product-type models exist
+        """
+        model_paths = {}
+        for prod_id in product_types['pdm_prod_type_id']:
+            prod_id = int(prod_id)
+            model_path = self.config.scoring.get_model_path(prod_id)
+            if Path(model_path).exists():
+                model_paths[prod_id] = model_path
+            else:
+                logger.warning(
+                    f"Model not found for product {prod_id}. "
+                    f"Skipping... (path: {model_path})"
+                )
+
+        if not model_paths:
+            raise ValueError("No predictions generated. Check if models exist.")
+
+        compiled_path = self.config.scoring.get_compiled_model_path()
+        if Path(compiled_path).exists():
+            forest = CompiledForest.load(compiled_path)
+            newest_model = max(os.path.getmtime(p) for p in model_paths.values())
+            if (
+                set(forest.product_ids.tolist()) == set(model_paths)
+                and os.path.getmtime(compiled_path) >= newest_model
+            ):
+                return forest
+            logger.info("Compiled forest is stale, recompiling...")
+
+        models = {
+            prod_id: self.model_persistence.load_model(path)
+            for prod_id, path in model_paths.items()
+        }
+        forest = CompiledForest.from_models(models, self.config.features.features)
+        forest.save(compiled_path)
+        return forest
+
+    def generate_compiled_predictions(
+        self,
+        scoring_data: pd.DataFrame,
+        product_types: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Generate predictions for all product types with the compiled forest.
+
+        Args:
+            scoring_data: Customer data to score
+            product_types: DataFrame with product type IDs
+
+        Returns:
+            DataFrame with predictions for all customers and product types, in
+            the same long format as the per-product path
+        """
+        scoring_data = scoring_data.reset_index(drop=True)
+        customers = scoring_data["customer_id"]
+
+        X = self.prepare_features(scoring_data)
+        with self.profiler.stage('load_compiled_forest'):
+            forest = self.load_compiled_forest(product_types)
+
+        chunk_size = self.config.scoring.compiled_chunk_size
+        with self.profiler.stage('predict_compiled', rows=len(X)) as stage:
+            if chunk_size is None and self.scheduler.enabled:
+                self.scheduler.set_shape(X.shape[1], len(forest.product_ids), forest.n_trees)
+                plan = self.scheduler.plan(
+                    'score',
+                    len(X),
+                    max_workers=1,
+                    reserve_bytes=len(X) * len(forest.product_ids) * np.dtype(np.float32).itemsize
+                )
+                chunk_size = plan.chunk_rows
+                stage.attributes['memory_plan'] = asdict(plan)
+            prob = forest.predict(X, chunk_size=chunk_size)
+        all_predictions = self.data_processor.predictions_to_long(
+            customers, prob, forest.product_ids
+        )
+
+        self.model_persistence.save_dataframe(
+            all_predictions,
+            self.predictions_file,
+            codec=self.config.quantization.codec_for('checkpoints')
+        )
+
+        logger.info(f"Total predictions: {len(all_predictions)}")
+        return all_predictions
+
+    def load_distilled_model(self, product_types: pd.DataFrame) -> DistilledModel:
+        """
+        Load the distilled model and check it against the product-type models.
+
+        The student cannot be refit at scoring time, so staleness (a model
+        file newer than the student) and product types it does not cover are
+        only logged.
+
+        Args:
+            product_types: DataFrame with product type IDs
+
+        Returns:
+            Distilled model
+
+        Raises:
+            FileNotFoundError: If no distilled model was trained
+        """
+        model_dir = self.config.scoring.model_dir
+        model_path = self.config.distillation.get_model_path(model_dir)
+        if not Path(model_path).exists():
+            raise FileNotFoundError(
+                f"Distilled model not found: {model_path}. "
+                f"Train with DISTILL_MODELS=True to create it."
+            )
+        student = DistilledModel.load(model_path)
+
+        requested = [int(p) for p in product_types['pdm_prod_type_id']]
+        missing = sorted(set(requested) - set(student.product_ids.tolist()))
+        if missing:
+            logger.warning(
+                f"Distilled model does not cover {len(missing)} product types, "
+                f"skipping them: {missing}"
+            )
+
+        newer = [
+            prod_id for prod_id in requested
+            if Path(self.config.scoring.get_model_path(prod_id)).exists()
+            and os.path.getmtime(self.config.scoring.get_model_path(prod_id))
+            > os.path.getmtime(model_path)
+        ]
+        if newer:
+            logger.warning(
+                f"Distilled model is older than the models of {len(newer)} product "
+                f"types; retrain with DISTILL_MODELS=True to refresh it"
+            )
+        return student
+
+    def generate_distilled_predictions(
+        self,
+        scoring_data: pd.DataFrame,
+        product_types: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Generate predictions for all product types with the distilled model.
+
+        Args:
+            scoring_data: Customer data to score
+            product_types: DataFrame with product type IDs
+
+        Returns:
+            DataFrame with predictions for all customers and product types, in
+            the same long format as the per-product path
+
+        Raises:
+            ValueError: If the distilled model covers none of the product types
+        """
+        scoring_data = scoring_data.reset_index(drop=True)
+        customers = scoring_data["customer_id"]
+
+        X = self.prepare_features(scoring_data)
+        with self.profiler.stage('load_distilled_model'):
+            student = self.load_distilled_model(product_types)
+
+        requested = {int(p) for p in product_types['pdm_prod_type_id']}
+        columns = [i for i, p in enumerate(student.product_ids) if int(p) in requested]
+        if not columns:
+            raise ValueError("No predictions generated. Distilled model covers no product type.")
+        product_ids = student.product_ids[columns]
+
+        chunk_size = self.config.scoring.compiled_chunk_size
+        with self.profiler.stage('predict_distilled', rows=len(X)) as stage:
+            if chunk_size is None and self.scheduler.enabled:
+                self.scheduler.set_shape(
+                    X.shape[1], len(student.product_ids), hidden_units=student.hidden_units
+                )
+                plan = self.scheduler.plan(
+                    'score',
+                    len(X),
+                    max_workers=1,
+                    reserve_bytes=len(X) * len(student.product_ids) * np.dtype(np.float32).itemsize
+                )
+                chunk_size = plan.chunk_rows
+                stage.attributes['memory_plan'] = asdict(plan)
+            prob = student.predict(X, chunk_size=chunk_size)
+            if len(columns) < len(student.product_ids):
+                prob = prob[:, columns]
+        all_predictions = self.data_processor.predictions_to_long(customers, prob, product_ids)
+
+        self.model_persistence.save_dataframe(
+            all_predictions,
+            self.predictions_file,
+            codec=self.config.quantization.codec_for('checkpoints')
+        )
+
+        logger.info(f"Total predictions: {len(all_predictions)}")
+        return all_predictions
+
     def create_clustering_data(
         self,
         predictions: pd.DataFrame
@@ -215,11 +659,229 @@ class ProductRecommendationScorer:
         """
         logger.info("Creating clustering data format...")
 
-        clustering_data = self.data_processor.pivot_predictions(predictions)
+        if not self.scheduler.enabled:
+            clustering_data = self.data_processor.pivot_predictions(predictions)
+        else:
+            # The wide matrix is allocated up front; the long rows are
+            # scattered into it chunk by chunk
+            customers = np.sort(predictions['customer_id'].unique())
+            products = np.sort(np.asarray(predictions['pdm_prod_type_id'].unique()))
+            cells = len(customers) * len(products)
+            chunks = (
+                predictions.iloc[rows]
+                for rows in self.scheduler.chunks(
+                    'pivot', len(predictions), reserve_bytes=cells * np.dtype(np.float32).itemsize
+                )
+            )
+            clustering_data = self.data_processor.pivot_predictions(
+                chunks, keys=(customers, products)
+            )
 
         logger.info(f"Clustering data shape: {clustering_data.shape}")
         return clustering_data
 
+    def create_top_n_recommendations(
+        self,
+        clustering_data: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Build the narrow top-N product table from the wide probabilities.
+
+        Args:
+            clustering_data: Wide-format DataFrame with p<id> columns
+
+        Returns:
+            DataFrame with customer_id, rank, pdm_prod_type_id and score
+        """
+        prob_columns = [c for c in clustering_data.columns if c != 'customer_id']
+        product_ids = np.array([int(c[1:]) for c in prob_columns], dtype=np.int64)
+
+        return self.data_processor.top_n_recommendations(
+            clustering_data[prob_columns].to_numpy(dtype=np.float32),
+            clustering_data['customer_id'].values,
+            product_ids,
+            self.config.scoring.top_n,
+            block_size=self.config.scoring.top_n_block_size
+        )
+
+    def create_lookalikes(self, clustering_data: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        Build the lookalike index over the p<id> vectors and query the seeds.
+
+        The index is saved to ``lookalike.index_file`` for later seed lists.
+        With ``n_lists`` set the seeds are searched approximately, and a
+        sample of them exactly as well, to report the recall.
+
+        Args:
+            clustering_data: Wide-format DataFrame with p<id> columns
+
+        Returns:
+            Narrow lookalike DataFrame, or None when no seed table is set
+        """
+        settings = self.config.lookalike
+        prob_columns = [c for c in clustering_data.columns if c != 'customer_id']
+
+        with self.profiler.stage('lookalike_index', rows=len(clustering_data)) as stage:
+            index = LookalikeIndex.build(
+                clustering_data['customer_id'].values,
+                clustering_data[prob_columns].to_numpy(dtype=np.float32),
+                [int(c[1:]) for c in prob_columns],
+                metric=settings.metric,
+                n_lists=settings.n_lists,
+                kmeans_iterations=settings.kmeans_iterations,
+                kmeans_sample=settings.kmeans_sample,
+                block_size=settings.block_size
+            )
+            index.save(settings.index_file)
+            stage.attributes['lists'] = index.n_lists
+
+        if not settings.seed_table:
+            logger.info("No lookalike seed table set; index built only")
+            return None
+
+        with self.profiler.stage('lookalike_seeds') as stage:
+            seeds = self.data_source.execute_query(
+                f"SELECT customer_id FROM `{self.config.bigquery.dataset}.{settings.seed_table}`"
+            )['customer_id'].to_numpy(dtype=np.int64)
+            stage.rows = len(seeds)
+
+        exact = not index.partitioned
+        with self.profiler.stage('lookalike_query', rows=len(seeds)) as stage:
+            started = time.perf_counter()
+            lookalikes = index.query_customers(
+                seeds,
+                k=settings.k,
+                exact=exact,
+                n_probe=settings.n_probe,
+                block_size=settings.block_size,
+                query_block_size=settings.query_block_size
+            )
+            ms_per_seed = (time.perf_counter() - started) * 1000 / max(len(seeds), 1)
+            stage.attributes['search'] = 'exact' if exact else 'approximate'
+            stage.attributes['ms_per_seed'] = ms_per_seed
+        logger.info(
+            f"Found {len(lookalikes)} lookalikes for {len(seeds)} seeds "
+            f"({'exact' if exact else 'approximate'}, {ms_per_seed:.3f} ms per seed)"
+        )
+
+        if not exact and settings.recall_sample > 0:
+            seed_rows = index.rows_of(seeds)
+            seed_rows = seed_rows[seed_rows >= 0]
+            if len(seed_rows) > settings.recall_sample:
+                rng = np.random.default_rng(0)
+                seed_rows = rng.choice(seed_rows, settings.recall_sample, replace=False)
+            with self.profiler.stage('lookalike_recall', rows=len(seed_rows)) as stage:
+                metrics = index.evaluate(
+                    seed_rows,
+                    k=settings.k,
+                    n_probe=settings.n_probe,
+                    block_size=settings.block_size,
+                    query_block_size=settings.query_block_size
+                )
+                stage.attributes.update(metrics)
+            logger.info(
+                f"Lookalike recall@{settings.k} with {settings.n_probe}/{index.n_lists} lists: "
+                f"{metrics['recall']:.3f} ({metrics['approximate_ms_per_query']:.3f} vs "
+                f"{metrics['exact_ms_per_query']:.3f} ms per seed exact)"
+            )
+
+        return lookalikes
+
+    def upload_chunked(self, df: pd.DataFrame, table_name: str) -> int:
+        """
+        Upload a table in chunks that fit the memory budget.
+
+        With more than one chunk, the chunks are written to a staging table
+        (the first replaces it, later ones append) that replaces the
+        destination only once every chunk is in, so a failed chunk never
+        leaves the destination truncated. A single chunk is uploaded straight
+        to the destination.
+
+        Args:
+            df: Table to upload
+            table_name: Destination table
+
+        Returns:
+            Number of upload calls
+        """
+        dataset = self.config.bigquery.dataset
+        # Chunks are re-planned as they go, so only the first one is known here
+        chunks = self.scheduler.chunks('upload', len(df))
+        first = next(chunks)
+        if first.stop >= len(df):
+            self.data_source.upload_dataframe(df.iloc[first], dataset, table_name, if_exists='replace')
+            return 1
+
+        staging_table = f"{table_name}{self.config.scoring.staging_suffix}"
+        uploads = 0
+        for rows in itertools.chain([first], chunks):
+            try:
+                self.data_source.upload_dataframe(
+                    df.iloc[rows],
+                    dataset,
+                    staging_table,
+                    if_exists='replace' if uploads == 0 else 'append'
+                )
+            except Exception:
+                logger.error(
+                    f"Upload of rows {rows.start}-{rows.stop} to {dataset}.{staging_table} "
+                    f"failed; {dataset}.{table_name} was left unchanged"
+                )
+                raise
+            uploads += 1
+        self.data_source.replace_table(dataset, staging_table, table_name)
+        return uploads
+
+    def upload_top_n(self, top_n: pd.DataFrame) -> None:
+        """
+        Upload the top-N recommendations to BigQuery.
+
+        Args:
+            top_n: Narrow top-N DataFrame
+
+        Raises:
+            Exception: If upload fails
+        """
+        logger.info("Uploading top-N recommendations to BigQuery...")
+
+        try:
+            with self.profiler.stage('upload_top_n', rows=len(top_n)) as stage:
+                stage.bytes_transferred = dataframe_bytes(top_n)
+                stage.attributes['chunks'] = self.upload_chunked(
+                    top_n, self.config.scoring.top_n_output_table
+                )
+
+            logger.info("✓ Top-N recommendations uploaded successfully")
+
+        except Exception as e:
+            logger.error(f"Failed to upload top-N recommendations: {str(e)}")
+            raise
+
+    def upload_lookalikes(self, lookalikes: pd.DataFrame) -> None:
+        """
+        Upload the seed customers' lookalikes to BigQuery.
+
+        Args:
+            lookalikes: Narrow lookalike DataFrame
+
+        Raises:
+            Exception: If upload fails
+        """
+        logger.info("Uploading lookalike customers to BigQuery...")
+
+        try:
+            with self.profiler.stage('upload_lookalikes', rows=len(lookalikes)) as stage:
+                stage.bytes_transferred = dataframe_bytes(lookalikes)
+                stage.attributes['chunks'] = self.upload_chunked(
+                    lookalikes, self.config.lookalike.output_table
+                )
+
+            logger.info("✓ Lookalike customers uploaded successfully")
+
+        except Exception as e:
+            logger.error(f"Failed to upload lookalike customers: {str(e)}")
+            raise
+
     def upload_results(self, clustering_data: pd.DataFrame) -> None:
         """
         Upload scored clustering data to BigQuery.
@@ -233,12 +895,11 @@ class ProductRecommendationScorer:
         logger.info("Uploading scored data to BigQuery...")
 
         try:
-            self.bq_client.upload_dataframe(
-                clustering_data,
-                self.config.bigquery.dataset,
-                self.config.scoring.output_table,
-                if_exists='replace'
-            )
+            with self.profiler.stage('upload_clustering_data', rows=len(clustering_data)) as stage:
+                stage.bytes_transferred = dataframe_bytes(clustering_data)
+                stage.attributes['chunks'] = self.upload_chunked(
+                    clustering_data, self.config.scoring.output_table
+                )
 
             logger.info("✓ Scored data uploaded successfully")
 
@@ -246,6 +907,53 @@ class ProductRecommendationScorer:
             logger.error(f"Failed to upload scored data: {str(e)}")
             raise
 
+    def merge_shard_outputs(
+        self,
+        run_id: Optional[str] = None,
+        expected_count: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Merge the outputs of a sharded run and upload the final tables.
+
+        Args:
+            run_id: Sharded run to merge (default: scoring.shard_run_id)
+            expected_count: Number of shards the run must have
+
+        Returns:
+            Final clustering dataset
+        """
+        run_id = run_id or self.config.scoring.shard_run_id
+        run_dir = self.config.scoring.get_shard_run_dir(run_id)
+        logger.info(f"Merging shard outputs from {run_dir}...")
+
+        try:
+            with self.profiler.stage('merge_shards'):
+                clustering_data, top_n = merge_shards(run_dir, run_id, expected_count)
+            self.scheduler.set_shape(
+                len(self.config.features.features), len(clustering_data.columns) - 1
+            )
+
+            lookalikes = None
+            if self.config.lookalike.enabled:
+                with self.profiler.stage('lookalike', rows=len(clustering_data)) as stage:
+                    lookalikes = self.create_lookalikes(clustering_data)
+                    if lookalikes is not None:
+                        lookalikes = LOOKALIKES.enforce(lookalikes, stage)
+
+            with self.profiler.stage('upload'):
+                self.upload_results(clustering_data)
+                if top_n is not None:
+                    self.upload_top_n(top_n)
+                if lookalikes is not None:
+                    self.upload_lookalikes(lookalikes)
+
+            return clustering_data
+
+        finally:
+            if self.scheduler.enabled:
+                self.profiler.sections['memory_scheduler'] = self.scheduler.summary()
+            self.profiler.write_report(self.config.profiling.get_report_path('scoring.merge'))
+
     def run(self) -> pd.DataFrame:
         """
         Execute the complete scoring pipeline.
@@ -254,7 +962,10 @@ class ProductRecommendationScorer:
         1. Load scoring data
         2. Generate predictions using trained models
         3. Create clustering dataset
-        4. Upload results to BigQuery
+        4. Optionally build top-N recommendations
+        5. Optionally build the lookalike index and query the seed customers
+           (sharded runs build it when the shards are merged)
+        6. Upload results to BigQuery (or, for a shard, write shard outputs)
 
         Returns:
             Final clustering dataset
@@ -268,16 +979,54 @@ class ProductRecommendationScorer:
             logger.info("=" * 60 + "\n")
 
             # Load data
-            scoring_data, product_types = self.load_scoring_data()
+            with self.profiler.stage('load_data'):
+                scoring_data, product_types = self.load_scoring_data()
+            self.scheduler.set_shape(len(self.config.features.features), len(product_types))
 
             # Generate predictions
-            predictions = self.generate_predictions(scoring_data, product_types)
+            with self.profiler.stage('predict', rows=len(scoring_data)) as stage:
+                predictions = self.generate_predictions(scoring_data, product_types)
+                predictions = PREDICTIONS.enforce(predictions, stage)
 
             # Create clustering data
-            clustering_data = self.create_clustering_data(predictions)
-
-            # Upload results
-            self.upload_results(clustering_data)
+            with self.profiler.stage('pivot', rows=len(predictions)) as stage:
+                clustering_data = self.create_clustering_data(predictions)
+                clustering_data = CLUSTERING.enforce(clustering_data, stage)
+
+            # Top-N recommendations per customer
+            top_n = None
+            if self.config.scoring.top_n > 0:
+                with self.profiler.stage('top_n', rows=len(clustering_data)) as stage:
+                    top_n = self.create_top_n_recommendations(clustering_data)
+                    top_n = TOP_N.enforce(top_n, stage)
+
+            # Lookalike index over all customers' propensity vectors
+            lookalikes = None
+            if self.config.lookalike.enabled and self.shard is None:
+                with self.profiler.stage('lookalike', rows=len(clustering_data)) as stage:
+                    lookalikes = self.create_lookalikes(clustering_data)
+                    if lookalikes is not None:
+                        lookalikes = LOOKALIKES.enforce(lookalikes, stage)
+
+            if self.shard is not None:
+                # Shard outputs are uploaded by the merge step
+                with self.profiler.stage('write_shard'):
+                    write_shard_outputs(
+                        self.config.scoring.get_shard_run_dir(),
+                        self.config.scoring.shard_run_id,
+                        self.shard,
+                        clustering_data,
+                        top_n,
+                        codec=self.config.quantization.codec_for('outputs')
+                    )
+            else:
+                # Upload results
+                with self.profiler.stage('upload'):
+                    self.upload_results(clustering_data)
+                    if top_n is not None:
+                        self.upload_top_n(top_n)
+                    if lookalikes is not None:
+                        self.upload_lookalikes(lookalikes)
 
             logger.info("\n" + "=" * 60)
             logger.info("SCORING PIPELINE COMPLETED SUCCESSFULLY")
@@ -292,9 +1041,96 @@ class ProductRecommendationScorer:
             logger.error(f"Error: {str(e)}", exc_info=True)
             raise
 
+        finally:
+            if self.scheduler.enabled:
+                self.profiler.sections['memory_scheduler'] = self.scheduler.summary()
+            self.profiler.write_report(self.config.profiling.get_report_path(self.profiler.pipeline))
+
+
+def simulate_shards(
+    config: Config,
+    count: int,
+    run_id: str,
+    processes: Optional[int] = None
+) -> None:
+    """
+    Simulate a sharded run with one local process per shard.
+
+    Args:
+        config: Application configuration object
+        count: Number of shards
+        run_id: Sharded run ID shared by all shard processes
+        processes: Shard processes run at once (default: all)
+
+    Raises:
+        RuntimeError: If any shard process fails
+    """
+    import subprocess
+
+    # Outputs of an earlier run with the same ID would be merged otherwise
+    for stale in Path(config.scoring.get_shard_run_dir(run_id)).glob("shard-*"):
+        stale.unlink()
 
-def main():
+    pending = [
+        [sys.executable, __file__, '--shard', f"{i}/{count}", '--run-id', run_id]
+        for i in range(count)
+    ]
+    running, failed = [], []
+    limit = processes or count
+
+    while pending or running:
+        while pending and len(running) < limit:
+            command = pending.pop(0)
+            running.append((command[3], subprocess.Popen(command)))
+        shard, proc = running.pop(0)
+        if proc.wait() != 0:
+            failed.append(shard)
+
+    if failed:
+        raise RuntimeError(f"Shard processes failed: {', '.join(failed)}")
+
+
+def _shard_arg(value: str) -> ShardSpec:
+    """argparse type for ``--shard``."""
+    try:
+        return ShardSpec.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse score-recommender command-line arguments."""
+    parser = argparse.ArgumentParser(
+        prog='score-recommender',
+        description="Score at-risk/lapsed customers with the product-type models."
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--shard', type=_shard_arg, metavar='i/N',
+        help="Score only customers hashing to shard i of N and write shard outputs"
+    )
+    mode.add_argument(
+        '--merge', action='store_true',
+        help="Merge the shard outputs of --run-id and upload the final tables"
+    )
+    mode.add_argument(
+        '--simulate', type=int, metavar='N',
+        help="Run N local shard processes, then merge (for testing)"
+    )
+    parser.add_argument(
+        '--run-id',
+        help="Sharded run ID, required with --shard/--merge (default: scoring.shard_run_id; "
+             "with --simulate: a new timestamp)"
+    )
+    parser.add_argument('--shards', type=int, help="With --merge: number of shards expected")
+    parser.add_argument('--processes', type=int, help="With --simulate: concurrent shard processes")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
     """Main entry point for the scoring pipeline."""
+    args = parse_args(argv)
+
     # Setup logging
     setup_logging(
         log_level='INFO',
@@ -304,10 +1140,23 @@ def main():
     try:
         # Load configuration
         config = get_config()
+        run_id = args.run_id or config.scoring.shard_run_id
+        if args.simulate and not run_id:
+            run_id = datetime.now(timezone.utc).strftime('simulate-%Y%m%dT%H%M%S')
+        if (args.shard is not None or args.merge) and not run_id:
+            raise ValueError("--shard and --merge require --run-id (or SHARD_RUN_ID)")
+
+        if args.simulate:
+            simulate_shards(config, args.simulate, run_id, args.processes)
 
         # Create and run scorer
-        scorer = ProductRecommendationScorer(config)
-        results = scorer.run()
+        if args.merge or args.simulate:
+            scorer = ProductRecommendationScorer(config)
+            results = scorer.merge_shard_outputs(run_id, args.shards or args.simulate)
+        else:
+            config.scoring.shard_run_id = run_id
+            scorer = ProductRecommendationScorer(config, shard=args.shard)
+            results = scorer.run()
 
         logger.info(f"Scoring completed. Final dataset shape: {results.shape}")
 
@@ -5,24 +5,39 @@ This module trains separate XGBoost classifiers for each product type to predict
 customer purchase probability, applies isotonic calibration, and generates clustering data.
 """
 
+import json
 import logging
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import warnings
 
 import pandas as pd
 import numpy as np
-from sklearn.calibration import CalibratedClassifierCV
-from xgboost import XGBClassifier
-from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
 from config import get_config, Config
+from change_detection import ChangeDetector, compute_fingerprints
+from calibration import base_estimator, calibrate_out_of_fold
+from concurrent_scoring import ConcurrentModelScorer
+from data_sources import DataSource, create_data_source
+from distillation import DistilledModel, distill
+from manifest import COMPLETED, FAILED, ModelManifest, file_checksum, params_checksum
+from profiling import PipelineProfiler, dataframe_bytes
+from schemas import (
+    CLUSTERING,
+    PREDICTIONS,
+    PRODUCT_TYPES,
+    features_schema,
+    scoring_data_schema,
+    training_data_schema
+)
 from utils import (
-    BigQueryClient,
     DataProcessor,
     ModelPersistence,
     setup_logging,
@@ -40,20 +55,20 @@ class ProductRecommendationTrainer:
     to predict purchase probability for customer re-engagement.
     """
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, data_source: Optional[DataSource] = None):
         """
         Initialize the trainer.
 
         Args:
             config: Application configuration object
+            data_source: Data source to use instead of the one selected by
+                config.data_source
         """
         self.config = config
-        self.bq_client = BigQueryClient(
-            config.bigquery.credentials_path,
-            config.bigquery.project_id
-        )
+        self.data_source = data_source or create_data_source(config)
         self.data_processor = DataProcessor()
         self.model_persistence = ModelPersistence()
+        self.profiler = PipelineProfiler.from_config('training', config.profiling)
 
         logger.info("ProductRecommendationTrainer initialized")
 
@@ -70,32 +85,26 @@ class ProductRecommendationTrainer:
         logger.info("Loading training data from BigQuery...")
 
         try:
-            # Load training data
-            training_query = f"""
-                SELECT * FROM `{self.config.bigquery.dataset}.{self.config.training.training_data_table}`
-                LIMIT {self.config.training.training_limit}
-            """
-            training_data = self.bq_client.execute_query(training_query)
+            # The three queries run concurrently
+            with self.profiler.stage('query_concurrent') as stage:
+                results = self.data_source.execute_queries(self.training_queries())
+                stage.rows = sum(len(df) for df in results.values())
+                stage.bytes_transferred = sum(dataframe_bytes(df) for df in results.values())
+                stage.attributes['queries'] = {name: len(df) for name, df in results.items()}
+
+                training_data = training_data_schema(self.config.features.features).enforce(
+                    results['training_data'], stage
+                )
+                train_to_predict = scoring_data_schema(self.config.features.features).enforce(
+                    results['train_to_predict'], stage
+                )
+
             logger.info(f"Loaded {len(training_data)} training records")
 
-            # Load product types
-            prod_types_query = f"""
-                SELECT * FROM `{self.config.bigquery.dataset}.{self.config.training.prod_types_table}`
-                LIMIT {self.config.training.prod_types_limit}
-            """
-            prod_types = self.bq_client.execute_query(prod_types_query)
             # Skip first row as per original logic
-            prod_types = prod_types[1:]
+            prod_types = PRODUCT_TYPES.enforce(results['product_types'][1:])
             logger.info(f"Loaded {len(prod_types)} product types")
 
-            # Load prediction dataset for clustering
-            train_to_predict_query = f"""
-                SELECT customer_id, {', '.join(self.config.features.features)}
-                FROM `{self.config.bigquery.dataset}.{self.config.training.training_data_table}`
-                GROUP BY customer_id, {', '.join(self.config.features.features)}
-                LIMIT {self.config.training.train_to_predict_limit}
-            """
-            train_to_predict = self.bq_client.execute_query(train_to_predict_query)
             logger.info(f"Loaded {len(train_to_predict)} records for clustering")
 
             return training_data, prod_types, train_to_predict
@@ -104,6 +113,34 @@ class ProductRecommendationTrainer:
             logger.error(f"Failed to load training data: {str(e)}")
             raise
 
+    def training_queries(self) -> Dict[str, str]:
+        """
+        Build the training pipeline's input queries.
+
+        Returns:
+            Query name to SQL, for execute_queries
+        """
+        dataset = self.config.bigquery.dataset
+        features = ', '.join(self.config.features.features)
+
+        return {
+            'training_data': f"""
+                SELECT * FROM `{dataset}.{self.config.training.training_data_table}`
+                LIMIT {self.config.training.training_limit}
+            """,
+            'product_types': f"""
+                SELECT * FROM `{dataset}.{self.config.training.prod_types_table}`
+                LIMIT {self.config.training.prod_types_limit}
+            """,
+            # Prediction dataset for clustering
+            'train_to_predict': f"""
+                SELECT customer_id, {features}
+                FROM `{dataset}.{self.config.training.training_data_table}`
+                GROUP BY customer_id, {features}
+                LIMIT {self.config.training.train_to_predict_limit}
+            """,
+        }
+
     def prepare_features(
         self,
         df: pd.DataFrame,
@@ -122,11 +159,13 @@ class ProductRecommendationTrainer:
         logger.info("Preparing features...")
 
         # Select and impute features
-        X = self.data_processor.apply_feature_imputation(
-            df,
-            self.config.features.features,
-            self.config.features.imputation_rules
-        )
+        with self.profiler.stage('impute', rows=len(df)) as stage:
+            X = self.data_processor.apply_feature_imputation(
+                df,
+                self.config.features.features,
+                self.config.features.imputation_rules
+            )
+            X = features_schema(self.config.features.features).enforce(X, stage)
 
         if self.config.debug:
             logger.debug(f"Features shape: {X.shape}")
@@ -138,7 +177,9 @@ class ProductRecommendationTrainer:
         self,
         product_id: int,
         X: pd.DataFrame,
-        training_data: pd.DataFrame
+        training_data: pd.DataFrame,
+        warm_start: bool = False,
+        n_jobs: Optional[int] = None
     ) -> None:
         """
         Train and calibrate a model for a specific product type.
@@ -147,10 +188,18 @@ class ProductRecommendationTrainer:
             product_id: Product type ID to train for
             X: Feature matrix
             training_data: Full training dataset with target column
+            warm_start: Continue boosting from the existing model for this
+                product type instead of fitting from scratch
+            n_jobs: XGBoost threads (default: the model config's)
 
         Raises:
             Exception: If training fails
         """
+        # Imported on first use so that loading this module (and starting
+        # scoring-only or pool worker processes) does not pay for them
+        from sklearn.calibration import CalibratedClassifierCV
+        from xgboost import XGBClassifier
+
         try:
             logger.info(f"Training model for product type {product_id}")
 
@@ -161,26 +210,89 @@ class ProductRecommendationTrainer:
                 product_id
             )
 
-            # Train base XGBoost model
-            model = XGBClassifier(**self.config.model.to_xgb_params())
-            model.fit(X, y)
-
-            logger.info(f"Base model trained for product {product_id}")
-
-            # Apply calibration
-            calibrated_model = CalibratedClassifierCV(
-                estimator=model,
-                method=self.config.model.calibration_method,
-                cv=self.config.model.calibration_cv,
-                n_jobs=self.config.model.calibration_n_jobs
-            )
-            calibrated_model.fit(X, y)
+            model_path = self.config.training.get_model_path(product_id)
+            params = self.config.model.to_xgb_params(product_id)
+            if n_jobs is not None:
+                params['n_jobs'] = n_jobs
+
+            def fit(rows: Optional[np.ndarray] = None, threads: Optional[int] = None):
+                """Fit the booster on a row subset (None = all rows, the final model)."""
+                fit_params = dict(params, n_jobs=threads) if threads else dict(params)
+                X_fit, y_fit = (X, y) if rows is None else (X.iloc[rows], np.asarray(y)[rows])
+                booster = None
+                if rows is None and warm_start and Path(model_path).exists():
+                    booster = base_estimator(self.model_persistence.load_model(model_path)).get_booster()
+                    added = self.config.training.warm_start_estimators
+                    max_trees = params['n_estimators'] + self.config.training.warm_start_max_extra
+                    if booster.num_boosted_rounds() + added > max_trees:
+                        # Nightly warm starts would otherwise grow the model
+                        # (and its scoring time) without bound
+                        logger.info(
+                            f"Refitting product {product_id} from scratch: warm start would "
+                            f"exceed {max_trees} trees"
+                        )
+                        booster = None
+                if booster is not None:
+                    # Add a few trees on top of the previous booster
+                    fit_params['n_estimators'] = added
+                    model = XGBClassifier(**fit_params)
+                    model.fit(X_fit, y_fit, xgb_model=booster)
+                    logger.info(f"Warm-started model for product {product_id}")
+                else:
+                    model = XGBClassifier(**fit_params)
+                    model.fit(X_fit, y_fit)
+                return model
+
+            model_config = self.config.model
+            if model_config.calibration_cv == 'prefit':
+                # Calibrate the booster on its own training rows
+                with self.profiler.stage('fit', rows=len(X)):
+                    model = fit(threads=n_jobs)
+                logger.info(f"Base model trained for product {product_id}")
+
+                with self.profiler.stage('calibrate', rows=len(X)):
+                    calibrated_model = CalibratedClassifierCV(
+                        estimator=model,
+                        method=model_config.calibration_method,
+                        cv='prefit',
+                        n_jobs=model_config.calibration_n_jobs
+                    )
+                    calibrated_model.fit(X, y)
+            else:
+                # Fold models and the final model are fit together; the map
+                # is fit on the folds' out-of-fold predictions
+                with self.profiler.stage('fit', rows=len(X)) as stage:
+                    calibrated_model = calibrate_out_of_fold(
+                        fit,
+                        X,
+                        np.asarray(y),
+                        n_folds=model_config.calibration_cv,
+                        method=model_config.calibration_method,
+                        ensemble=model_config.calibration_ensemble,
+                        max_parallel=(
+                            model_config.calibration_n_jobs
+                            if model_config.calibration_n_jobs > 0 else None
+                        ),
+                        n_threads=n_jobs,
+                        random_state=model_config.random_state
+                    )
+                    stage.attributes.update(
+                        folds=calibrated_model.n_folds, **calibrated_model.diagnostics
+                    )
+                if calibrated_model.diagnostics:
+                    logger.info(
+                        f"Out-of-fold Brier for product {product_id}: "
+                        f"{calibrated_model.diagnostics['oof_brier_raw']:.5f} raw, "
+                        f"{calibrated_model.diagnostics['oof_brier_calibrated']:.5f} "
+                        f"calibrated (cross-fit)"
+                    )
 
             logger.info(f"Model calibrated for product {product_id}")
 
-            # Save model
-            model_path = self.config.training.get_model_path(product_id)
-            self.model_persistence.save_model(model, model_path)
+            # Save the calibrated model
+            with self.profiler.stage('save') as stage:
+                self.model_persistence.save_model(calibrated_model, model_path)
+                stage.bytes_transferred = Path(model_path).stat().st_size
 
             logger.info(f"✓ Model saved for product {product_id}")
 
@@ -188,6 +300,23 @@ class ProductRecommendationTrainer:
             logger.error(f"Failed to train model for product {product_id}: {str(e)}")
             raise
 
+    def training_params(self, product_id: int) -> str:
+        """
+        Checksum of the parameters a product type's model is fit with.
+
+        Covers the XGBoost and calibration parameters but not the thread
+        count, which does not change the fitted model.
+        """
+        params = self.config.model.to_xgb_params(product_id)
+        params.pop('n_jobs', None)
+        return params_checksum({
+            'xgb': params,
+            'calibration_method': self.config.model.calibration_method,
+            'calibration_cv': self.config.model.calibration_cv,
+            'calibration_ensemble': self.config.model.calibration_ensemble,
+            'warm_start': self.config.training.warm_start and self.config.training.incremental,
+        })
+
     def train_all_models(
         self,
         training_data: pd.DataFrame,
@@ -201,7 +330,8 @@ class ProductRecommendationTrainer:
             product_types: DataFrame with product type IDs
 
         Raises:
-            Exception: If any model training fails
+            RuntimeError: If any product type failed to train; the others are
+                still trained and recorded in the manifest
         """
         logger.info("=" * 60)
         logger.info("STARTING MODEL TRAINING")
@@ -218,14 +348,195 @@ class ProductRecommendationTrainer:
         # Prepare features once for all models
         X = self.prepare_features(training_data, is_training=True)
 
-        # Train models for each product type
-        for prod_id in product_types['pdm_prod_type_id']:
-            self.train_model_for_product(int(prod_id), X, training_data)
+        product_ids = [int(p) for p in product_types['pdm_prod_type_id']]
+        labels = training_data['pdm_prod_type_id']
+
+        manifest = ModelManifest.load(self.config.training.get_manifest_path())
+        fingerprints = compute_fingerprints(X, labels, product_ids)
+
+        if self.config.training.incremental:
+            detector = ChangeDetector(
+                self.config.training.drift_count_tolerance,
+                self.config.training.drift_mean_tolerance,
+                self.config.training.drift_std_tolerance
+            )
+            model_exists = {
+                p: Path(self.config.training.get_model_path(p)).exists()
+                for p in product_ids
+            }
+            to_train = detector.select(fingerprints, manifest, model_exists)
+        else:
+            to_train = {p: "full retrain" for p in product_ids}
+
+        for prod_id in product_ids:
+            if prod_id not in to_train:
+                logger.info(f"Skipping product {prod_id}: training slice unchanged")
+
+        # Resume an unfinished run: product types it completed from the same
+        # slice and parameters, with an intact model file, are not refit
+        params = {p: self.training_params(p) for p in to_train}
+        if manifest.start_run(resume=self.config.training.resume):
+            for prod_id in list(to_train):
+                model_path = self.config.training.get_model_path(prod_id)
+                if manifest.is_complete(prod_id, fingerprints[prod_id], params[prod_id], model_path):
+                    logger.info(f"Skipping product {prod_id}: completed earlier in this run")
+                    del to_train[prod_id]
+        manifest.save()
+
+        # Longest fits first (durations from earlier runs) to shorten the makespan
+        order = manifest.longest_first([p for p in product_ids if p in to_train])
+        workers = max(1, min(self.config.training.workers, len(order)))
+        n_jobs = max(1, (os.cpu_count() or 1) // workers) if workers > 1 else None
+        warm_start = {
+            p: (
+                self.config.training.warm_start
+                and self.config.training.incremental
+                and manifest.get(p) is not None
+            )
+            for p in order
+        }
+
+        def train(prod_id: int) -> float:
+            """Fit one product type and return its duration in seconds."""
+            logger.info(f"Retraining product {prod_id}: {to_train[prod_id]}")
+            started = time.perf_counter()
+            with self.profiler.stage('train_product', product_id=prod_id):
+                self.train_model_for_product(
+                    prod_id, X, training_data, warm_start=warm_start[prod_id], n_jobs=n_jobs
+                )
+            return time.perf_counter() - started
+
+        # A failed product type does not stop the others; the manifest is
+        # updated (from this thread only) as each fit finishes
+        failed: Dict[int, Exception] = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(train, prod_id): prod_id for prod_id in order}
+            for future in as_completed(futures):
+                prod_id = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    failed[prod_id] = e
+                    manifest.update(
+                        prod_id,
+                        status=FAILED,
+                        run_id=manifest.run['run_id'],
+                        error=f"{type(e).__name__}: {e}"
+                    )
+                else:
+                    model_path = self.config.training.get_model_path(prod_id)
+                    manifest.update(
+                        prod_id,
+                        fingerprint=fingerprints[prod_id],
+                        model_path=model_path,
+                        warm_started=warm_start[prod_id],
+                        status=COMPLETED,
+                        run_id=manifest.run['run_id'],
+                        params=params[prod_id],
+                        checksum=file_checksum(model_path),
+                        duration_seconds=round(seconds, 3),
+                        error=None
+                    )
+                manifest.save()
+
+        manifest.finish_run(failed)
+        manifest.save()
+
+        if failed:
+            raise RuntimeError(
+                f"Training failed for {len(failed)} of {len(order)} product types "
+                f"({', '.join(str(p) for p in sorted(failed))}); rerun to retry them"
+            ) from next(iter(failed.values()))
 
         logger.info("=" * 60)
         logger.info("MODEL TRAINING COMPLETED")
         logger.info("=" * 60)
 
+    def distill_models(
+        self,
+        training_data: pd.DataFrame,
+        product_types: pd.DataFrame
+    ) -> DistilledModel:
+        """
+        Distill the product-type models into one multi-output student.
+
+        The trained (calibrated) models label up to ``max_rows`` training rows
+        with every product type's probability; the student is fit on those
+        labels and saved next to the models with its fidelity report.
+
+        Args:
+            training_data: Training dataset
+            product_types: DataFrame with product type IDs
+
+        Returns:
+            The distilled model
+
+        Raises:
+            ValueError: If no product-type models exist
+        """
+        distillation = self.config.distillation
+        model_dir = self.config.training.model_dir
+
+        if len(training_data) > distillation.max_rows:
+            training_data = training_data.sample(
+                n=distillation.max_rows,
+                random_state=self.config.model.random_state
+            )
+        X = self.prepare_features(training_data, is_training=False)
+
+        scorer = ConcurrentModelScorer(
+            self.config.processing.max_workers,
+            model_nthread=self.config.processing.model_nthread,
+            prefetch=self.config.processing.prefetch_models,
+            model_persistence=self.model_persistence
+        )
+        with self.profiler.stage('distill_label', rows=len(X)):
+            teacher, product_ids = scorer.score(X, {
+                int(prod_id): self.config.training.get_model_path(int(prod_id))
+                for prod_id in product_types['pdm_prod_type_id']
+            }, skip_missing=True)
+        if not product_ids:
+            raise ValueError("No product-type models to distill")
+
+        with self.profiler.stage('distill_fit', rows=len(X)) as stage:
+            student = distill(
+                X,
+                teacher,
+                product_ids,
+                self.config.features.features,
+                hidden_units=distillation.hidden_units,
+                epochs=distillation.epochs,
+                batch_size=distillation.batch_size,
+                learning_rate=distillation.learning_rate,
+                validation_fraction=distillation.validation_fraction,
+                patience=distillation.patience,
+                random_state=self.config.model.random_state
+            )
+            stage.attributes.update(student.fidelity['overall'])
+
+        student.save(distillation.get_model_path(model_dir))
+        fidelity_path = distillation.get_fidelity_path(model_dir)
+        with open(fidelity_path, 'w') as f:
+            json.dump(student.fidelity, f, indent=2)
+
+        overall = student.fidelity['overall']
+        logger.info(
+            f"Distilled {len(product_ids)} product types: held-out MAE {overall['mae']:.5f}, "
+            f"top-1 agreement {overall['top1_agreement']:.3f} (report: {fidelity_path})"
+        )
+        drifted = {
+            prod_id: metrics['mae']
+            for prod_id, metrics in student.fidelity['products'].items()
+            if metrics['mae'] > distillation.max_product_mae
+        }
+        if drifted:
+            logger.warning(
+                f"Distilled model differs from the product-type models by more than "
+                f"{distillation.max_product_mae} MAE for {len(drifted)} product types: "
+                + ", ".join(f"{p} ({mae:.4f})" for p, mae in sorted(drifted.items()))
+            )
+        return student
+
     def generate_predictions(
         self,
         data: pd.DataFrame,
@@ -251,6 +562,24 @@ class ProductRecommendationTrainer:
         # Prepare features
         X = self.prepare_features(data, is_training=False)
 
+        if self.config.processing.concurrent_scoring:
+            scorer = ConcurrentModelScorer(
+                self.config.processing.max_workers,
+                model_nthread=self.config.processing.model_nthread,
+                prefetch=self.config.processing.prefetch_models,
+                model_persistence=self.model_persistence
+            )
+            with self.profiler.stage('predict_concurrent', rows=len(X)):
+                prob, product_ids = scorer.score(X, {
+                    int(prod_id): self.config.training.get_model_path(int(prod_id))
+                    for prod_id in product_types['pdm_prod_type_id']
+                })
+            all_predictions = self.data_processor.predictions_to_long(
+                customers, prob, product_ids
+            )
+            logger.info(f"Total predictions: {len(all_predictions)}")
+            return all_predictions
+
         all_predictions = pd.DataFrame()
 
         # Generate predictions for each product type
@@ -260,10 +589,12 @@ class ProductRecommendationTrainer:
             try:
                 # Load model
                 model_path = self.config.training.get_model_path(prod_id)
-                model = self.model_persistence.load_model(model_path)
+                with self.profiler.stage('load_model', product_id=prod_id):
+                    model = self.model_persistence.load_model(model_path)
 
                 # Predict probabilities
-                prob = model.predict_proba(X)
+                with self.profiler.stage('predict_product', rows=len(X), product_id=prod_id):
+                    prob = model.predict_proba(X)
                 prob_df = pd.DataFrame(
                     data=prob[:, 1],
                     columns=['p'],
@@ -324,12 +655,14 @@ class ProductRecommendationTrainer:
         logger.info("Uploading clustering data to BigQuery...")
 
         try:
-            self.bq_client.upload_dataframe(
-                clustering_data,
-                self.config.bigquery.dataset,
-                self.config.training.output_table,
-                if_exists='replace'
-            )
+            with self.profiler.stage('upload_clustering_data', rows=len(clustering_data)) as stage:
+                stage.bytes_transferred = dataframe_bytes(clustering_data)
+                self.data_source.upload_dataframe(
+                    clustering_data,
+                    self.config.bigquery.dataset,
+                    self.config.training.output_table,
+                    if_exists='replace'
+                )
 
             logger.info("✓ Clustering data uploaded successfully")
 
@@ -344,9 +677,10 @@ class ProductRecommendationTrainer:
         This method orchestrates the entire training workflow:
         1. Load training data
         2. Train models for all product types
-        3. Generate predictions
-        4. Create clustering dataset
-        5. Upload results to BigQuery
+        3. Optionally distill them into one multi-output model
+        4. Generate predictions
+        5. Create clustering dataset
+        6. Upload results to BigQuery
         """
         try:
             logger.info("\n" + "=" * 60)
@@ -354,19 +688,31 @@ class ProductRecommendationTrainer:
             logger.info("=" * 60 + "\n")
 
             # Load data
-            training_data, product_types, train_to_predict = self.load_training_data()
+            with self.profiler.stage('load_data'):
+                training_data, product_types, train_to_predict = self.load_training_data()
 
             # Train models
-            self.train_all_models(training_data, product_types)
+            with self.profiler.stage('train', rows=len(training_data)):
+                self.train_all_models(training_data, product_types)
+
+            # Distill them into one multi-output scoring model
+            if self.config.distillation.enabled:
+                with self.profiler.stage('distill'):
+                    self.distill_models(training_data, product_types)
 
             # Generate predictions
-            predictions = self.generate_predictions(train_to_predict, product_types)
+            with self.profiler.stage('predict', rows=len(train_to_predict)) as stage:
+                predictions = self.generate_predictions(train_to_predict, product_types)
+                predictions = PREDICTIONS.enforce(predictions, stage)
 
             # Create clustering data
-            clustering_data = self.create_clustering_data(predictions)
+            with self.profiler.stage('pivot', rows=len(predictions)) as stage:
+                clustering_data = self.create_clustering_data(predictions)
+                clustering_data = CLUSTERING.enforce(clustering_data, stage)
 
             # Upload results
-            self.upload_results(clustering_data)
+            with self.profiler.stage('upload'):
+                self.upload_results(clustering_data)
 
             logger.info("\n" + "=" * 60)
             logger.info("TRAINING PIPELINE COMPLETED SUCCESSFULLY")
@@ -379,6 +725,9 @@ class ProductRecommendationTrainer:
             logger.error(f"Error: {str(e)}", exc_info=True)
             raise
 
+        finally:
+            self.profiler.write_report(self.config.profiling.get_report_path('training'))
+
 
 def main():
     """Main entry point for the training pipeline."""
@@ -0,0 +1,132 @@
+"""
+Benchmark in-sample versus out-of-fold calibration of one product type.
+
+Trains one product type's booster on synthetic purchases and calibrates it
+four ways:
+- ``prefit``: isotonic map fit on the training rows (the previous behaviour)
+- ``oof-serial``: K fold fits and the final fit one after another
+- ``oof-parallel``: the same fits run together on a thread pool
+- ``oof-ensemble``: K parallel fold models averaged, with no final fit
+
+For each one it reports the fit wall time and, on held-out customers, the
+Brier score, log loss and expected calibration error (ECE, 10 equal-width
+bins). The parallel variants only beat the serial one when there are more
+cores than one fit can use.
+
+Usage:
+    python benchmarks/bench_calibration.py --customers 100000 --folds 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from calibration import calibrate_out_of_fold
+from config import Config
+from synthetic import SyntheticDataGenerator
+
+
+def calibration_metrics(p: np.ndarray, y: np.ndarray, bins: int = 10) -> dict:
+    """Brier score, log loss and expected calibration error."""
+    clipped = np.clip(p, 1e-7, 1 - 1e-7)
+    edges = np.minimum((p * bins).astype(int), bins - 1)
+    ece = sum(
+        abs(p[edges == b].mean() - y[edges == b].mean()) * np.mean(edges == b)
+        for b in range(bins) if np.any(edges == b)
+    )
+    return {
+        'brier': float(np.mean((p - y) ** 2)),
+        'log_loss': float(-np.mean(y * np.log(clipped) + (1 - y) * np.log(1 - clipped))),
+        'ece': float(ece),
+    }
+
+
+def main():
+    """Run the benchmark and print a JSON summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--test-customers', type=int, default=50_000)
+    parser.add_argument('--product-types', type=int, default=10)
+    parser.add_argument('--product-rank', type=int, default=3,
+                        help='Popularity rank of the product type calibrated (0 = most popular)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--n-estimators', type=int, default=200)
+    parser.add_argument('--max-depth', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from sklearn.calibration import CalibratedClassifierCV
+    from xgboost import XGBClassifier
+
+    config = Config()
+    config.model.n_estimators = args.n_estimators
+    config.model.max_depth = args.max_depth
+    features = config.features.features
+
+    generator = SyntheticDataGenerator(n_product_types=args.product_types, seed=args.seed)
+    train = generator.training_data(args.customers)
+    test = generator.training_data(args.test_customers)
+    product_id = int(generator.product_ids[args.product_rank])
+
+    X = train[features].astype(np.float32)
+    y = (train['pdm_prod_type_id'] == product_id).to_numpy().astype(np.int8)
+    X_test = test[features].astype(np.float32)
+    y_test = (test['pdm_prod_type_id'] == product_id).to_numpy().astype(np.int8)
+    params = config.model.to_xgb_params(product_id)
+    threads = os.cpu_count() or 1
+
+    def fit(rows=None, n_jobs=None):
+        model = XGBClassifier(**dict(params, n_jobs=n_jobs or threads))
+        return model.fit(X if rows is None else X.iloc[rows], y if rows is None else y[rows])
+
+    def prefit():
+        return CalibratedClassifierCV(fit(), method='isotonic', cv='prefit').fit(X, y)
+
+    variants = {
+        'prefit': prefit,
+        'oof-serial': lambda: calibrate_out_of_fold(
+            fit, X, y, n_folds=args.folds, max_parallel=1, random_state=args.seed
+        ),
+        'oof-parallel': lambda: calibrate_out_of_fold(
+            fit, X, y, n_folds=args.folds, random_state=args.seed
+        ),
+        'oof-ensemble': lambda: calibrate_out_of_fold(
+            fit, X, y, n_folds=args.folds, ensemble=True, random_state=args.seed
+        ),
+    }
+
+    results = []
+    for name, build in variants.items():
+        started = time.perf_counter()
+        model = build()
+        seconds = time.perf_counter() - started
+        p = model.predict_proba(X_test)[:, 1]
+        results.append({
+            'variant': name,
+            'fit_seconds': round(seconds, 3),
+            **{k: round(v, 6) for k, v in calibration_metrics(p, y_test).items()},
+        })
+
+    raw = fit().predict_proba(X_test)[:, 1]
+    print(json.dumps({
+        'customers': args.customers,
+        'product_id': product_id,
+        'positive_rate': round(float(y.mean()), 4),
+        'folds': args.folds,
+        'cpu_count': threads,
+        'uncalibrated': {k: round(v, 6) for k, v in calibration_metrics(raw, y_test).items()},
+        'variants': results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
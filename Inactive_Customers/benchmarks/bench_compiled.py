@@ -0,0 +1,108 @@
+"""
+Benchmark the compiled forest against per-model ``predict_proba`` scoring.
+
+Trains small synthetic product-type models, then scores the same customers
+through both paths and reports throughput and the maximum absolute
+difference between their probabilities.
+
+Usage:
+    python benchmarks/bench_compiled.py --customers 100000 --product-types 20
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import FeatureConfig
+from compiled import CompiledForest
+
+
+def train_models(
+    X: pd.DataFrame,
+    labels: np.ndarray,
+    n_estimators: int,
+    max_depth: int,
+    calibrate: bool
+) -> dict:
+    """Fit one (optionally calibrated) model per product type."""
+    from sklearn.calibration import CalibratedClassifierCV
+    from xgboost import XGBClassifier
+
+    models = {}
+    for prod_id in np.unique(labels):
+        y = (labels == prod_id).astype(int)
+        model = XGBClassifier(n_estimators=n_estimators, max_depth=max_depth, n_jobs=-1)
+        model.fit(X, y)
+        if calibrate:
+            model = CalibratedClassifierCV(model, method='isotonic', cv='prefit').fit(X, y)
+        models[int(prod_id)] = model
+    return models
+
+
+def main():
+    """Run the benchmark and print a JSON summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--customers', type=int, default=50_000)
+    parser.add_argument('--train-rows', type=int, default=20_000)
+    parser.add_argument('--product-types', type=int, default=10)
+    parser.add_argument('--n-estimators', type=int, default=200)
+    parser.add_argument('--max-depth', type=int, default=5)
+    parser.add_argument('--calibrate', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    features = FeatureConfig().features
+
+    X_train = pd.DataFrame(
+        rng.normal(size=(args.train_rows, len(features))).astype(np.float32),
+        columns=features
+    )
+    labels = rng.integers(0, args.product_types, size=args.train_rows)
+    X_score = pd.DataFrame(
+        rng.normal(size=(args.customers, len(features))).astype(np.float32),
+        columns=features
+    )
+
+    models = train_models(X_train, labels, args.n_estimators, args.max_depth, args.calibrate)
+
+    started = time.perf_counter()
+    reference = np.column_stack([
+        models[prod_id].predict_proba(X_score)[:, 1] for prod_id in sorted(models)
+    ])
+    per_model_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    forest = CompiledForest.from_models(models, features)
+    compile_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compiled = forest.predict(X_score)
+    compiled_seconds = time.perf_counter() - started
+
+    n_scores = args.customers * len(models)
+    print(json.dumps({
+        'customers': args.customers,
+        'product_types': len(models),
+        'trees': forest.n_trees,
+        'calibrated': args.calibrate,
+        'compile_seconds': round(compile_seconds, 3),
+        'per_model_seconds': round(per_model_seconds, 3),
+        'compiled_seconds': round(compiled_seconds, 3),
+        'per_model_scores_per_second': round(n_scores / per_model_seconds),
+        'compiled_scores_per_second': round(n_scores / compiled_seconds),
+        'speedup': round(per_model_seconds / compiled_seconds, 2),
+        'max_abs_diff': float(np.abs(compiled - reference).max()),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark a distilled student against the per-product-type teacher models.
+
+Trains calibrated synthetic product-type models (the teacher) on imputed
+purchases whose product type depends on the features, distills them into one
+multi-output MLP, then scores held-out customers through per-model
+``predict_proba``, the compiled forest and the student. Reports throughput of
+each path and the student's fidelity to the teacher: per product type mean
+absolute error, and overall top-1 / top-3 agreement.
+
+Usage:
+    python benchmarks/bench_distillation.py --customers 100000 --product-types 50
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from bench_compiled import train_models
+from compiled import CompiledForest
+from config import DistillationConfig, FeatureConfig
+from distillation import distill, fidelity_report
+from synthetic import SyntheticDataGenerator
+from utils import DataProcessor
+
+
+def timed(func, *args, **kwargs):
+    """Return (result, seconds) of one call."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark and print a JSON summary."""
+    defaults = DistillationConfig()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--customers', type=int, default=50_000,
+                        help='Held-out customers scored by every path')
+    parser.add_argument('--train-rows', type=int, default=50_000,
+                        help='Purchases the teacher models are trained on')
+    parser.add_argument('--distill-rows', type=int, default=defaults.max_rows,
+                        help='Customers the student is distilled on')
+    parser.add_argument('--product-types', type=int, default=20)
+    parser.add_argument('--n-estimators', type=int, default=200)
+    parser.add_argument('--max-depth', type=int, default=5)
+    parser.add_argument('--hidden-units', type=int, nargs='+', default=list(defaults.hidden_units))
+    parser.add_argument('--epochs', type=int, default=defaults.epochs)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    feature_config = FeatureConfig()
+    features = feature_config.features
+    generator = SyntheticDataGenerator(n_product_types=args.product_types, seed=args.seed)
+
+    def impute(df):
+        """Impute the features as the pipelines do."""
+        return DataProcessor.apply_feature_imputation(
+            df, features, feature_config.imputation_rules
+        ).astype(np.float32)
+
+    train = generator.training_data(args.train_rows)
+    X_distill = impute(generator.scoring_data(args.distill_rows))
+    X_score = impute(generator.scoring_data(args.customers))
+
+    models, train_seconds = timed(
+        train_models,
+        impute(train),
+        train['pdm_prod_type_id'].to_numpy(),
+        args.n_estimators,
+        args.max_depth,
+        True
+    )
+    product_ids = sorted(models)
+    forest = CompiledForest.from_models(models, features)
+
+    def teacher(X):
+        """Calibrated probabilities of every teacher model."""
+        return np.column_stack([models[p].predict_proba(X)[:, 1] for p in product_ids])
+
+    teacher_distill, teacher_seconds = timed(teacher, X_distill)
+    student, distill_seconds = timed(
+        distill,
+        X_distill,
+        teacher_distill,
+        product_ids,
+        features,
+        hidden_units=args.hidden_units,
+        epochs=args.epochs,
+        batch_size=defaults.batch_size,
+        learning_rate=defaults.learning_rate,
+        validation_fraction=defaults.validation_fraction,
+        patience=defaults.patience,
+        random_state=args.seed
+    )
+
+    reference, per_model_seconds = timed(teacher, X_score)
+    _, compiled_seconds = timed(forest.predict, X_score)
+    predicted, student_seconds = timed(student.predict, X_score)
+
+    report = fidelity_report(predicted, reference, product_ids)
+    maes = {p: round(m['mae'], 5) for p, m in report['products'].items()}
+    n_scores = args.customers * len(product_ids)
+
+    print(json.dumps({
+        'customers': args.customers,
+        'product_types': len(product_ids),
+        'teacher_trees': forest.n_trees,
+        'hidden_units': list(student.hidden_units),
+        'teacher_train_seconds': round(train_seconds, 3),
+        'teacher_label_seconds': round(teacher_seconds, 3),
+        'distill_seconds': round(distill_seconds, 3),
+        'epochs': student.fidelity['training']['epochs'],
+        'scores_per_second': {
+            'per_model': round(n_scores / per_model_seconds),
+            'compiled': round(n_scores / compiled_seconds),
+            'distilled': round(n_scores / student_seconds),
+        },
+        'speedup_vs_per_model': round(per_model_seconds / student_seconds, 2),
+        'speedup_vs_compiled': round(compiled_seconds / student_seconds, 2),
+        'fidelity': report['overall'],
+        'validation_fidelity': student.fidelity['overall'],
+        'product_mae': maes,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark exact and partitioned lookalike search over propensity vectors.
+
+Builds a synthetic clustering table whose customers fall into segments (each
+segment a skewed propensity profile, each customer a noisy copy of it, with
+missing scores), indexes it and queries a batch of seed customers. Reports
+the build time, and for the exact blocked search and the approximate (IVF)
+search at each ``n_probe``: milliseconds per seed, seeds per second and
+recall@k against the exact neighbours.
+
+Usage:
+    python benchmarks/bench_lookalike.py --customers 1000000 --seeds 5000 --lists 1000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import LookalikeConfig
+from lookalike import LookalikeIndex, recall_at_k
+
+
+def propensity_vectors(
+    customers: int,
+    product_types: int,
+    segments: int,
+    missing: float,
+    seed: int
+) -> np.ndarray:
+    """Segmented (customers x product types) probabilities shaped like the p<id> columns."""
+    rng = np.random.default_rng(seed)
+    profiles = rng.beta(0.5, 8.0, size=(segments, product_types))
+    p = profiles[rng.integers(segments, size=customers)]
+    p = p * rng.lognormal(0.0, 0.5, size=p.shape)
+    p = np.clip(p, 0.0, 1.0).astype(np.float32)
+    p[rng.random(p.shape) < missing] = np.nan
+    return p
+
+
+def timed(func, *args, **kwargs):
+    """Return (result, seconds) of one call."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark and print a JSON summary."""
+    defaults = LookalikeConfig()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--customers', type=int, default=500_000)
+    parser.add_argument('--product-types', type=int, default=100)
+    parser.add_argument('--segments', type=int, default=200)
+    parser.add_argument('--missing', type=float, default=0.01)
+    parser.add_argument('--seeds', type=int, default=2000, help='Seed customers queried')
+    parser.add_argument('--k', type=int, default=defaults.k)
+    parser.add_argument('--metric', choices=('cosine', 'l2'), default=defaults.metric)
+    parser.add_argument('--lists', type=int, default=700,
+                        help='IVF partitions (about sqrt(customers) is a good start)')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    vectors = propensity_vectors(
+        args.customers, args.product_types, args.segments, args.missing, args.seed
+    )
+    customer_ids = np.arange(1, args.customers + 1, dtype=np.int64)
+    product_ids = np.arange(1, args.product_types + 1)
+
+    index, build_seconds = timed(
+        LookalikeIndex.build,
+        customer_ids,
+        vectors,
+        product_ids,
+        metric=args.metric,
+        n_lists=args.lists,
+        kmeans_iterations=defaults.kmeans_iterations,
+        kmeans_sample=defaults.kmeans_sample,
+        random_state=args.seed
+    )
+    rng = np.random.default_rng(args.seed)
+    seed_rows = index.rows_of(rng.choice(customer_ids, args.seeds, replace=False))
+    queries = index.vectors[seed_rows]
+
+    def search(exact, n_probe=defaults.n_probe):
+        return index.search(
+            queries, k=args.k, exact=exact, n_probe=n_probe, exclude_rows=seed_rows,
+            block_size=defaults.block_size, query_block_size=defaults.query_block_size
+        )[0]
+
+    exact_rows, exact_seconds = timed(search, True)
+    results = [{
+        'search': 'exact',
+        'ms_per_seed': round(exact_seconds * 1000 / args.seeds, 4),
+        'seeds_per_second': round(args.seeds / exact_seconds),
+        'recall': 1.0,
+    }]
+    for n_probe in args.probes if index.partitioned else []:
+        rows, seconds = timed(search, False, n_probe)
+        results.append({
+            'search': f'ivf n_probe={n_probe}',
+            'ms_per_seed': round(seconds * 1000 / args.seeds, 4),
+            'seeds_per_second': round(args.seeds / seconds),
+            'recall': round(recall_at_k(rows, exact_rows), 4),
+        })
+
+    list_sizes = np.diff(index.list_offsets) if index.partitioned else np.array([len(index)])
+    print(json.dumps({
+        'customers': args.customers,
+        'product_types': args.product_types,
+        'seeds': args.seeds,
+        'k': args.k,
+        'metric': args.metric,
+        'lists': index.n_lists,
+        'list_size_max': int(list_sizes.max()),
+        'list_size_median': int(np.median(list_sizes)),
+        'build_seconds': round(build_seconds, 3),
+        'searches': results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
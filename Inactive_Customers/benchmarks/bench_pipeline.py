@@ -0,0 +1,230 @@
+"""
+End-to-end benchmark of the training and scoring pipelines on synthetic data.
+
+Generates training/scoring/product-type tables at the requested scale, runs
+``ProductRecommendationTrainer`` and ``ProductRecommendationScorer`` against a
+``LocalDataSource`` (no GCP credentials needed), and records the wall time
+of imputation, training, scoring, pivoting and upload from the pipelines' own
+profiler. Results are written as JSON keyed by commit and scale so runs can be
+compared across commits.
+
+Usage:
+    python benchmarks/bench_pipeline.py --train-customers 100000 --score-customers 1000000 --product-types 50
+    python benchmarks/bench_pipeline.py ... --compare benchmarks/results/<baseline>.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from config import Config
+from data_sources import LocalDataSource
+from results import RESULTS_DIR, compare, git_revision
+from synthetic import SyntheticDataGenerator
+from Score.score import ProductRecommendationScorer
+from Train.training import ProductRecommendationTrainer
+from utils import setup_logging
+
+# Reported stage -> top-level profiler stage (imputation is summed over all paths)
+STAGES = {
+    'load_data': 'load_data',
+    'train': 'train',
+    'score': 'predict',
+    'pivot': 'pivot',
+    'upload': 'upload',
+    'top_n': 'top_n',
+}
+
+
+def build_config(args: argparse.Namespace, workdir: Path) -> Config:
+    """Build a pipeline configuration that runs entirely on local files."""
+    config = Config()
+    config.data_source.backend = 'local'
+
+    config.model.n_estimators = args.n_estimators
+    config.model.max_depth = args.max_depth
+
+    rows = args.train_customers * args.purchases_per_customer
+    config.training.training_limit = rows
+    config.training.prod_types_limit = args.product_types + 1
+    config.training.train_to_predict_limit = args.train_customers
+    config.training.model_dir = str(workdir / "models")
+    config.scoring.model_dir = str(workdir / "models")
+    config.scoring.predictions_file = str(workdir / "predictions" / "prod_type_p.pkl")
+    config.scoring.compiled_model_file = str(workdir / "models" / "compiled_forest.npz")
+    config.scoring.predictor = args.predictor
+    config.scoring.top_n = args.top_n
+
+    config.processing.concurrent_scoring = args.concurrent
+    config.profiling.enabled = True
+    config.profiling.report_dir = str(workdir / "reports")
+
+    return config
+
+
+def summarize(report: Dict[str, Any]) -> Dict[str, float]:
+    """Reduce a profiler run report to the benchmarked stage timings."""
+    stages = report['stages']
+    top_level = [s for s in stages if s['depth'] == 0]
+    summary = {
+        name: sum(s['wall_seconds'] for s in top_level if s['name'] == stage)
+        for name, stage in STAGES.items()
+        if any(s['name'] == stage for s in top_level)
+    }
+    summary['impute'] = sum(s['wall_seconds'] for s in stages if s['name'] == 'impute')
+    summary['total'] = sum(s['wall_seconds'] for s in top_level)
+    return {name: round(seconds, 4) for name, seconds in summary.items()}
+
+
+def dtype_savings(report: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """Collect the per-table memory recorded by schema enforcement, by stage path."""
+    return {
+        f"{stage['path']}:{table}": {k: v for k, v in entry.items() if k != 'cast_columns'}
+        for stage in report['stages']
+        for table, entry in stage['attributes'].get('dtypes', {}).items()
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Generate data, run both pipelines and collect the timings."""
+    generator = SyntheticDataGenerator(
+        n_product_types=args.product_types,
+        seed=args.seed,
+        chunk_size=args.chunk_size
+    )
+
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as tmp:
+        workdir = Path(tmp)
+        config = build_config(args, workdir)
+
+        started = time.perf_counter()
+        if args.parquet:
+            data_dir = workdir / "tables"
+            generator.write_parquet(
+                str(data_dir), args.train_customers, args.score_customers,
+                args.purchases_per_customer,
+                config.training.training_data_table,
+                config.scoring.scoring_data_table,
+                config.training.prod_types_table
+            )
+            source_kwargs = {'data_dir': str(data_dir), 'output_dir': str(workdir / "uploads")}
+        else:
+            source_kwargs = {'tables': {
+                config.training.training_data_table:
+                    generator.training_data(args.train_customers, args.purchases_per_customer),
+                config.scoring.scoring_data_table: generator.scoring_data(args.score_customers),
+                config.training.prod_types_table: generator.product_types(),
+            }}
+        generate_seconds = time.perf_counter() - started
+
+        trainer = ProductRecommendationTrainer(config, data_source=LocalDataSource(**source_kwargs))
+        trainer.run()
+
+        scorer = ProductRecommendationScorer(config, data_source=LocalDataSource(**source_kwargs))
+        scorer.run()
+
+        training_report = trainer.profiler.report()
+        scoring_report = scorer.profiler.report()
+
+    return {
+        **git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'platform': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'params': {
+            'train_customers': args.train_customers,
+            'score_customers': args.score_customers,
+            'product_types': args.product_types,
+            'purchases_per_customer': args.purchases_per_customer,
+            'n_estimators': args.n_estimators,
+            'max_depth': args.max_depth,
+            'predictor': args.predictor,
+            'concurrent': args.concurrent,
+            'top_n': args.top_n,
+            'parquet': args.parquet,
+            'seed': args.seed,
+        },
+        'generate_seconds': round(generate_seconds, 4),
+        'results': {
+            'training': summarize(training_report),
+            'scoring': summarize(scoring_report),
+        },
+        'peak_rss_bytes': max(training_report['peak_rss_bytes'], scoring_report['peak_rss_bytes']),
+        'dtype_savings': {
+            'training': dtype_savings(training_report),
+            'scoring': dtype_savings(scoring_report),
+        },
+    }
+
+
+def result_path(result: Dict[str, Any], label: Optional[str]) -> Path:
+    """Build the results file name from commit (or label) and scale."""
+    params = result['params']
+    scale = f"t{params['train_customers']}_s{params['score_customers']}_p{params['product_types']}"
+    return RESULTS_DIR / f"{label or result['commit']}_{scale}.json"
+
+
+def main():
+    """Run the benchmark, store the result and optionally compare to a baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--train-customers', type=int, default=10_000)
+    parser.add_argument('--score-customers', type=int, default=10_000)
+    parser.add_argument('--product-types', type=int, default=10)
+    parser.add_argument('--purchases-per-customer', type=int, default=1)
+    parser.add_argument('--n-estimators', type=int, default=50,
+                        help='Trees per model (the production default of 1000 is slow at scale)')
+    parser.add_argument('--max-depth', type=int, default=5)
+    parser.add_argument('--predictor', choices=['per_product', 'compiled'], default='per_product')
+    parser.add_argument('--concurrent', action='store_true', help='Use concurrent scoring')
+    parser.add_argument('--top-n', type=int, default=0)
+    parser.add_argument('--parquet', action='store_true',
+                        help='Stage tables and uploads through Parquet files instead of memory')
+    parser.add_argument('--chunk-size', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', help='Results file prefix (default: commit hash)')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', help='Baseline result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown flagged as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Ignore stages faster than this in the baseline')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    setup_logging('INFO' if args.verbose else 'WARNING')
+
+    result = run_benchmark(args)
+
+    if not args.no_save:
+        path = result_path(result, args.label)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        result['saved_to'] = str(path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        result['comparison'] = compare(result, baseline, args.threshold, args.min_seconds)
+
+    print(json.dumps(result, indent=2))
+
+    if any(row['regression'] for row in result.get('comparison', [])):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark quantized storage of the wide p<id> probability table.
+
+Builds a synthetic clustering table (customer_id plus one float32 p<id>
+column per product type, with skewed probabilities and missing scores) and
+writes it as a pickle checkpoint and as a Parquet output in each codec. It
+reports file sizes against float32 (and float64), write/read time, the
+largest and mean absolute error against the documented bound, and how often
+a customer's top product type changes. Exits non-zero if any error exceeds
+its bound.
+
+Usage:
+    python benchmarks/bench_quantization.py --customers 200000 --product-types 100
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from quantization import CODECS, dequantize_frame, max_error, quantize_frame
+
+
+def clustering_table(customers: int, product_types: int, missing: float, seed: int) -> pd.DataFrame:
+    """Wide table shaped like pivot_predictions output."""
+    rng = np.random.default_rng(seed)
+    p = rng.beta(0.5, 8.0, size=(customers, product_types)).astype(np.float32)
+    p[rng.random(p.shape) < missing] = np.nan
+    df = pd.DataFrame(p, columns=[f"p{i}" for i in range(1, product_types + 1)], copy=False)
+    df['customer_id'] = np.arange(1, customers + 1, dtype=np.int64)
+    return df
+
+
+def timed(func, *args, **kwargs):
+    """Return (result, seconds) of one call."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def run_codec(df: pd.DataFrame, codec, workdir: Path) -> dict:
+    """Write and read the table in one codec and measure its error."""
+    name = codec or 'float32'
+    stored, quantize_seconds = (timed(quantize_frame, df, codec) if codec else (df, 0.0))
+
+    pickle_path = workdir / f"{name}.pkl"
+    parquet_path = workdir / f"{name}.parquet"
+    _, pickle_write = timed(stored.to_pickle, pickle_path)
+    _, parquet_write = timed(stored.to_parquet, parquet_path, index=False)
+    restored, pickle_read = timed(lambda: dequantize_frame(pd.read_pickle(pickle_path)))
+    from_parquet, parquet_read = timed(lambda: dequantize_frame(pd.read_parquet(parquet_path)))
+
+    columns = [c for c in df.columns if c != 'customer_id']
+    original = df[columns].to_numpy()
+    values = restored[columns].to_numpy()
+    errors = np.abs(values - original)
+    bounds = np.array([max_error(stored).get(c, 0.0) for c in columns])
+
+    with np.errstate(invalid='ignore'):
+        top = np.nanargmax(np.nan_to_num(original, nan=-1.0), axis=1)
+        restored_top = np.nanargmax(np.nan_to_num(values, nan=-1.0), axis=1)
+
+    return {
+        'codec': name,
+        'pickle_bytes': pickle_path.stat().st_size,
+        'parquet_bytes': parquet_path.stat().st_size,
+        'quantize_seconds': round(quantize_seconds, 4),
+        'pickle_write_seconds': round(pickle_write, 4),
+        'pickle_read_seconds': round(pickle_read, 4),
+        'parquet_write_seconds': round(parquet_write, 4),
+        'parquet_read_seconds': round(parquet_read, 4),
+        'max_abs_error': float(np.nanmax(errors)),
+        'mean_abs_error': float(np.nanmean(errors)),
+        'max_error_bound': float(bounds.max()),
+        'within_bound': bool((np.nan_to_num(errors) <= bounds).all()),
+        'nan_preserved': bool((np.isnan(values) == np.isnan(original)).all()),
+        'parquet_matches_pickle': bool(np.array_equal(
+            from_parquet[columns].to_numpy(), values, equal_nan=True
+        )),
+        'top_product_changed': float((top != restored_top).mean()),
+    }
+
+
+def main():
+    """Run the benchmark and print a JSON summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--product-types', type=int, default=50)
+    parser.add_argument('--missing', type=float, default=0.05,
+                        help='Fraction of customer x product type scores that are NaN')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    df = clustering_table(args.customers, args.product_types, args.missing, args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_quantization_") as tmp:
+        results = [run_codec(df, codec, Path(tmp)) for codec in (None,) + CODECS]
+
+    baseline = results[0]
+    float64_bytes = args.customers * args.product_types * 8
+    for result in results:
+        result['pickle_ratio'] = round(baseline['pickle_bytes'] / result['pickle_bytes'], 2)
+        result['parquet_ratio'] = round(baseline['parquet_bytes'] / result['parquet_bytes'], 2)
+        result['ratio_vs_float64_values'] = round(
+            float64_bytes / (result['pickle_bytes'] - args.customers * 8), 2
+        )
+
+    print(json.dumps({
+        'customers': args.customers,
+        'product_types': args.product_types,
+        'codecs': results,
+    }, indent=2))
+
+    if not all(r['within_bound'] and r['nan_preserved'] and r['parquet_matches_pickle']
+               for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark sequential vs concurrent loading of the pipelines' BigQuery inputs.
+
+Runs the training and scoring input queries through a ``BigQueryClient``
+backed by the offline fakes in ``fake_bigquery.py`` with simulated query and
+download latency. 'sequential' issues the queries one after another and reads
+each result over a single stream (the previous behaviour); 'concurrent' uses
+``execute_queries`` with parallel Storage API read streams. Reports wall time,
+the peak number of jobs and read streams in flight and whether both modes
+returned the same rows.
+
+Usage:
+    python benchmarks/bench_query_loading.py
+    python benchmarks/bench_query_loading.py --query-latency 2 --streams 8 --score-customers 500000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from config import Config
+from fake_bigquery import fake_bigquery_client
+from synthetic import SyntheticDataGenerator
+from Score.score import ProductRecommendationScorer
+from Train.training import ProductRecommendationTrainer
+from utils import setup_logging
+
+
+def build_tables(args: argparse.Namespace, config: Config) -> Dict[str, pd.DataFrame]:
+    """Generate the synthetic tables the pipelines query."""
+    generator = SyntheticDataGenerator(n_product_types=args.product_types, seed=args.seed)
+    return {
+        config.training.training_data_table: generator.training_data(args.train_customers),
+        config.scoring.scoring_data_table: generator.scoring_data(args.score_customers),
+        config.training.prod_types_table: generator.product_types(),
+    }
+
+
+def same_rows(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    """Row-order independent equality of two query results."""
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    key = list(a.columns)
+    a = a.sort_values(key, ignore_index=True)
+    b = b.sort_values(key, ignore_index=True)
+    return a.equals(b)
+
+
+def run_mode(
+    mode: str,
+    queries: Dict[str, str],
+    tables: Dict[str, pd.DataFrame],
+    args: argparse.Namespace
+) -> Dict[str, Any]:
+    """Load one query set in one mode."""
+    client = fake_bigquery_client(
+        tables,
+        query_latency=args.query_latency,
+        stream_latency=args.stream_latency,
+        seconds_per_million_rows=args.seconds_per_million_rows,
+        default_streams=args.streams,
+        max_read_streams=1 if mode == 'sequential' else args.streams
+    )
+
+    started = time.perf_counter()
+    if mode == 'sequential':
+        results = {name: client.execute_query(query) for name, query in queries.items()}
+    else:
+        results = client.execute_queries(queries)
+    seconds = time.perf_counter() - started
+
+    return {
+        'results': results,
+        'seconds': round(seconds, 4),
+        'rows': {name: len(df) for name, df in results.items()},
+        'peak_jobs_waiting': client.bq_client.jobs_waiting.peak,
+        'read_streams': client.bq_storage_client.streams_open.total,
+        'peak_read_streams': client.bq_storage_client.streams_open.peak,
+    }
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--train-customers', type=int, default=50_000)
+    parser.add_argument('--score-customers', type=int, default=200_000)
+    parser.add_argument('--product-types', type=int, default=10)
+    parser.add_argument('--query-latency', type=float, default=1.0,
+                        help='Simulated seconds each query job runs')
+    parser.add_argument('--stream-latency', type=float, default=0.1,
+                        help='Simulated fixed cost per download/read stream')
+    parser.add_argument('--seconds-per-million-rows', type=float, default=2.0,
+                        help='Simulated download cost per million rows per stream')
+    parser.add_argument('--streams', type=int, default=4, help='Read streams per result')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    setup_logging('WARNING')
+
+    config = Config()
+    config.training.training_limit = args.train_customers
+    config.training.prod_types_limit = args.product_types + 1
+    config.training.train_to_predict_limit = args.train_customers
+    tables = build_tables(args, config)
+
+    # The clients only build queries here; the fakes serve them
+    placeholder = fake_bigquery_client(tables)
+    query_sets = {
+        'training': ProductRecommendationTrainer(config, data_source=placeholder).training_queries(),
+        'scoring': ProductRecommendationScorer(config, data_source=placeholder).scoring_queries(),
+    }
+
+    report = {'params': {k: v for k, v in vars(args).items() if k != 'output'}}
+    parity = True
+    for pipeline, queries in query_sets.items():
+        sequential = run_mode('sequential', queries, tables, args)
+        concurrent = run_mode('concurrent', queries, tables, args)
+        matches = all(
+            same_rows(sequential['results'][name], concurrent['results'][name]) for name in queries
+        )
+        parity = parity and matches
+
+        report[pipeline] = {
+            'sequential': {k: v for k, v in sequential.items() if k != 'results'},
+            'concurrent': {k: v for k, v in concurrent.items() if k != 'results'},
+            'speedup': round(sequential['seconds'] / concurrent['seconds'], 2),
+            'parity': matches,
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+
+    if not parity:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark memory-budgeted chunking of the scoring imputation stage.
+
+Imputation is the scoring stage with the largest per-row footprint: it
+stacks every feature cell into one Series before coercing it. For each
+budget, a fresh process generates the synthetic scoring features, runs
+``ProductRecommendationScorer.prepare_features`` under a ``MemoryScheduler``
+with that budget, and reports the chunks used, the stage's wall time and the
+process's peak RSS growth over the data already loaded. The imputed features
+must be identical for every budget.
+
+Usage:
+    python benchmarks/bench_scheduler.py --customers 1000000 --budgets none 900M 600M 400M
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+
+def run_budget(customers: int, budget: str, seed: int) -> Dict[str, Any]:
+    """Impute the features under one budget (in this process) and measure it."""
+    from config import Config
+    from data_sources import LocalDataSource
+    from profiling import current_rss_bytes, peak_rss_bytes
+    from scheduler import parse_bytes
+    from synthetic import generate_features
+    from Score.score import ProductRecommendationScorer
+
+    config = Config()
+    config.processing.memory_budget_bytes = None if budget == 'none' else parse_bytes(budget)
+    scorer = ProductRecommendationScorer(config, data_source=LocalDataSource(tables={}))
+
+    df = generate_features(customers, np.random.default_rng(seed))
+    scorer.scheduler.set_shape(len(config.features.features), 1)
+
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    X = scorer.prepare_features(df)
+    seconds = time.perf_counter() - started
+
+    return {
+        'budget': budget,
+        'budget_bytes': config.processing.memory_budget_bytes,
+        'chunks': scorer.scheduler.summary()['chunks'].get('impute', 0),
+        'impute_seconds': round(seconds, 3),
+        'rss_before_bytes': rss_before,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'peak_growth_bytes': peak_rss_bytes() - rss_before,
+        'within_budget': (
+            config.processing.memory_budget_bytes is None
+            or peak_rss_bytes() <= config.processing.memory_budget_bytes
+        ),
+        'learned_bytes_per_row': round(scorer.scheduler.costs['impute'].bytes_per_row, 1),
+        'checksum': hashlib.sha256(np.ascontiguousarray(X.to_numpy()).tobytes()).hexdigest(),
+    }
+
+
+def main():
+    """Run each budget in a fresh process and print a JSON summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--budgets', nargs='+', default=['none', '900M', '600M', '400M'],
+                        help="Memory budgets ('none' = unlimited), e.g. 512M or 2G")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_budget(args.customers, args.worker, args.seed)))
+        return
+
+    results = []
+    for budget in args.budgets:
+        output = subprocess.run(
+            [sys.executable, __file__, '--customers', str(args.customers),
+             '--seed', str(args.seed), '--worker', budget],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    identical = len({r['checksum'] for r in results}) == 1
+    print(json.dumps({
+        'customers': args.customers,
+        'identical_features': identical,
+        'budgets': results,
+    }, indent=2))
+
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Measure import-time startup cost of the pipeline entry points.
+
+Imports each module in a fresh interpreter with ``python -X importtime`` and
+reports the median wall time, the module's own cumulative import time, and
+the cumulative time of heavy third-party packages that got pulled in. Heavy
+packages that the entry points are expected to load lazily (Google clients,
+XGBoost, scikit-learn) are flagged when they appear at import time.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --compare benchmarks/results/startup_<baseline>.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from results import RESULTS_DIR, compare, git_revision
+
+MODULE_DIR = Path(__file__).parent.parent
+
+MODULES = ['config', 'utils', 'data_sources', 'Score.score', 'Train.training', 'tuning']
+
+# Packages reported individually; LAZY ones must not load on import
+HEAVY_PACKAGES = ['pandas', 'numpy', 'pyarrow', 'google.cloud.bigquery',
+                  'google.cloud.bigquery_storage', 'xgboost', 'sklearn']
+LAZY_PACKAGES = ['google.cloud.bigquery', 'google.cloud.bigquery_storage', 'xgboost', 'sklearn']
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """
+    Parse ``-X importtime`` output.
+
+    Returns:
+        Module name -> cumulative import time in microseconds
+    """
+    cumulative = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative
+
+
+def measure_module(module: str, repeats: int) -> Dict[str, Any]:
+    """Import a module ``repeats`` times in fresh interpreters."""
+    env = dict(os.environ, PYTHONPATH=str(MODULE_DIR))
+    walls: List[float] = []
+    selfs: List[int] = []
+    heavy: Dict[str, List[int]] = {}
+
+    for _ in range(repeats):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=MODULE_DIR, env=env, capture_output=True, text=True
+        )
+        walls.append(time.perf_counter() - started)
+        if proc.returncode != 0:
+            return {'error': proc.stderr.strip().splitlines()[-1]}
+
+        cumulative = parse_importtime(proc.stderr)
+        selfs.append(cumulative.get(module, 0))
+        for package in HEAVY_PACKAGES:
+            if package in cumulative:
+                heavy.setdefault(package, []).append(cumulative[package])
+
+    return {
+        'wall_seconds': round(statistics.median(walls), 4),
+        'import_seconds': round(statistics.median(selfs) / 1e6, 4),
+        'heavy_imports': {
+            package: round(statistics.median(times) / 1e6, 4) for package, times in heavy.items()
+        },
+        'eager_lazy_imports': [p for p in LAZY_PACKAGES if p in heavy],
+    }
+
+
+def main():
+    """Run the startup benchmark, store the result and optionally compare."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--label', help='Results file prefix (default: commit hash)')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', help='Baseline result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.20,
+                        help='Relative slowdown flagged as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Ignore modules faster than this in the baseline')
+    args = parser.parse_args()
+
+    modules = {module: measure_module(module, args.repeats) for module in args.modules}
+    result = {
+        **git_revision(),
+        'python': sys.version.split()[0],
+        'repeats': args.repeats,
+        'modules': modules,
+        'results': {
+            'startup': {m: r['wall_seconds'] for m, r in modules.items() if 'error' not in r},
+        },
+    }
+
+    if not args.no_save:
+        path = RESULTS_DIR / f"startup_{args.label or result['commit']}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        result['saved_to'] = str(path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        result['comparison'] = compare(result, baseline, args.threshold, args.min_seconds)
+
+    print(json.dumps(result, indent=2))
+
+    eager = any(r.get('eager_lazy_imports') for r in modules.values())
+    regressed = any(row['regression'] for row in result.get('comparison', []))
+    if eager or regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Shared helpers for storing and comparing benchmark results across commits."""
+
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def git_revision() -> Dict[str, Any]:
+    """Return the current commit hash and whether the tree has local changes."""
+    repo = Path(__file__).parent
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=repo,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo,
+            capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': 'unknown', 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def compare(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float,
+    min_seconds: float
+) -> List[Dict[str, Any]]:
+    """
+    Compare stage timings against a baseline result.
+
+    Args:
+        current: Result from this run
+        baseline: Previously stored result
+        threshold: Relative slowdown that counts as a regression (0.1 = 10%)
+        min_seconds: Stages faster than this in the baseline are ignored as noise
+
+    Returns:
+        One entry per compared stage, with a ``regression`` flag
+    """
+    rows = []
+    for pipeline, stages in current['results'].items():
+        for stage, seconds in stages.items():
+            before = baseline.get('results', {}).get(pipeline, {}).get(stage)
+            if before is None:
+                continue
+            ratio = seconds / before if before > 0 else float('inf')
+            rows.append({
+                'stage': f"{pipeline}.{stage}",
+                'baseline_seconds': before,
+                'current_seconds': seconds,
+                'ratio': round(ratio, 3),
+                'regression': before >= min_seconds and ratio > 1 + threshold,
+            })
+    return rows
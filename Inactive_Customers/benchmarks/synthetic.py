@@ -0,0 +1,221 @@
+"""
+Synthetic data generators for the Inactive_Customers pipelines.
+
+Produces tables shaped like ``reengagement_product_recommendation_training``,
+``reengagement_product_recommendation_scoring`` and ``shopping_prod`` at a
+configurable scale. Features follow rough real-world ranges (deciles,
+recency in days, basket averages, demographic percentages) with missing
+values, and product-type labels depend on the features through a random
+multinomial-logit model so the per-product classifiers have signal to learn.
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import FeatureConfig
+
+
+# Feature name -> (distribution, parameters, missing rate)
+FEATURE_SPECS: Dict[str, Tuple[str, tuple, float]] = {
+    'BBB_INSTORE_M_DECILE_2Y': ('integers', (1, 11), 0.05),
+    'A_AAP000447N_ASET_PRPN_DIS_INC': ('uniform', (0.0, 100.0), 0.10),
+    'time_interval': ('integers', (180, 1500), 0.0),
+    'PH_DM_RECENCY': ('integers', (0, 365), 0.20),
+    'AVG_NET_SALES_PER_TXN': ('lognormal', (4.0, 0.7), 0.02),
+    'COUPON_SALES_Q_08': ('uniform', (0.0, 1.0), 0.15),
+    'A_A3101N_RACE_WHITE': ('uniform', (0.0, 100.0), 0.10),
+    'BBB_R_2Y': ('integers', (0, 720), 0.05),
+    'MOVER': ('integers', (0, 2), 0.30),
+    'NUM_MERCH_DIVISIONS': ('poisson', (3.0,), 0.02),
+    'AVG_TOTAL_ITEMS_PER_TXN': ('lognormal', (1.0, 0.5), 0.02),
+    'A_A8588N_HM_SQR_FT': ('uniform', (800.0, 5000.0), 0.10),
+    'PH_MREDEEM730D_PERC': ('uniform', (0.0, 1.0), 0.25),
+}
+
+
+def generate_features(
+    n_rows: int,
+    rng: np.random.Generator,
+    missing: bool = True
+) -> pd.DataFrame:
+    """
+    Generate the 13 model features.
+
+    Args:
+        n_rows: Number of rows
+        rng: Random generator
+        missing: Whether to inject missing values at each feature's rate
+
+    Returns:
+        DataFrame with one float64 column per ``FeatureConfig.features`` entry
+    """
+    columns = {}
+    for name in FeatureConfig().features:
+        kind, params, missing_rate = FEATURE_SPECS[name]
+        values = getattr(rng, kind)(*params, size=n_rows).astype(np.float64)
+        if missing and missing_rate > 0:
+            values[rng.random(n_rows) < missing_rate] = np.nan
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+class SyntheticDataGenerator:
+    """
+    Generates training, scoring and product-type tables.
+
+    Product types have Zipf-like popularity and a random linear preference
+    over the standardized features; each purchase's product type is drawn
+    with the Gumbel-max trick, in row chunks so memory stays bounded at any
+    scale.
+    """
+
+    def __init__(
+        self,
+        n_product_types: int = 10,
+        seed: int = 42,
+        first_prod_type_id: int = 100,
+        chunk_size: int = 20_000
+    ):
+        """
+        Initialize the generator.
+
+        Args:
+            n_product_types: Number of product types to draw labels from
+            seed: Random seed
+            first_prod_type_id: ID of the first product type
+            chunk_size: Rows generated per chunk
+        """
+        self.n_product_types = n_product_types
+        self.rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.product_ids = np.arange(
+            first_prod_type_id, first_prod_type_id + n_product_types, dtype=np.int64
+        )
+
+        n_features = len(FeatureConfig().features)
+        self.weights = self.rng.normal(scale=0.8, size=(n_features, n_product_types))
+        popularity = 1.0 / np.arange(1, n_product_types + 1) ** 0.8
+        self.intercepts = np.log(popularity / popularity.sum())
+
+    def product_types(self) -> pd.DataFrame:
+        """
+        Generate the product types table.
+
+        The pipelines drop the first row of this table, so a placeholder row
+        is prepended.
+
+        Returns:
+            DataFrame with a pdm_prod_type_id column
+        """
+        return pd.DataFrame({'pdm_prod_type_id': np.r_[0, self.product_ids]})
+
+    def _labels(self, features: pd.DataFrame) -> np.ndarray:
+        """Draw a product type per row from the feature-dependent logits."""
+        values = features.values
+        z = (values - np.nanmean(values, axis=0)) / (np.nanstd(values, axis=0) + 1e-9)
+        logits = np.nan_to_num(z) @ self.weights + self.intercepts
+        gumbel = -np.log(-np.log(self.rng.random(logits.shape)))
+        return self.product_ids[np.argmax(logits + gumbel, axis=1)]
+
+    def iter_training_chunks(
+        self,
+        n_customers: int,
+        purchases_per_customer: int = 1
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Generate the training table in chunks.
+
+        Args:
+            n_customers: Number of reactivated customers
+            purchases_per_customer: Labelled rows per customer
+
+        Yields:
+            Chunks with customer_id, the features and pdm_prod_type_id
+        """
+        for start in range(0, n_customers, self.chunk_size):
+            n = min(self.chunk_size, n_customers - start)
+            features = generate_features(n, self.rng)
+            customer_ids = np.arange(start, start + n, dtype=np.int64) + 1
+
+            for _ in range(purchases_per_customer):
+                chunk = features.copy()
+                chunk.insert(0, 'customer_id', customer_ids)
+                chunk['pdm_prod_type_id'] = self._labels(features)
+                yield chunk
+
+    def iter_scoring_chunks(self, n_customers: int) -> Iterator[pd.DataFrame]:
+        """
+        Generate the scoring table in chunks.
+
+        Args:
+            n_customers: Number of at-risk/lapsed customers
+
+        Yields:
+            Chunks with customer_id and the features
+        """
+        for start in range(0, n_customers, self.chunk_size):
+            n = min(self.chunk_size, n_customers - start)
+            chunk = generate_features(n, self.rng)
+            chunk.insert(0, 'customer_id', np.arange(start, start + n, dtype=np.int64) + 10**9)
+            yield chunk
+
+    def training_data(self, n_customers: int, purchases_per_customer: int = 1) -> pd.DataFrame:
+        """Generate the full training table in memory."""
+        return pd.concat(
+            self.iter_training_chunks(n_customers, purchases_per_customer),
+            ignore_index=True
+        )
+
+    def scoring_data(self, n_customers: int) -> pd.DataFrame:
+        """Generate the full scoring table in memory."""
+        return pd.concat(self.iter_scoring_chunks(n_customers), ignore_index=True)
+
+    def write_parquet(
+        self,
+        directory: str,
+        n_train_customers: int,
+        n_score_customers: int,
+        purchases_per_customer: int = 1,
+        training_table: str = "reengagement_product_recommendation_training",
+        scoring_table: str = "reengagement_product_recommendation_scoring",
+        prod_types_table: str = "shopping_prod"
+    ) -> None:
+        """
+        Write all three tables as Parquet, streaming chunks to disk.
+
+        Args:
+            directory: Output directory; tables are written as <table>.parquet
+            n_train_customers: Training table size
+            n_score_customers: Scoring table size
+            purchases_per_customer: Labelled training rows per customer
+            training_table: Training table name
+            scoring_table: Scoring table name
+            prod_types_table: Product types table name
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        out = Path(directory)
+        out.mkdir(parents=True, exist_ok=True)
+
+        for table, chunks in (
+            (training_table, self.iter_training_chunks(n_train_customers, purchases_per_customer)),
+            (scoring_table, self.iter_scoring_chunks(n_score_customers)),
+        ):
+            writer: Optional[pq.ParquetWriter] = None
+            for chunk in chunks:
+                batch = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out / f"{table}.parquet", batch.schema)
+                writer.write_table(batch)
+            if writer is not None:
+                writer.close()
+
+        self.product_types().to_parquet(out / f"{prod_types_table}.parquet", index=False)
@@ -0,0 +1,239 @@
+"""
+Out-of-fold probability calibration of the per-product-type boosters.
+
+A calibration map fit on the booster's own training rows learns from
+in-sample scores, which are overconfident. Here the rows are split into K
+stratified folds. Each fold model is fit on the other K - 1 folds and scores
+its held-out fold, so every row gets an out-of-fold probability. The isotonic
+(or sigmoid) map is fit on those probabilities.
+
+With ``ensemble=True`` (the training default) the K calibrated fold models
+are kept and averaged, so the fold fits are reused and there is no final fit:
+K fits on (K - 1) / K of the rows, about K - 1 times the CPU of a single fit.
+Without it a final model is fit on all rows as well (K + 1 fits, about K
+times the CPU). The fits are independent and run together on a
+thread pool (XGBoost releases the GIL while fitting), with the XGBoost
+threads given to this product type split between them. That only spreads
+the same CPU work over more cores: when the cores are already busy, e.g.
+with several product types training in parallel, wall time grows by about
+the same factor.
+
+``OutOfFoldCalibratedClassifier`` exposes ``calibrated_classifiers_``
+members with ``estimator`` and ``calibrators`` like scikit-learn's
+``CalibratedClassifierCV``, so the compiled and concurrent scorers read it
+unchanged.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils import logger
+
+METHODS = ('isotonic', 'sigmoid')
+
+# fit(rows, n_jobs) -> fitted classifier; rows=None means all rows
+FitFunction = Callable[[Optional[np.ndarray], Optional[int]], Any]
+
+
+class SigmoidCalibration:
+    """Platt scaling: ``p' = 1 / (1 + exp(a * p + b))``."""
+
+    def fit(self, p: np.ndarray, y: np.ndarray) -> 'SigmoidCalibration':
+        """Fit ``a_`` and ``b_`` by logistic regression of y on p."""
+        from sklearn.linear_model import LogisticRegression
+
+        regression = LogisticRegression(C=1e6).fit(np.asarray(p).reshape(-1, 1), y)
+        self.a_ = -float(regression.coef_[0, 0])
+        self.b_ = -float(regression.intercept_[0])
+        return self
+
+    def predict(self, p: np.ndarray) -> np.ndarray:
+        """Calibrated probabilities."""
+        return 1.0 / (1.0 + np.exp(self.a_ * np.asarray(p) + self.b_))
+
+
+def fit_calibrator(method: str, p: np.ndarray, y: np.ndarray) -> Any:
+    """
+    Fit a calibration map from probabilities to outcomes.
+
+    Args:
+        method: 'isotonic' or 'sigmoid'
+        p: Uncalibrated positive-class probabilities
+        y: Binary outcomes
+
+    Returns:
+        Fitted IsotonicRegression or SigmoidCalibration
+
+    Raises:
+        ValueError: If the method is unknown
+    """
+    if method == 'isotonic':
+        from sklearn.isotonic import IsotonicRegression
+
+        return IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(p, y)
+    if method == 'sigmoid':
+        return SigmoidCalibration().fit(p, y)
+    raise ValueError(f"Unknown calibration method {method!r}; expected one of {METHODS}")
+
+
+class CalibratedMember:
+    """One booster with its calibration map."""
+
+    def __init__(self, estimator: Any, calibrator: Any):
+        """
+        Initialize the member.
+
+        Args:
+            estimator: Fitted binary classifier with predict_proba
+            calibrator: Fitted calibration map (see ``fit_calibrator``)
+        """
+        self.estimator = estimator
+        self.calibrators = [calibrator]
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        """Calibrated (n, 2) class probabilities."""
+        p = self.estimator.predict_proba(X)[:, 1]
+        calibrated = np.clip(self.calibrators[0].predict(p), 0.0, 1.0)
+        return np.column_stack([1.0 - calibrated, calibrated])
+
+
+class OutOfFoldCalibratedClassifier:
+    """Booster(s) calibrated on out-of-fold predictions."""
+
+    def __init__(
+        self,
+        members: List[CalibratedMember],
+        method: str,
+        n_folds: int,
+        diagnostics: Optional[Dict[str, float]] = None
+    ):
+        """
+        Initialize the classifier.
+
+        Args:
+            members: The final booster, or the fold boosters, with their map
+            method: Calibration method
+            n_folds: Folds the map was fit on (0 = in-sample fallback)
+            diagnostics: Out-of-fold Brier scores before and after calibration
+        """
+        self.calibrated_classifiers_ = members
+        self.classes_ = np.array([0, 1])
+        self.method = method
+        self.n_folds = n_folds
+        self.diagnostics = diagnostics or {}
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        """Class probabilities averaged over the members."""
+        proba = self.calibrated_classifiers_[0].predict_proba(X)
+        for member in self.calibrated_classifiers_[1:]:
+            proba = proba + member.predict_proba(X)
+        return proba / len(self.calibrated_classifiers_)
+
+    def predict(self, X: Any) -> np.ndarray:
+        """Most likely class."""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def base_estimator(model: Any) -> Any:
+    """The (first) booster of a calibrated model, or the model itself."""
+    if hasattr(model, 'calibrated_classifiers_'):
+        return model.calibrated_classifiers_[0].estimator
+    return model
+
+
+def fold_count(y: np.ndarray, n_folds: int) -> int:
+    """Folds usable for stratified splitting: at most the rarer class's count."""
+    positives = int(np.count_nonzero(y))
+    return min(n_folds, positives, len(y) - positives)
+
+
+def calibrate_out_of_fold(
+    fit: FitFunction,
+    X: Any,
+    y: Any,
+    n_folds: int = 5,
+    method: str = 'isotonic',
+    ensemble: bool = False,
+    max_parallel: Optional[int] = None,
+    n_threads: Optional[int] = None,
+    random_state: int = 42
+) -> OutOfFoldCalibratedClassifier:
+    """
+    Fit fold models in parallel and calibrate on their out-of-fold predictions.
+
+    Args:
+        fit: Fits a classifier on a row subset with a given XGBoost thread
+            count; with rows=None it fits the final model on all rows
+        X: Feature matrix (DataFrame or array)
+        y: Binary target
+        n_folds: Number of folds K (reduced if a class has fewer rows)
+        method: 'isotonic' or 'sigmoid'
+        ensemble: Keep the K calibrated fold models instead of a final model
+        max_parallel: Fits run at once (None = all of them)
+        n_threads: XGBoost threads shared by the parallel fits
+            (None = CPU count)
+        random_state: Seed of the fold assignment
+
+    Returns:
+        Calibrated classifier. With fewer than two usable folds the map is
+        fit in-sample on the final model, with a warning. Its diagnostics
+        hold the out-of-fold Brier score before and after calibration; the
+        latter is cross-fit (each fold's scores are mapped by a calibrator
+        fit on the other folds' scores), so the two are comparable.
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    y = np.asarray(y).astype(np.int8)
+    k = fold_count(y, n_folds)
+
+    if k < 2:
+        logger.warning(
+            f"Only {int(y.sum())} positive rows: calibrating in-sample instead of on {n_folds} folds"
+        )
+        model = fit(None, n_threads)
+        calibrator = fit_calibrator(method, model.predict_proba(X)[:, 1], y)
+        return OutOfFoldCalibratedClassifier([CalibratedMember(model, calibrator)], method, 0)
+
+    folds = list(StratifiedKFold(n_splits=k, shuffle=True, random_state=random_state).split(
+        np.zeros(len(y)), y
+    ))
+    jobs: List[Optional[int]] = list(range(k)) + ([] if ensemble else [None])
+    threads = n_threads or os.cpu_count() or 1
+    # More fits at once than threads would only oversubscribe the cores
+    workers = min(len(jobs), max_parallel or len(jobs), threads)
+    job_threads = max(1, threads // workers)
+
+    def run(job: Optional[int]) -> Any:
+        rows = None if job is None else folds[job][0]
+        return fit(rows, job_threads)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        models = list(pool.map(run, jobs))
+
+    oof = np.empty(len(y), dtype=np.float64)
+    for fold, (_, held_out) in enumerate(folds):
+        oof[held_out] = models[fold].predict_proba(_take(X, held_out))[:, 1]
+    calibrator = fit_calibrator(method, oof, y)
+
+    # Cross-fit the map for the diagnostics: scoring it on the scores it was
+    # fit on would flatter it
+    calibrated = np.empty(len(y), dtype=np.float64)
+    for fit_rows, held_out in folds:
+        fold_calibrator = fit_calibrator(method, oof[fit_rows], y[fit_rows])
+        calibrated[held_out] = np.clip(fold_calibrator.predict(oof[held_out]), 0.0, 1.0)
+    diagnostics = {
+        'oof_brier_raw': float(np.mean((oof - y) ** 2)),
+        'oof_brier_calibrated': float(np.mean((calibrated - y) ** 2)),
+    }
+
+    final_models = models[:k] if ensemble else models[k:]
+    members = [CalibratedMember(model, calibrator) for model in final_models]
+    return OutOfFoldCalibratedClassifier(members, method, k, diagnostics)
+
+
+def _take(X: Any, rows: np.ndarray) -> Any:
+    """Rows of a DataFrame or array by position."""
+    return X.iloc[rows] if hasattr(X, 'iloc') else X[rows]
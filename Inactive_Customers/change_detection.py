@@ -0,0 +1,157 @@
+"""
+Change detection for incremental retraining.
+
+Every product type's training slice is summarised by a fingerprint: the row
+count, the positive label count and the mean/std of each feature over the
+positive rows. Comparing a fresh fingerprint against the one stored in the
+model manifest (counts, feature set, and each feature's mean and spread)
+tells whether the product type's model is stale.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from manifest import ModelManifest
+from utils import logger
+
+
+def compute_fingerprints(
+    X: pd.DataFrame,
+    labels: pd.Series,
+    product_ids: List[int]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Fingerprint the training slice of every product type in one pass.
+
+    Args:
+        X: Imputed feature matrix used for training
+        labels: Product type ID of each training row
+        product_ids: Product types to fingerprint
+
+    Returns:
+        Product type ID to fingerprint dict
+    """
+    labels = pd.Series(np.asarray(labels), index=X.index)
+    grouped = X.groupby(labels)
+    counts = grouped.size()
+    means = grouped.mean()
+    stds = grouped.std(ddof=0)
+    overall_std = X.std(ddof=0)
+
+    fingerprints = {}
+    for prod_id in product_ids:
+        prod_id = int(prod_id)
+        if prod_id in counts.index:
+            feature_mean = means.loc[prod_id]
+            feature_std = stds.loc[prod_id]
+            n_positive = int(counts.loc[prod_id])
+        else:
+            feature_mean = pd.Series(0.0, index=X.columns)
+            feature_std = pd.Series(0.0, index=X.columns)
+            n_positive = 0
+
+        fingerprints[prod_id] = {
+            'n_rows': int(len(X)),
+            'n_positive': n_positive,
+            'feature_mean': {c: float(v) for c, v in feature_mean.items()},
+            'feature_std': {c: float(v) for c, v in feature_std.items()},
+            'overall_std': {c: float(v) for c, v in overall_std.items()},
+        }
+
+    return fingerprints
+
+
+class ChangeDetector:
+    """Decides which product types need retraining."""
+
+    def __init__(self, count_tolerance: float, mean_tolerance: float, std_tolerance: float):
+        """
+        Initialize the detector.
+
+        Args:
+            count_tolerance: Maximum relative change in row or positive counts
+            mean_tolerance: Maximum shift of a positive-row feature mean,
+                in units of that feature's overall standard deviation
+            std_tolerance: Maximum relative change of a positive-row feature
+                std (the larger over the smaller std, minus one)
+        """
+        self.count_tolerance = count_tolerance
+        self.mean_tolerance = mean_tolerance
+        self.std_tolerance = std_tolerance
+
+    def drift_reason(
+        self,
+        current: Dict[str, Any],
+        previous: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """
+        Compare two fingerprints.
+
+        Args:
+            current: Fingerprint of the new training slice
+            previous: Fingerprint stored in the manifest, if any
+
+        Returns:
+            Human-readable reason for retraining, or None if unchanged
+        """
+        if previous is None:
+            return "new product type"
+
+        for key in ('n_rows', 'n_positive'):
+            before, after = previous[key], current[key]
+            if abs(after - before) > self.count_tolerance * max(before, 1):
+                return f"{key} changed {before} -> {after}"
+
+        added = sorted(set(current['feature_mean']) - set(previous['feature_mean']))
+        removed = sorted(set(previous['feature_mean']) - set(current['feature_mean']))
+        if added or removed:
+            return f"features changed (added {added}, removed {removed})"
+
+        for feature, mean in current['feature_mean'].items():
+            scale = current['overall_std'].get(feature) or 1.0
+            shift = abs(mean - previous['feature_mean'][feature]) / scale
+            if shift > self.mean_tolerance:
+                return f"{feature} mean shifted {shift:.3f} std"
+
+            before, after = previous['feature_std'][feature], current['feature_std'][feature]
+            low, high = sorted((before, after))
+            if high > 0 and (low == 0 or high / low - 1 > self.std_tolerance):
+                return f"{feature} std changed {before:.4g} -> {after:.4g}"
+
+        return None
+
+    def select(
+        self,
+        fingerprints: Dict[int, Dict[str, Any]],
+        manifest: ModelManifest,
+        model_exists: Dict[int, bool]
+    ) -> Dict[int, str]:
+        """
+        Select the product types to retrain.
+
+        Args:
+            fingerprints: Fresh fingerprints by product type ID
+            manifest: Manifest of the previous run
+            model_exists: Whether a model file is present, by product type ID
+
+        Returns:
+            Product type ID to retraining reason, for drifted or new products only
+        """
+        selected = {}
+        for prod_id, fingerprint in fingerprints.items():
+            entry = manifest.get(prod_id)
+            if not model_exists.get(prod_id, False):
+                reason = "model file missing"
+            else:
+                reason = self.drift_reason(fingerprint, entry and entry.get('fingerprint'))
+
+            if reason is not None:
+                selected[prod_id] = reason
+
+        logger.info(
+            f"Change detection: {len(selected)} of {len(fingerprints)} "
+            f"product types need retraining"
+        )
+        return selected
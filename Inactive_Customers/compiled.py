@@ -0,0 +1,399 @@
+"""
+Flat NumPy predictor compiled from the per-product-type models.
+
+All boosters are exported into one set of arrays so that every product type
+can be scored for a chunk of customers with a handful of vectorized gathers,
+instead of one ``predict_proba`` call per model. Each tree is padded to a
+complete binary tree of the forest's depth and stored level by level, so the
+walk needs no child pointers: from position ``i`` a row moves to ``2i + 1``
+(left) or ``2i + 2`` (right). Isotonic or sigmoid calibration maps of
+``CalibratedClassifierCV`` models are compiled alongside.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import logger
+
+
+Calibration = Optional[Tuple[str, np.ndarray, np.ndarray]]
+
+
+def _unwrap_model(model: Any) -> List[Tuple[Any, Calibration]]:
+    """
+    Split a fitted model into (booster, calibrator) members.
+
+    Args:
+        model: XGBClassifier or CalibratedClassifierCV wrapping XGBClassifiers
+
+    Returns:
+        One (booster, calibrator) pair per ensemble member; the calibrator is
+        ('isotonic', x_thresholds, y_thresholds), ('sigmoid', [a], [b]) or None
+    """
+    if hasattr(model, 'calibrated_classifiers_'):
+        members = []
+        for calibrated in model.calibrated_classifiers_:
+            calibrator = calibrated.calibrators[0]
+            if hasattr(calibrator, 'X_thresholds_'):
+                spec = ('isotonic', calibrator.X_thresholds_, calibrator.y_thresholds_)
+            else:
+                spec = ('sigmoid', np.array([calibrator.a_]), np.array([calibrator.b_]))
+            members.append((calibrated.estimator.get_booster(), spec))
+        return members
+
+    return [(model.get_booster(), None)]
+
+
+def _parse_booster(
+    booster: Any,
+    feature_index: Dict[str, int]
+) -> Tuple[float, List[Dict[str, np.ndarray]]]:
+    """
+    Read the trees of a booster from its JSON model.
+
+    Args:
+        booster: Fitted XGBoost booster
+        feature_index: Feature name to column position at prediction time
+
+    Returns:
+        Base margin and one dict of node arrays per tree
+    """
+    learner = json.loads(booster.save_raw('json'))['learner']
+
+    base_score = float(learner['learner_model_param']['base_score'])
+    if learner['objective']['name'] in ('binary:logistic', 'reg:logistic'):
+        base_score = float(np.log(base_score / (1.0 - base_score)))
+
+    # Boosters fit on arrays have no names; their columns are already in order
+    names = booster.feature_names
+    remap = np.array(
+        [feature_index[n] for n in names] if names else list(range(len(feature_index))),
+        dtype=np.int32
+    )
+
+    trees = []
+    for tree in learner['gradient_booster']['model']['trees']:
+        trees.append({
+            'left': np.array(tree['left_children'], dtype=np.int32),
+            'right': np.array(tree['right_children'], dtype=np.int32),
+            'feature': remap[np.array(tree['split_indices'], dtype=np.int32)],
+            # Leaves keep their value in split_conditions
+            'condition': np.array(tree['split_conditions'], dtype=np.float32),
+            'default_left': np.array(tree['default_left'], dtype=bool),
+        })
+
+    return base_score, trees
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Depth of the deepest leaf of one tree."""
+    depth = 0
+    frontier = np.array([0])
+    while True:
+        frontier = frontier[left[frontier] >= 0]
+        if len(frontier) == 0:
+            return depth
+        frontier = np.concatenate([left[frontier], right[frontier]])
+        depth += 1
+
+
+def _pad_tree(tree: Dict[str, np.ndarray], depth: int) -> Tuple[np.ndarray, ...]:
+    """
+    Lay one tree out as a complete binary tree of the given depth.
+
+    Leaves above the bottom level become pass-through splits (threshold +inf,
+    so every row goes left) whose subtree leaves all carry the leaf value.
+
+    Returns:
+        (feature, threshold, default_left) of length 2**depth - 1 and the
+        2**depth bottom-level leaf values
+    """
+    n_internal = 2 ** depth - 1
+    feature = np.zeros(n_internal, dtype=np.int32)
+    threshold = np.full(n_internal, np.inf, dtype=np.float32)
+    default_left = np.ones(n_internal, dtype=bool)
+
+    source = np.array([0], dtype=np.int32)
+    for level in range(depth):
+        start = 2 ** level - 1
+        is_split = tree['left'][source] >= 0
+        slots = start + np.flatnonzero(is_split)
+        feature[slots] = tree['feature'][source[is_split]]
+        threshold[slots] = tree['condition'][source[is_split]]
+        default_left[slots] = tree['default_left'][source[is_split]]
+
+        # A leaf is its own left and right child in the padded layout
+        left = np.where(is_split, tree['left'][source], source)
+        right = np.where(is_split, tree['right'][source], source)
+        source = np.stack([left, right], axis=1).ravel()
+
+    return feature, threshold, default_left, tree['condition'][source]
+
+
+class CompiledForest:
+    """
+    Vectorized evaluator over the trees of many product-type models.
+
+    Trees are grouped by ensemble member (one booster and its calibrator) and
+    members by output column; margins and calibrated probabilities are reduced
+    with ``np.add.reduceat``.
+    """
+
+    def __init__(
+        self,
+        product_ids: np.ndarray,
+        feature_names: List[str],
+        depth: int,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        default_left: np.ndarray,
+        leaf_value: np.ndarray,
+        tree_group: np.ndarray,
+        group_output: np.ndarray,
+        group_base: np.ndarray,
+        group_calibration: List[Calibration]
+    ):
+        """
+        Initialize from flat arrays; use ``from_models`` or ``load`` instead.
+
+        Args:
+            product_ids: Product type ID of each output column
+            feature_names: Feature column order expected at prediction time
+            depth: Depth of the padded trees
+            feature: (n_trees, 2**depth - 1) split feature positions
+            threshold: (n_trees, 2**depth - 1) split thresholds
+            default_left: (n_trees, 2**depth - 1) direction of missing values
+            leaf_value: (n_trees, 2**depth) bottom-level leaf values
+            tree_group: Ensemble member of each tree, sorted
+            group_output: Output column of each member, sorted
+            group_base: Base margin of each member
+            group_calibration: Calibration map of each member, if any
+        """
+        self.product_ids = product_ids
+        self.feature_names = feature_names
+        self.depth = depth
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.tree_group = tree_group
+        self.group_output = group_output
+        self.group_base = group_base
+        self.group_calibration = group_calibration
+
+        n_internal = 2 ** depth - 1
+        self._internal_offset = np.arange(self.n_trees, dtype=np.int64) * n_internal
+        self._leaf_offset = np.arange(self.n_trees, dtype=np.int64) * (n_internal + 1)
+        self._tree_starts = np.flatnonzero(np.r_[True, np.diff(tree_group) != 0])
+        self._group_starts = np.flatnonzero(np.r_[True, np.diff(group_output) != 0])
+        self._group_counts = np.diff(np.r_[self._group_starts, len(group_output)])
+
+    @property
+    def n_trees(self) -> int:
+        """Total number of compiled trees."""
+        return len(self.tree_group)
+
+    @classmethod
+    def from_models(
+        cls,
+        models: Dict[int, Any],
+        feature_names: Sequence[str]
+    ) -> 'CompiledForest':
+        """
+        Compile fitted product-type models.
+
+        Args:
+            models: Product type ID to fitted model
+            feature_names: Feature column order expected at prediction time
+
+        Returns:
+            Compiled forest scoring one output column per product type
+        """
+        feature_index = {name: i for i, name in enumerate(feature_names)}
+        trees, tree_group = [], []
+        group_output, group_base, group_calibration = [], [], []
+
+        product_ids = sorted(int(p) for p in models)
+        for output, prod_id in enumerate(product_ids):
+            for booster, calibration in _unwrap_model(models[prod_id]):
+                base_margin, member_trees = _parse_booster(booster, feature_index)
+                tree_group.extend([len(group_output)] * len(member_trees))
+                trees.extend(member_trees)
+                group_output.append(output)
+                group_base.append(base_margin)
+                group_calibration.append(calibration)
+
+        depth = max((_tree_depth(t['left'], t['right']) for t in trees), default=0)
+        padded = [_pad_tree(t, depth) for t in trees]
+
+        forest = cls(
+            product_ids=np.array(product_ids, dtype=np.int64),
+            feature_names=list(feature_names),
+            depth=depth,
+            feature=np.stack([p[0] for p in padded]),
+            threshold=np.stack([p[1] for p in padded]),
+            default_left=np.stack([p[2] for p in padded]),
+            leaf_value=np.stack([p[3] for p in padded]),
+            tree_group=np.array(tree_group, dtype=np.int32),
+            group_output=np.array(group_output, dtype=np.int32),
+            group_base=np.array(group_base, dtype=np.float32),
+            group_calibration=group_calibration
+        )
+
+        logger.info(
+            f"Compiled {forest.n_trees} trees for {len(product_ids)} product types "
+            f"(depth {depth})"
+        )
+        return forest
+
+    def _calibrate(self, prob: np.ndarray) -> np.ndarray:
+        """Apply each member's calibration map column by column."""
+        for group, spec in enumerate(self.group_calibration):
+            if spec is None:
+                continue
+            kind, a, b = spec
+            if kind == 'isotonic':
+                prob[:, group] = np.interp(prob[:, group], a, b)
+            else:
+                prob[:, group] = 1.0 / (1.0 + np.exp(a[0] * prob[:, group] + b[0]))
+        return prob
+
+    def predict(self, X: Any, chunk_size: Optional[int] = None) -> np.ndarray:
+        """
+        Score every product type for a batch of customers.
+
+        Args:
+            X: Feature matrix with columns in ``feature_names`` order
+            chunk_size: Rows evaluated at once; defaults to keeping the
+                (rows x trees) working arrays around four million entries
+
+        Returns:
+            float32 array of shape (n_rows, n_product_types), columns ordered
+            like ``product_ids``
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_names].values
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        if chunk_size is None:
+            chunk_size = max(1, 4_000_000 // max(self.n_trees, 1))
+
+        feature = self.feature.ravel()
+        threshold = self.threshold.ravel()
+        default_left = self.default_left.ravel()
+        leaf_value = self.leaf_value.ravel()
+        n_features = X.shape[1]
+        output = np.empty((len(X), len(self.product_ids)), dtype=np.float32)
+
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start:start + chunk_size]
+            flat_chunk = chunk.ravel()
+            row_offset = (np.arange(len(chunk), dtype=np.int64) * n_features)[:, None]
+            has_missing = bool(np.isnan(chunk).any())
+
+            position = np.zeros((len(chunk), self.n_trees), dtype=np.int64)
+            for _ in range(self.depth):
+                slot = position + self._internal_offset
+                x = flat_chunk[row_offset + feature[slot]]
+                # XGBoost sends x < threshold left; NaN compares False here
+                go_right = x >= threshold[slot]
+                if has_missing:
+                    go_right |= np.isnan(x) & ~default_left[slot]
+                position = 2 * position + 1 + go_right
+
+            leaf = leaf_value[position - (2 ** self.depth - 1) + self._leaf_offset]
+
+            # Accumulate in float32 like XGBoost so calibration steps line up
+            margin = np.add.reduceat(leaf, self._tree_starts, axis=1) + self.group_base
+            prob = self._calibrate(
+                (1.0 / (1.0 + np.exp(-margin, dtype=np.float32))).astype(np.float64)
+            )
+
+            # Average calibrated ensemble members of the same product type
+            output[start:start + len(chunk)] = (
+                np.add.reduceat(prob, self._group_starts, axis=1) / self._group_counts
+            )
+
+        return output
+
+    def save(self, filepath: str) -> None:
+        """
+        Save the compiled arrays to a ``.npz`` file.
+
+        Args:
+            filepath: Destination path
+        """
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+
+        calibration = {}
+        for group, spec in enumerate(self.group_calibration):
+            if spec is not None:
+                calibration[f"cal_{group}_{spec[0]}_a"] = spec[1]
+                calibration[f"cal_{group}_{spec[0]}_b"] = spec[2]
+
+        # Written to a temporary file and renamed, so scoring shards that
+        # recompile concurrently never read a partially written forest
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                product_ids=self.product_ids,
+                feature_names=np.array(self.feature_names),
+                depth=np.array(self.depth),
+                feature=self.feature,
+                threshold=self.threshold,
+                default_left=self.default_left,
+                leaf_value=self.leaf_value,
+                tree_group=self.tree_group,
+                group_output=self.group_output,
+                group_base=self.group_base,
+                **calibration
+            )
+        os.replace(tmp_path, filepath)
+        logger.info(f"Compiled forest saved to {filepath}")
+
+    @classmethod
+    def load(cls, filepath: str) -> 'CompiledForest':
+        """
+        Load a compiled forest saved with ``save``.
+
+        Args:
+            filepath: Path to the ``.npz`` file
+
+        Returns:
+            Compiled forest
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+        """
+        if not Path(filepath).exists():
+            raise FileNotFoundError(f"Compiled forest not found: {filepath}")
+
+        with np.load(filepath) as data:
+            group_calibration: List[Calibration] = [None] * len(data['group_output'])
+            for key in data.files:
+                if key.startswith('cal_') and key.endswith('_a'):
+                    _, group, kind, _ = key.split('_')
+                    group_calibration[int(group)] = (kind, data[key], data[key[:-2] + '_b'])
+
+            forest = cls(
+                product_ids=data['product_ids'],
+                feature_names=[str(f) for f in data['feature_names']],
+                depth=int(data['depth']),
+                feature=data['feature'],
+                threshold=data['threshold'],
+                default_left=data['default_left'],
+                leaf_value=data['leaf_value'],
+                tree_group=data['tree_group'],
+                group_output=data['group_output'],
+                group_base=data['group_base'],
+                group_calibration=group_calibration
+            )
+
+        logger.info(f"Compiled forest loaded from {filepath} ({forest.n_trees} trees)")
+        return forest
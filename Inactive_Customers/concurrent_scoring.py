@@ -0,0 +1,154 @@
+"""
+Concurrent per-product-type model scoring.
+
+XGBoost releases the GIL while predicting, so product types can be scored in
+parallel threads against one shared feature matrix. Models are loaded ahead of
+scoring by background loader threads and each result is written straight into
+its column of a preallocated output matrix.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import ModelPersistence, logger
+
+
+def set_model_threads(model: Any, n_threads: int) -> None:
+    """
+    Set the prediction thread count of a fitted model.
+
+    Args:
+        model: XGBClassifier or a calibration wrapper around XGBClassifiers
+        n_threads: Threads XGBoost may use for this model
+    """
+    if hasattr(model, 'calibrated_classifiers_'):
+        for calibrated in model.calibrated_classifiers_:
+            set_model_threads(calibrated.estimator, n_threads)
+    elif hasattr(model, 'get_booster'):
+        model.set_params(n_jobs=n_threads)
+
+
+class ConcurrentModelScorer:
+    """
+    Scores many product-type models over a thread pool.
+
+    ``max_workers`` models are scored at once, each limited to
+    ``model_nthread`` XGBoost threads (by default the CPU count divided by
+    ``max_workers``) so the total stays at the core count. At most
+    ``prefetch`` loaded-but-unscored models are held in memory. With
+    ``chunk_rows``, each model scores the rows in chunks of that size, which
+    bounds the per-call temporaries.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        model_nthread: Optional[int] = None,
+        prefetch: int = 4,
+        model_persistence: Optional[ModelPersistence] = None,
+        chunk_rows: Optional[int] = None
+    ):
+        """
+        Initialize the scorer.
+
+        Args:
+            max_workers: Number of models scored concurrently
+            model_nthread: XGBoost threads per model (None = cores / workers)
+            prefetch: Models loaded ahead of the scoring threads
+            model_persistence: Model loader
+            chunk_rows: Rows per predict_proba call (None = all rows at once)
+        """
+        cpu_count = os.cpu_count() or 1
+        self.max_workers = max(1, max_workers)
+        self.model_nthread = model_nthread or max(1, cpu_count // self.max_workers)
+        self.prefetch = max(1, prefetch)
+        self.model_persistence = model_persistence or ModelPersistence()
+        self.chunk_rows = chunk_rows
+
+    def score(
+        self,
+        X: pd.DataFrame,
+        model_paths: Dict[int, str],
+        skip_missing: bool = False
+    ) -> Tuple[np.ndarray, List[int]]:
+        """
+        Score all models against the feature matrix.
+
+        Args:
+            X: Prepared feature matrix
+            model_paths: Product type ID to model file path
+            skip_missing: Drop product types whose model file is missing
+                instead of raising
+
+        Returns:
+            Tuple of (float32 probability matrix with one column per scored
+            product type, product type IDs of those columns)
+
+        Raises:
+            FileNotFoundError: If a model is missing and skip_missing is False
+        """
+        product_ids = list(model_paths)
+        output = np.full((len(X), len(product_ids)), np.nan, dtype=np.float32)
+        scored = np.zeros(len(product_ids), dtype=bool)
+        workers = min(self.max_workers, max(len(product_ids), 1))
+
+        logger.info(
+            f"Scoring {len(product_ids)} models on {workers} threads "
+            f"({self.model_nthread} XGBoost threads each)"
+        )
+
+        # Bounds loaded-but-unscored models; released once a column is written
+        slots = threading.Semaphore(workers + self.prefetch)
+
+        def load(prod_id: int) -> Any:
+            slots.acquire()
+            try:
+                model = self.model_persistence.load_model(model_paths[prod_id])
+            except BaseException:
+                slots.release()
+                raise
+            set_model_threads(model, self.model_nthread)
+            return model
+
+        def predict(column: int, pending: Future) -> None:
+            try:
+                model = pending.result()
+            except FileNotFoundError:
+                if not skip_missing:
+                    raise
+                logger.warning(
+                    f"Model not found for product {product_ids[column]}. "
+                    f"Skipping... (path: {model_paths[product_ids[column]]})"
+                )
+                return
+
+            try:
+                step = self.chunk_rows or max(len(X), 1)
+                for start in range(0, len(X), step):
+                    rows = slice(start, start + step)
+                    output[rows, column] = model.predict_proba(X.iloc[rows])[:, 1]
+                scored[column] = True
+            finally:
+                slots.release()
+
+            logger.info(f"✓ Generated predictions for product {product_ids[column]}")
+
+        with ThreadPoolExecutor(max_workers=min(self.prefetch, workers)) as loaders, \
+                ThreadPoolExecutor(max_workers=workers) as scorers:
+            loading = [loaders.submit(load, prod_id) for prod_id in product_ids]
+            futures = [
+                scorers.submit(predict, column, pending)
+                for column, pending in enumerate(loading)
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+        if scored.all():
+            return output, product_ids
+
+        return output[:, scored], [p for p, ok in zip(product_ids, scored) if ok]
@@ -2,7 +2,8 @@
 
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
+import json
+from typing import Dict, Any, Optional, Tuple, Union
 from dataclasses import dataclass, field
 
 
@@ -14,6 +15,13 @@ class BigQueryConfig:
     dataset: str = "SANDBOX_ANALYTICS"
     credentials_path: Optional[str] = None
 
+    # Query results downloaded at once, and Storage API read streams per
+    # result (0 = let BigQuery choose). Results under storage_api_min_rows
+    # rows are downloaded by RowIterator.to_dataframe instead
+    max_concurrent_queries: int = 4
+    read_streams: int = 0
+    storage_api_min_rows: int = 100_000
+
     def __post_init__(self):
         """Initialize credentials path from environment if not provided."""
         if self.credentials_path is None:
@@ -22,10 +30,26 @@ class BigQueryConfig:
                 '/home/jupyter/d00_key.json'
             )
 
-        if not os.path.exists(self.credentials_path):
-            raise FileNotFoundError(
-                f"Credentials file not found: {self.credentials_path}"
-            )
+
+@dataclass
+class DataSourceConfig:
+    """Where pipeline tables are read from and written to."""
+
+    # 'bigquery' or 'local' (Parquet/Arrow snapshots on disk)
+    backend: str = 'bigquery'
+
+    # Local backend: <data_dir>/<table>.parquet (or a directory of part files),
+    # uploads written to <output_dir>/<table>.parquet
+    data_dir: str = "./data"
+    output_dir: Optional[str] = None
+
+    # Local SQL engine: 'pandas' (the pipelines' simple SELECT/LIMIT queries)
+    # or 'duckdb' (arbitrary SQL over the files; requires duckdb)
+    engine: str = 'pandas'
+
+    def get_output_dir(self) -> str:
+        """Get the local upload directory (defaults to <data_dir>/output)."""
+        return self.output_dir or os.path.join(self.data_dir, "output")
 
 
 @dataclass
@@ -36,6 +60,7 @@ class ModelConfig:
     n_estimators: int = 1000
     max_depth: int = 5
     gamma: float = 0
+    min_child_weight: float = 1.0
     subsample: float = 0.9
     colsample_bytree: float = 0.6
     objective: str = 'binary:logistic'
@@ -43,18 +68,37 @@ class ModelConfig:
     scale_pos_weight: float = 1.0
     random_state: int = 42
 
-    # Calibration settings
+    # Calibration settings: an int K calibrates on K folds of out-of-fold
+    # predictions, calibration_n_jobs fold fits at a time (-1 = all folds at
+    # once); see calibration.py. With calibration_ensemble the K calibrated
+    # fold models are kept and averaged, so there is no final fit (about
+    # K - 1 times the CPU of one fit, K times the scoring work); without it a
+    # final model is fit on all rows (K + 1 fits). 'prefit' calibrates on the
+    # booster's own training rows (one fit, in-sample scores)
     calibration_method: str = 'isotonic'
-    calibration_cv: str = 'prefit'
+    calibration_cv: Union[int, str] = 3
     calibration_n_jobs: int = -1
+    calibration_ensemble: bool = True
 
-    def to_xgb_params(self) -> Dict[str, Any]:
-        """Convert to XGBoost parameters dict."""
-        return {
+    # Per-product-type parameter overrides (e.g. produced by tuning.py)
+    param_overrides: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+
+    def to_xgb_params(self, prod_type_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Convert to XGBoost parameters dict.
+
+        Args:
+            prod_type_id: Optional product type whose overrides are applied
+
+        Returns:
+            XGBoost keyword arguments
+        """
+        params = {
             'learning_rate': self.learning_rate,
             'n_estimators': self.n_estimators,
             'max_depth': self.max_depth,
             'gamma': self.gamma,
+            'min_child_weight': self.min_child_weight,
             'subsample': self.subsample,
             'colsample_bytree': self.colsample_bytree,
             'objective': self.objective,
@@ -63,6 +107,32 @@ class ModelConfig:
             'random_state': self.random_state,
         }
 
+        if prod_type_id is not None:
+            params.update(self.param_overrides.get(int(prod_type_id), {}))
+
+        return params
+
+    def apply_tuning_results(self, filepath: str) -> None:
+        """
+        Apply tuned parameters written by the hyperparameter search.
+
+        The file holds a ``global`` parameter dict, applied to this config, and
+        an optional ``per_product`` mapping of product type ID to overrides.
+
+        Args:
+            filepath: Path to the tuned parameters JSON file
+        """
+        with open(filepath) as f:
+            tuned = json.load(f)
+
+        for name, value in tuned.get('global', {}).items():
+            if not hasattr(self, name):
+                raise ValueError(f"Unknown model parameter in tuning results: {name}")
+            setattr(self, name, value)
+
+        for prod_type_id, overrides in tuned.get('per_product', {}).items():
+            self.param_overrides[int(prod_type_id)] = dict(overrides)
+
 
 @dataclass
 class FeatureConfig:
@@ -119,6 +189,22 @@ class TrainingConfig:
     model_dir: str = "./models"
     model_prefix: str = "cali_model_"
     model_extension: str = ".pkl"
+    manifest_file: str = "manifest.json"
+
+    # Incremental retraining: only refit product types whose slice changed
+    incremental: bool = False
+    drift_count_tolerance: float = 0.05
+    drift_mean_tolerance: float = 0.1
+    drift_std_tolerance: float = 0.2
+    warm_start: bool = False
+    warm_start_estimators: int = 100
+    # Trees beyond n_estimators warm starts may accumulate before a full refit
+    warm_start_max_extra: int = 500
+
+    # Resume an unfinished run from the manifest, skipping completed product
+    # types; product types fit on `workers` threads, longest first
+    resume: bool = True
+    workers: int = 1
 
     def get_model_path(self, prod_type_id: int) -> str:
         """Get the model file path for a specific product type."""
@@ -128,6 +214,10 @@ class TrainingConfig:
             f"{self.model_prefix}{prod_type_id}{self.model_extension}"
         )
 
+    def get_manifest_path(self) -> str:
+        """Get the path of the model manifest."""
+        return os.path.join(self.model_dir, self.manifest_file)
+
 
 @dataclass
 class ScoringConfig:
@@ -144,6 +234,28 @@ class ScoringConfig:
     model_extension: str = ".pkl"
     predictions_file: str = "./predictions/prod_type_p.pkl"
 
+    # Predictor: 'per_product' (one predict_proba per model), 'compiled'
+    # (all boosters flattened into one NumPy evaluator) or 'distilled' (the
+    # multi-output student trained with DISTILL_MODELS)
+    predictor: str = 'per_product'
+    compiled_model_file: str = "compiled_forest.npz"
+    compiled_chunk_size: Optional[int] = None
+
+    # Top-N recommendations per customer (0 = disabled)
+    top_n: int = 0
+    top_n_output_table: str = "scored_top_products"
+    top_n_block_size: int = 100_000
+
+    # Uploads split into chunks by the memory budget go to <table><suffix>
+    # first and replace the table once complete
+    staging_suffix: str = "_staging"
+
+    # Sharded scoring: shard outputs and manifests go to <shard_dir>/<run_id>/.
+    # There is no default run ID: shards of different runs must never share a
+    # directory, so --shard and --merge need an explicit one
+    shard_dir: str = "./shards"
+    shard_run_id: Optional[str] = None
+
     def get_model_path(self, prod_type_id: int) -> str:
         """Get the model file path for a specific product type."""
         return os.path.join(
@@ -151,6 +263,80 @@ class ScoringConfig:
             f"{self.model_prefix}{prod_type_id}{self.model_extension}"
         )
 
+    def get_compiled_model_path(self) -> str:
+        """Get the path of the compiled forest."""
+        return os.path.join(self.model_dir, self.compiled_model_file)
+
+    def get_shard_run_dir(self, run_id: Optional[str] = None) -> str:
+        """
+        Get the directory holding the shard outputs of a run.
+
+        Raises:
+            ValueError: If neither ``run_id`` nor ``shard_run_id`` is set
+        """
+        run_id = run_id or self.shard_run_id
+        if not run_id:
+            raise ValueError("Sharded scoring requires a run ID (--run-id or SHARD_RUN_ID)")
+        return os.path.join(self.shard_dir, run_id)
+
+    def get_predictions_path(self, shard_name: Optional[str] = None) -> str:
+        """Get the intermediate predictions path, made unique per shard."""
+        if shard_name is None:
+            return self.predictions_file
+        root, ext = os.path.splitext(self.predictions_file)
+        return f"{root}.{shard_name}{ext}"
+
+
+@dataclass
+class FeatureStoreConfig:
+    """Local feature store for imputed scoring features."""
+
+    # Read scoring features from memory-mapped snapshots instead of the
+    # scoring table (only customer IDs are still queried)
+    enabled: bool = False
+    root_dir: str = "./feature_store"
+
+    # Snapshot to read (None = latest); refreshes write to this snapshot, or
+    # to one named after today's date
+    snapshot: Optional[str] = None
+
+    # Re-query the scoring table and upsert new/changed customers before scoring
+    refresh: bool = False
+    block_rows: int = 1_000_000
+
+
+@dataclass
+class TuningConfig:
+    """Hyperparameter search configuration."""
+
+    # 'successive_halving' or 'random'
+    strategy: str = 'successive_halving'
+    n_trials: int = 27
+    sample_prod_types: int = 8
+    per_product: bool = False
+
+    # Budget: successive halving grows n_estimators from min to max by reduction_factor
+    min_estimators: int = 50
+    max_estimators: int = 1000
+    reduction_factor: int = 3
+    trial_time_budget: float = 600.0
+    validation_fraction: float = 0.25
+    random_state: int = 42
+
+    # Search space: name -> (distribution, low, high) or ('choice', [values])
+    search_space: Dict[str, tuple] = field(default_factory=lambda: {
+        'learning_rate': ('loguniform', 0.005, 0.3),
+        'max_depth': ('int', 3, 8),
+        'gamma': ('uniform', 0.0, 5.0),
+        'subsample': ('uniform', 0.5, 1.0),
+        'colsample_bytree': ('uniform', 0.4, 1.0),
+        'min_child_weight': ('loguniform', 0.5, 20.0),
+    })
+
+    # Outputs
+    history_path: str = "./tuning/trials.jsonl"
+    output_path: str = "./tuning/tuned_params.json"
+
 
 @dataclass
 class ProcessingConfig:
@@ -159,6 +345,19 @@ class ProcessingConfig:
     max_workers: int = 72
     use_multiprocessing: bool = True
 
+    # Thread-pool scoring: max_workers models at once, model_nthread XGBoost
+    # threads each (None = CPU count / max_workers), prefetch_models loaded ahead
+    concurrent_scoring: bool = False
+    model_nthread: Optional[int] = None
+    prefetch_models: int = 4
+
+    # Scoring memory budget (None = unlimited): stages are run in chunks and
+    # on as many workers as fit in budget * (1 - headroom); see scheduler.py
+    memory_budget_bytes: Optional[int] = None
+    memory_headroom: float = 0.1
+    min_chunk_rows: int = 10_000
+    max_chunk_rows: int = 1_000_000
+
     def __post_init__(self):
         """Validate and adjust worker count."""
         cpu_count = os.cpu_count() or 1
@@ -168,16 +367,116 @@ class ProcessingConfig:
             self.max_workers = cpu_count * 2
 
 
+@dataclass
+class ProfilingConfig:
+    """Pipeline instrumentation configuration."""
+
+    enabled: bool = False
+    trace_memory: bool = False
+    report_dir: str = "./reports"
+    cprofile_dir: Optional[str] = None
+
+    def get_report_path(self, pipeline: str) -> str:
+        """Get the run report path for a pipeline."""
+        return os.path.join(self.report_dir, f"{pipeline}_run_report.json")
+
+
+@dataclass
+class QuantizationConfig:
+    """Quantized storage of probability tables (see quantization.py)."""
+
+    # None (float32), 'float16', 'uint16' or 'uint8'
+    codec: Optional[str] = None
+    # Intermediate prediction checkpoints
+    checkpoints: bool = True
+    # Local output tables and shard outputs; BigQuery uploads stay float32
+    outputs: bool = True
+
+    def codec_for(self, kind: str) -> Optional[str]:
+        """Codec for 'checkpoints' or 'outputs' (None = not quantized)."""
+        return self.codec if getattr(self, kind) else None
+
+
+@dataclass
+class DistillationConfig:
+    """Multi-output student distilled from the product-type models (see distillation.py)."""
+
+    # Train the student at the end of training
+    enabled: bool = False
+    model_file: str = "distilled_model.npz"
+    fidelity_file: str = "distilled_fidelity.json"
+
+    # Customers (training rows) the teacher models label for the student
+    max_rows: int = 200_000
+
+    # Student network and optimizer
+    hidden_units: Tuple[int, ...] = (256,)
+    epochs: int = 30
+    batch_size: int = 1024
+    learning_rate: float = 3e-3
+    validation_fraction: float = 0.1
+    patience: int = 3
+
+    # Product types whose held-out mean absolute error exceeds this are logged
+    max_product_mae: float = 0.05
+
+    def get_model_path(self, model_dir: str) -> str:
+        """Get the path of the student in a model directory."""
+        return os.path.join(model_dir, self.model_file)
+
+    def get_fidelity_path(self, model_dir: str) -> str:
+        """Get the path of the student's fidelity report in a model directory."""
+        return os.path.join(model_dir, self.fidelity_file)
+
+
+@dataclass
+class LookalikeConfig:
+    """Nearest-neighbour index over the scored p<id> vectors (see lookalike.py)."""
+
+    # Build the index at the end of scoring (unsharded runs and shard merges)
+    enabled: bool = False
+    index_file: str = "./lookalike/lookalike_index.npz"
+
+    # 'cosine' (score = similarity) or 'l2' (score = distance)
+    metric: str = 'cosine'
+
+    # Partitions of the approximate (IVF) search; 0 = exact search only
+    n_lists: int = 0
+    n_probe: int = 16
+    kmeans_iterations: int = 10
+    kmeans_sample: int = 100_000
+
+    # Seed customers to find lookalikes for (a table with a customer_id
+    # column; empty = build and save the index only)
+    seed_table: str = ""
+    output_table: str = "lookalike_customers"
+    k: int = 50
+
+    # Index rows and seeds per block of the search
+    block_size: int = 16_384
+    query_block_size: int = 1024
+
+    # Seeds also searched exactly to report the approximate search's recall
+    recall_sample: int = 1000
+
+
 @dataclass
 class Config:
     """Main configuration container."""
 
     bigquery: BigQueryConfig = field(default_factory=BigQueryConfig)
+    data_source: DataSourceConfig = field(default_factory=DataSourceConfig)
     model: ModelConfig = field(default_factory=ModelConfig)
     features: FeatureConfig = field(default_factory=FeatureConfig)
     training: TrainingConfig = field(default_factory=TrainingConfig)
     scoring: ScoringConfig = field(default_factory=ScoringConfig)
+    feature_store: FeatureStoreConfig = field(default_factory=FeatureStoreConfig)
     processing: ProcessingConfig = field(default_factory=ProcessingConfig)
+    tuning: TuningConfig = field(default_factory=TuningConfig)
+    profiling: ProfilingConfig = field(default_factory=ProfilingConfig)
+    quantization: QuantizationConfig = field(default_factory=QuantizationConfig)
+    distillation: DistillationConfig = field(default_factory=DistillationConfig)
+    lookalike: LookalikeConfig = field(default_factory=LookalikeConfig)
 
     # Environment
     environment: str = field(default_factory=lambda: os.getenv('ENV', 'development'))
@@ -195,23 +494,131 @@ class Config:
         if dataset := os.getenv('BQ_DATASET'):
             config.bigquery.dataset = dataset
 
+        if max_concurrent_queries := os.getenv('BQ_MAX_CONCURRENT_QUERIES'):
+            config.bigquery.max_concurrent_queries = int(max_concurrent_queries)
+
+        if read_streams := os.getenv('BQ_READ_STREAMS'):
+            config.bigquery.read_streams = int(read_streams)
+
+        if backend := os.getenv('DATA_SOURCE'):
+            config.data_source.backend = backend
+
+        if data_dir := os.getenv('LOCAL_DATA_DIR'):
+            config.data_source.data_dir = data_dir
+
+        if output_dir := os.getenv('LOCAL_OUTPUT_DIR'):
+            config.data_source.output_dir = output_dir
+
+        if engine := os.getenv('LOCAL_SQL_ENGINE'):
+            config.data_source.engine = engine
+
         if model_dir := os.getenv('MODEL_DIR'):
             config.training.model_dir = model_dir
             config.scoring.model_dir = model_dir
 
+        if concurrent := os.getenv('CONCURRENT_SCORING'):
+            config.processing.concurrent_scoring = concurrent.lower() == 'true'
+
+        if predictor := os.getenv('SCORING_PREDICTOR'):
+            config.scoring.predictor = predictor
+
+        if shard_dir := os.getenv('SHARD_DIR'):
+            config.scoring.shard_dir = shard_dir
+
+        if shard_run_id := os.getenv('SHARD_RUN_ID'):
+            config.scoring.shard_run_id = shard_run_id
+
+        if feature_store := os.getenv('FEATURE_STORE'):
+            config.feature_store.enabled = feature_store.lower() == 'true'
+
+        if feature_store_dir := os.getenv('FEATURE_STORE_DIR'):
+            config.feature_store.root_dir = feature_store_dir
+
+        if snapshot := os.getenv('FEATURE_SNAPSHOT'):
+            config.feature_store.snapshot = snapshot
+
+        if refresh := os.getenv('FEATURE_STORE_REFRESH'):
+            config.feature_store.refresh = refresh.lower() == 'true'
+
+        if top_n := os.getenv('TOP_N'):
+            config.scoring.top_n = int(top_n)
+
+        if profile := os.getenv('PROFILE_RUN'):
+            config.profiling.enabled = profile.lower() == 'true'
+
+        if trace_memory := os.getenv('PROFILE_TRACE_MEMORY'):
+            config.profiling.trace_memory = trace_memory.lower() == 'true'
+
+        if cprofile_dir := os.getenv('PROFILE_CPROFILE_DIR'):
+            config.profiling.cprofile_dir = cprofile_dir
+
+        if codec := os.getenv('QUANTIZATION_CODEC'):
+            config.quantization.codec = None if codec.lower() == 'none' else codec
+
+        if distill := os.getenv('DISTILL_MODELS'):
+            config.distillation.enabled = distill.lower() == 'true'
+
+        if lookalike := os.getenv('LOOKALIKE_INDEX'):
+            config.lookalike.enabled = lookalike.lower() == 'true'
+
+        if seed_table := os.getenv('LOOKALIKE_SEED_TABLE'):
+            config.lookalike.seed_table = seed_table
+
+        if lookalike_k := os.getenv('LOOKALIKE_K'):
+            config.lookalike.k = int(lookalike_k)
+
+        if n_lists := os.getenv('LOOKALIKE_LISTS'):
+            config.lookalike.n_lists = int(n_lists)
+
+        if incremental := os.getenv('INCREMENTAL_TRAINING'):
+            config.training.incremental = incremental.lower() == 'true'
+
+        if warm_start := os.getenv('WARM_START'):
+            config.training.warm_start = warm_start.lower() == 'true'
+
+        if calibration_cv := os.getenv('CALIBRATION_CV'):
+            config.model.calibration_cv = (
+                calibration_cv if calibration_cv == 'prefit' else int(calibration_cv)
+            )
+
+        if calibration_ensemble := os.getenv('CALIBRATION_ENSEMBLE'):
+            config.model.calibration_ensemble = calibration_ensemble.lower() == 'true'
+
+        if resume := os.getenv('RESUME_TRAINING'):
+            config.training.resume = resume.lower() == 'true'
+
+        if training_workers := os.getenv('TRAINING_WORKERS'):
+            config.training.workers = int(training_workers)
+
         if max_workers := os.getenv('MAX_WORKERS'):
             config.processing.max_workers = int(max_workers)
 
+        if memory_budget := os.getenv('MEMORY_BUDGET'):
+            from scheduler import parse_bytes
+            config.processing.memory_budget_bytes = parse_bytes(memory_budget)
+
+        if tuned_params := os.getenv('TUNED_PARAMS_PATH'):
+            config.model.apply_tuning_results(tuned_params)
+
         return config
 
     def validate(self) -> bool:
         """Validate configuration."""
         errors = []
 
-        # Validate BigQuery config
-        if not os.path.exists(self.bigquery.credentials_path):
+        # Validate data source config
+        if self.data_source.backend not in ('bigquery', 'local'):
+            errors.append(f"Invalid data source backend: {self.data_source.backend}")
+
+        if self.data_source.engine not in ('pandas', 'duckdb'):
+            errors.append(f"Invalid local SQL engine: {self.data_source.engine}")
+
+        if self.data_source.backend == 'bigquery' and not os.path.exists(self.bigquery.credentials_path):
             errors.append(f"Credentials file not found: {self.bigquery.credentials_path}")
 
+        if self.data_source.backend == 'local' and not os.path.isdir(self.data_source.data_dir):
+            errors.append(f"Local data directory not found: {self.data_source.data_dir}")
+
         # Validate model config
         if self.model.learning_rate <= 0 or self.model.learning_rate >= 1:
             errors.append(f"Invalid learning rate: {self.model.learning_rate}")
@@ -219,10 +626,68 @@ class Config:
         if self.model.n_estimators <= 0:
             errors.append(f"Invalid n_estimators: {self.model.n_estimators}")
 
+        if self.model.calibration_method not in ('isotonic', 'sigmoid'):
+            errors.append(f"Invalid calibration method: {self.model.calibration_method}")
+
+        cv = self.model.calibration_cv
+        if cv != 'prefit' and not (isinstance(cv, int) and cv >= 2):
+            errors.append(f"Invalid calibration_cv: {cv} (expected 'prefit' or >= 2 folds)")
+
+        if self.training.warm_start and cv != 'prefit':
+            # Fold models are fit from scratch, so an out-of-fold map would be
+            # applied to a different (warm-started) booster than it was fit on
+            errors.append("warm_start requires calibration_cv='prefit'")
+
         # Validate processing config
         if self.processing.max_workers <= 0:
             errors.append(f"Invalid max_workers: {self.processing.max_workers}")
 
+        if self.training.workers < 1:
+            errors.append(f"Invalid training workers: {self.training.workers}")
+
+        budget = self.processing.memory_budget_bytes
+        if budget is not None and budget <= 0:
+            errors.append(f"Invalid memory budget: {budget}")
+
+        if not 0 <= self.processing.memory_headroom < 1:
+            errors.append(f"Invalid memory headroom: {self.processing.memory_headroom}")
+
+        # Validate scoring config
+        if self.scoring.predictor not in ('per_product', 'compiled', 'distilled'):
+            errors.append(f"Invalid scoring predictor: {self.scoring.predictor}")
+
+        if self.quantization.codec not in (None, 'float16', 'uint16', 'uint8'):
+            errors.append(f"Invalid quantization codec: {self.quantization.codec}")
+
+        # Validate distillation config
+        if self.distillation.epochs < 1 or self.distillation.batch_size < 1:
+            errors.append(
+                f"Invalid distillation epochs/batch size: "
+                f"{self.distillation.epochs}/{self.distillation.batch_size}"
+            )
+
+        if not 0 <= self.distillation.validation_fraction < 1:
+            errors.append(
+                f"Invalid distillation validation fraction: {self.distillation.validation_fraction}"
+            )
+
+        # Validate lookalike config
+        if self.lookalike.metric not in ('cosine', 'l2'):
+            errors.append(f"Invalid lookalike metric: {self.lookalike.metric}")
+
+        if self.lookalike.k < 1 or self.lookalike.n_probe < 1 or self.lookalike.n_lists < 0:
+            errors.append(
+                f"Invalid lookalike k/n_probe/n_lists: {self.lookalike.k}/"
+                f"{self.lookalike.n_probe}/{self.lookalike.n_lists}"
+            )
+
+        # Validate tuning config
+        if self.tuning.strategy not in ('successive_halving', 'random'):
+            errors.append(f"Invalid tuning strategy: {self.tuning.strategy}")
+
+        if self.tuning.reduction_factor < 2:
+            errors.append(f"Invalid reduction_factor: {self.tuning.reduction_factor}")
+
         if errors:
             raise ValueError(f"Configuration validation failed:\n" + "\n".join(errors))
 
@@ -0,0 +1,458 @@
+"""
+Data sources the training and scoring pipelines read from and upload to.
+
+``BigQueryClient`` (in utils) is the production backend. ``LocalDataSource``
+serves the same calls from Parquet/Arrow snapshots on disk (or in-memory
+DataFrames), so pipelines can run on one machine without network access or
+Google client libraries. ``create_data_source`` picks the backend from
+``Config.data_source``.
+"""
+
+import os
+import re
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from config import Config
+from quantization import dequantize_frame, quantize_frame, schema_is_quantized
+from utils import BigQueryClient, logger
+
+# Table references look like `project.dataset.table` or `dataset.table`
+_TABLE_REF_RE = re.compile(r"`(?:[^`.]+\.)?(?:[^`.]+\.)?(?P<table>[^`.]+)`")
+
+# The query shapes the pipelines issue, for the pandas engine
+_SELECT_RE = re.compile(
+    r"^SELECT\s+(?P<columns>.+?)\s+FROM\s+`(?:[^`]*\.)?(?P<table>[^`.]+)`"
+    r"(?P<group_by>\s+GROUP\s+BY\s+.+?)?(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+
+_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
+
+class DataSource(ABC):
+    """Interface shared by the BigQuery and local backends."""
+
+    @abstractmethod
+    def execute_query(
+        self,
+        query: str,
+        use_storage_api: bool = True,
+        ordered: bool = False
+    ) -> pd.DataFrame:
+        """Run a query and return its result."""
+
+    def execute_queries(
+        self,
+        queries: Dict[str, str],
+        use_storage_api: bool = True,
+        ordered: Sequence[str] = ()
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Run several queries concurrently.
+
+        Args:
+            queries: Query name to SQL query string
+            use_storage_api: Passed through to execute_query
+            ordered: Names of the queries whose row order must be kept
+
+        Returns:
+            Query name to results DataFrame
+        """
+        with ThreadPoolExecutor(max_workers=max(1, len(queries))) as pool:
+            futures = {
+                name: pool.submit(self.execute_query, query, use_storage_api, name in ordered)
+                for name, query in queries.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+    @abstractmethod
+    def load_table(self, dataset: str, table_name: str, limit: Optional[int] = None) -> pd.DataFrame:
+        """Load a table."""
+
+    @abstractmethod
+    def upload_dataframe(
+        self,
+        df: pd.DataFrame,
+        dataset: str,
+        table_name: str,
+        if_exists: str = 'replace'
+    ) -> None:
+        """Write a DataFrame to a table."""
+
+    @abstractmethod
+    def replace_table(self, dataset: str, source_table: str, table_name: str) -> None:
+        """Replace a table with another table's contents and drop the source."""
+
+
+DataSource.register(BigQueryClient)
+
+
+class LocalDataSource(DataSource):
+    """
+    Serves pipeline queries from local table snapshots.
+
+    A table ``name`` is ``<data_dir>/<name>.parquet`` (or ``.arrow``/
+    ``.feather``), or a directory ``<data_dir>/<name>/`` of part files.
+    In-memory ``tables`` take precedence. Dataset and project qualifiers in
+    queries are ignored.
+
+    The 'pandas' engine understands ``SELECT * | <columns> FROM `table`
+    [GROUP BY ...] [LIMIT n]``, reading only the selected columns and, for
+    LIMIT without GROUP BY, only the first n rows; a GROUP BY over the selected
+    columns is evaluated as DISTINCT. The 'duckdb' engine runs any SQL DuckDB
+    can parse, with each referenced table exposed as a view over its files.
+
+    With a quantization ``codec``, uploaded probability columns are written
+    quantized (see quantization.py). Quantized snapshots are restored to
+    float32 on read, part file by part file, since each part carries its own
+    parameters.
+    """
+
+    def __init__(
+        self,
+        data_dir: Optional[str] = None,
+        output_dir: Optional[str] = None,
+        engine: str = 'pandas',
+        tables: Optional[Dict[str, pd.DataFrame]] = None,
+        codec: Optional[str] = None
+    ):
+        """
+        Initialize the local data source.
+
+        Args:
+            data_dir: Directory of table snapshots
+            output_dir: Directory uploads are written to (None keeps them in memory only)
+            engine: 'pandas' or 'duckdb'
+            tables: In-memory tables, by name
+            codec: Quantization codec for uploaded probability columns
+                (None = float32)
+
+        Raises:
+            ValueError: If the engine is unknown
+        """
+        if engine not in ('pandas', 'duckdb'):
+            raise ValueError(f"Unknown local SQL engine: {engine}")
+
+        self.data_dir = Path(data_dir) if data_dir else None
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.engine = engine
+        self.tables: Dict[str, pd.DataFrame] = dict(tables or {})
+        self.uploads: Dict[str, pd.DataFrame] = {}
+        self.codec = codec
+        self.project_id = 'local'
+        self._duckdb = None
+        self._duckdb_lock = threading.Lock()
+
+        logger.info(f"Local data source initialized ({engine} engine, data_dir={self.data_dir})")
+
+    def table_path(self, table_name: str) -> Path:
+        """
+        Locate a table snapshot on disk.
+
+        Raises:
+            FileNotFoundError: If no snapshot exists for the table
+        """
+        if self.data_dir is not None:
+            directory = self.data_dir / table_name
+            if directory.is_dir():
+                return directory
+            for suffix in _FORMATS:
+                path = self.data_dir / f"{table_name}{suffix}"
+                if path.exists():
+                    return path
+        raise FileNotFoundError(f"No local snapshot for table {table_name} in {self.data_dir}")
+
+    def _dataset(self, table_name: str):
+        """Open a table snapshot as a pyarrow dataset."""
+        import pyarrow.dataset as ds
+
+        path = self.table_path(table_name)
+        if path.is_dir():
+            suffixes = {p.suffix for p in path.iterdir() if p.suffix in _FORMATS}
+            fmt = _FORMATS[suffixes.pop()] if len(suffixes) == 1 else 'parquet'
+        else:
+            fmt = _FORMATS[path.suffix]
+        return ds.dataset(str(path), format=fmt)
+
+    def read_table(
+        self,
+        table_name: str,
+        columns: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Read a table, optionally projecting columns and limiting rows.
+
+        Args:
+            table_name: Table name
+            columns: Columns to read (None = all)
+            limit: Maximum rows (None = all)
+
+        Returns:
+            Table data as pandas DataFrame
+        """
+        if table_name in self.tables:
+            df = self.tables[table_name]
+            if columns is not None:
+                df = df[columns]
+            return df.head(limit) if limit is not None else df
+
+        dataset = self._dataset(table_name)
+        if self._is_quantized(dataset):
+            parts = []
+            for fragment in dataset.get_fragments():
+                parts.append(dequantize_frame(fragment.to_table(columns=columns).to_pandas()))
+                if limit is not None and sum(len(p) for p in parts) >= limit:
+                    break
+            df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            return df.head(limit) if limit is not None else df
+
+        if limit is not None:
+            table = dataset.head(limit, columns=columns)
+        else:
+            table = dataset.to_table(columns=columns)
+        return table.to_pandas()
+
+    @staticmethod
+    def _is_quantized(dataset) -> bool:
+        """Whether any file of a snapshot holds quantized columns."""
+        return any(
+            schema_is_quantized(fragment.physical_schema.metadata)
+            for fragment in dataset.get_fragments()
+        )
+
+    def execute_query(
+        self,
+        query: str,
+        use_storage_api: bool = True,
+        ordered: bool = False
+    ) -> pd.DataFrame:
+        """
+        Run a query against the local snapshots.
+
+        Args:
+            query: SQL query string
+            use_storage_api: Ignored (kept for BigQueryClient compatibility)
+            ordered: Ignored (local results keep the query's order)
+
+        Returns:
+            Query results as pandas DataFrame
+
+        Raises:
+            ValueError: If the pandas engine cannot evaluate the query
+        """
+        logger.info(f"Executing local query ({self.engine})...")
+        logger.debug(f"Query: {query[:200]}...")
+
+        if self.engine == 'duckdb':
+            # One DuckDB connection serves all threads of execute_queries
+            with self._duckdb_lock:
+                df = self._execute_duckdb(query)
+        else:
+            df = self._execute_pandas(query)
+
+        logger.info(f"Query returned {len(df)} rows")
+        return df
+
+    def _execute_pandas(self, query: str) -> pd.DataFrame:
+        """Evaluate one of the pipelines' simple SELECT queries."""
+        match = _SELECT_RE.match(query.strip())
+        if match is None:
+            raise ValueError(
+                "Query not supported by the pandas engine (use engine='duckdb'): "
+                f"{query.strip()[:200]}"
+            )
+
+        columns = match.group('columns').strip()
+        columns = None if columns == '*' else [c.strip() for c in columns.split(',')]
+        limit = int(match.group('limit')) if match.group('limit') else None
+        grouped = bool(match.group('group_by'))
+
+        df = self.read_table(match.group('table'), columns, None if grouped else limit)
+        if grouped:
+            df = df.drop_duplicates()
+            if limit is not None:
+                df = df.head(limit)
+
+        return df.reset_index(drop=True)
+
+    def _execute_duckdb(self, query: str) -> pd.DataFrame:
+        """Run the query in DuckDB with each referenced table as a view."""
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("The duckdb engine requires the duckdb package") from e
+
+        if self._duckdb is None:
+            self._duckdb = duckdb.connect()
+
+        for table_name in set(m.group('table') for m in _TABLE_REF_RE.finditer(query)):
+            if table_name in self.tables:
+                self._duckdb.register(table_name, self.tables[table_name])
+                continue
+            if self._is_quantized(self._dataset(table_name)):
+                self._duckdb.register(table_name, self.read_table(table_name))
+                continue
+            path = self.table_path(table_name)
+            if path.is_dir():
+                source = f"read_parquet('{path.as_posix()}/*.parquet')"
+            elif path.suffix == '.parquet':
+                source = f"read_parquet('{path.as_posix()}')"
+            else:
+                self._duckdb.register(table_name, self._dataset(table_name))
+                continue
+            self._duckdb.execute(f'CREATE OR REPLACE VIEW "{table_name}" AS SELECT * FROM {source}')
+
+        local_query = _TABLE_REF_RE.sub(lambda m: f'"{m.group("table")}"', query)
+        return self._duckdb.execute(local_query).df()
+
+    def load_table(self, dataset: str, table_name: str, limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        Load a local table.
+
+        Args:
+            dataset: Dataset name (ignored)
+            table_name: Table name
+            limit: Optional row limit
+
+        Returns:
+            Table data as pandas DataFrame
+        """
+        return self.read_table(table_name, limit=limit)
+
+    def upload_dataframe(
+        self,
+        df: pd.DataFrame,
+        dataset: str,
+        table_name: str,
+        if_exists: str = 'replace'
+    ) -> None:
+        """
+        Write a DataFrame to <output_dir>/<table_name>.
+
+        'replace' writes <table_name>.parquet; 'append' adds a part file to the
+        <table_name>/ directory so earlier parts are not rewritten. The
+        in-memory copy in ``uploads`` is never quantized.
+
+        Args:
+            df: DataFrame to upload
+            dataset: Dataset name (ignored)
+            table_name: Table name
+            if_exists: What to do if table exists ('fail', 'replace', 'append')
+
+        Raises:
+            ValueError: If the table exists and if_exists is 'fail'
+        """
+        logger.info(f"Writing {len(df)} rows to local table {table_name}")
+
+        exists = table_name in self.uploads
+        if self.output_dir is not None:
+            file_path = self.output_dir / f"{table_name}.parquet"
+            dir_path = self.output_dir / table_name
+            exists = exists or file_path.exists() or dir_path.exists()
+
+        if exists and if_exists == 'fail':
+            raise ValueError(f"Table {table_name} already exists")
+
+        if if_exists == 'append' and table_name in self.uploads:
+            self.uploads[table_name] = pd.concat([self.uploads[table_name], df], ignore_index=True)
+        else:
+            self.uploads[table_name] = df
+
+        if self.output_dir is None:
+            return
+
+        if self.codec is not None:
+            df = quantize_frame(df, self.codec)
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if if_exists == 'append':
+            if file_path.exists():
+                dir_path.mkdir(exist_ok=True)
+                file_path.rename(dir_path / "part-00000.parquet")
+            dir_path.mkdir(exist_ok=True)
+            part = len(list(dir_path.glob("part-*.parquet")))
+            df.to_parquet(dir_path / f"part-{part:05d}.parquet", index=False)
+        else:
+            if dir_path.exists():
+                shutil.rmtree(dir_path)
+            df.to_parquet(file_path, index=False)
+
+        logger.info("Upload completed successfully")
+
+    def replace_table(self, dataset: str, source_table: str, table_name: str) -> None:
+        """
+        Move a local table over another and drop the source.
+
+        Args:
+            dataset: Dataset name (ignored)
+            source_table: Table holding the new contents
+            table_name: Table to replace
+
+        Raises:
+            ValueError: If the source table does not exist
+        """
+        sources = []
+        if self.output_dir is not None:
+            # <table>.parquet after a replace, <table>/ part files after appends
+            sources = [
+                path for path in (
+                    self.output_dir / f"{source_table}.parquet", self.output_dir / source_table
+                ) if path.exists()
+            ]
+        if source_table not in self.uploads and not sources:
+            raise ValueError(f"Table {source_table} does not exist")
+
+        if source_table in self.uploads:
+            self.uploads[table_name] = self.uploads.pop(source_table)
+        if self.output_dir is None:
+            return
+
+        for target in (self.output_dir / f"{table_name}.parquet", self.output_dir / table_name):
+            if target.is_dir():
+                shutil.rmtree(target)
+            elif target.exists():
+                target.unlink()
+        for source in sources:
+            os.replace(source, source.with_name(source.name.replace(source_table, table_name, 1)))
+
+        logger.info(f"Replaced local table {table_name} with {source_table}")
+
+
+def create_data_source(config: Config) -> DataSource:
+    """
+    Build the data source selected by ``config.data_source.backend``.
+
+    Args:
+        config: Application configuration object
+
+    Returns:
+        BigQueryClient or LocalDataSource
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = config.data_source.backend
+    if backend == 'bigquery':
+        return BigQueryClient(
+            config.bigquery.credentials_path,
+            config.bigquery.project_id,
+            max_concurrent_queries=config.bigquery.max_concurrent_queries,
+            max_read_streams=config.bigquery.read_streams,
+            storage_api_min_rows=config.bigquery.storage_api_min_rows
+        )
+    if backend == 'local':
+        return LocalDataSource(
+            data_dir=config.data_source.data_dir,
+            output_dir=config.data_source.get_output_dir(),
+            engine=config.data_source.engine,
+            codec=config.quantization.codec_for('outputs')
+        )
+    raise ValueError(f"Unknown data source backend: {backend}")
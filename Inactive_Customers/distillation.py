@@ -0,0 +1,373 @@
+"""
+Distillation of the per-product-type models into one multi-output student.
+
+Scoring runs every customer through one calibrated booster per product type,
+so its cost grows with the number of product types. The student is a small
+multi-layer perceptron, in NumPy: standardized features, ReLU hidden layers
+and one sigmoid output per product type. It is trained to reproduce the
+teacher models' calibrated probabilities, with cross-entropy against the
+soft targets, and scores every product type in one pass of a few matrix
+products.
+
+Fidelity to the teacher is measured on held-out rows for each product type
+(mean and largest absolute error, correlation) and overall (agreement of each
+customer's top product type and top-k set). The report is saved with the
+model.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils import logger
+
+_EPS = 1e-6
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    """Logistic function, computed without overflow."""
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    """Inverse of the logistic function, for probabilities clipped away from 0 and 1."""
+    p = np.clip(p, _EPS, 1 - _EPS)
+    return np.log(p / (1 - p))
+
+
+class DistilledModel:
+    """Multi-output MLP scoring every product type at once."""
+
+    def __init__(
+        self,
+        product_ids: Sequence[int],
+        feature_names: Sequence[str],
+        mean: np.ndarray,
+        scale: np.ndarray,
+        weights: List[np.ndarray],
+        biases: List[np.ndarray],
+        fidelity: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize the model.
+
+        Args:
+            product_ids: Product type of each output column
+            feature_names: Feature column order expected at prediction time
+            mean: Per-feature mean used to standardize inputs
+            scale: Per-feature standard deviation used to standardize inputs
+            weights: Weight matrix of each layer, input to output
+            biases: Bias vector of each layer
+            fidelity: Fidelity report against the teacher models
+        """
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.fidelity = fidelity or {}
+
+    @property
+    def hidden_units(self) -> Tuple[int, ...]:
+        """Width of each hidden layer."""
+        return tuple(w.shape[1] for w in self.weights[:-1])
+
+    def _inputs(self, X: Any) -> np.ndarray:
+        """Standardized float32 feature matrix in training column order."""
+        if hasattr(X, 'columns'):
+            X = X[self.feature_names].to_numpy(dtype=np.float32)
+        X = (np.asarray(X, dtype=np.float32) - self.mean) / self.scale
+        return np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def _forward(self, inputs: np.ndarray) -> List[np.ndarray]:
+        """Activations of every layer; the last holds the output logits."""
+        activations = [inputs]
+        for layer, (w, b) in enumerate(zip(self.weights, self.biases)):
+            z = activations[-1] @ w + b
+            if layer < len(self.weights) - 1:
+                np.maximum(z, 0.0, out=z)
+            activations.append(z)
+        return activations
+
+    def predict(self, X: Any, chunk_size: Optional[int] = None) -> np.ndarray:
+        """
+        Score every product type for a batch of customers.
+
+        Args:
+            X: Features (DataFrame with the training columns, or an array in
+                ``feature_names`` order)
+            chunk_size: Rows per forward pass (None = 65536)
+
+        Returns:
+            float32 array of shape (n_rows, n_product_types), columns ordered
+            like ``product_ids``
+        """
+        if hasattr(X, 'columns'):
+            X = X[self.feature_names].to_numpy(dtype=np.float32)
+        chunk_size = chunk_size or 65536
+        output = np.empty((len(X), len(self.product_ids)), dtype=np.float32)
+        # Inputs are standardized per chunk, so only one chunk's copies are live
+        for start in range(0, len(X), chunk_size):
+            logits = self._forward(self._inputs(X[start:start + chunk_size]))[-1]
+            output[start:start + chunk_size] = _sigmoid(logits)
+        return output
+
+    def save(self, filepath: str) -> None:
+        """
+        Save the model to a ``.npz`` file.
+
+        Args:
+            filepath: Destination path
+        """
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+
+        layers = {}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            layers[f"w_{i}"] = w
+            layers[f"b_{i}"] = b
+
+        # Written to a temporary file and renamed, so scorers never read a
+        # partially written model
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                product_ids=self.product_ids,
+                feature_names=np.array(self.feature_names),
+                mean=self.mean,
+                scale=self.scale,
+                n_layers=np.array(len(self.weights)),
+                fidelity=np.array(json.dumps(self.fidelity)),
+                **layers
+            )
+        os.replace(tmp_path, filepath)
+        logger.info(f"Distilled model saved to {filepath}")
+
+    @classmethod
+    def load(cls, filepath: str) -> 'DistilledModel':
+        """
+        Load a model saved with ``save``.
+
+        Args:
+            filepath: Path to the ``.npz`` file
+
+        Returns:
+            Distilled model
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+        """
+        if not Path(filepath).exists():
+            raise FileNotFoundError(f"Distilled model not found: {filepath}")
+
+        with np.load(filepath) as data:
+            n_layers = int(data['n_layers'])
+            model = cls(
+                product_ids=data['product_ids'],
+                feature_names=[str(f) for f in data['feature_names']],
+                mean=data['mean'],
+                scale=data['scale'],
+                weights=[data[f"w_{i}"] for i in range(n_layers)],
+                biases=[data[f"b_{i}"] for i in range(n_layers)],
+                fidelity=json.loads(str(data['fidelity']))
+            )
+
+        logger.info(
+            f"Distilled model loaded from {filepath} "
+            f"({len(model.product_ids)} product types, hidden {model.hidden_units})"
+        )
+        return model
+
+
+def _correlation(a: np.ndarray, b: np.ndarray) -> Optional[float]:
+    """Pearson correlation, or None if either side is constant."""
+    a, b = a - a.mean(), b - b.mean()
+    denom = np.sqrt((a * a).sum() * (b * b).sum())
+    return float((a * b).sum() / denom) if denom > 0 else None
+
+
+def fidelity_report(
+    student: np.ndarray,
+    teacher: np.ndarray,
+    product_ids: Sequence[int],
+    top_k: int = 3
+) -> Dict[str, Any]:
+    """
+    Compare student and teacher probabilities.
+
+    Args:
+        student: (n_rows, n_product_types) student probabilities
+        teacher: Teacher probabilities of the same shape
+        product_ids: Product type of each column
+        top_k: Size of the per-customer top set compared
+
+    Returns:
+        Dict with 'overall' metrics and 'products' metrics keyed by product
+        type ID (as a string, for JSON)
+    """
+    student = student.astype(np.float64)
+    teacher = teacher.astype(np.float64)
+    errors = np.abs(student - teacher)
+
+    products = {}
+    for column, prod_id in enumerate(product_ids):
+        products[str(int(prod_id))] = {
+            'mae': float(errors[:, column].mean()),
+            'max_abs_error': float(errors[:, column].max()),
+            'correlation': _correlation(student[:, column], teacher[:, column]),
+            'teacher_mean': float(teacher[:, column].mean()),
+            'student_mean': float(student[:, column].mean()),
+        }
+
+    k = min(top_k, teacher.shape[1])
+    teacher_top = np.argsort(-teacher, axis=1)[:, :k]
+    student_top = np.argsort(-student, axis=1)[:, :k]
+    overlap = np.mean([
+        len(set(t) & set(s)) / k for t, s in zip(teacher_top.tolist(), student_top.tolist())
+    ])
+    maes = [m['mae'] for m in products.values()]
+
+    return {
+        'overall': {
+            'rows': int(len(teacher)),
+            'mae': float(errors.mean()),
+            'worst_product_mae': float(max(maes)),
+            'top1_agreement': float(np.mean(teacher_top[:, 0] == student_top[:, 0])),
+            f'top{k}_overlap': float(overlap),
+        },
+        'products': products,
+    }
+
+
+def distill(
+    X: Any,
+    teacher: np.ndarray,
+    product_ids: Sequence[int],
+    feature_names: Sequence[str],
+    hidden_units: Sequence[int] = (256,),
+    epochs: int = 30,
+    batch_size: int = 1024,
+    learning_rate: float = 3e-3,
+    validation_fraction: float = 0.1,
+    patience: int = 3,
+    top_k: int = 3,
+    random_state: int = 42
+) -> DistilledModel:
+    """
+    Train a student MLP on the teacher models' probabilities.
+
+    Minimizes the cross-entropy between the student's sigmoid outputs and the
+    teacher probabilities with Adam, keeping the weights of the epoch with the
+    lowest validation loss. Training stops after ``patience`` epochs without
+    improvement.
+
+    Args:
+        X: Imputed features (DataFrame, or array in ``feature_names`` order)
+        teacher: (n_rows, n_product_types) teacher probabilities
+        product_ids: Product type of each teacher column
+        feature_names: Feature columns of X
+        hidden_units: Width of each hidden layer
+        epochs: Maximum passes over the training rows
+        batch_size: Rows per gradient step
+        learning_rate: Adam step size
+        validation_fraction: Rows held out for early stopping and fidelity
+        patience: Epochs without validation improvement before stopping
+        top_k: Size of the per-customer top set in the fidelity report
+        random_state: Seed of the split, initialization and batch order
+
+    Returns:
+        Trained model with its fidelity report on the held-out rows
+    """
+    rng = np.random.default_rng(random_state)
+    if hasattr(X, 'columns'):
+        X = X[list(feature_names)].to_numpy(dtype=np.float32)
+    X = np.asarray(X, dtype=np.float32)
+    teacher = np.clip(np.nan_to_num(np.asarray(teacher, dtype=np.float32)), 0.0, 1.0)
+
+    order = rng.permutation(len(X))
+    n_valid = max(1, int(len(X) * validation_fraction)) if len(X) > 1 else 0
+    valid, train = order[:n_valid], order[n_valid:]
+
+    # Missing values are standardized to 0, the feature mean
+    mean = np.nan_to_num(np.nanmean(X[train], axis=0))
+    scale = np.nan_to_num(np.nanstd(X[train], axis=0))
+    scale[scale == 0] = 1.0
+
+    # He initialization; output biases start at the teacher's mean logit
+    sizes = [X.shape[1], *hidden_units, teacher.shape[1]]
+    weights = [
+        (rng.standard_normal((a, b)) * np.sqrt(2.0 / a)).astype(np.float32)
+        for a, b in zip(sizes[:-1], sizes[1:])
+    ]
+    biases = [np.zeros(b, dtype=np.float32) for b in sizes[1:]]
+    biases[-1] = _logit(teacher[train].mean(axis=0)).astype(np.float32)
+    model = DistilledModel(product_ids, feature_names, mean, scale, weights, biases)
+
+    inputs = model._inputs(X)
+    params = model.weights + model.biases
+    moments = [np.zeros_like(p) for p in params]
+    velocities = [np.zeros_like(p) for p in params]
+    beta1, beta2, step = 0.9, 0.999, 0
+
+    def loss(rows: np.ndarray) -> float:
+        z = model._forward(inputs[rows])[-1]
+        t = teacher[rows]
+        return float(np.mean(np.logaddexp(0.0, z) - t * z))
+
+    best_loss = loss(valid) if n_valid else np.inf
+    best = [p.copy() for p in params]
+    stale = 0
+    for epoch in range(epochs):
+        rng.shuffle(train)
+        for start in range(0, len(train), batch_size):
+            rows = train[start:start + batch_size]
+            activations = model._forward(inputs[rows])
+
+            # d(mean cross-entropy)/d(logits), back through the ReLU layers
+            delta = (_sigmoid(activations[-1]) - teacher[rows]) / (len(rows) * teacher.shape[1])
+            grads_w, grads_b = [], []
+            for layer in range(len(model.weights) - 1, -1, -1):
+                grads_w.append(activations[layer].T @ delta)
+                grads_b.append(delta.sum(axis=0))
+                if layer:
+                    delta = (delta @ model.weights[layer].T) * (activations[layer] > 0)
+            grads = grads_w[::-1] + grads_b[::-1]
+
+            step += 1
+            correction = np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            for param, grad, m, v in zip(params, grads, moments, velocities):
+                m *= beta1
+                m += (1 - beta1) * grad
+                v *= beta2
+                v += (1 - beta2) * grad * grad
+                param -= learning_rate * correction * m / (np.sqrt(v) + 1e-8)
+
+        current = loss(valid) if n_valid else loss(train)
+        logger.debug(f"Distillation epoch {epoch + 1}: validation loss {current:.6f}")
+        if current < best_loss - 1e-7:
+            best_loss, stale = current, 0
+            best = [p.copy() for p in params]
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+
+    n_layers = len(model.weights)
+    model.weights, model.biases = best[:n_layers], best[n_layers:]
+
+    evaluate = valid if n_valid else train
+    model.fidelity = fidelity_report(
+        model.predict(X[evaluate]), teacher[evaluate], product_ids, top_k
+    )
+    model.fidelity['training'] = {
+        'rows': int(len(train)),
+        'epochs': epoch + 1,
+        'validation_loss': best_loss,
+        'hidden_units': list(hidden_units),
+    }
+    return model
+
@@ -0,0 +1,300 @@
+"""
+In-process fakes of the BigQuery and BigQuery Storage clients.
+
+``fake_bigquery_client`` returns a real ``BigQueryClient`` whose Google
+clients are replaced by these fakes, so its query submission, concurrent
+download and Storage API stream logic runs offline. Queries are evaluated by
+``LocalDataSource`` over in-memory tables. Latency is simulated with sleeps
+that release the GIL, like network waits:
+
+- a query job finishes ``query_latency`` seconds after it was submitted,
+  whether or not anyone is waiting on it;
+- each Storage API read stream costs ``stream_latency`` plus
+  ``seconds_per_million_rows`` for its share of the rows;
+- the non-Storage download costs ``stream_latency`` plus
+  ``rest_slowdown`` times the per-row cost for all rows.
+
+The fakes count submitted jobs, opened read streams and the peak number of
+jobs and streams in flight, so callers can check that work overlapped.
+"""
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from data_sources import LocalDataSource
+from utils import BigQueryClient
+
+
+@dataclass(frozen=True)
+class FakeTableReference:
+    """Stand-in for google.cloud.bigquery.TableReference."""
+
+    project: str
+    dataset_id: str
+    table_id: str
+
+
+class _InFlight:
+    """Thread-safe counter that remembers its peak."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.total = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.total += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+class FakeRowIterator:
+    """Stand-in for the RowIterator returned by QueryJob.result()."""
+
+    def __init__(self, client: 'FakeBigQuery', df: pd.DataFrame):
+        self._client = client
+        self._df = df
+        self.total_rows = len(df)
+
+    def to_dataframe(self, bqstorage_client: Any = None) -> pd.DataFrame:
+        """Download the whole result over the (slower) REST path."""
+        time.sleep(self._client.stream_latency + self._client.rest_slowdown
+                   * self._client.seconds_per_million_rows * len(self._df) / 1e6)
+        return self._df.copy()
+
+
+class FakeQueryJob:
+    """Stand-in for google.cloud.bigquery.QueryJob."""
+
+    def __init__(self, client: 'FakeBigQuery', query: str, destination: FakeTableReference):
+        self._client = client
+        self.query = query
+        self.destination = destination
+        self.ready_at = time.perf_counter() + client.query_latency
+        self.cancelled = False
+        self._error: Optional[Exception] = None
+        self._df: Optional[pd.DataFrame] = None
+
+        try:
+            self._df = client.engine.execute_query(query)
+        except Exception as e:
+            self._error = e
+        else:
+            client.results[destination.table_id] = self._df
+
+    def done(self) -> bool:
+        """Whether the job finished."""
+        return self.cancelled or time.perf_counter() >= self.ready_at
+
+    def cancel(self) -> bool:
+        """Cancel the job."""
+        self.cancelled = True
+        return True
+
+    def result(self) -> FakeRowIterator:
+        """
+        Wait for the job to finish.
+
+        Raises:
+            Exception: The query's evaluation error, if any
+        """
+        with self._client.jobs_waiting:
+            remaining = self.ready_at - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+        if self._error is not None:
+            raise self._error
+        return FakeRowIterator(self._client, self._df)
+
+
+class FakeBigQuery:
+    """Stand-in for google.cloud.bigquery.Client."""
+
+    def __init__(
+        self,
+        tables: Dict[str, pd.DataFrame],
+        project: str = 'fake-project',
+        query_latency: float = 0.0,
+        stream_latency: float = 0.0,
+        seconds_per_million_rows: float = 0.0,
+        rest_slowdown: float = 4.0,
+        engine: str = 'pandas'
+    ):
+        """
+        Initialize the fake client.
+
+        Args:
+            tables: In-memory tables by name
+            project: Project ID reported in table references
+            query_latency: Seconds from submission until a job finishes
+            stream_latency: Fixed seconds per download (or read stream)
+            seconds_per_million_rows: Download cost per million rows
+            rest_slowdown: Cost multiplier of the non-Storage download
+            engine: LocalDataSource engine evaluating the queries ('duckdb'
+                for SQL beyond simple SELECTs, e.g. shard predicates)
+        """
+        self.project = project
+        self.engine = LocalDataSource(tables=tables, engine=engine)
+        self.query_latency = query_latency
+        self.stream_latency = stream_latency
+        self.seconds_per_million_rows = seconds_per_million_rows
+        self.rest_slowdown = rest_slowdown
+
+        self.results: Dict[str, pd.DataFrame] = {}
+        self.jobs: List[FakeQueryJob] = []
+        self.jobs_waiting = _InFlight()
+        self._ids = itertools.count()
+
+    def query(self, query: str) -> FakeQueryJob:
+        """Submit a query; it is evaluated now and 'finishes' after query_latency."""
+        destination = FakeTableReference(self.project, '_fake_results', f"anon{next(self._ids)}")
+        job = FakeQueryJob(self, query, destination)
+        self.jobs.append(job)
+        return job
+
+
+@dataclass
+class FakeReadStream:
+    """Stand-in for a ReadStream of a read session."""
+
+    name: str
+
+
+@dataclass
+class FakeArrowSchema:
+    """Stand-in for ArrowSchema."""
+
+    serialized_schema: bytes
+
+
+@dataclass
+class FakeReadSession:
+    """Stand-in for a Storage API ReadSession."""
+
+    name: str
+    streams: List[FakeReadStream]
+    arrow_schema: FakeArrowSchema
+
+
+class FakeReadRowsStream:
+    """Stand-in for the ReadRowsStream returned by read_rows()."""
+
+    def __init__(self, client: 'FakeBigQueryReadClient', df: pd.DataFrame):
+        self._client = client
+        self._df = df
+
+    def to_arrow(self, read_session: Any = None) -> Any:
+        """Download this stream's rows as an Arrow table."""
+        import pyarrow as pa
+
+        bq = self._client.bq
+        with self._client.streams_open:
+            time.sleep(bq.stream_latency + bq.seconds_per_million_rows * len(self._df) / 1e6)
+        return pa.Table.from_pandas(self._df, preserve_index=False)
+
+
+class FakeBigQueryReadClient:
+    """Stand-in for google.cloud.bigquery_storage.BigQueryReadClient."""
+
+    def __init__(self, bq: FakeBigQuery, default_streams: int = 4):
+        """
+        Initialize the fake Storage API client.
+
+        Args:
+            bq: Fake BigQuery client whose query results are read
+            default_streams: Streams per session when the caller lets BigQuery decide
+        """
+        self.bq = bq
+        self.default_streams = default_streams
+        self.streams_open = _InFlight()
+        self._streams: Dict[str, pd.DataFrame] = {}
+        self._ids = itertools.count()
+
+    def create_read_session(
+        self,
+        parent: str,
+        read_session: Dict[str, Any],
+        max_stream_count: int = 0
+    ) -> FakeReadSession:
+        """Split a result table into up to max_stream_count row ranges."""
+        import pyarrow as pa
+
+        table_id = read_session['table'].rsplit('/', 1)[-1]
+        df = self.bq.results[table_id]
+        fields = read_session.get('read_options', {}).get('selected_fields')
+        if fields:
+            df = df[fields]
+
+        session_name = f"{parent}/sessions/fake{next(self._ids)}"
+        n_streams = min(max_stream_count or self.default_streams, len(df))
+        bounds = [len(df) * i // max(n_streams, 1) for i in range(n_streams + 1)]
+
+        streams = []
+        for i in range(n_streams):
+            name = f"{session_name}/streams/{i}"
+            self._streams[name] = df.iloc[bounds[i]:bounds[i + 1]]
+            streams.append(FakeReadStream(name))
+
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        return FakeReadSession(session_name, streams, FakeArrowSchema(schema.serialize().to_pybytes()))
+
+    def read_rows(self, name: str) -> FakeReadRowsStream:
+        """Open a read stream."""
+        return FakeReadRowsStream(self, self._streams.pop(name))
+
+
+def fake_bigquery_client(
+    tables: Dict[str, pd.DataFrame],
+    query_latency: float = 0.0,
+    stream_latency: float = 0.0,
+    seconds_per_million_rows: float = 0.0,
+    default_streams: int = 4,
+    max_concurrent_queries: int = 4,
+    max_read_streams: int = 0,
+    storage_api_min_rows: int = 100_000,
+    engine: str = 'pandas'
+) -> BigQueryClient:
+    """
+    Build a BigQueryClient backed by the fakes.
+
+    Args:
+        tables: In-memory tables by name
+        query_latency: Seconds from submission until a job finishes
+        stream_latency: Fixed seconds per download (or read stream)
+        seconds_per_million_rows: Download cost per million rows
+        default_streams: Streams per session when BigQuery decides
+        max_concurrent_queries: Passed to BigQueryClient
+        max_read_streams: Passed to BigQueryClient
+        storage_api_min_rows: Passed to BigQueryClient
+        engine: LocalDataSource engine evaluating the queries
+
+    Returns:
+        BigQueryClient whose ``bq_client``/``bq_storage_client`` are fakes
+    """
+    bq = FakeBigQuery(
+        tables,
+        query_latency=query_latency,
+        stream_latency=stream_latency,
+        seconds_per_million_rows=seconds_per_million_rows,
+        engine=engine
+    )
+    storage = FakeBigQueryReadClient(bq, default_streams=default_streams)
+    return BigQueryClient.from_clients(
+        bq,
+        storage,
+        bq.project,
+        max_concurrent_queries=max_concurrent_queries,
+        max_read_streams=max_read_streams,
+        storage_api_min_rows=storage_api_min_rows
+    )
@@ -0,0 +1,357 @@
+"""
+On-disk feature store for imputed per-customer feature vectors.
+
+A snapshot is a directory ``<root_dir>/<snapshot>/`` holding ``ids.npy``
+(sorted, unique int64 customer IDs), ``features.npy`` (a float32 matrix with
+one row per ID and columns in ``FeatureConfig.features`` order) and
+``meta.json``. Readers open both arrays with ``np.load(mmap_mode='r')``, so
+features are paged in from the file instead of being copied, and customers are
+located with a ``searchsorted`` over the ID index. New snapshots are written
+to a temporary directory and renamed into place.
+
+``upsert`` compares incoming rows with the current snapshot and writes only
+customers that are new or whose features changed: in place when the target
+snapshot already holds all of them, otherwise into a new snapshot that merges
+the base snapshot with the changes.
+
+Features stay float32 even when ``QUANTIZATION_CODEC`` is set: quantization.py
+is for probability tables. Rounding a model input can move it across a split
+threshold and change the scores.
+"""
+
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils import logger
+
+_SNAPSHOT_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+IDS_FILE = "ids.npy"
+FEATURES_FILE = "features.npy"
+META_FILE = "meta.json"
+
+
+class FeatureSnapshot:
+    """Read-only, memory-mapped view of one feature store snapshot."""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open a snapshot.
+
+        Args:
+            path: Snapshot directory
+
+        Raises:
+            FileNotFoundError: If the snapshot is incomplete
+        """
+        self.path = Path(path)
+        with open(self.path / META_FILE) as f:
+            self.meta: Dict[str, Any] = json.load(f)
+
+        self.name: str = self.meta['snapshot']
+        self.features: List[str] = self.meta['features']
+        self.ids: np.ndarray = np.load(self.path / IDS_FILE, mmap_mode='r')
+        self.matrix: np.ndarray = np.load(self.path / FEATURES_FILE, mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def lookup(self, customer_ids: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Locate customers in the snapshot.
+
+        Args:
+            customer_ids: Customer IDs to look up
+
+        Returns:
+            Tuple of (row positions, found mask); positions of customers that
+            are not found are meaningless
+        """
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+
+        positions = np.searchsorted(self.ids, ids)
+        positions = np.minimum(positions, len(self.ids) - 1)
+        return positions, self.ids[positions] == ids
+
+    def take(self, customer_ids: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the feature rows of the customers present in the snapshot.
+
+        When the request is exactly the snapshot's ID index the memory-mapped
+        matrix itself is returned, without copying.
+
+        Args:
+            customer_ids: Customer IDs to fetch
+
+        Returns:
+            Tuple of (float32 feature rows of the found customers, found mask)
+        """
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        if len(ids) == len(self.ids) and np.array_equal(ids, self.ids):
+            return self.matrix, np.ones(len(ids), dtype=bool)
+
+        positions, found = self.lookup(ids)
+        return self.matrix[positions[found]], found
+
+    def frame(self, customer_ids: Optional[Any] = None) -> pd.DataFrame:
+        """
+        Get customers' features as a DataFrame.
+
+        Args:
+            customer_ids: Customers to fetch (None = the whole snapshot);
+                customers not in the snapshot are dropped
+
+        Returns:
+            DataFrame with customer_id followed by the feature columns
+        """
+        if customer_ids is None:
+            ids, rows = np.asarray(self.ids), self.matrix
+        else:
+            ids = np.asarray(customer_ids, dtype=np.int64)
+            rows, found = self.take(ids)
+            ids = ids[found]
+
+        df = pd.DataFrame(rows, columns=self.features, copy=False)
+        df.insert(0, 'customer_id', ids)
+        return df
+
+
+class FeatureStore:
+    """
+    Directory of dated feature snapshots.
+
+    Snapshot names sort chronologically (e.g. ISO dates), so the latest
+    snapshot is the greatest name.
+    """
+
+    def __init__(self, root_dir: str, features: List[str], block_rows: int = 1_000_000):
+        """
+        Initialize the feature store.
+
+        Args:
+            root_dir: Directory holding the snapshots
+            features: Feature columns, in model input order
+            block_rows: Rows copied at a time when merging snapshots
+        """
+        self.root_dir = Path(root_dir)
+        self.features = list(features)
+        self.block_rows = block_rows
+
+    def snapshots(self) -> List[str]:
+        """List the complete snapshots, oldest first."""
+        if not self.root_dir.is_dir():
+            return []
+        return sorted(
+            p.name for p in self.root_dir.iterdir()
+            if _SNAPSHOT_RE.match(p.name) and (p / META_FILE).exists()
+        )
+
+    def latest(self) -> Optional[str]:
+        """Name of the latest snapshot, or None if the store is empty."""
+        snapshots = self.snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def open(self, snapshot: Optional[str] = None) -> FeatureSnapshot:
+        """
+        Open a snapshot for reading.
+
+        Args:
+            snapshot: Snapshot name (None = latest)
+
+        Returns:
+            Memory-mapped snapshot
+
+        Raises:
+            FileNotFoundError: If the snapshot does not exist
+            ValueError: If the snapshot holds different features
+        """
+        snapshot = snapshot or self.latest()
+        if snapshot is None or not (self.root_dir / snapshot / META_FILE).exists():
+            raise FileNotFoundError(f"No feature snapshot {snapshot!r} in {self.root_dir}")
+
+        opened = FeatureSnapshot(self.root_dir / snapshot)
+        if opened.features != self.features:
+            raise ValueError(
+                f"Feature snapshot {snapshot} holds features {opened.features}, "
+                f"expected {self.features}"
+            )
+        return opened
+
+    def _prepare(self, customer_ids: Any, values: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Validate incoming rows and sort them by customer ID."""
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        if isinstance(values, pd.DataFrame):
+            values = values[self.features]
+        matrix = np.asarray(values, dtype=np.float32)
+
+        if matrix.ndim != 2 or matrix.shape != (len(ids), len(self.features)):
+            raise ValueError(
+                f"Expected a {len(ids)} x {len(self.features)} feature matrix, got {matrix.shape}"
+            )
+
+        order = np.argsort(ids, kind='stable')
+        ids, matrix = ids[order], matrix[order]
+        if len(ids) > 1 and (ids[1:] == ids[:-1]).any():
+            raise ValueError("Duplicate customer IDs in feature rows")
+        return ids, matrix
+
+    def _write(
+        self,
+        snapshot: str,
+        ids: np.ndarray,
+        fill: Callable[[np.ndarray], None],
+        **meta: Any
+    ) -> FeatureSnapshot:
+        """Write a snapshot through a temporary directory and rename it into place."""
+        if not _SNAPSHOT_RE.match(snapshot):
+            raise ValueError(f"Invalid snapshot name: {snapshot!r}")
+
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        target = self.root_dir / snapshot
+        tmp = self.root_dir / f".{snapshot}.{os.getpid()}.tmp"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir()
+
+        np.save(tmp / IDS_FILE, ids)
+        matrix = np.lib.format.open_memmap(
+            tmp / FEATURES_FILE, mode='w+', dtype=np.float32, shape=(len(ids), len(self.features))
+        )
+        fill(matrix)
+        matrix.flush()
+        del matrix
+
+        with open(tmp / META_FILE, 'w') as f:
+            json.dump({
+                'snapshot': snapshot,
+                'features': self.features,
+                'rows': len(ids),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                **meta,
+            }, f, indent=2)
+
+        # A directory cannot be renamed over a non-empty one; move the old
+        # snapshot aside first
+        if target.exists():
+            old = self.root_dir / f".{snapshot}.{os.getpid()}.old"
+            os.replace(target, old)
+            os.replace(tmp, target)
+            shutil.rmtree(old)
+        else:
+            os.replace(tmp, target)
+
+        return FeatureSnapshot(target)
+
+    def write_snapshot(self, snapshot: str, customer_ids: Any, values: Any) -> FeatureSnapshot:
+        """
+        Write (or replace) a snapshot from scratch.
+
+        Args:
+            snapshot: Snapshot name
+            customer_ids: Customer IDs
+            values: Imputed features (DataFrame with the feature columns, or
+                an array in feature order)
+
+        Returns:
+            The written snapshot
+
+        Raises:
+            ValueError: If the rows are malformed or customer IDs repeat
+        """
+        ids, matrix = self._prepare(customer_ids, values)
+
+        def fill(out: np.ndarray) -> None:
+            out[:] = matrix
+
+        written = self._write(snapshot, ids, fill)
+        logger.info(f"Feature snapshot {snapshot} written ({len(ids)} customers)")
+        return written
+
+    def upsert(
+        self,
+        snapshot: str,
+        customer_ids: Any,
+        values: Any,
+        base: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Insert new customers and update changed ones.
+
+        Customers of the base snapshot that are not in ``customer_ids`` are
+        carried over unchanged. If ``snapshot`` is the base and every incoming
+        customer is already in it, only the changed rows are rewritten, in
+        place (readers that already mapped the snapshot see the new values).
+
+        Args:
+            snapshot: Snapshot to write
+            customer_ids: Customer IDs
+            values: Imputed features (DataFrame with the feature columns, or
+                an array in feature order)
+            base: Snapshot to start from (default: ``snapshot`` if it exists,
+                otherwise the latest snapshot)
+
+        Returns:
+            Counts of inserted, updated and unchanged customers
+        """
+        ids, matrix = self._prepare(customer_ids, values)
+
+        if base is None:
+            base = snapshot if snapshot in self.snapshots() else self.latest()
+        if base is None:
+            self.write_snapshot(snapshot, ids, matrix)
+            return {'inserted': len(ids), 'updated': 0, 'unchanged': 0}
+
+        current = self.open(base)
+        positions, found = current.lookup(ids)
+
+        changed = np.zeros(len(ids), dtype=bool)
+        old = current.matrix[positions[found]]
+        new = matrix[found]
+        changed[found] = ~((old == new) | (np.isnan(old) & np.isnan(new))).all(axis=1)
+        inserted = ~found
+
+        stats = {
+            'inserted': int(inserted.sum()),
+            'updated': int(changed.sum()),
+            'unchanged': int(found.sum() - changed.sum()),
+        }
+
+        if base == snapshot and not inserted.any():
+            if changed.any():
+                out = np.lib.format.open_memmap(current.path / FEATURES_FILE, mode='r+')
+                out[positions[changed]] = matrix[changed]
+                out.flush()
+                del out
+            logger.info(f"Feature snapshot {snapshot} updated in place: {stats}")
+            return stats
+
+        # Merge the base index with the new customers, then copy rows in blocks
+        merged = np.concatenate([current.ids, ids[inserted]])
+        order = np.argsort(merged, kind='stable')
+        merged = merged[order]
+        n_base = len(current)
+        new_rows = matrix[inserted]
+
+        def fill(out: np.ndarray) -> None:
+            for start in range(0, len(merged), self.block_rows):
+                source = order[start:start + self.block_rows]
+                from_base = source < n_base
+                block = np.empty((len(source), len(self.features)), dtype=np.float32)
+                block[from_base] = current.matrix[source[from_base]]
+                block[~from_base] = new_rows[source[~from_base] - n_base]
+                out[start:start + len(source)] = block
+            out[np.searchsorted(merged, ids[changed])] = matrix[changed]
+
+        self._write(snapshot, merged, fill, base=base, upsert=stats)
+        logger.info(f"Feature snapshot {snapshot} written from {base}: {stats}")
+        return stats
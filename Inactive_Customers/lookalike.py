@@ -0,0 +1,498 @@
+"""
+Nearest-neighbour index over the customers' predicted propensity vectors.
+
+Each scored customer has one probability per product type (the ``p<id>``
+columns of the clustering table). ``LookalikeIndex`` finds, for a batch of
+seed customers, the customers whose vectors are closest: by cosine similarity
+(vectors are unit-normalised once, so similarity is a dot product) or by
+Euclidean distance (``|q|^2 - 2 q.x + |x|^2``, with the index norms
+precomputed).
+
+Exact search is blocked: a block of queries is multiplied against a block of
+index rows at a time and each query's running top k is merged with
+``np.argpartition``, so memory is bounded by the two block sizes rather than
+queries x customers.
+
+With ``n_lists > 0`` the index is also partitioned (IVF): k-means on a sample
+assigns every customer to its nearest of ``n_lists`` centroids and the rows
+are stored grouped by list. An approximate search scores only the
+``n_probe`` lists nearest to each query; queries probing the same list are
+scored together in one matrix product. ``recall_at_k`` compares the result
+with the exact search.
+
+Missing probabilities (product types without a model) count as 0.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import logger
+
+METRICS = ('cosine', 'l2')
+
+
+def _prepare(vectors: Any, metric: str) -> np.ndarray:
+    """Contiguous float32 vectors with NaN as 0, unit-normalised for cosine."""
+    vectors = np.nan_to_num(np.asarray(vectors, dtype=np.float32), nan=0.0)
+    if metric == 'cosine':
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Customers with no propensity at all stay zero (similarity 0 to all)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def _merge_top_k(
+    best_scores: np.ndarray,
+    best_rows: np.ndarray,
+    scores: np.ndarray,
+    rows: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k highest of the running and new scores of each query (unsorted)."""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(scores), len(rows)))], axis=1)
+    keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, keep, axis=1), np.take_along_axis(rows, keep, axis=1)
+
+
+def recall_at_k(approximate_rows: np.ndarray, exact_rows: np.ndarray) -> float:
+    """
+    Mean fraction of each query's exact neighbours found by the approximate search.
+
+    Args:
+        approximate_rows: (queries, k) index rows, -1 for no neighbour
+        exact_rows: (queries, k) index rows of the exact search
+
+    Returns:
+        Recall in [0, 1] (1.0 when there are no exact neighbours)
+    """
+    valid = exact_rows >= 0
+    if not valid.any():
+        return 1.0
+    found = (exact_rows[:, :, None] == approximate_rows[:, None, :]).any(axis=2) & valid
+    return float(found.sum() / valid.sum())
+
+
+class LookalikeIndex:
+    """Exact and partitioned (IVF) nearest-neighbour search over propensity vectors."""
+
+    def __init__(
+        self,
+        customer_ids: np.ndarray,
+        vectors: np.ndarray,
+        product_ids: np.ndarray,
+        metric: str = 'cosine',
+        centroids: Optional[np.ndarray] = None,
+        list_offsets: Optional[np.ndarray] = None
+    ):
+        """
+        Initialize the index from prepared arrays (use ``build``).
+
+        Args:
+            customer_ids: Customer ID of each row
+            vectors: (customers, product types) float32 vectors, already
+                normalised for cosine and grouped by list when partitioned
+            product_ids: Product type ID of each vector component
+            metric: 'cosine' or 'l2'
+            centroids: (n_lists, product types) list centroids (None = exact only)
+            list_offsets: Row offsets of each list, length n_lists + 1
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {METRICS}")
+        self.customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        self.vectors = vectors
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.metric = metric
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.sq_norms = np.einsum('ij,ij->i', vectors, vectors) if metric == 'l2' else None
+        self._rows = pd.Index(self.customer_ids)
+
+    @classmethod
+    def build(
+        cls,
+        customer_ids: Any,
+        vectors: Any,
+        product_ids: Any,
+        metric: str = 'cosine',
+        n_lists: int = 0,
+        kmeans_iterations: int = 10,
+        kmeans_sample: int = 100_000,
+        block_size: int = 16_384,
+        random_state: int = 42
+    ) -> 'LookalikeIndex':
+        """
+        Build an index from the customers' propensity vectors.
+
+        Args:
+            customer_ids: Customer ID of each vector
+            vectors: (customers, product types) probabilities
+            product_ids: Product type ID of each column
+            metric: 'cosine' or 'l2'
+            n_lists: Partitions for approximate search (0 = exact only)
+            kmeans_iterations: Lloyd iterations of the partitioning
+            kmeans_sample: Customers the centroids are fit on
+            block_size: Rows assigned to lists per block
+            random_state: Seed of the sample and centroid initialisation
+
+        Returns:
+            Index
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {METRICS}")
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        vectors = _prepare(vectors, metric)
+
+        n_lists = min(n_lists, len(vectors))
+        if n_lists < 2:
+            return cls(customer_ids, vectors, product_ids, metric)
+
+        rng = np.random.default_rng(random_state)
+        sample = vectors
+        if len(vectors) > kmeans_sample:
+            sample = vectors[rng.choice(len(vectors), kmeans_sample, replace=False)]
+        centroids = cls._kmeans(sample, n_lists, kmeans_iterations, metric, block_size, rng)
+
+        assignment = cls._assign(vectors, centroids, metric, block_size)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=offsets[1:])
+
+        return cls(
+            customer_ids[order],
+            np.ascontiguousarray(vectors[order]),
+            product_ids,
+            metric,
+            centroids=centroids,
+            list_offsets=offsets
+        )
+
+    @staticmethod
+    def _assign(
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        metric: str,
+        block_size: int
+    ) -> np.ndarray:
+        """Nearest centroid of each vector, in row blocks."""
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        # Both metrics rank by q.c - |c|^2 / 2 (cosine centroids are unit length)
+        offset = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T - offset, axis=1)
+        return assignment
+
+    @classmethod
+    def _kmeans(
+        cls,
+        sample: np.ndarray,
+        n_lists: int,
+        iterations: int,
+        metric: str,
+        block_size: int,
+        rng: np.random.Generator
+    ) -> np.ndarray:
+        """Lloyd's k-means (spherical for cosine); empty lists are reseeded."""
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = cls._assign(sample, centroids, metric, block_size)
+            counts = np.bincount(assignment, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = counts == 0
+            centroids = sums / np.maximum(counts, 1)[:, None]
+            if empty.any():
+                centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            if metric == 'cosine':
+                norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+                centroids = centroids / np.where(norms > 0, norms, 1.0)
+        return centroids.astype(np.float32)
+
+    @property
+    def partitioned(self) -> bool:
+        """Whether approximate (IVF) search is available."""
+        return self.centroids is not None
+
+    @property
+    def n_lists(self) -> int:
+        """Number of partitions (0 = exact only)."""
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.customer_ids)
+
+    def rows_of(self, customer_ids: Any) -> np.ndarray:
+        """Index row of each customer ID (-1 if not indexed)."""
+        return self._rows.get_indexer(np.asarray(customer_ids, dtype=np.int64))
+
+    def _scores(self, queries: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """Higher-is-closer scores of queries against index rows start:stop."""
+        scores = queries @ self.vectors[start:stop].T
+        if self.metric == 'l2':
+            # -|q - x|^2 up to the per-query constant |q|^2
+            scores = 2.0 * scores - self.sq_norms[start:stop]
+        return scores
+
+    def _search_rows(
+        self,
+        queries: np.ndarray,
+        ranges: Iterable[Tuple[int, int]],
+        best_scores: np.ndarray,
+        best_rows: np.ndarray,
+        exclude_rows: np.ndarray,
+        k: int,
+        block_size: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Merge the scores of index row ranges into the queries' running top k."""
+        for range_start, range_stop in ranges:
+            for start in range(range_start, range_stop, block_size):
+                stop = min(start + block_size, range_stop)
+                scores = self._scores(queries, start, stop)
+                # A seed is not its own lookalike
+                own = (exclude_rows >= start) & (exclude_rows < stop)
+                scores[np.nonzero(own)[0], exclude_rows[own] - start] = -np.inf
+                best_scores, best_rows = _merge_top_k(
+                    best_scores, best_rows, scores, np.arange(start, stop), k
+                )
+        return best_scores, best_rows
+
+    def search(
+        self,
+        queries: Any,
+        k: int = 10,
+        exact: bool = True,
+        n_probe: int = 8,
+        exclude_rows: Optional[np.ndarray] = None,
+        block_size: int = 16_384,
+        query_block_size: int = 1024
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest index rows of each query vector.
+
+        Args:
+            queries: (queries, product types) probabilities
+            k: Neighbours per query
+            exact: Scan every row; otherwise only the ``n_probe`` nearest
+                lists (requires a partitioned index)
+            n_probe: Lists scanned per query by the approximate search
+            exclude_rows: Index row to skip for each query (-1 = none)
+            block_size: Index rows per block of the exact scan
+            query_block_size: Queries scored together
+
+        Returns:
+            Tuple of (rows, scores), each (queries, k) and sorted closest
+            first. Scores are cosine similarities or L2 distances; rows are
+            -1 where fewer than k candidates were scanned.
+        """
+        if not exact and not self.partitioned:
+            raise ValueError("Approximate search needs an index built with n_lists > 0")
+        queries = _prepare(queries, self.metric)
+        k = max(1, min(k, len(self)))
+        if exclude_rows is None:
+            exclude_rows = np.full(len(queries), -1, dtype=np.int64)
+        exclude_rows = np.asarray(exclude_rows, dtype=np.int64)
+
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        n_probe = min(n_probe, self.n_lists)
+
+        for q_start in range(0, len(queries), query_block_size):
+            q_stop = min(q_start + query_block_size, len(queries))
+            block = queries[q_start:q_stop]
+            best_scores = np.full((len(block), k), -np.inf, dtype=np.float32)
+            best_rows = np.full((len(block), k), -1, dtype=np.int64)
+            excluded = exclude_rows[q_start:q_stop]
+
+            if exact or n_probe >= self.n_lists:
+                best_scores, best_rows = self._search_rows(
+                    block, [(0, len(self))], best_scores, best_rows, excluded, k, block_size
+                )
+            else:
+                offset = 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+                probes = np.argpartition(
+                    -(block @ self.centroids.T - offset), n_probe - 1, axis=1
+                )[:, :n_probe]
+                # Queries probing the same list are scored in one product
+                for list_id in np.unique(probes):
+                    members = np.nonzero((probes == list_id).any(axis=1))[0]
+                    start, stop = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+                    if start == stop:
+                        continue
+                    best_scores[members], best_rows[members] = self._search_rows(
+                        block[members], [(start, stop)], best_scores[members],
+                        best_rows[members], excluded[members], k, block_size
+                    )
+
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+            best_rows[np.isneginf(best_scores)] = -1
+
+            if self.metric == 'l2':
+                q_norms = np.einsum('ij,ij->i', block, block)[:, None]
+                best_scores = np.sqrt(np.maximum(q_norms - best_scores, 0.0))
+            rows[q_start:q_stop] = best_rows
+            scores[q_start:q_stop] = best_scores
+
+        scores[rows < 0] = np.nan
+        return rows, scores
+
+    def query_customers(
+        self,
+        seed_customer_ids: Any,
+        k: int = 50,
+        exact: bool = True,
+        n_probe: int = 8,
+        block_size: int = 16_384,
+        query_block_size: int = 1024
+    ) -> pd.DataFrame:
+        """
+        Find the lookalikes of indexed seed customers.
+
+        Seeds missing from the index are logged and skipped; a seed is never
+        returned as its own lookalike.
+
+        Args:
+            seed_customer_ids: Seed customer IDs
+            k: Lookalikes per seed
+            exact: Exact search instead of the partitioned approximation
+            n_probe: Lists scanned per seed by the approximate search
+            block_size: Index rows per block of the exact scan
+            query_block_size: Seeds scored together
+
+        Returns:
+            Narrow DataFrame with seed_customer_id, rank (1 = closest),
+            customer_id and score, k rows per seed
+        """
+        seeds = np.unique(np.asarray(seed_customer_ids, dtype=np.int64))
+        seed_rows = self.rows_of(seeds)
+        if (seed_rows < 0).any():
+            logger.warning(
+                f"{int((seed_rows < 0).sum())} of {len(seeds)} seed customers "
+                f"were not scored and are skipped"
+            )
+        seeds, seed_rows = seeds[seed_rows >= 0], seed_rows[seed_rows >= 0]
+
+        # Indexed vectors are already prepared; preparing them again is a no-op
+        rows, scores = self.search(
+            self.vectors[seed_rows],
+            k=k,
+            exact=exact,
+            n_probe=n_probe,
+            exclude_rows=seed_rows,
+            block_size=block_size,
+            query_block_size=query_block_size
+        )
+        k = rows.shape[1]
+        found = rows >= 0
+        return pd.DataFrame({
+            'seed_customer_id': np.repeat(seeds, k)[found.ravel()],
+            'rank': np.tile(np.arange(1, k + 1, dtype=np.int16), len(seeds))[found.ravel()],
+            'customer_id': self.customer_ids[rows[found]],
+            'score': scores[found].astype(np.float32),
+        })
+
+    def evaluate(
+        self,
+        seed_rows: np.ndarray,
+        k: int = 50,
+        n_probe: int = 8,
+        block_size: int = 16_384,
+        query_block_size: int = 1024
+    ) -> Dict[str, float]:
+        """
+        Recall and latency of the approximate search against the exact one.
+
+        Args:
+            seed_rows: Index rows used as queries
+            k: Neighbours per query
+            n_probe: Lists scanned per query
+            block_size: Index rows per block of the exact scan
+            query_block_size: Queries scored together
+
+        Returns:
+            Dict with recall, and ms per query of both searches
+        """
+        queries = self.vectors[seed_rows]
+        timings = {}
+        results = {}
+        for name, exact in (('exact', True), ('approximate', False)):
+            started = time.perf_counter()
+            results[name], _ = self.search(
+                queries, k=k, exact=exact, n_probe=n_probe, exclude_rows=seed_rows,
+                block_size=block_size, query_block_size=query_block_size
+            )
+            timings[name] = (time.perf_counter() - started) * 1000 / max(len(seed_rows), 1)
+        return {
+            'queries': int(len(seed_rows)),
+            'recall': recall_at_k(results['approximate'], results['exact']),
+            'exact_ms_per_query': timings['exact'],
+            'approximate_ms_per_query': timings['approximate'],
+        }
+
+    def save(self, filepath: str) -> None:
+        """
+        Save the index to a ``.npz`` file.
+
+        Args:
+            filepath: Destination path
+        """
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+
+        partitions = {}
+        if self.partitioned:
+            partitions = {'centroids': self.centroids, 'list_offsets': self.list_offsets}
+
+        # Written to a temporary file and renamed, so readers never see a
+        # partially written index
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                customer_ids=self.customer_ids,
+                vectors=self.vectors,
+                product_ids=self.product_ids,
+                metric=np.array(self.metric),
+                **partitions
+            )
+        os.replace(tmp_path, filepath)
+        logger.info(f"Lookalike index saved to {filepath}")
+
+    @classmethod
+    def load(cls, filepath: str) -> 'LookalikeIndex':
+        """
+        Load an index saved with ``save``.
+
+        Args:
+            filepath: Path to the ``.npz`` file
+
+        Returns:
+            Index
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+        """
+        if not Path(filepath).exists():
+            raise FileNotFoundError(f"Lookalike index not found: {filepath}")
+
+        with np.load(filepath) as data:
+            index = cls(
+                customer_ids=data['customer_ids'],
+                vectors=data['vectors'],
+                product_ids=data['product_ids'],
+                metric=str(data['metric']),
+                centroids=data['centroids'] if 'centroids' in data else None,
+                list_offsets=data['list_offsets'] if 'list_offsets' in data else None
+            )
+
+        logger.info(
+            f"Lookalike index loaded from {filepath} "
+            f"({len(index)} customers, {index.n_lists} lists)"
+        )
+        return index
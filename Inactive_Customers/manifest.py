@@ -0,0 +1,198 @@
+"""Model manifest recording what was trained for each product type."""
+
+import hashlib
+import json
+import os
+import statistics
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils import logger
+
+COMPLETED = 'completed'
+FAILED = 'failed'
+RUNNING = 'running'
+
+
+def file_checksum(filepath: str) -> Optional[str]:
+    """SHA-256 of a file's contents, or None if it does not exist."""
+    if not Path(filepath).exists():
+        return None
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_checksum(params: Dict[str, Any]) -> str:
+    """Stable hash of the training parameters of a model."""
+    encoded = json.dumps(params, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ModelManifest:
+    """
+    JSON manifest stored next to the per-product-type models.
+
+    Each entry is keyed by product type ID and records the training slice
+    fingerprint the model was fit on, when it was trained and where the model
+    file lives. Incremental runs compare new fingerprints against it to decide
+    which product types need refitting.
+
+    Entries also record the progress of the training run: its ``status``
+    (running, completed or failed), the run it belongs to, the model file's
+    checksum and the fit duration. A run that did not complete is resumed by
+    the next one, which skips the product types it already completed.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        entries: Optional[Dict[int, Dict[str, Any]]] = None,
+        run: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize the manifest.
+
+        Args:
+            filepath: Path of the manifest JSON file
+            entries: Existing entries keyed by product type ID
+            run: The last training run (run_id, status, timestamps)
+        """
+        self.filepath = filepath
+        self.entries: Dict[int, Dict[str, Any]] = entries or {}
+        self.run: Dict[str, Any] = run or {}
+
+    @classmethod
+    def load(cls, filepath: str) -> 'ModelManifest':
+        """
+        Load a manifest, returning an empty one if the file does not exist.
+
+        Args:
+            filepath: Path of the manifest JSON file
+
+        Returns:
+            Loaded manifest
+        """
+        if not Path(filepath).exists():
+            logger.info(f"No model manifest at {filepath}, starting a new one")
+            return cls(filepath)
+
+        with open(filepath) as f:
+            raw = json.load(f)
+
+        entries = {int(k): v for k, v in raw.get('products', {}).items()}
+        logger.info(f"Model manifest loaded from {filepath} ({len(entries)} products)")
+        return cls(filepath, entries, raw.get('run'))
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+        Path(self.filepath).parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(
+                {
+                    'run': self.run,
+                    'products': {str(k): v for k, v in sorted(self.entries.items())},
+                },
+                f,
+                indent=2
+            )
+        os.replace(tmp_path, self.filepath)
+
+    def get(self, prod_type_id: int) -> Optional[Dict[str, Any]]:
+        """Return the entry for a product type, if any."""
+        return self.entries.get(int(prod_type_id))
+
+    def update(self, prod_type_id: int, **fields: Any) -> None:
+        """
+        Update (or create) the entry for a product type.
+
+        Args:
+            prod_type_id: Product type ID
+            **fields: Entry fields to set
+        """
+        entry = self.entries.setdefault(int(prod_type_id), {})
+        entry.update(fields)
+        entry['updated_at'] = datetime.now(timezone.utc).isoformat()
+
+    def start_run(self, resume: bool = True) -> bool:
+        """
+        Start a training run, resuming the last one if it did not complete.
+
+        Args:
+            resume: Whether an unfinished run may be resumed
+
+        Returns:
+            True if the last run is resumed
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        if resume and self.run.get('run_id') and self.run.get('status') != COMPLETED:
+            logger.info(
+                f"Resuming training run {self.run['run_id']} "
+                f"(last status: {self.run.get('status')})"
+            )
+            self.run.update(status=RUNNING, resumed_at=now)
+            return True
+
+        self.run = {'run_id': uuid.uuid4().hex[:12], 'status': RUNNING, 'started_at': now}
+        return False
+
+    def finish_run(self, failed: Iterable[int] = ()) -> None:
+        """Mark the run completed, or failed if any product type failed."""
+        failed = sorted(int(p) for p in failed)
+        self.run.update(
+            status=FAILED if failed else COMPLETED,
+            failed=failed,
+            finished_at=datetime.now(timezone.utc).isoformat()
+        )
+
+    def is_complete(
+        self,
+        prod_type_id: int,
+        fingerprint: Dict[str, Any],
+        params: str,
+        model_path: str
+    ) -> bool:
+        """
+        Whether the current run already produced this product type's model.
+
+        The entry must be completed in this run, from the same training slice
+        and parameters, and the model file must still match its checksum.
+
+        Args:
+            prod_type_id: Product type ID
+            fingerprint: Fingerprint of the current training slice
+            params: ``params_checksum`` of the current training parameters
+            model_path: Path of the model file
+        """
+        entry = self.get(prod_type_id)
+        return (
+            entry is not None
+            and entry.get('status') == COMPLETED
+            and entry.get('run_id') == self.run.get('run_id')
+            and entry.get('fingerprint') == fingerprint
+            and entry.get('params') == params
+            and entry.get('checksum') is not None
+            and entry.get('checksum') == file_checksum(model_path)
+        )
+
+    def longest_first(self, product_ids: List[int]) -> List[int]:
+        """
+        Order product types by their last recorded fit duration, longest first.
+
+        Product types without a duration are assumed to take the median of the
+        known ones. Starting the longest fits first shortens the makespan when
+        product types are trained in parallel.
+        """
+        durations = {
+            p: self.entries[p]['duration_seconds']
+            for p in product_ids
+            if p in self.entries and self.entries[p].get('duration_seconds') is not None
+        }
+        default = statistics.median(durations.values()) if durations else 0.0
+        return sorted(product_ids, key=lambda p: -durations.get(p, default))
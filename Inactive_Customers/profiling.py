@@ -0,0 +1,339 @@
+"""
+Stage-level instrumentation for the training and scoring pipelines.
+
+``PipelineProfiler.stage`` wraps a pipeline stage or a per-product model
+operation and records wall time, CPU time, rows processed, bytes transferred
+and memory (RSS, and the tracemalloc peak when enabled). Stages nest; the run
+report is written as JSON, and top-level stages can optionally be dumped as
+cProfile stats.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils import logger
+
+
+def current_rss_bytes() -> int:
+    """Return the current resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+# Process peak before the last reset_peak_rss(), which clears the kernel's counter
+_peak_before_reset = 0
+
+# Highest peak of the windows closed by reset_peak_rss() since start_stage_peak()
+_closed_windows_peak = 0
+
+
+def window_peak_rss_bytes() -> int:
+    """Return the peak resident set size since the last reset_peak_rss() (or process start)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def peak_rss_bytes() -> int:
+    """Return the peak resident set size of this process in bytes."""
+    return max(window_peak_rss_bytes(), _peak_before_reset)
+
+
+def reset_peak_rss() -> bool:
+    """
+    Start a new peak RSS window, so window_peak_rss_bytes() measures one block of work.
+
+    Needs Linux's /proc/self/clear_refs; peak_rss_bytes() keeps reporting
+    the whole process's peak.
+
+    Returns:
+        Whether the peak was reset
+    """
+    global _peak_before_reset, _closed_windows_peak
+    window = window_peak_rss_bytes()
+    peak = max(window, _peak_before_reset)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    _peak_before_reset = peak
+    _closed_windows_peak = max(_closed_windows_peak, window)
+    return True
+
+
+def start_stage_peak() -> bool:
+    """
+    Start measuring one stage's peak RSS, see stage_peak_rss_bytes().
+
+    Windows opened inside the stage (e.g. the memory scheduler's per-chunk
+    resets) are folded into the stage's peak.
+
+    Returns:
+        Whether the peak was reset
+    """
+    global _closed_windows_peak
+    if not reset_peak_rss():
+        return False
+    _closed_windows_peak = 0
+    return True
+
+
+def stage_peak_rss_bytes() -> int:
+    """Return the peak resident set size since the last start_stage_peak()."""
+    return max(window_peak_rss_bytes(), _closed_windows_peak)
+
+
+def dataframe_bytes(df: Any) -> int:
+    """Return the in-memory size of a DataFrame (0 for None)."""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True).sum())
+
+
+@dataclass
+class StageRecord:
+    """Measurements for one profiled stage."""
+
+    name: str
+    path: str
+    depth: int
+    started_at: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rows: Optional[int] = None
+    bytes_transferred: Optional[int] = None
+    rss_start_bytes: int = 0
+    rss_end_bytes: int = 0
+    peak_rss_bytes: Optional[int] = None
+    traced_peak_bytes: Optional[int] = None
+    status: str = 'ok'
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class PipelineProfiler:
+    """
+    Collects StageRecords for one pipeline run.
+
+    A disabled profiler still yields a StageRecord from ``stage`` so that
+    callers can set ``rows``/``bytes_transferred`` unconditionally, but records
+    nothing.
+
+    Stages opened on other threads (e.g. product types trained on a pool) nest
+    under the stages open on the creating thread when the thread first uses
+    the profiler. Their CPU time is the whole process's.
+
+    The peak RSS is measured for top-level stages on the creating thread
+    only: the kernel keeps one peak per process, so a nested or threaded
+    stage's peak cannot be told apart from its neighbours' and is None.
+    Where the peak cannot be reset (outside Linux), a top-level stage reports
+    the process peak only if it rose during the stage.
+    """
+
+    def __init__(
+        self,
+        pipeline: str,
+        enabled: bool = False,
+        trace_memory: bool = False,
+        cprofile_dir: Optional[str] = None
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            pipeline: Pipeline name recorded in the report
+            enabled: Whether stages are measured at all
+            trace_memory: Track Python/NumPy allocation peaks with tracemalloc
+            cprofile_dir: Directory for per-stage cProfile dumps of top-level stages
+        """
+        self.pipeline = pipeline
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.cprofile_dir = cprofile_dir if enabled else None
+        self.records: List[StageRecord] = []
+        # Run-level sections added to the report (e.g. the memory scheduler)
+        self.sections: Dict[str, Any] = {}
+        self._owner = threading.get_ident()
+        self._owner_stack: List[Dict[str, Any]] = []
+        self._local = threading.local()
+        self._started = time.perf_counter()
+
+    @classmethod
+    def from_config(cls, pipeline: str, profiling_config: Any) -> 'PipelineProfiler':
+        """
+        Create a profiler from a ProfilingConfig.
+
+        Args:
+            pipeline: Pipeline name recorded in the report
+            profiling_config: ProfilingConfig instance
+
+        Returns:
+            Configured profiler
+        """
+        return cls(
+            pipeline,
+            enabled=profiling_config.enabled,
+            trace_memory=profiling_config.trace_memory,
+            cprofile_dir=profiling_config.cprofile_dir
+        )
+
+    @property
+    def _stack(self) -> List[Dict[str, Any]]:
+        """Open stages of the calling thread."""
+        if threading.get_ident() == self._owner:
+            return self._owner_stack
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = list(self._owner_stack)
+        return stack
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, **attributes: Any) -> Iterator[StageRecord]:
+        """
+        Measure a block of code as a pipeline stage.
+
+        Args:
+            name: Stage name; nested stages are reported as 'outer/inner'
+            rows: Rows processed, if known up front
+            **attributes: Extra fields recorded with the stage (e.g. product_id)
+
+        Yields:
+            The stage record; callers may set rows and bytes_transferred
+        """
+        path = "/".join([frame['record'].name for frame in self._stack] + [name])
+        record = StageRecord(
+            name=name,
+            path=path,
+            depth=len(self._stack),
+            started_at=datetime.now(timezone.utc).isoformat(),
+            rows=rows,
+            attributes=attributes
+        )
+
+        if not self.enabled:
+            yield record
+            return
+
+        frame = {'record': record, 'traced_peak': 0}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self._stack:
+                parent = self._stack[-1]
+                parent['traced_peak'] = max(parent['traced_peak'], tracemalloc.get_traced_memory()[1])
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+        profile = None
+        if self.cprofile_dir and not self._stack:
+            profile = cProfile.Profile()
+
+        measure_peak = not self._stack and threading.get_ident() == self._owner
+        windowed = measure_peak and start_stage_peak()
+        process_peak_start = peak_rss_bytes()
+
+        self._stack.append(frame)
+        record.rss_start_bytes = current_rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile is not None:
+            profile.enable()
+
+        try:
+            yield record
+        except BaseException:
+            record.status = 'failed'
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.rss_end_bytes = current_rss_bytes()
+            if windowed:
+                record.peak_rss_bytes = stage_peak_rss_bytes()
+            elif measure_peak and peak_rss_bytes() > process_peak_start:
+                record.peak_rss_bytes = peak_rss_bytes()
+            self._stack.pop()
+
+            if self.trace_memory:
+                record.traced_peak_bytes = max(frame['traced_peak'], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent['traced_peak'] = max(parent['traced_peak'], record.traced_peak_bytes)
+
+            if profile is not None:
+                Path(self.cprofile_dir).mkdir(parents=True, exist_ok=True)
+                profile.dump_stats(os.path.join(self.cprofile_dir, f"{self.pipeline}.{name}.prof"))
+
+            self.records.append(record)
+            logger.debug(
+                f"[profile] {path}: {record.wall_seconds:.3f}s wall, "
+                f"{record.cpu_seconds:.3f}s cpu, rss {record.rss_end_bytes / 2**20:.1f} MiB"
+            )
+
+    def profile(self, name: Optional[str] = None):
+        """
+        Decorator form of ``stage``.
+
+        Args:
+            name: Stage name (defaults to the function name)
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build the machine-readable run report.
+
+        Returns:
+            Report dict with per-stage records in completion order
+        """
+        return {
+            'pipeline': self.pipeline,
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'total_wall_seconds': time.perf_counter() - self._started,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': [asdict(r) for r in self.records],
+            **self.sections,
+        }
+
+    def write_report(self, filepath: str) -> None:
+        """
+        Write the run report as JSON.
+
+        Args:
+            filepath: Destination path
+        """
+        if not self.enabled:
+            return
+
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        logger.info(f"Run report written to {filepath} ({len(self.records)} stages)")
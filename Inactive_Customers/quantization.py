@@ -0,0 +1,272 @@
+"""
+Quantized storage of probability matrices.
+
+The wide ``p<id>`` tables (``prod_type_cluster_data``, ``scored_cluster_data``)
+and the long prediction checkpoints hold one float32 probability per customer
+per product type. For files and transfers they can be stored in a smaller
+codec:
+
+- ``uint8`` / ``uint16``: fixed point with a per-column offset and scale.
+  Code ``k`` stands for ``offset + k * scale``; the largest code is reserved
+  for NaN. A column spanning ``[lo, hi]`` is stored with
+  ``scale = (hi - lo) / (2**bits - 2)``, so every value is off by at most
+  ``scale / 2`` plus float32 rounding: 1/508 (about 0.002) for uint8 and
+  1/131068 (about 7.6e-6) for uint16 when the column spans [0, 1].
+- ``float16``: half precision, off by at most half a float16 ULP of the
+  column's largest value (2.4e-4 for probabilities below 1), NaN kept as is.
+
+Each column's parameters, including its ``max_error``, are kept in
+``DataFrame.attrs['quantization']``. pandas writes the attrs into pickles and
+Parquet file metadata and restores them on read. ``dequantize_frame`` turns a
+quantized table back into float32 columns, and readers in this package call it
+on every table they load.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+CODECS = ('float16', 'uint16', 'uint8')
+ATTRS_KEY = 'quantization'
+
+# Probability columns: p (long predictions) and p<id> (wide tables)
+PROBABILITY_COLUMN = re.compile(r'^p\d*$')
+
+_FIXED_POINT = {'uint8': np.uint8, 'uint16': np.uint16}
+_FLOAT16_MAX = float(np.finfo(np.float16).max)
+_BLOCK_ROWS = 1 << 16
+
+
+def _check_codec(codec: str) -> None:
+    """Raise ValueError for an unknown codec."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown quantization codec {codec!r}; expected one of {CODECS}")
+
+
+def error_bound(codec: str, lo: float = 0.0, hi: float = 1.0) -> float:
+    """
+    Maximum absolute error of a column whose values lie in [lo, hi].
+
+    Args:
+        codec: 'float16', 'uint16' or 'uint8'
+        lo: Smallest value of the column
+        hi: Largest value of the column
+
+    Returns:
+        Bound on ``|dequantize(quantize(x)) - x|`` for every value x
+    """
+    _check_codec(codec)
+    magnitude = max(abs(lo), abs(hi))
+
+    if codec == 'float16':
+        # Half a float16 ULP of the largest value; float16 -> float32 is exact
+        return float(np.spacing(np.float16(magnitude))) / 2
+
+    # Half a step, plus half a float32 ULP for the dequantized value
+    steps = np.iinfo(_FIXED_POINT[codec]).max - 1
+    return (hi - lo) / steps / 2 + float(np.spacing(np.float32(magnitude))) / 2
+
+
+def quantize(values: Any, codec: str) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    Quantize a matrix column by column.
+
+    Args:
+        values: 1-D or 2-D array of float values (NaN allowed)
+        codec: 'float16', 'uint16' or 'uint8'
+
+    Returns:
+        Tuple of (codes with the input's shape, one parameter dict per column)
+
+    Raises:
+        ValueError: If the codec is unknown or a value is infinite or out of
+            float16 range
+    """
+    _check_codec(codec)
+    values = np.asarray(values, dtype=np.float32)
+    matrix = values.reshape(len(values), -1)
+
+    if np.isinf(matrix).any():
+        raise ValueError("Cannot quantize infinite values")
+
+    # Column ranges over the non-NaN values; all-NaN columns get [0, 0]
+    present = ~np.isnan(matrix)
+    lo = np.min(matrix, axis=0, initial=np.inf, where=present).astype(np.float64)
+    hi = np.max(matrix, axis=0, initial=-np.inf, where=present).astype(np.float64)
+    empty = ~present.any(axis=0)
+    lo[empty] = hi[empty] = 0.0
+
+    if codec == 'float16':
+        if len(hi) and max(np.abs(lo).max(), np.abs(hi).max()) > _FLOAT16_MAX:
+            raise ValueError(f"Values exceed the float16 range (±{_FLOAT16_MAX})")
+        codes = matrix.astype(np.float16)
+        params = [
+            {'codec': codec, 'max_error': error_bound(codec, a, b)}
+            for a, b in zip(lo, hi)
+        ]
+        return codes.reshape(values.shape), params
+
+    dtype = _FIXED_POINT[codec]
+    nan_code = np.iinfo(dtype).max
+    steps = nan_code - 1
+    scale = np.where(hi > lo, (hi - lo) / steps, 1.0)
+
+    codes = np.empty(matrix.shape, dtype=dtype)
+    for start in range(0, len(matrix), _BLOCK_ROWS):
+        block = matrix[start:start + _BLOCK_ROWS].astype(np.float64)
+        scaled = np.clip(np.rint((block - lo) / scale), 0, steps)
+        codes[start:start + _BLOCK_ROWS] = np.where(np.isnan(block), nan_code, scaled)
+
+    params = [
+        {
+            'codec': codec,
+            'offset': float(a),
+            'scale': float(s),
+            'max_error': error_bound(codec, a, b),
+        }
+        for a, b, s in zip(lo, hi, scale)
+    ]
+    return codes.reshape(values.shape), params
+
+
+def dequantize(codes: Any, params: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Turn codes back into float32 values.
+
+    Args:
+        codes: 1-D or 2-D codes from ``quantize``
+        params: The parameter dict of each column
+
+    Returns:
+        float32 array with the codes' shape
+    """
+    codes = np.asarray(codes)
+    matrix = codes.reshape(len(codes), -1)
+    codec = params[0]['codec'] if params else 'float16'
+    _check_codec(codec)
+
+    if codec == 'float16':
+        return codes.astype(np.float32)
+
+    nan_code = np.iinfo(_FIXED_POINT[codec]).max
+    offset = np.array([p['offset'] for p in params], dtype=np.float64)
+    scale = np.array([p['scale'] for p in params], dtype=np.float64)
+
+    out = np.empty(matrix.shape, dtype=np.float32)
+    for start in range(0, len(matrix), _BLOCK_ROWS):
+        block = matrix[start:start + _BLOCK_ROWS]
+        values = offset + block * scale
+        out[start:start + _BLOCK_ROWS] = np.where(block == nan_code, np.nan, values)
+    return out.reshape(codes.shape)
+
+
+def probability_columns(df: pd.DataFrame) -> List[str]:
+    """Float columns named p or p<id>."""
+    return [
+        c for c in df.columns
+        if PROBABILITY_COLUMN.match(str(c)) and pd.api.types.is_float_dtype(df[c])
+    ]
+
+
+def is_quantized(df: pd.DataFrame) -> bool:
+    """Whether a table holds quantized columns."""
+    return bool(df.attrs.get(ATTRS_KEY))
+
+
+def _replace_columns(
+    df: pd.DataFrame,
+    columns: List[str],
+    matrix: np.ndarray,
+    attrs: Dict[str, Any]
+) -> pd.DataFrame:
+    """Swap columns for one 2-D block, keeping the column order."""
+    replaced = pd.DataFrame(matrix, index=df.index, columns=columns, copy=False)
+    out = pd.concat([replaced, df.drop(columns=columns)], axis=1)
+    if list(out.columns) != list(df.columns):
+        out = out[list(df.columns)]
+    out.attrs = attrs
+    return out
+
+
+def quantize_frame(
+    df: pd.DataFrame,
+    codec: str,
+    columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Quantize a table's probability columns.
+
+    Args:
+        df: Table with float probability columns
+        codec: 'float16', 'uint16' or 'uint8'
+        columns: Columns to quantize (default: ``probability_columns(df)``)
+
+    Returns:
+        Table with the columns replaced by their codes and the parameters in
+        ``attrs['quantization']``
+
+    Raises:
+        ValueError: If the table is already quantized or a value cannot be
+            represented
+    """
+    _check_codec(codec)
+    if is_quantized(df):
+        raise ValueError("Table is already quantized")
+
+    columns = probability_columns(df) if columns is None else list(columns)
+    if not columns:
+        return df
+
+    codes, params = quantize(df[columns].to_numpy(dtype=np.float32), codec)
+    attrs = {**df.attrs, ATTRS_KEY: dict(zip(columns, params))}
+    return _replace_columns(df, columns, codes, attrs)
+
+
+def dequantize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Restore the float32 columns of a quantized table.
+
+    Tables without quantization parameters are returned unchanged, so readers
+    can call this on everything they load.
+
+    Args:
+        df: Table read from a quantized file
+
+    Returns:
+        Table with float32 columns and no quantization parameters
+    """
+    if not is_quantized(df):
+        return df
+
+    attrs = dict(df.attrs)
+    params = attrs.pop(ATTRS_KEY)
+    # Column projections may have dropped some of the quantized columns
+    columns = [c for c in params if c in df.columns]
+    if not columns:
+        out = df.copy(deep=False)
+        out.attrs = attrs
+        return out
+
+    by_codec: Dict[str, List[str]] = {}
+    for column in columns:
+        by_codec.setdefault(params[column]['codec'], []).append(column)
+
+    for group in by_codec.values():
+        values = dequantize(df[group].to_numpy(), [params[c] for c in group])
+        df = _replace_columns(df, group, values, df.attrs)
+    df.attrs = attrs
+    return df
+
+
+def max_error(df: pd.DataFrame) -> Dict[str, float]:
+    """Documented maximum absolute error of each quantized column."""
+    return {c: p['max_error'] for c, p in df.attrs.get(ATTRS_KEY, {}).items()}
+
+
+def schema_is_quantized(metadata: Optional[Dict[bytes, bytes]]) -> bool:
+    """Whether Arrow/Parquet schema metadata (as pandas writes it) marks a quantized table."""
+    attrs = (metadata or {}).get(b'PANDAS_ATTRS')
+    return attrs is not None and bool(json.loads(attrs).get(ATTRS_KEY))
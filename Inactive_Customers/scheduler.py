@@ -0,0 +1,357 @@
+"""
+Memory-budget-aware chunk and worker scheduling for the scoring pipeline.
+
+Each stage (imputation, scoring, pivot, upload) is described by a
+``StageCost``: bytes held per row of a chunk, bytes per row per concurrent
+worker, and fixed bytes. The costs are estimated from the table shapes
+(features, product types, compiled trees). ``MemoryScheduler.plan`` fits the
+largest chunk, and as many workers as allowed, into the memory still free
+under the budget: the budget less headroom, less the process's current RSS.
+
+``chunks`` yields row slices one at a time and measures the peak RSS growth
+of each chunk (on Linux the kernel's peak counter is reset per chunk). It folds
+the observed bytes per row into the stage's cost and re-plans the next chunk,
+so an underestimate shrinks later chunks and data accumulating in memory is
+accounted for. Without a budget every stage runs as one chunk on
+``max_workers`` workers, as before.
+"""
+
+import re
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from profiling import current_rss_bytes, reset_peak_rss, window_peak_rss_bytes
+from utils import logger
+
+STAGES = ('impute', 'score', 'pivot', 'upload')
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', re.IGNORECASE)
+_UNITS = {'': 1, 'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+def parse_bytes(value: str) -> int:
+    """
+    Parse a memory size such as '512M', '16G' or '1073741824'.
+
+    Units are binary (K = 1024 bytes).
+
+    Raises:
+        ValueError: If the value is not a size
+    """
+    match = _SIZE_RE.match(str(value))
+    if match is None:
+        raise ValueError(f"Invalid memory size: {value!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+@dataclass
+class StageCost:
+    """Memory a stage needs: fixed bytes plus bytes per chunk row (and per worker)."""
+
+    bytes_per_row: float
+    bytes_per_worker_row: float = 0.0
+    fixed_bytes: int = 0
+
+    def chunk_bytes(self, rows: int, workers: int = 1) -> int:
+        """Estimated bytes of one chunk processed by ``workers`` workers."""
+        per_row = self.bytes_per_row + self.bytes_per_worker_row * workers
+        return int(self.fixed_bytes + rows * per_row)
+
+
+@dataclass
+class ChunkPlan:
+    """Chunk size and worker count chosen for a stage."""
+
+    stage: str
+    rows: int
+    chunk_rows: int
+    workers: int
+    estimated_bytes: int
+    available_bytes: Optional[int]
+    fits: bool = True
+
+
+def estimate_costs(
+    n_features: int,
+    n_products: int,
+    n_trees: int = 0,
+    hidden_units: Sequence[int] = ()
+) -> Dict[str, StageCost]:
+    """
+    Estimate the per-row memory of each scoring stage from the table shapes.
+
+    The figures count the arrays each stage allocates per row, not Python
+    object overhead; the scheduler corrects them from observed RSS.
+
+    Args:
+        n_features: Model input features
+        n_products: Product types scored
+        n_trees: Trees of the compiled forest (0 = per-model scoring)
+        hidden_units: Hidden layer widths of the distilled model (empty =
+            not distilled scoring)
+
+    Returns:
+        StageCost per stage name
+    """
+    # Imputation stacks the raw columns into one Series (value plus two index
+    # codes per cell), coerces them to numbers and unstacks: about six
+    # 8-byte arrays per cell, plus the float32 result
+    impute = StageCost(bytes_per_row=n_features * (6 * 8 + 4))
+
+    if hidden_units:
+        # Distilled forward pass: standardized float32 inputs (two live
+        # copies), every layer's float32 activations, and the output logits
+        # with the sigmoid's temporaries
+        score = StageCost(
+            bytes_per_row=n_features * 4 * 2 + sum(hidden_units) * 4 + n_products * 4 * 3
+        )
+    elif n_trees:
+        # Compiled walk: int64 node positions and gathered float32 feature
+        # values for every tree, plus per-tree leaf values
+        score = StageCost(bytes_per_row=n_trees * (8 + 4 + 4) + n_features * 4)
+    else:
+        # predict_proba: a float32 DMatrix copy of the features and the
+        # (rows, 2) float64 probabilities plus the margin, per model in flight
+        score = StageCost(bytes_per_row=0.0, bytes_per_worker_row=n_features * 4 + 3 * 8)
+
+    # Pivot, per long (customer, product type) row of a chunk: the customer
+    # and product type IDs and the probabilities copied out of the chunk, the
+    # int64 row and column codes found for them, the flat cell index with its
+    # sorted copy for the duplicate check, and the float32 values already in
+    # those cells with their NaN mask. The wide matrix is reserved up front
+    pivot = StageCost(bytes_per_row=8 + 8 + 4 + 8 + 8 + 8 + 8 + 4 + 1)
+
+    # Upload: a copy of the wide rows plus their serialized form
+    upload = StageCost(bytes_per_row=2 * (n_products * 4 + 8))
+
+    return {'impute': impute, 'score': score, 'pivot': pivot, 'upload': upload}
+
+
+class MemoryScheduler:
+    """Chooses chunk sizes and worker counts that keep stages under a memory budget."""
+
+    def __init__(
+        self,
+        budget_bytes: Optional[int] = None,
+        max_workers: int = 1,
+        headroom: float = 0.1,
+        min_chunk_rows: int = 10_000,
+        max_chunk_rows: int = 1_000_000,
+        smoothing: float = 0.5,
+        rss: Callable[[], int] = current_rss_bytes
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            budget_bytes: Process memory budget (None = unlimited)
+            max_workers: Upper bound on workers of any stage
+            headroom: Fraction of the budget kept free
+            min_chunk_rows: Smallest chunk planned, even when it does not fit
+            max_chunk_rows: Largest chunk planned under a budget
+            smoothing: Weight of each new observation in the learned per-row cost
+            rss: Returns the current resident set size in bytes
+        """
+        self.budget_bytes = budget_bytes
+        self.max_workers = max(1, max_workers)
+        self.headroom = headroom
+        self.min_chunk_rows = max(1, min_chunk_rows)
+        self.max_chunk_rows = max(self.min_chunk_rows, max_chunk_rows)
+        self.smoothing = smoothing
+        self.rss = rss
+        self.costs: Dict[str, StageCost] = {}
+        self._observed: set = set()
+        self._warned: set = set()
+        self.history: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_config(cls, processing_config: Any) -> 'MemoryScheduler':
+        """
+        Create a scheduler from a ProcessingConfig.
+
+        Args:
+            processing_config: ProcessingConfig instance
+
+        Returns:
+            Configured scheduler
+        """
+        return cls(
+            budget_bytes=processing_config.memory_budget_bytes,
+            max_workers=processing_config.max_workers,
+            headroom=processing_config.memory_headroom,
+            min_chunk_rows=processing_config.min_chunk_rows,
+            max_chunk_rows=processing_config.max_chunk_rows
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether a memory budget is set."""
+        return self.budget_bytes is not None
+
+    def set_shape(
+        self,
+        n_features: int,
+        n_products: int,
+        n_trees: int = 0,
+        hidden_units: Sequence[int] = ()
+    ) -> None:
+        """
+        Estimate the stage costs for a run (see ``estimate_costs``).
+
+        Costs already learned from observed chunks are kept.
+        """
+        costs = estimate_costs(n_features, n_products, n_trees, hidden_units)
+        for stage, cost in costs.items():
+            if stage not in self._observed:
+                self.costs[stage] = cost
+
+    def available_bytes(self) -> Optional[int]:
+        """Memory still free under the budget, or None without a budget."""
+        if self.budget_bytes is None:
+            return None
+        return max(0, int(self.budget_bytes * (1 - self.headroom)) - self.rss())
+
+    def plan(
+        self,
+        stage: str,
+        rows: int,
+        max_workers: Optional[int] = None,
+        reserve_bytes: int = 0
+    ) -> ChunkPlan:
+        """
+        Choose a chunk size and worker count for a stage.
+
+        Workers are reduced until a chunk of ``min_chunk_rows`` fits; the chunk
+        then takes the rest of the free memory.
+
+        Args:
+            stage: Stage name (one of ``STAGES``)
+            rows: Rows the stage will process
+            max_workers: Upper bound on workers for this stage (default: the
+                scheduler's)
+            reserve_bytes: Memory the stage will allocate for its whole
+                output before processing chunks
+
+        Returns:
+            The plan; ``fits`` is False if even the smallest chunk on one
+            worker exceeds the budget
+        """
+        rows = max(rows, 1)
+        workers = max(1, min(max_workers or self.max_workers, self.max_workers))
+        cost = self.costs.get(stage, StageCost(bytes_per_row=0.0))
+        available = self.available_bytes()
+
+        if available is None:
+            return ChunkPlan(stage, rows, rows, workers, cost.chunk_bytes(rows, workers), None)
+
+        available = max(0, available - reserve_bytes)
+        smallest = min(self.min_chunk_rows, rows)
+        while workers > 1 and cost.chunk_bytes(smallest, workers) > available:
+            workers -= 1
+
+        per_row = cost.bytes_per_row + cost.bytes_per_worker_row * workers
+        if per_row > 0:
+            chunk_rows = int((available - cost.fixed_bytes) // per_row)
+        else:
+            chunk_rows = rows
+        chunk_rows = max(smallest, min(chunk_rows, self.max_chunk_rows, rows))
+
+        estimated = cost.chunk_bytes(chunk_rows, workers)
+        fits = estimated <= available
+        if not fits and stage not in self._warned:
+            self._warned.add(stage)
+            logger.warning(
+                f"Memory budget: {stage} needs ~{estimated / 2**20:.0f} MiB for a "
+                f"{chunk_rows}-row chunk, {available / 2**20:.0f} MiB free"
+            )
+        return ChunkPlan(stage, rows, chunk_rows, workers, estimated, available, fits)
+
+    def observe(
+        self,
+        stage: str,
+        rows: int,
+        used_bytes: int,
+        workers: int = 1,
+        lower: bool = True
+    ) -> None:
+        """
+        Fold an observed chunk's memory into the stage's per-row cost.
+
+        Args:
+            stage: Stage name
+            rows: Rows of the chunk
+            used_bytes: Peak RSS growth while processing the chunk
+            workers: Workers that processed the chunk
+            lower: Whether the observation may lower the cost (False when
+                the measurement can miss transient memory)
+        """
+        # Chunks served from memory freed earlier show no growth: no information
+        if rows <= 0 or used_bytes <= 0:
+            return
+        cost = self.costs.setdefault(stage, StageCost(bytes_per_row=0.0))
+        self._observed.add(stage)
+        observed = max(0, used_bytes - cost.fixed_bytes) / rows
+        # Attribute the observation in the proportions of the current estimate
+        estimated = cost.bytes_per_row + cost.bytes_per_worker_row * workers
+        if not lower and observed <= estimated:
+            return
+        share = cost.bytes_per_row / estimated if estimated > 0 else 1.0
+        blended = (1 - self.smoothing) * estimated + self.smoothing * observed
+        cost.bytes_per_row = blended * share
+        cost.bytes_per_worker_row = blended * (1 - share) / workers
+
+    def chunks(
+        self,
+        stage: str,
+        rows: int,
+        max_workers: Optional[int] = None,
+        reserve_bytes: int = 0
+    ) -> Iterator[slice]:
+        """
+        Yield row slices of a stage, re-planning after each chunk.
+
+        Args:
+            stage: Stage name
+            rows: Rows to process
+            max_workers: Upper bound on workers for this stage
+            reserve_bytes: Output memory allocated before the first chunk
+
+        Yields:
+            Row slices covering ``range(rows)`` in order (one empty slice
+            when ``rows`` is 0, so stages still produce their empty output)
+        """
+        start = 0
+        while True:
+            plan = self.plan(stage, rows - start, max_workers, reserve_bytes)
+            reserve_bytes = 0
+            stop = min(rows, start + plan.chunk_rows)
+
+            # With a per-chunk peak (Linux) the chunk's transient memory is
+            # measured exactly. Otherwise only a new process peak or retained
+            # memory shows, so observations may raise the cost but not lower it
+            windowed = self.enabled and reset_peak_rss()
+            rss_before = self.rss()
+            peak_before = window_peak_rss_bytes()
+            yield slice(start, stop)
+            peak = window_peak_rss_bytes()
+            if not windowed and peak <= peak_before:
+                peak = 0
+            used = max(self.rss(), peak) - rss_before
+
+            if self.enabled:
+                self.observe(stage, stop - start, used, plan.workers, lower=windowed)
+            self.history.append({**asdict(plan), 'start': start, 'stop': stop, 'used_bytes': used})
+            start = stop
+            if start >= rows:
+                return
+
+    def summary(self) -> Dict[str, Any]:
+        """Budget, learned costs and per-stage chunk counts, for run reports."""
+        chunks: Dict[str, int] = {}
+        for entry in self.history:
+            chunks[entry['stage']] = chunks.get(entry['stage'], 0) + 1
+        return {
+            'budget_bytes': self.budget_bytes,
+            'costs': {stage: asdict(cost) for stage, cost in self.costs.items()},
+            'chunks': chunks,
+        }
@@ -0,0 +1,175 @@
+"""
+Column dtypes of the tables the training and scoring pipelines pass around.
+
+Query results arrive as float64/object (or nullable Int64) columns. Each
+``TableSchema`` declares the dtype a column should have: int64 customer IDs,
+float32 features and probabilities, categorical product types in long tables
+(one small code per row instead of a repeated int64) and int32 product types
+in output tables. The pipelines enforce the schemas where data enters (after
+the query), after imputation and before output; when given a profiler stage
+record, ``enforce`` adds the table's memory before and after to the run report.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from profiling import StageRecord, dataframe_bytes
+
+CUSTOMER_ID = 'int64'
+FEATURE = 'float32'
+PROBABILITY = 'float32'
+PRODUCT_TYPE = 'int32'
+PRODUCT_TYPE_LABEL = 'category'
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    """
+    Declared dtypes for one table.
+
+    Columns are matched by exact name first, then by the ``patterns`` regexes
+    (e.g. the ``p<id>`` columns of the wide table). Columns the schema does not
+    mention are left as they are.
+    """
+
+    name: str
+    columns: Dict[str, str] = field(default_factory=dict)
+    patterns: Dict[str, str] = field(default_factory=dict)
+
+    def dtype_for(self, column: str) -> Optional[str]:
+        """Return the declared dtype of a column, or None if undeclared."""
+        if column in self.columns:
+            return self.columns[column]
+        for pattern, dtype in self.patterns.items():
+            if re.match(pattern, str(column)):
+                return dtype
+        return None
+
+    def enforce(self, df: pd.DataFrame, record: Optional[StageRecord] = None) -> pd.DataFrame:
+        """
+        Cast a table's columns to their declared dtypes.
+
+        Non-numeric values in numeric columns become NaN, as in feature
+        imputation. Columns that already have the declared dtype are not
+        copied.
+
+        Args:
+            df: Table to cast
+            record: Profiler stage record the memory before/after is added to
+
+        Returns:
+            Table with declared dtypes (``df`` itself if nothing changed)
+
+        Raises:
+            ValueError: If an integer column holds missing or non-integer values
+        """
+        casts = {}
+        for column in df.columns:
+            dtype = self.dtype_for(column)
+            if dtype is not None and str(df[column].dtype) != dtype:
+                casts[column] = dtype
+
+        bytes_before = dataframe_bytes(df) if record is not None else None
+
+        if casts:
+            df = df.copy(deep=False)
+            for column, dtype in casts.items():
+                df[column] = _cast(df[column], dtype, f"{self.name}.{column}")
+
+        if record is not None:
+            bytes_after = dataframe_bytes(df)
+            record.attributes.setdefault('dtypes', {})[self.name] = {
+                'bytes_before': bytes_before,
+                'bytes_after': bytes_after,
+                'saved_bytes': bytes_before - bytes_after,
+                'cast_columns': len(casts),
+            }
+
+        return df
+
+    def check(self, df: pd.DataFrame) -> List[str]:
+        """
+        List the columns whose dtype differs from the schema.
+
+        Returns:
+            'column: actual != declared' strings (empty if the table conforms)
+        """
+        return [
+            f"{column}: {df[column].dtype} != {dtype}"
+            for column in df.columns
+            if (dtype := self.dtype_for(column)) is not None and str(df[column].dtype) != dtype
+        ]
+
+
+def _cast(values: pd.Series, dtype: str, label: str) -> pd.Series:
+    """Cast one column, coercing non-numeric values for numeric dtypes."""
+    if dtype == 'category':
+        return values.astype('category')
+
+    if values.dtype == object:
+        values = pd.to_numeric(values, errors='coerce')
+
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        if values.isna().any():
+            raise ValueError(f"{label} has missing values and cannot be cast to {dtype}")
+        cast = values.astype(dtype)
+        if pd.api.types.is_float_dtype(values) and not np.array_equal(cast, values):
+            raise ValueError(f"{label} has non-integer values and cannot be cast to {dtype}")
+        return cast
+
+    return values.astype(dtype)
+
+
+def features_schema(features: List[str]) -> TableSchema:
+    """Schema of the imputed model input matrix."""
+    return TableSchema('features', {feature: FEATURE for feature in features})
+
+
+def training_data_schema(features: List[str]) -> TableSchema:
+    """Schema of the training query result (one row per purchase)."""
+    return TableSchema('training_data', {
+        'customer_id': CUSTOMER_ID,
+        'pdm_prod_type_id': PRODUCT_TYPE_LABEL,
+        **{feature: FEATURE for feature in features},
+    })
+
+
+def scoring_data_schema(features: List[str]) -> TableSchema:
+    """Schema of the scoring (and train-to-predict) query results."""
+    return TableSchema('scoring_data', {
+        'customer_id': CUSTOMER_ID,
+        **{feature: FEATURE for feature in features},
+    })
+
+
+PRODUCT_TYPES = TableSchema('product_types', {'pdm_prod_type_id': PRODUCT_TYPE})
+
+PREDICTIONS = TableSchema('predictions', {
+    'customer_id': CUSTOMER_ID,
+    'p': PROBABILITY,
+    'pdm_prod_type_id': PRODUCT_TYPE_LABEL,
+})
+
+CLUSTERING = TableSchema(
+    'clustering',
+    {'customer_id': CUSTOMER_ID},
+    patterns={r'^p\d+$': PROBABILITY}
+)
+
+TOP_N = TableSchema('top_n', {
+    'customer_id': CUSTOMER_ID,
+    'rank': 'int16',
+    'pdm_prod_type_id': PRODUCT_TYPE,
+    'score': PROBABILITY,
+})
+
+LOOKALIKES = TableSchema('lookalikes', {
+    'seed_customer_id': CUSTOMER_ID,
+    'rank': 'int16',
+    'customer_id': CUSTOMER_ID,
+    'score': PROBABILITY,
+})
@@ -0,0 +1,271 @@
+"""
+Customer-hash sharding for multi-node scoring.
+
+A customer belongs to shard ``((|customer_id| mod P) * A mod P) mod N`` with
+P = 2^31 - 1 and A = 48271 (the MINSTD multiplier). The multiply scrambles
+sequential IDs across shards, every intermediate fits in INT64, and the same
+expression is available as a BigQuery predicate so each node can read only its
+own customers.
+
+Each shard writes its clustering (and top-N) output as Parquet under
+``<shard_dir>/<run_id>/`` together with a shard manifest, written last, that
+records the run ID, row counts, product-type columns and file checksums.
+``merge_shards`` checks that every shard of the run is present, intact and
+written by the same run, and assembles the final tables in customer_id order,
+independent of which node finished first.
+Shards may write their probability columns quantized (see quantization.py) to
+cut the bytes moved between nodes; the merge restores them to float32.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from quantization import dequantize_frame, quantize_frame
+from utils import logger
+
+HASH_MODULUS = 2_147_483_647
+HASH_MULTIPLIER = 48_271
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """One shard out of ``count``, with a 0-based ``index``."""
+
+    index: int
+    count: int
+
+    def __post_init__(self):
+        """Validate the shard bounds."""
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(f"Invalid shard {self.index}/{self.count}")
+
+    @classmethod
+    def parse(cls, value: str) -> 'ShardSpec':
+        """
+        Parse an ``i/N`` shard argument.
+
+        Raises:
+            ValueError: If the value is not of the form i/N with 0 <= i < N
+        """
+        try:
+            index, count = (int(part) for part in value.split('/'))
+        except ValueError:
+            raise ValueError(f"Shard must look like i/N, got {value!r}") from None
+        return cls(index, count)
+
+    @property
+    def name(self) -> str:
+        """File-name stem for this shard's outputs."""
+        return f"shard-{self.index:05d}-of-{self.count:05d}"
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def shard_of(customer_ids: Any, count: int) -> np.ndarray:
+    """
+    Compute the shard of each customer ID.
+
+    Args:
+        customer_ids: Integer (or integer-valued string) customer IDs
+        count: Number of shards
+
+    Returns:
+        int64 array of shard indices
+
+    Raises:
+        TypeError: If the IDs are not integers
+    """
+    ids = pd.Series(customer_ids)
+    if not pd.api.types.is_integer_dtype(ids):
+        ids = pd.to_numeric(ids, errors='raise')
+        if not pd.api.types.is_integer_dtype(ids):
+            raise TypeError("Sharding requires integer customer IDs")
+
+    ids = np.abs(ids.to_numpy(dtype=np.int64))
+    return (ids % HASH_MODULUS * HASH_MULTIPLIER % HASH_MODULUS) % count
+
+
+def shard_mask(customer_ids: Any, shard: ShardSpec) -> np.ndarray:
+    """Boolean mask of the customers that belong to ``shard``."""
+    return shard_of(customer_ids, shard.count) == shard.index
+
+
+def shard_sql_predicate(column: str, shard: ShardSpec) -> str:
+    """
+    BigQuery predicate selecting the rows of ``shard``.
+
+    Args:
+        column: Integer customer ID column
+        shard: Shard to select
+
+    Returns:
+        SQL boolean expression equivalent to ``shard_mask``
+    """
+    return (
+        f"MOD(MOD(MOD(ABS({column}), {HASH_MODULUS}) * {HASH_MULTIPLIER}, "
+        f"{HASH_MODULUS}), {shard.count}) = {shard.index}"
+    )
+
+
+def _sha256(path: Path) -> str:
+    """Return the hex SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path: Path, payload: Dict[str, Any]) -> None:
+    """Write JSON via a temporary file so readers never see a partial file."""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_shard_outputs(
+    run_dir: str,
+    run_id: str,
+    shard: ShardSpec,
+    clustering_data: pd.DataFrame,
+    top_n: Optional[pd.DataFrame] = None,
+    codec: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Write one shard's outputs and its manifest.
+
+    Args:
+        run_dir: Directory shared by all shards of the run
+        run_id: Sharded run the outputs belong to
+        shard: Shard that produced the outputs
+        clustering_data: Wide clustering table for the shard's customers
+        top_n: Optional narrow top-N table
+        codec: Quantization codec for the clustering table's p<id> columns
+            (None = float32)
+
+    Returns:
+        The shard manifest
+    """
+    out = Path(run_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    if codec is not None:
+        clustering = quantize_frame(clustering_data, codec)
+    else:
+        clustering = clustering_data
+
+    files = {}
+    for table, df in (('clustering', clustering), ('top_n', top_n)):
+        if df is None:
+            continue
+        path = out / f"{shard.name}.{table}.parquet"
+        df.to_parquet(path, index=False)
+        files[table] = {'path': path.name, 'rows': len(df), 'sha256': _sha256(path)}
+
+    manifest = {
+        'run_id': run_id,
+        'shard': shard.index,
+        'count': shard.count,
+        'hash': {'modulus': HASH_MODULUS, 'multiplier': HASH_MULTIPLIER},
+        'customers': int(clustering_data['customer_id'].nunique()),
+        'columns': list(clustering_data.columns),
+        'codec': codec,
+        'files': files,
+        'completed_at': datetime.now(timezone.utc).isoformat(),
+    }
+    _write_json_atomic(out / f"{shard.name}.json", manifest)
+
+    logger.info(f"Shard {shard} outputs written to {out} ({manifest['customers']} customers)")
+    return manifest
+
+
+def load_shard_manifests(run_dir: str) -> List[Dict[str, Any]]:
+    """Load every completed shard manifest of a run, ordered by shard."""
+    manifests = []
+    for path in sorted(Path(run_dir).glob("shard-*-of-*.json")):
+        with open(path) as f:
+            manifests.append(json.load(f))
+    return sorted(manifests, key=lambda m: m['shard'])
+
+
+def merge_shards(
+    run_dir: str,
+    run_id: str,
+    expected_count: Optional[int] = None,
+    verify_checksums: bool = True
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    Assemble the final clustering and top-N tables from shard outputs.
+
+    Args:
+        run_dir: Directory shared by all shards of the run
+        run_id: Sharded run every manifest must belong to
+        expected_count: Number of shards the run must have (default: from manifests)
+        verify_checksums: Recompute file checksums before reading
+
+    Returns:
+        Tuple of (clustering_data, top_n or None), sorted by customer_id
+
+    Raises:
+        ValueError: If shards are missing, inconsistent or corrupted
+    """
+    manifests = load_shard_manifests(run_dir)
+    if not manifests:
+        raise ValueError(f"No shard manifests found in {run_dir}")
+
+    stale = [m['shard'] for m in manifests if m.get('run_id') != run_id]
+    if stale:
+        raise ValueError(f"Shards {stale} in {run_dir} were not written by run {run_id}")
+
+    counts = {m['count'] for m in manifests}
+    if len(counts) != 1:
+        raise ValueError(f"Shards from different shard counts in {run_dir}: {sorted(counts)}")
+    count = counts.pop()
+    if expected_count is not None and count != expected_count:
+        raise ValueError(f"Run has {count} shards, expected {expected_count}")
+
+    missing = sorted(set(range(count)) - {m['shard'] for m in manifests})
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count} in {run_dir}")
+
+    # Every shard should score the same product types; keep the first shard's
+    # column order and append any columns only other shards produced
+    columns: List[str] = []
+    for manifest in manifests:
+        columns += [c for c in manifest['columns'] if c not in columns]
+    if any(len(m['columns']) != len(columns) for m in manifests):
+        logger.warning("Shards scored different product types; missing columns are filled with NaN")
+
+    tables: Dict[str, List[pd.DataFrame]] = {'clustering': [], 'top_n': []}
+    for manifest in manifests:
+        for table, entry in manifest['files'].items():
+            path = Path(run_dir) / entry['path']
+            if verify_checksums and _sha256(path) != entry['sha256']:
+                raise ValueError(f"Checksum mismatch for {path}")
+            df = pd.read_parquet(path)
+            if len(df) != entry['rows']:
+                raise ValueError(f"Row count mismatch for {path}")
+            # Each shard is quantized with its own parameters: restore before concatenating
+            tables[table].append(dequantize_frame(df))
+
+    clustering = pd.concat(tables['clustering'], ignore_index=True)
+    clustering = clustering.reindex(columns=columns)
+    clustering = clustering.sort_values('customer_id', kind='stable', ignore_index=True)
+
+    top_n = None
+    if tables['top_n']:
+        top_n = pd.concat(tables['top_n'], ignore_index=True)
+        top_n = top_n.sort_values(['customer_id', 'rank'], kind='stable', ignore_index=True)
+
+    logger.info(f"Merged {count} shards: {len(clustering)} customers")
+    return clustering, top_n
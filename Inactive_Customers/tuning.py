@@ -0,0 +1,457 @@
+"""
+Hyperparameter search for the per-product-type XGBoost models.
+
+Runs randomized or successive-halving search over the XGBoost parameters in
+``ModelConfig`` for a sample of product types. Trials are fitted in parallel
+across a process pool, each bounded by a wall-clock time budget, and every
+trial is appended to a JSON-lines history file. The result is either a tuned
+global parameter set or per-product-type overrides, written in the format read
+by ``ModelConfig.apply_tuning_results``.
+"""
+
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent))
+
+from config import Config, ModelConfig, get_config
+from utils import setup_logging, logger
+
+
+# Worker-process state, populated once per process by _init_worker
+_WORKER_DATA: Dict[str, np.ndarray] = {}
+
+
+def _init_worker(
+    X: np.ndarray,
+    labels: np.ndarray,
+    train_idx: np.ndarray,
+    valid_idx: np.ndarray
+) -> None:
+    """Store the shared training arrays in the worker process."""
+    _WORKER_DATA['X'] = X
+    _WORKER_DATA['labels'] = labels
+    _WORKER_DATA['train_idx'] = train_idx
+    _WORKER_DATA['valid_idx'] = valid_idx
+
+
+def _make_time_budget_callback(time_budget: float):
+    """Create an XGBoost callback that stops boosting once the budget is spent."""
+    from xgboost.callback import TrainingCallback
+
+    class TimeBudgetCallback(TrainingCallback):
+        def __init__(self):
+            super().__init__()
+            self.start = None
+            self.timed_out = False
+
+        def before_training(self, model):
+            self.start = time.perf_counter()
+            return model
+
+        def after_iteration(self, model, epoch, evals_log):
+            if time.perf_counter() - self.start > time_budget:
+                self.timed_out = True
+                return True
+            return False
+
+    return TimeBudgetCallback()
+
+
+def _log_loss(y: np.ndarray, p: np.ndarray) -> float:
+    """Binary log loss with clipped probabilities."""
+    p = np.clip(p, 1e-7, 1 - 1e-7)
+    return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+
+def _run_trial(trial: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fit and evaluate one (parameters, product type, budget) trial.
+
+    Executed in a worker process; reads the feature matrix from worker state.
+
+    Args:
+        trial: Trial specification with 'params', 'prod_type_id' and 'time_budget'
+
+    Returns:
+        The trial specification extended with its outcome
+    """
+    from xgboost import XGBClassifier
+
+    X = _WORKER_DATA['X']
+    labels = _WORKER_DATA['labels']
+    train_idx = _WORKER_DATA['train_idx']
+    valid_idx = _WORKER_DATA['valid_idx']
+
+    y = (labels == trial['prod_type_id']).astype(np.int8)
+    callback = _make_time_budget_callback(trial['time_budget'])
+    started = time.perf_counter()
+
+    try:
+        model = XGBClassifier(**trial['params'], callbacks=[callback])
+        model.fit(X[train_idx], y[train_idx])
+
+        p = model.predict_proba(X[valid_idx])[:, 1]
+        metric = _log_loss(y[valid_idx], p)
+        status = 'timed_out' if callback.timed_out else 'ok'
+        n_trees = model.get_booster().num_boosted_rounds()
+        error = None
+
+    except Exception as e:
+        metric = math.inf
+        status = 'failed'
+        n_trees = 0
+        error = str(e)
+
+    return {
+        **trial,
+        'metric': metric,
+        'status': status,
+        'n_trees': n_trees,
+        'elapsed': time.perf_counter() - started,
+        'error': error,
+    }
+
+
+@dataclass
+class TuningResult:
+    """Outcome of a hyperparameter search."""
+
+    best_params: Dict[str, Any]
+    best_metric: float
+    per_product: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    n_trials: int = 0
+
+    def to_model_config(self, base: ModelConfig) -> ModelConfig:
+        """
+        Build a tuned ModelConfig from a base configuration.
+
+        Args:
+            base: Configuration supplying all untuned settings
+
+        Returns:
+            New ModelConfig with the tuned global parameters and overrides
+        """
+        tuned = replace(base, **self.best_params)
+        tuned.param_overrides = {**base.param_overrides, **self.per_product}
+        return tuned
+
+    def save(self, filepath: str) -> None:
+        """
+        Write the tuned parameters for ModelConfig.apply_tuning_results.
+
+        Args:
+            filepath: Destination JSON path
+        """
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+
+        with open(filepath, 'w') as f:
+            json.dump({
+                'global': self.best_params,
+                'per_product': {str(k): v for k, v in self.per_product.items()},
+                'best_metric': self.best_metric,
+                'n_trials': self.n_trials,
+            }, f, indent=2)
+
+        logger.info(f"Tuned parameters saved to {filepath}")
+
+
+class HyperparameterTuner:
+    """
+    Parallel hyperparameter search over XGBoost parameters.
+
+    Candidate parameter sets are sampled from ``TuningConfig.search_space``.
+    With successive halving, every candidate starts with ``min_estimators``
+    trees; after each rung only the best ``1 / reduction_factor`` survive and
+    their tree budget is multiplied by ``reduction_factor`` up to
+    ``max_estimators``. Random search fits every candidate at the full budget.
+    Candidates are ranked by mean validation log loss over the sampled product
+    types, or per product type when ``TuningConfig.per_product`` is set.
+    Candidates whose trials all completed rank ahead of those with a trial
+    stopped by the time budget, and the tuned ``n_estimators`` is the number
+    of trees the winner actually fit.
+    """
+
+    def __init__(self, config: Config):
+        """
+        Initialize the tuner.
+
+        Args:
+            config: Application configuration object
+        """
+        self.config = config
+        self.tuning = config.tuning
+        self.rng = np.random.default_rng(self.tuning.random_state)
+        self.history: List[Dict[str, Any]] = []
+        self.run_id = uuid.uuid4().hex[:12]
+
+        logger.info(f"HyperparameterTuner initialized (run {self.run_id})")
+
+    def sample_params(self) -> Dict[str, Any]:
+        """
+        Sample one parameter set from the search space.
+
+        Returns:
+            Parameter name to sampled value
+        """
+        params = {}
+        for name, spec in self.tuning.search_space.items():
+            kind = spec[0]
+            if kind == 'uniform':
+                params[name] = float(self.rng.uniform(spec[1], spec[2]))
+            elif kind == 'loguniform':
+                params[name] = float(np.exp(self.rng.uniform(np.log(spec[1]), np.log(spec[2]))))
+            elif kind == 'int':
+                params[name] = int(self.rng.integers(spec[1], spec[2] + 1))
+            elif kind == 'choice':
+                params[name] = spec[1][int(self.rng.integers(len(spec[1])))]
+            else:
+                raise ValueError(f"Unknown search space distribution for {name}: {kind}")
+        return params
+
+    def sample_product_types(self, product_ids: List[int]) -> List[int]:
+        """
+        Choose the product types the search is evaluated on.
+
+        Args:
+            product_ids: All candidate product type IDs
+
+        Returns:
+            Sampled product type IDs
+        """
+        n = min(self.tuning.sample_prod_types, len(product_ids))
+        return sorted(int(p) for p in self.rng.choice(product_ids, size=n, replace=False))
+
+    def _trial_params(self, params: Dict[str, Any], n_estimators: int) -> Dict[str, Any]:
+        """Merge sampled parameters into the base XGBoost parameters."""
+        cpu_count = os.cpu_count() or 1
+        xgb_params = self.config.model.to_xgb_params()
+        xgb_params.update(params)
+        xgb_params['n_estimators'] = int(n_estimators)
+        # Split cores between concurrent trials instead of oversubscribing
+        xgb_params['n_jobs'] = max(1, cpu_count // self.config.processing.max_workers)
+        return xgb_params
+
+    def _run_rung(
+        self,
+        pool: ProcessPoolExecutor,
+        candidates: Dict[int, Dict[str, Any]],
+        groups: Dict[int, List[int]],
+        product_ids: List[int],
+        n_estimators: int,
+        rung: int
+    ) -> Dict[int, Dict[int, Dict[str, Any]]]:
+        """
+        Evaluate surviving candidates at one budget level.
+
+        Args:
+            pool: Process pool running the trials
+            candidates: Candidate ID to sampled parameters
+            groups: Selection group ID to the candidate IDs still alive in it
+            product_ids: Product types each group is evaluated on, by group
+            n_estimators: Tree budget for this rung
+            rung: Rung number, recorded in the history
+
+        Returns:
+            Group ID to {candidate ID: score}, each score holding the mean
+            'metric', whether every trial 'completed' its full budget and
+            the fewest trees any of its successful trials fit ('n_trees')
+        """
+        trials = []
+        for group_id, alive in groups.items():
+            prods = product_ids if group_id < 0 else [group_id]
+            for candidate_id in alive:
+                for prod_id in prods:
+                    trials.append({
+                        'candidate_id': candidate_id,
+                        'group_id': group_id,
+                        'rung': rung,
+                        'prod_type_id': prod_id,
+                        'params': self._trial_params(candidates[candidate_id], n_estimators),
+                        'time_budget': self.tuning.trial_time_budget,
+                    })
+
+        logger.info(f"Rung {rung}: {len(trials)} trials at n_estimators={n_estimators}")
+
+        outcomes: Dict[int, Dict[int, List[Dict[str, Any]]]] = {}
+        for outcome in pool.map(_run_trial, trials):
+            self._record(outcome)
+            outcomes.setdefault(outcome['group_id'], {}).setdefault(
+                outcome['candidate_id'], []
+            ).append(outcome)
+
+        return {
+            group_id: {
+                cid: {
+                    'metric': float(np.mean([o['metric'] for o in trial_outcomes])),
+                    'completed': all(o['status'] == 'ok' for o in trial_outcomes),
+                    'n_trees': min(
+                        (o['n_trees'] for o in trial_outcomes if o['status'] != 'failed'), default=0
+                    ),
+                }
+                for cid, trial_outcomes in by_candidate.items()
+            }
+            for group_id, by_candidate in outcomes.items()
+        }
+
+    def _record(self, outcome: Dict[str, Any]) -> None:
+        """Append a finished trial to the in-memory and on-disk history."""
+        outcome = {**outcome, 'run_id': self.run_id, 'trial_id': len(self.history)}
+        self.history.append(outcome)
+
+        history_path = Path(self.tuning.history_path)
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(history_path, 'a') as f:
+            f.write(json.dumps(outcome, default=str) + "\n")
+
+        if outcome['status'] == 'failed':
+            logger.warning(
+                f"Trial {self.run_id}/{outcome['trial_id']} failed for product "
+                f"{outcome['prod_type_id']}: {outcome['error']}"
+            )
+
+    def _budget_schedule(self) -> List[int]:
+        """Tree budgets for each rung of the search."""
+        if self.tuning.strategy == 'random':
+            return [self.tuning.max_estimators]
+
+        budgets = []
+        n_estimators = self.tuning.min_estimators
+        while n_estimators < self.tuning.max_estimators:
+            budgets.append(n_estimators)
+            n_estimators *= self.tuning.reduction_factor
+        budgets.append(self.tuning.max_estimators)
+        return budgets
+
+    def run(
+        self,
+        X: pd.DataFrame,
+        labels: pd.Series,
+        product_ids: List[int]
+    ) -> TuningResult:
+        """
+        Execute the hyperparameter search.
+
+        Args:
+            X: Imputed feature matrix
+            labels: Product type ID of each training row
+            product_ids: Candidate product type IDs to sample from
+
+        Returns:
+            Tuning result with the best global parameters and, when
+            ``TuningConfig.per_product`` is set, per-product overrides
+        """
+        logger.info("=" * 60)
+        logger.info(f"HYPERPARAMETER SEARCH ({self.tuning.strategy})")
+        logger.info("=" * 60)
+
+        sampled = self.sample_product_types(list(product_ids))
+        logger.info(f"Tuning on product types: {sampled}")
+
+        candidates = {i: self.sample_params() for i in range(self.tuning.n_trials)}
+
+        # Group -1 ranks candidates across all sampled product types
+        if self.tuning.per_product:
+            groups = {prod_id: list(candidates) for prod_id in sampled}
+        else:
+            groups = {-1: list(candidates)}
+
+        X_values = np.ascontiguousarray(X.values, dtype=np.float32)
+        label_values = np.asarray(labels, dtype=np.int64)
+        order = self.rng.permutation(len(X_values))
+        n_valid = max(1, int(len(order) * self.tuning.validation_fraction))
+        valid_idx, train_idx = np.sort(order[:n_valid]), np.sort(order[n_valid:])
+
+        best: Dict[int, tuple] = {}
+        started = time.perf_counter()
+
+        with ProcessPoolExecutor(
+            max_workers=self.config.processing.max_workers,
+            initializer=_init_worker,
+            initargs=(X_values, label_values, train_idx, valid_idx)
+        ) as pool:
+            for rung, n_estimators in enumerate(self._budget_schedule()):
+                scores = self._run_rung(pool, candidates, groups, sampled, n_estimators, rung)
+
+                for group_id, by_candidate in scores.items():
+                    # A trial stopped by the time budget fit fewer trees than
+                    # the rung's budget, so it only wins if none completed
+                    ranked = sorted(
+                        by_candidate,
+                        key=lambda cid: (not by_candidate[cid]['completed'], by_candidate[cid]['metric'])
+                    )
+                    winner = by_candidate[ranked[0]]
+                    # Emit the trees the winner actually fit, not the budget
+                    best[group_id] = (ranked[0], winner['metric'], winner['n_trees'])
+                    keep = max(1, len(ranked) // self.tuning.reduction_factor)
+                    groups[group_id] = ranked[:keep]
+
+        def tuned_params(group_id: int) -> Dict[str, Any]:
+            candidate_id, _, n_trees = best[group_id]
+            return {**candidates[candidate_id], 'n_estimators': n_trees}
+
+        if self.tuning.per_product:
+            per_product = {prod_id: tuned_params(prod_id) for prod_id in sampled}
+            result = TuningResult(
+                best_params={},
+                best_metric=float(np.mean([best[p][1] for p in sampled])),
+                per_product=per_product,
+                n_trials=len(self.history)
+            )
+        else:
+            result = TuningResult(
+                best_params=tuned_params(-1),
+                best_metric=best[-1][1],
+                n_trials=len(self.history)
+            )
+
+        logger.info(
+            f"Search finished: {len(self.history)} trials in "
+            f"{time.perf_counter() - started:.1f}s, best log loss {result.best_metric:.5f}"
+        )
+        return result
+
+
+def main():
+    """Main entry point for the hyperparameter search."""
+    setup_logging(
+        log_level='INFO',
+        log_file='tuning.log'
+    )
+
+    try:
+        from Train.training import ProductRecommendationTrainer
+
+        config = get_config()
+
+        trainer = ProductRecommendationTrainer(config)
+        training_data, product_types, _ = trainer.load_training_data()
+        X = trainer.prepare_features(training_data, is_training=True)
+
+        tuner = HyperparameterTuner(config)
+        result = tuner.run(
+            X,
+            training_data['pdm_prod_type_id'],
+            [int(p) for p in product_types['pdm_prod_type_id']]
+        )
+        result.save(config.tuning.output_path)
+
+    except Exception as e:
+        logger.error("Hyperparameter search failed with error:", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
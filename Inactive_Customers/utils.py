@@ -1,35 +1,78 @@
 """Utility functions for the Inactive Customers recommendation system."""
 
+from __future__ import annotations
+
 import logging
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple, Any
-import pandas as pd
-import numpy as np
-from google.oauth2 import service_account
-from google.cloud import bigquery
-from google.cloud import bigquery_storage
-
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Handlers are configured by the entry points via setup_logging(), not on import
 logger = logging.getLogger(__name__)
 
 
+def bigquery_dtype(arrow_type: Any) -> Any:
+    """
+    The pandas dtype RowIterator.to_dataframe gives an Arrow column type.
+
+    Used as ``types_mapper`` when converting Storage API reads, so INT64 stays
+    nullable Int64 and DATE/TIME become db-dtypes columns rather than
+    float64/object. NUMERIC stays object (Decimal), as in to_dataframe.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    if pa.types.is_integer(arrow_type):
+        return pd.Int64Dtype()
+    if pa.types.is_boolean(arrow_type):
+        return pd.BooleanDtype()
+    if pa.types.is_date32(arrow_type) or pa.types.is_time64(arrow_type):
+        try:
+            import db_dtypes
+        except ImportError:
+            return None
+        return db_dtypes.DateDtype() if pa.types.is_date32(arrow_type) else db_dtypes.TimeDtype()
+    return None
+
+
 class BigQueryClient:
     """Wrapper for BigQuery client with convenience methods."""
 
-    def __init__(self, credentials_path: str, project_id: Optional[str] = None):
+    def __init__(
+        self,
+        credentials_path: str,
+        project_id: Optional[str] = None,
+        max_concurrent_queries: int = 4,
+        max_read_streams: int = 0,
+        storage_api_min_rows: int = 100_000
+    ):
         """
         Initialize BigQuery client.
 
         Args:
             credentials_path: Path to GCP service account JSON key file
             project_id: GCP project ID (if None, uses credentials default)
+            max_concurrent_queries: Query results downloaded at once by execute_queries
+            max_read_streams: Storage API read streams per result (0 = BigQuery decides)
+            storage_api_min_rows: Smaller results are downloaded by
+                RowIterator.to_dataframe, without a parallel read session
+
+        Raises:
+            FileNotFoundError: If the credentials file does not exist
         """
+        # Google client libraries are only needed by this backend
+        from google.oauth2 import service_account
+        from google.cloud import bigquery
+        from google.cloud import bigquery_storage
+
+        if not Path(credentials_path).exists():
+            raise FileNotFoundError(f"Credentials file not found: {credentials_path}")
+
         self.credentials = service_account.Credentials.from_service_account_file(
             credentials_path,
             scopes=["https://www.googleapis.com/auth/cloud-platform"],
@@ -46,12 +89,149 @@ class BigQueryClient:
             credentials=self.credentials
         )
 
+        self.max_concurrent_queries = max_concurrent_queries
+        self.max_read_streams = max_read_streams
+        self.storage_api_min_rows = storage_api_min_rows
+
         logger.info(f"BigQuery client initialized for project: {self.project_id}")
 
+    @classmethod
+    def from_clients(
+        cls,
+        bq_client: Any,
+        bq_storage_client: Any,
+        project_id: str,
+        max_concurrent_queries: int = 4,
+        max_read_streams: int = 0,
+        storage_api_min_rows: int = 100_000
+    ) -> 'BigQueryClient':
+        """
+        Wrap already constructed BigQuery and Storage API clients.
+
+        Used with fake clients (see fake_bigquery.py) to run the query and
+        download logic without credentials or network access.
+
+        Args:
+            bq_client: bigquery.Client (or a compatible fake)
+            bq_storage_client: bigquery_storage.BigQueryReadClient (or a fake)
+            project_id: GCP project ID
+            max_concurrent_queries: Query results downloaded at once
+            max_read_streams: Storage API read streams per result
+            storage_api_min_rows: Smaller results skip the parallel read session
+
+        Returns:
+            BigQueryClient using the given clients
+        """
+        client = cls.__new__(cls)
+        client.credentials = None
+        client.project_id = project_id
+        client.bq_client = bq_client
+        client.bq_storage_client = bq_storage_client
+        client.max_concurrent_queries = max_concurrent_queries
+        client.max_read_streams = max_read_streams
+        client.storage_api_min_rows = storage_api_min_rows
+        return client
+
+    def submit_query(self, query: str) -> Any:
+        """
+        Start a query job without waiting for it.
+
+        Args:
+            query: SQL query string
+
+        Returns:
+            The running QueryJob
+        """
+        logger.debug(f"Submitting query: {query[:200]}...")
+        return self.bq_client.query(query)
+
+    def fetch_results(
+        self,
+        query_job: Any,
+        use_storage_api: bool = True,
+        ordered: bool = False
+    ) -> pd.DataFrame:
+        """
+        Wait for a query job and download its result.
+
+        Results of at least ``storage_api_min_rows`` rows are read over
+        parallel Storage API streams; smaller ones through
+        RowIterator.to_dataframe, which skips the read session when the
+        first page holds every row.
+
+        Args:
+            query_job: Job returned by submit_query
+            use_storage_api: Read the result table over parallel Storage API streams
+            ordered: The query's row order must be kept (read in one stream)
+
+        Returns:
+            Query results as pandas DataFrame
+        """
+        rows = query_job.result()
+
+        if not use_storage_api:
+            return rows.to_dataframe()
+
+        if rows.total_rows is not None and rows.total_rows < self.storage_api_min_rows:
+            return rows.to_dataframe(bqstorage_client=self.bq_storage_client)
+
+        # Rows of an ordered result must come back in one stream
+        return self.read_table_streams(
+            query_job.destination,
+            max_streams=1 if ordered else self.max_read_streams
+        )
+
+    def read_table_streams(
+        self,
+        table: Any,
+        selected_fields: Optional[List[str]] = None,
+        max_streams: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Read a table through the Storage API, one thread per read stream.
+
+        Args:
+            table: TableReference (or object with project, dataset_id, table_id)
+            selected_fields: Columns to read (None = all)
+            max_streams: Upper bound on read streams (0/None = BigQuery decides)
+
+        Returns:
+            Table data as pandas DataFrame, with the dtypes
+            RowIterator.to_dataframe would give (see ``bigquery_dtype``)
+        """
+        import pyarrow as pa
+
+        read_session = {
+            'table': f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}",
+            'data_format': 'ARROW',
+        }
+        if selected_fields:
+            read_session['read_options'] = {'selected_fields': list(selected_fields)}
+
+        session = self.bq_storage_client.create_read_session(
+            parent=f"projects/{self.project_id}",
+            read_session=read_session,
+            max_stream_count=max_streams or 0
+        )
+
+        if not session.streams:
+            schema = pa.ipc.read_schema(pa.py_buffer(session.arrow_schema.serialized_schema))
+            return schema.empty_table().to_pandas(types_mapper=bigquery_dtype)
+
+        def read_stream(stream: Any) -> pa.Table:
+            return self.bq_storage_client.read_rows(stream.name).to_arrow(session)
+
+        with ThreadPoolExecutor(max_workers=len(session.streams)) as pool:
+            tables = list(pool.map(read_stream, session.streams))
+
+        logger.debug(f"Read {table.table_id} over {len(tables)} streams")
+        return pa.concat_tables(tables).to_pandas(types_mapper=bigquery_dtype)
+
     def execute_query(
         self,
         query: str,
-        use_storage_api: bool = True
+        use_storage_api: bool = True,
+        ordered: bool = False
     ) -> pd.DataFrame:
         """
         Execute a BigQuery query and return results as DataFrame.
@@ -59,6 +239,7 @@ class BigQueryClient:
         Args:
             query: SQL query string
             use_storage_api: Whether to use BigQuery Storage API for faster reads
+            ordered: The query's row order (its ORDER BY) must be kept
 
         Returns:
             Query results as pandas DataFrame
@@ -70,14 +251,7 @@ class BigQueryClient:
             logger.info("Executing BigQuery query...")
             logger.debug(f"Query: {query[:200]}...")
 
-            query_job = self.bq_client.query(query)
-
-            if use_storage_api:
-                df = query_job.result().to_dataframe(
-                    bqstorage_client=self.bq_storage_client
-                )
-            else:
-                df = query_job.result().to_dataframe()
+            df = self.fetch_results(self.submit_query(query), use_storage_api, ordered)
 
             logger.info(f"Query returned {len(df)} rows")
             return df
@@ -86,6 +260,60 @@ class BigQueryClient:
             logger.error(f"Query execution failed: {str(e)}")
             raise
 
+    def execute_queries(
+        self,
+        queries: Dict[str, str],
+        use_storage_api: bool = True,
+        ordered: Sequence[str] = ()
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Run several queries concurrently.
+
+        All jobs are submitted before any result is awaited, so BigQuery runs
+        them side by side, and results are downloaded on up to
+        ``max_concurrent_queries`` threads. Load time becomes roughly the
+        slowest query rather than the sum.
+
+        Args:
+            queries: Query name to SQL query string
+            use_storage_api: Whether to use BigQuery Storage API for faster reads
+            ordered: Names of the queries whose row order must be kept
+
+        Returns:
+            Query name to results DataFrame
+
+        Raises:
+            Exception: If any query fails (the other jobs are cancelled)
+        """
+        logger.info(f"Executing {len(queries)} BigQuery queries concurrently...")
+
+        jobs = {name: self.submit_query(query) for name, query in queries.items()}
+
+        pool = ThreadPoolExecutor(max_workers=max(1, self.max_concurrent_queries))
+        futures = {
+            name: pool.submit(self.fetch_results, job, use_storage_api, name in ordered)
+            for name, job in jobs.items()
+        }
+
+        try:
+            results = {name: future.result() for name, future in futures.items()}
+
+        except Exception as e:
+            logger.error(f"Query execution failed: {str(e)}")
+            for future in futures.values():
+                future.cancel()
+            for job in jobs.values():
+                if not job.done():
+                    job.cancel()
+            raise
+
+        finally:
+            pool.shutdown(wait=True)
+
+        for name, df in results.items():
+            logger.info(f"Query {name} returned {len(df)} rows")
+        return results
+
     def load_table(
         self,
         dataset: str,
@@ -141,6 +369,30 @@ class BigQueryClient:
             logger.error(f"Upload failed: {str(e)}")
             raise
 
+    def replace_table(self, dataset: str, source_table: str, table_name: str) -> None:
+        """
+        Replace a table with another table's contents and drop the source.
+
+        The copy job truncates the destination and writes the source rows in
+        one step, so readers see either the old or the new table.
+
+        Args:
+            dataset: Dataset of both tables
+            source_table: Table holding the new contents (dropped afterwards)
+            table_name: Table to replace
+        """
+        from google.cloud import bigquery
+
+        source = f"{self.project_id}.{dataset}.{source_table}"
+        destination = f"{self.project_id}.{dataset}.{table_name}"
+        logger.info(f"Replacing {dataset}.{table_name} with {dataset}.{source_table}")
+
+        job_config = bigquery.CopyJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+        )
+        self.bq_client.copy_table(source, destination, job_config=job_config).result()
+        self.bq_client.delete_table(source, not_found_ok=True)
+
 
 class DataProcessor:
     """Data processing utilities."""
@@ -162,6 +414,8 @@ class DataProcessor:
         Returns:
             DataFrame with imputed values
         """
+        import pandas as pd
+
         logger.info("Applying feature imputation...")
 
         # Convert to numeric, coercing errors to NaN
@@ -201,48 +455,217 @@ class DataProcessor:
         Returns:
             Binary target series
         """
+        import numpy as np
+
         return np.where(df[target_column] == target_value, 1, 0)
 
+    @staticmethod
+    def predictions_to_long(
+        customers: pd.Series,
+        prob: np.ndarray,
+        product_ids: list
+    ) -> pd.DataFrame:
+        """
+        Convert a (customers x product types) probability matrix to long format.
+
+        Rows are product-major, matching the per-product concatenation.
+
+        Args:
+            customers: Customer IDs, one per matrix row
+            prob: Probability matrix with one column per product type
+            product_ids: Product type ID of each matrix column
+
+        Returns:
+            Long-format DataFrame with customer_id, float32 p and categorical
+            pdm_prod_type_id
+        """
+        import numpy as np
+        import pandas as pd
+
+        customer_ids = np.asarray(customers)
+        return pd.DataFrame({
+            'customer_id': np.tile(customer_ids, len(product_ids)),
+            'p': prob.T.astype(np.float32).ravel(),
+            # One small code per row instead of a repeated int64
+            'pdm_prod_type_id': pd.Categorical.from_codes(
+                np.repeat(np.arange(len(product_ids)), len(customer_ids)),
+                categories=np.asarray(product_ids, dtype=np.int64)
+            ),
+        })
+
     @staticmethod
     def pivot_predictions(
-        predictions: pd.DataFrame,
+        predictions: Union[pd.DataFrame, Sequence[pd.DataFrame]],
         index_col: str = 'customer_id',
         columns_col: str = 'pdm_prod_type_id',
-        values_col: str = 'p'
+        values_col: str = 'p',
+        dtype: Any = 'float32',
+        keys: Optional[Tuple[Any, Any]] = None
     ) -> pd.DataFrame:
         """
         Pivot predictions from long to wide format.
 
+        Customer and product type IDs are factorized once and each value is
+        scattered straight into a preallocated NaN-filled matrix, which then
+        backs the output DataFrame without further copies. Input may be given
+        as several chunks (e.g. one per product type); keys are collected from
+        all chunks before any values are placed, unless given as ``keys``, in
+        which case the chunks may be generated lazily and are read once.
+
         Args:
-            predictions: Long-format predictions DataFrame
+            predictions: Long-format predictions DataFrame, or a sequence of chunks
             index_col: Column to use as index
             columns_col: Column to use as columns
             values_col: Column containing values
+            dtype: Value dtype of the wide matrix
+            keys: Sorted customer IDs and product type IDs of the output
+                (every chunk's keys must be among them)
 
         Returns:
-            Wide-format DataFrame with pivoted predictions
+            Wide-format DataFrame with one p<id> column per product type (in
+            ascending ID order) followed by customer_id, one row per customer
+            in ascending ID order
+
+        Raises:
+            ValueError: If a (customer, product type) pair occurs more than once,
+                an ID is null or an ID is missing from ``keys`` (a duplicate
+                is missed only if the earlier value was NaN)
         """
+        import numpy as np
+        import pandas as pd
+
         logger.info("Pivoting predictions to wide format...")
 
-        predictions_wide = pd.pivot(
-            predictions,
-            index=[index_col],
-            columns=columns_col,
-            values=values_col
-        )
+        if isinstance(predictions, pd.DataFrame):
+            chunks = [predictions]
+        elif keys is None:
+            chunks = list(predictions)
+        else:
+            chunks = predictions
+
+        if keys is not None:
+            customers, products = keys
+            chunk_codes = None
+        elif len(chunks) == 1:
+            row_codes, customers = pd.factorize(chunks[0][index_col], sort=True)
+            col_codes, products = pd.factorize(chunks[0][columns_col], sort=True)
+            chunk_codes = [(row_codes, col_codes)]
+        else:
+            customers = np.unique(np.concatenate([c[index_col].unique() for c in chunks]))
+            products = np.unique(np.concatenate([c[columns_col].unique() for c in chunks]))
+            chunk_codes = None
+
+        customers = np.asarray(customers)
+        products = np.asarray(products)
+
+        def codes_of(keys: np.ndarray, ids: np.ndarray, name: str) -> np.ndarray:
+            """Positions of ``ids`` in the sorted ``keys``, which must hold them all."""
+            codes = np.searchsorted(keys, ids)
+            found = codes < len(keys)
+            found[found] = keys[codes[found]] == ids[found]
+            if not found.all():
+                missing = ids[~found]
+                raise ValueError(
+                    f"{len(missing)} {name} values missing from the pivot keys, e.g. {missing[:5].tolist()}"
+                )
+            return codes
 
-        # Rename columns with prefix
-        column_names = predictions_wide.columns.values.tolist()
-        column_names_prep = ["p" + str(sub) for sub in column_names]
-        predictions_wide.columns = column_names_prep
+        wide = np.full((len(customers), len(products)), np.nan, dtype=dtype)
 
-        # Reset index
-        predictions_wide['customer_id'] = predictions_wide.index
-        predictions_wide = predictions_wide.reset_index(drop=True)
+        for i, chunk in enumerate(chunks):
+            if chunk[index_col].isna().any() or chunk[columns_col].isna().any():
+                raise ValueError(f"Null {index_col} or {columns_col} in predictions")
+
+            if chunk_codes is not None:
+                row_codes, col_codes = chunk_codes[i]
+            else:
+                row_codes = codes_of(customers, chunk[index_col].to_numpy(), index_col)
+                col_codes = codes_of(products, chunk[columns_col].to_numpy(), columns_col)
+
+            # Repeated pairs within the chunk share a cell; across chunks they
+            # land on a cell an earlier chunk already filled. A mask of
+            # written cells would add a quarter to the float32 matrix's peak
+            cells = row_codes.astype(np.int64) * len(products) + col_codes
+            if len(np.unique(cells)) != len(cells) or not np.isnan(wide.flat[cells]).all():
+                raise ValueError("Index contains duplicate entries, cannot reshape")
+
+            wide.flat[cells] = chunk[values_col].to_numpy()
+
+        predictions_wide = pd.DataFrame(
+            wide,
+            columns=["p" + str(sub) for sub in products],
+            copy=False
+        )
+        predictions_wide['customer_id'] = customers
 
         logger.info(f"Pivoted to {len(predictions_wide)} rows x {len(predictions_wide.columns)} columns")
         return predictions_wide
 
+    @staticmethod
+    def top_n_recommendations(
+        prob: np.ndarray,
+        customer_ids: np.ndarray,
+        product_ids: np.ndarray,
+        n: int,
+        block_size: int = 100_000
+    ) -> pd.DataFrame:
+        """
+        Select the N highest-probability product types per customer.
+
+        Works through the probability matrix in row blocks, using
+        ``np.argpartition`` to find each block's top N before sorting only
+        those N, so no full per-row sort or wide copy is made.
+
+        Args:
+            prob: (customers x product types) probability matrix
+            customer_ids: Customer ID of each matrix row
+            product_ids: Product type ID of each matrix column
+            n: Number of recommendations per customer
+            block_size: Rows processed per block
+
+        Returns:
+            Narrow DataFrame with customer_id, rank (1 = best),
+            pdm_prod_type_id and score, N rows per customer
+        """
+        import numpy as np
+        import pandas as pd
+
+        logger.info(f"Selecting top {n} product types per customer...")
+
+        n = min(n, prob.shape[1])
+        customer_ids = np.asarray(customer_ids)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+
+        top_products = np.empty((len(prob), n), dtype=np.int64)
+        top_scores = np.empty((len(prob), n), dtype=np.float32)
+
+        for start in range(0, len(prob), block_size):
+            # Missing probabilities rank last
+            block = np.nan_to_num(prob[start:start + block_size], nan=-np.inf)
+            rows = np.arange(len(block))[:, None]
+
+            if n < block.shape[1]:
+                candidates = np.argpartition(-block, n - 1, axis=1)[:, :n]
+            else:
+                candidates = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+
+            order = np.argsort(-block[rows, candidates], axis=1, kind='stable')
+            best = candidates[rows, order]
+
+            top_products[start:start + len(block)] = product_ids[best]
+            top_scores[start:start + len(block)] = block[rows, best]
+
+        top_n = pd.DataFrame({
+            'customer_id': np.repeat(customer_ids, n),
+            'rank': np.tile(np.arange(1, n + 1, dtype=np.int16), len(customer_ids)),
+            'pdm_prod_type_id': top_products.ravel(),
+            'score': top_scores.ravel(),
+        })
+        top_n.loc[np.isinf(top_n['score']), 'score'] = np.nan
+
+        logger.info(f"Top-{n} table: {len(top_n)} rows")
+        return top_n
+
 
 class ModelPersistence:
     """Model persistence utilities."""
@@ -298,17 +721,23 @@ class ModelPersistence:
             raise
 
     @staticmethod
-    def save_dataframe(df: pd.DataFrame, filepath: str) -> None:
+    def save_dataframe(df: pd.DataFrame, filepath: str, codec: Optional[str] = None) -> None:
         """
         Save a DataFrame to pickle.
 
         Args:
             df: DataFrame to save
             filepath: Path to save the DataFrame
+            codec: Store the probability columns quantized with this codec
+                ('float16', 'uint16' or 'uint8'; see quantization.py)
         """
         try:
             Path(filepath).parent.mkdir(parents=True, exist_ok=True)
 
+            if codec is not None:
+                from quantization import quantize_frame
+                df = quantize_frame(df, codec)
+
             df.to_pickle(filepath)
             logger.info(f"DataFrame saved to {filepath} ({len(df)} rows)")
 
@@ -321,17 +750,23 @@ class ModelPersistence:
         """
         Load a DataFrame from pickle.
 
+        Quantized probability columns are restored to float32.
+
         Args:
             filepath: Path to the pickle file
 
         Returns:
             Loaded DataFrame
         """
+        import pandas as pd
+
+        from quantization import dequantize_frame
+
         try:
             if not Path(filepath).exists():
                 raise FileNotFoundError(f"File not found: {filepath}")
 
-            df = pd.read_pickle(filepath)
+            df = dequantize_frame(pd.read_pickle(filepath))
             logger.info(f"DataFrame loaded from {filepath} ({len(df)} rows)")
             return df
 
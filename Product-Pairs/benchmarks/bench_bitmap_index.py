@@ -0,0 +1,173 @@
+"""
+Benchmark bitmap index queries against pandas set intersections.
+
+For each requested scale, generates a synthetic transaction history, builds a
+``BitmapIndex`` over product types and SKUs and reports build, save and load
+time, the index size against all-bitset and row storage, the latency of
+pair and 3-way intersection counts against filtering ``trans_hist`` and
+intersecting ``customer_id`` sets per query (as the notebook does), and the
+time to build ``prod_type_ref`` both ways. Every answer is checked against
+pandas.
+
+Usage:
+    python benchmarks/bench_bitmap_index.py --scales small medium
+    python benchmarks/bench_bitmap_index.py --scales large --queries 200 --unit transaction_guid
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from bitmap_index import BitmapIndex, prod_type_ref
+from pair_mining import FOCUS, PROD_TYPE, RECOMM, SKU
+from synthetic import SCALES, generate_transactions
+
+
+def pandas_count(trans_hist: pd.DataFrame, unit: str, terms: list) -> int:
+    """Intersect the unit sets of (column, value) terms by filtering the rows."""
+    units = None
+    for column, value in terms:
+        matched = set(trans_hist.loc[trans_hist[column] == value, unit].unique())
+        units = matched if units is None else units & matched
+    return len(units)
+
+
+def pandas_prod_type_ref(trans_hist: pd.DataFrame, unit: str, top_n: int) -> pd.DataFrame:
+    """Per-focus-type loop over pandas set intersections, the notebook's approach."""
+    sets = {t: set(g) for t, g in trans_hist.groupby(PROD_TYPE)[unit].unique().items()}
+    rows = []
+    for focus, focus_units in sets.items():
+        counts = [(recomm, len(focus_units & units)) for recomm, units in sets.items()
+                  if recomm != focus]
+        counts = sorted((c for c in counts if c[1] >= 1), key=lambda c: (-c[1], c[0]))
+        rows.append((focus, focus, len(focus_units), 0))
+        rows.extend((focus, recomm, n, rank + 1) for rank, (recomm, n) in enumerate(counts[:top_n]))
+    return pd.DataFrame(rows, columns=[FOCUS, RECOMM, 'count', 'product_type_rank'])
+
+
+def timed(func, *args, **kwargs):
+    """Return (result, seconds) of one call."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def run_scale(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Benchmark the index on one scale."""
+    trans_hist, _ = generate_transactions(SCALES[name], seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    index, build_seconds = timed(BitmapIndex.build, trans_hist, unit=args.unit)
+    with tempfile.TemporaryDirectory(prefix="bitmap_index_") as tmp:
+        _, save_seconds = timed(index.save, Path(tmp) / "index")
+        loaded, load_seconds = timed(BitmapIndex.load, Path(tmp) / "index")
+        loaded_bytes = loaded.nbytes()
+        del loaded
+
+    n_units = len(index.universe)
+    all_bitsets = sum(len(index.keys(d)) for d in index.dimensions) * index.n_words * 8
+    result: Dict[str, Any] = {
+        'scale': name,
+        'rows': len(trans_hist),
+        'units': n_units,
+        'keys': {d: len(index.keys(d)) for d in index.dimensions},
+        'dense_keys': {d: len(dim.words) for d, dim in index.dimensions.items()},
+        'build_seconds': round(build_seconds, 4),
+        'save_seconds': round(save_seconds, 4),
+        'load_seconds': round(load_seconds, 4),
+        'index_bytes': index.nbytes(),
+        'all_bitset_bytes': all_bitsets,
+        'trans_hist_bytes': int(trans_hist.memory_usage(deep=True).sum()),
+        'parity': loaded_bytes == index.nbytes(),
+    }
+
+    # Random pair and 3-way queries, weighted by row frequency like real lookups
+    samples = trans_hist.sample(args.queries * 3, replace=True, random_state=args.seed)
+    skus = rng.permutation(samples[SKU].to_numpy())
+    queries = {
+        'pair_prod_type': [
+            [(PROD_TYPE, a), (PROD_TYPE, b)]
+            for a, b in samples[PROD_TYPE].to_numpy().reshape(-1, 3)[:, :2]
+        ],
+        'prod_type_and_sku': [
+            [(PROD_TYPE, a), (SKU, s)]
+            for a, s in zip(samples[PROD_TYPE].to_numpy()[::3], skus[::3])
+        ],
+        'three_way': [
+            [(PROD_TYPE, a), (PROD_TYPE, b), (PROD_TYPE, c)]
+            for a, b, c in samples[PROD_TYPE].to_numpy().reshape(-1, 3)
+        ],
+    }
+
+    result['queries'] = {}
+    for kind, terms in queries.items():
+        answers, index_seconds = timed(lambda: [index.count(*t) for t in terms])
+        n_baseline = min(len(terms), args.pandas_queries)
+        expected, pandas_seconds = timed(
+            lambda: [pandas_count(trans_hist, args.unit, t) for t in terms[:n_baseline]]
+        )
+        matches = answers[:n_baseline] == expected
+        result['parity'] = result['parity'] and matches
+        result['queries'][kind] = {
+            'queries': len(terms),
+            'index_ms_per_query': round(1000 * index_seconds / len(terms), 4),
+            'pandas_ms_per_query': round(1000 * pandas_seconds / n_baseline, 4),
+            'parity': matches,
+        }
+
+    ref, index_seconds = timed(prod_type_ref, index, top_n=args.top_n)
+    expected, pandas_seconds = timed(pandas_prod_type_ref, trans_hist, args.unit, args.top_n)
+    key = [FOCUS, 'product_type_rank']
+    matches = ref.sort_values(key, ignore_index=True).astype('int64').equals(
+        expected.sort_values(key, ignore_index=True).astype('int64')
+    )
+    result['parity'] = result['parity'] and matches
+    result['prod_type_ref'] = {
+        'rows': len(ref),
+        'index_seconds': round(index_seconds, 4),
+        'pandas_seconds': round(pandas_seconds, 4),
+        'speedup': round(pandas_seconds / index_seconds, 2),
+        'parity': matches,
+    }
+
+    return result
+
+
+def main():
+    """Run the benchmark and print (and optionally save) a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--unit', default='customer_id', choices=['customer_id', 'transaction_guid'])
+    parser.add_argument('--queries', type=int, default=1000, help='Index queries per kind')
+    parser.add_argument('--pandas-queries', type=int, default=50,
+                        help='Queries per kind also answered (and timed) with pandas')
+    parser.add_argument('--top-n', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    report = [run_scale(name, args) for name in args.scales]
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+
+    if not all(result['parity'] for result in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
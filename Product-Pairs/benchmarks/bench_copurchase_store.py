@@ -0,0 +1,158 @@
+"""
+Benchmark incremental co-purchase window refreshes against full recomputation.
+
+For each requested scale, generates a dated synthetic transaction history,
+writes one ``CoPurchaseStore`` partition per day and refreshes the window as
+of a start date. It then moves the window forward ``--refreshes`` times by
+``--step-days``. Each incremental refresh is timed against recounting the
+whole window from the in-memory transaction rows, as ``query.sql`` does, and
+the two are checked for identical counts. The transaction lines each refresh
+reads are reported as a fraction of the window's lines; unlike the timings,
+this does not depend on the full recount's rows already being in memory. A
+final step re-adds one in-window day with rows removed and checks the
+corrected total.
+
+Usage:
+    python benchmarks/bench_copurchase_store.py --scales medium
+    python benchmarks/bench_copurchase_store.py --scales large --refreshes 8 --step-days 7
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from copurchase_store import DATE, TABLES, CoPurchaseStore, day_counts
+from synthetic import SCALES, generate_transactions
+
+
+def recompute(
+    store: CoPurchaseStore,
+    trans_hist: pd.DataFrame,
+    as_of: pd.Timestamp
+) -> Dict[str, Any]:
+    """Count the whole window from the transaction rows."""
+    start, end = store.window_bounds(as_of)
+    rows = trans_hist[(trans_hist[DATE] >= start) & (trans_hist[DATE] <= end)]
+    return day_counts(rows)
+
+
+def same_window(store: CoPurchaseStore, expected: Dict[str, Any]) -> bool:
+    """Whether the store's window total equals a full recount."""
+    if store.state()['baskets'] != expected['baskets']:
+        return False
+    for table, (keys, _) in TABLES.items():
+        actual = store._window_table(table).sort_values(keys, ignore_index=True)
+        wanted = expected[table].sort_values(keys, ignore_index=True)
+        if not actual.astype('int64').equals(wanted.astype('int64')):
+            return False
+    return True
+
+
+def run_scale(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Benchmark the store on one scale."""
+    trans_hist, _ = generate_transactions(SCALES[name], seed=args.seed)
+    first_day = trans_hist[DATE].min()
+
+    with tempfile.TemporaryDirectory(prefix="copurchase_store_") as tmp:
+        store = CoPurchaseStore(tmp, window_months=args.window_months)
+
+        started = time.perf_counter()
+        store.add_days(trans_hist)
+        ingest_seconds = time.perf_counter() - started
+
+        as_of = first_day + pd.Timedelta(days=args.start_day)
+        started = time.perf_counter()
+        store.refresh(as_of)
+        initial_seconds = time.perf_counter() - started
+
+        refreshes = []
+        parity = True
+        for _ in range(args.refreshes):
+            as_of += pd.Timedelta(days=args.step_days)
+
+            started = time.perf_counter()
+            summary = store.refresh(as_of)
+            incremental = time.perf_counter() - started
+
+            started = time.perf_counter()
+            expected = recompute(store, trans_hist, as_of)
+            full = time.perf_counter() - started
+
+            matches = same_window(store, expected)
+            parity = parity and matches
+            refreshes.append({
+                **summary,
+                'incremental_seconds': round(incremental, 4),
+                'full_seconds': round(full, 4),
+                'parity': matches,
+            })
+
+        # Late corrections: replace one in-window day with fewer rows
+        day = pd.Timestamp(store.state()['days'][len(store.state()['days']) // 2])
+        on_day = trans_hist[DATE] == day
+        keep = ~on_day | (np.arange(len(trans_hist)) % 2 == 0)
+        corrected = trans_hist[keep]
+        store.add_days(corrected[corrected[DATE] == day])
+        correction_parity = same_window(store, recompute(store, corrected, as_of))
+
+        partition_bytes = sum(f.stat().st_size for f in Path(tmp, 'days').rglob('*.parquet'))
+
+    incremental = np.mean([r['incremental_seconds'] for r in refreshes])
+    full = np.mean([r['full_seconds'] for r in refreshes])
+    return {
+        'scale': name,
+        'rows': len(trans_hist),
+        'days': int(trans_hist[DATE].nunique()),
+        'ingest_seconds': round(ingest_seconds, 4),
+        'initial_refresh_seconds': round(initial_seconds, 4),
+        'partition_bytes': partition_bytes,
+        'refreshes': refreshes,
+        'mean_incremental_seconds': round(float(incremental), 4),
+        'mean_full_seconds': round(float(full), 4),
+        'speedup': round(float(full / incremental), 2),
+        'rows_processed_fraction': round(float(np.mean(
+            [r['rows_processed'] / r['window_rows'] for r in refreshes]
+        )), 4),
+        'parity': parity,
+        'correction_parity': correction_parity,
+    }
+
+
+def main():
+    """Run the benchmark and print (and optionally save) a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['medium'])
+    parser.add_argument('--window-months', type=int, default=6)
+    parser.add_argument('--start-day', type=int, default=200,
+                        help='Days after the first transaction the first window ends')
+    parser.add_argument('--refreshes', type=int, default=4)
+    parser.add_argument('--step-days', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    report = [run_scale(name, args) for name in args.scales]
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+
+    if not all(result['parity'] and result['correction_parity'] for result in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark the frequent itemset miner against brute-force co-occurrence counts.
+
+For each requested scale, generates a synthetic transaction history and mines
+frequent pairs (and triples with ``--max-size 3``) of product types or SKUs
+with ``itemsets.frequent_itemsets`` at each requested worker count. Reports
+wall time, how many items and candidate pairs the support threshold pruned,
+the rule count and whether the frequent itemsets exactly match a brute-force
+self-join of the baskets filtered by the same threshold.
+
+Usage:
+    python benchmarks/bench_itemsets.py --scales small medium
+    python benchmarks/bench_itemsets.py --scales large --item-col item_sku_num --min-support 0.0005 --jobs 1 4
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from itemsets import frequent_itemsets, pair_rules, triple_rules
+from synthetic import SCALES, generate_transactions
+
+
+def brute_force(
+    trans_hist: pd.DataFrame,
+    basket_col: str,
+    item_col: str,
+    min_count: int,
+    size: int
+) -> pd.DataFrame:
+    """Count every co-occurring itemset of a size by self-joining the baskets."""
+    baskets = trans_hist[[basket_col, item_col]].drop_duplicates()
+    columns = [f"item_{c}" for c in 'abc'[:size]]
+
+    joined = baskets.rename(columns={item_col: columns[0]})
+    for column in columns[1:]:
+        joined = joined.merge(baskets.rename(columns={item_col: column}), on=basket_col)
+        joined = joined[joined[column] > joined[columns[columns.index(column) - 1]]]
+
+    counts = joined.groupby(columns).size().rename('count').reset_index()
+    return counts[counts['count'] >= min_count]
+
+
+def canonical(itemsets: pd.DataFrame, size: int) -> pd.DataFrame:
+    """Sort each itemset's items so tables can be compared."""
+    columns = [f"item_{c}" for c in 'abc'[:size]]
+    items = np.sort(itemsets[columns].to_numpy(), axis=1)
+    df = pd.DataFrame(items, columns=columns)
+    df['count'] = itemsets['count'].to_numpy()
+    return df.sort_values(columns, ignore_index=True).astype('int64')
+
+
+def run_scale(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Benchmark the miner on one scale."""
+    trans_hist, _ = generate_transactions(SCALES[name], seed=args.seed)
+    result: Dict[str, Any] = {
+        'scale': name,
+        'rows': len(trans_hist),
+        'baskets': int(trans_hist[args.basket_col].nunique()),
+        'items': int(trans_hist[args.item_col].nunique()),
+        'runs': {},
+    }
+
+    mined = None
+    for n_jobs in args.jobs:
+        started = time.perf_counter()
+        mined = frequent_itemsets(
+            trans_hist,
+            min_support=args.min_support,
+            basket_col=args.basket_col,
+            item_col=args.item_col,
+            max_size=args.max_size,
+            n_jobs=n_jobs
+        )
+        seconds = time.perf_counter() - started
+        result['runs'][f"jobs_{n_jobs}"] = {'seconds': round(seconds, 4)}
+
+    rules = pair_rules(mined, min_confidence=args.min_confidence)
+    result.update({
+        'min_count': mined.min_count,
+        **mined.stats,
+        'pair_rules': len(rules),
+        'triple_rules': len(triple_rules(mined, min_confidence=args.min_confidence)),
+    })
+
+    if len(trans_hist) <= args.brute_force_max_rows:
+        parity = {}
+        for size, found in [(2, mined.pairs), (3, mined.triples)][:args.max_size - 1]:
+            expected = brute_force(trans_hist, args.basket_col, args.item_col, mined.min_count, size)
+            a, b = canonical(found, size), canonical(expected, size)
+            parity[f"size_{size}"] = a.shape == b.shape and bool((a.values == b.values).all())
+        result['parity'] = parity
+    else:
+        result['parity'] = {'skipped': f"rows > {args.brute_force_max_rows}"}
+
+    return result
+
+
+def main():
+    """Run the benchmark and print (and optionally save) a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--basket-col', default='transaction_guid',
+                        choices=['transaction_guid', 'customer_id'])
+    parser.add_argument('--item-col', default='pdm_prod_type_id',
+                        choices=['pdm_prod_type_id', 'item_sku_num'])
+    parser.add_argument('--min-support', type=float, default=0.001)
+    parser.add_argument('--min-confidence', type=float, default=0.0)
+    parser.add_argument('--max-size', type=int, choices=[2, 3], default=3)
+    parser.add_argument('--jobs', nargs='+', type=int, default=[1, 4],
+                        help='Worker process counts to time')
+    parser.add_argument('--brute-force-max-rows', type=int, default=300_000,
+                        help='Skip the brute-force parity check above this many rows')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    report: List[Dict[str, Any]] = [run_scale(name, args) for name in args.scales]
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+
+    if any(ok is False for result in report for ok in result['parity'].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark SKU pair mining against the notebook reference implementation.
+
+For each requested scale, generates a synthetic transaction history, runs the
+pair-counting implementations and reports wall time, throughput (pairs
+counted per second), tracemalloc peak memory and whether the (Focus, Recomm)
+counts exactly match the reference loop.
+
+Usage:
+    python benchmarks/bench_pair_mining.py --scales small medium
+    python benchmarks/bench_pair_mining.py --scales large --reference-max-rows 0
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from pair_mining import aggregate_pair_rows, count_pairs, reference_pair_rows
+from synthetic import SCALES, generate_transactions
+
+
+def reference(trans_hist: pd.DataFrame, prod_type_recs: pd.DataFrame) -> pd.DataFrame:
+    """Notebook loop followed by its groupby."""
+    return aggregate_pair_rows(reference_pair_rows(trans_hist, prod_type_recs))
+
+
+IMPLEMENTATIONS: Dict[str, Callable[[pd.DataFrame, pd.DataFrame], pd.DataFrame]] = {
+    'reference': reference,
+    'vectorized': count_pairs,
+}
+
+
+def measure(
+    func: Callable[[pd.DataFrame, pd.DataFrame], pd.DataFrame],
+    trans_hist: pd.DataFrame,
+    prod_type_recs: pd.DataFrame,
+    trace_memory: bool
+) -> Dict[str, Any]:
+    """
+    Time one implementation, then rerun it under tracemalloc for its peak.
+
+    Returns:
+        Dict with the counts DataFrame, seconds and peak bytes
+    """
+    started = time.perf_counter()
+    counts = func(trans_hist, prod_type_recs)
+    seconds = time.perf_counter() - started
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        func(trans_hist, prod_type_recs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'counts': counts, 'seconds': seconds, 'peak_bytes': peak}
+
+
+def same_counts(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    """Exact equality of two (Focus, Recomm, pair_count) tables."""
+    key = ['Focus', 'Recomm']
+    a = a.sort_values(key).reset_index(drop=True).astype('int64')
+    b = b.sort_values(key).reset_index(drop=True).astype('int64')
+    return a.shape == b.shape and bool((a.values == b.values).all())
+
+
+def run_scale(
+    name: str,
+    seed: int,
+    implementations: list,
+    reference_max_rows: int,
+    trace_memory: bool
+) -> Dict[str, Any]:
+    """Benchmark all implementations on one scale."""
+    scale = SCALES[name]
+    trans_hist, prod_type_recs = generate_transactions(scale, seed=seed)
+
+    result: Dict[str, Any] = {
+        'scale': name,
+        'rows': len(trans_hist),
+        'customers': int(trans_hist['customer_id'].nunique()),
+        'skus': int(trans_hist['item_sku_num'].nunique()),
+        'prod_types': scale.n_prod_types,
+        'recs_per_type': scale.recs_per_type,
+        'basket_distribution': scale.basket_distribution,
+        'implementations': {},
+    }
+
+    baseline: Optional[pd.DataFrame] = None
+    for impl in implementations:
+        if impl == 'reference' and len(trans_hist) > reference_max_rows:
+            result['implementations'][impl] = {'skipped': f"rows > {reference_max_rows}"}
+            continue
+
+        measured = measure(IMPLEMENTATIONS[impl], trans_hist, prod_type_recs, trace_memory)
+        counts = measured['counts']
+        total_pairs = int(counts['pair_count'].sum()) if len(counts) else 0
+
+        entry = {
+            'seconds': round(measured['seconds'], 4),
+            'distinct_pairs': len(counts),
+            'total_pairs': total_pairs,
+            'pairs_per_second': round(total_pairs / measured['seconds']) if measured['seconds'] else None,
+            'peak_bytes': measured['peak_bytes'],
+        }
+
+        if impl == 'reference':
+            baseline = counts
+        elif baseline is not None:
+            entry['parity'] = same_counts(counts, baseline)
+            entry['speedup'] = round(
+                result['implementations']['reference']['seconds'] / measured['seconds'], 2
+            )
+
+        result['implementations'][impl] = entry
+
+    return result
+
+
+def main():
+    """Run the benchmark and print (and optionally save) a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--implementations', nargs='+', choices=list(IMPLEMENTATIONS),
+                        default=list(IMPLEMENTATIONS))
+    parser.add_argument('--reference-max-rows', type=int, default=500_000,
+                        help='Skip the (slow) reference loop above this many rows')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the tracemalloc rerun used for peak memory')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    # The reference runs first so later implementations are checked against it
+    implementations = sorted(args.implementations, key=lambda impl: impl != 'reference')
+
+    report = [
+        run_scale(name, args.seed, implementations, args.reference_max_rows, not args.no_memory)
+        for name in args.scales
+    ]
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+
+    if any(entry.get('parity') is False
+           for result in report for entry in result['implementations'].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark single-pass regional tables against one filtered pass per region.
+
+For each requested scale, generates a synthetic transaction history and
+customer territories, derives ``customer_base_table`` and ``multi_trans`` as
+``query.sql`` does, and builds the per-region outputs two ways. 'per_region'
+filters the input by ``customer_id in (<region's customers>)`` once per
+region, as the five ``layer2_<Region>`` statements do; 'single_pass' uses
+``regional.py``. Reports wall time for the layer2 tables, the product type
+co-purchase matrices and the notebook's SKU pair counts, and whether both
+ways produce identical tables.
+
+Usage:
+    python benchmarks/bench_regional.py --scales small medium
+    python benchmarks/bench_regional.py --scales large --no-pairs
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+# Add module directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+from pair_mining import CUSTOMER, PROD_TYPE, count_pairs
+from regional import (
+    REGION, REGIONS, customer_base_table, layer2_tables, multi_trans,
+    regional_co_purchase, regional_pair_counts
+)
+from synthetic import SCALES, generate_customer_states, generate_transactions
+
+
+def per_region(
+    rows: pd.DataFrame,
+    regions: pd.DataFrame,
+    func: Callable[[pd.DataFrame], pd.DataFrame]
+) -> Dict[str, pd.DataFrame]:
+    """Run func on each region's rows, filtering the full input once per region."""
+    return {
+        region: func(rows[rows[CUSTOMER].isin(regions.loc[regions[REGION] == region, CUSTOMER])])
+        for region in REGIONS
+    }
+
+
+def per_region_layer2(base: pd.DataFrame, regions: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """The layer2_<Region> statements of query.sql, one scan each."""
+    types = np.sort(base[PROD_TYPE].unique())
+    appended = pd.DataFrame({
+        CUSTOMER: np.arange(1, len(types) + 1),
+        PROD_TYPE: types,
+        'trans_count': 1,
+    })
+    return per_region(base, regions, lambda rows: pd.concat(
+        [rows[[CUSTOMER, PROD_TYPE, 'trans_count']].drop_duplicates(), appended], ignore_index=True
+    ))
+
+
+def co_purchase(rows: pd.DataFrame) -> pd.DataFrame:
+    """Customers per product type pair of one region's customer_base_table rows."""
+    pairs = rows[[CUSTOMER, PROD_TYPE]].merge(rows[[CUSTOMER, PROD_TYPE]], on=CUSTOMER)
+    pairs = pairs[pairs[f'{PROD_TYPE}_x'] < pairs[f'{PROD_TYPE}_y']]
+    counts = pairs.groupby([f'{PROD_TYPE}_x', f'{PROD_TYPE}_y']).size()
+    return counts.rename('customers').rename_axis(['item_a', 'item_b']).reset_index()
+
+
+def same_tables(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    """Row-order independent equality of two integer tables."""
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    key = list(a.columns)
+    a = a.astype('int64').sort_values(key, ignore_index=True)
+    b = b.astype('int64').sort_values(key, ignore_index=True)
+    return a.equals(b)
+
+
+def split(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Split a State_Division-keyed single-pass output into per-region tables."""
+    return {
+        region: df[df[REGION] == region].drop(columns=REGION).reset_index(drop=True)
+        for region in REGIONS
+    }
+
+
+def compare(per: Callable, single: Callable) -> Dict[str, Any]:
+    """Time both ways of building one output and check parity."""
+    started = time.perf_counter()
+    expected = per()
+    per_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = single()
+    single_seconds = time.perf_counter() - started
+
+    return {
+        'per_region_seconds': round(per_seconds, 4),
+        'single_pass_seconds': round(single_seconds, 4),
+        'speedup': round(per_seconds / single_seconds, 2),
+        'parity': all(same_tables(actual[r], expected[r]) for r in REGIONS),
+    }
+
+
+def run_scale(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Benchmark the regional outputs on one scale."""
+    trans_hist, prod_type_recs = generate_transactions(SCALES[name], seed=args.seed)
+    states = generate_customer_states(trans_hist, seed=args.seed)
+    base = customer_base_table(trans_hist)
+    regions = multi_trans(base, states)
+
+    result: Dict[str, Any] = {
+        'scale': name,
+        'rows': len(trans_hist),
+        'customer_base_rows': len(base),
+        'customers_by_region': {
+            region: int(n) for region, n in regions[REGION].value_counts().items()
+        },
+        'outputs': {
+            'layer2': compare(
+                lambda: per_region_layer2(base, regions),
+                lambda: layer2_tables(base, regions)
+            ),
+            'co_purchase': compare(
+                lambda: per_region(base, regions, co_purchase),
+                lambda: split(regional_co_purchase(base, regions))
+            ),
+        },
+    }
+
+    if not args.no_pairs:
+        result['outputs']['pair_counts'] = compare(
+            lambda: per_region(trans_hist, regions, lambda rows: count_pairs(rows, prod_type_recs)),
+            lambda: split(regional_pair_counts(trans_hist, regions, prod_type_recs))
+        )
+
+    return result
+
+
+def main():
+    """Run the benchmark and print (and optionally save) a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--no-pairs', action='store_true',
+                        help='Skip the (slowest) SKU pair counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    report = [run_scale(name, args) for name in args.scales]
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+
+    if not all(o['parity'] for result in report for o in result['outputs'].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
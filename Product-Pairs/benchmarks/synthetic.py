@@ -0,0 +1,175 @@
+"""
+Synthetic transaction histories for SKU pair mining.
+
+Generates ``layer2_<Region>``-shaped transaction rows (customer_id,
+transaction_guid, item_sku_num, pdm_prod_type_id, transaction_booked_date)
+and a ``prod_type_recs``
+focus -> recommended product type table. Customers lean towards a
+neighbourhood of product types so co-purchases have structure; product types
+and SKUs follow Zipf-like popularity, and a fraction of SKUs is mapped to a
+second product type, as happens in the SKU catalogue.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class TransactionScale:
+    """Size and shape of a synthetic transaction history."""
+
+    n_customers: int
+    n_prod_types: int
+    skus_per_type: int
+    mean_transactions: float = 2.0
+    basket_distribution: str = 'geometric'  # 'geometric', 'poisson' or 'lognormal'
+    mean_basket_size: float = 3.0
+    recs_per_type: int = 10
+    multi_type_sku_fraction: float = 0.02
+    n_days: int = 365
+
+
+SCALES: Dict[str, TransactionScale] = {
+    'small': TransactionScale(n_customers=2_000, n_prod_types=20, skus_per_type=50),
+    'medium': TransactionScale(n_customers=20_000, n_prod_types=50, skus_per_type=200),
+    'large': TransactionScale(n_customers=200_000, n_prod_types=200, skus_per_type=500,
+                              recs_per_type=20),
+    'xlarge': TransactionScale(n_customers=1_000_000, n_prod_types=500, skus_per_type=1000,
+                               recs_per_type=50),
+}
+
+
+def _basket_sizes(scale: TransactionScale, n: int, rng: np.random.Generator) -> np.ndarray:
+    """Draw basket sizes (>= 1) from the configured distribution."""
+    mean = scale.mean_basket_size
+    if scale.basket_distribution == 'geometric':
+        return rng.geometric(1.0 / mean, size=n)
+    if scale.basket_distribution == 'poisson':
+        return 1 + rng.poisson(mean - 1, size=n)
+    if scale.basket_distribution == 'lognormal':
+        sigma = 0.75
+        mu = np.log(mean) - sigma ** 2 / 2
+        return np.maximum(1, np.rint(rng.lognormal(mu, sigma, size=n))).astype(np.int64)
+    raise ValueError(f"Unknown basket distribution: {scale.basket_distribution}")
+
+
+def generate_transactions(
+    scale: TransactionScale,
+    seed: int = 42,
+    first_prod_type_id: int = 1000,
+    first_sku: int = 1_000_000,
+    first_date: str = '2024-01-01'
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Generate a transaction history and its focus -> recomm table.
+
+    Args:
+        scale: Table sizes and distributions
+        seed: Random seed
+        first_prod_type_id: ID of the first product type
+        first_sku: Number of the first SKU
+        first_date: Earliest transaction date; transactions are spread
+            uniformly over ``scale.n_days`` days
+
+    Returns:
+        Tuple of (trans_hist, prod_type_recs). prod_type_recs lists each focus
+        type as one of its own recommended types, which the pair mining needs
+        to see the focus rows at all.
+    """
+    rng = np.random.default_rng(seed)
+    n_types = scale.n_prod_types
+
+    # Transactions per customer and items per transaction
+    n_trans = rng.geometric(1.0 / scale.mean_transactions, size=scale.n_customers)
+    trans_customer = np.repeat(np.arange(scale.n_customers), n_trans)
+    basket = _basket_sizes(scale, len(trans_customer), rng)
+
+    row_trans = np.repeat(np.arange(len(trans_customer)), basket)
+    row_customer = trans_customer[row_trans]
+    n_rows = len(row_trans)
+
+    # Product type: a Zipf step away from the customer's home type
+    home = rng.zipf(1.3, size=scale.n_customers) % n_types
+    offset = np.minimum(rng.zipf(2.0, size=n_rows) - 1, n_types - 1)
+    offset *= rng.choice([-1, 1], size=n_rows)
+    row_type = (home[row_customer] + offset) % n_types
+
+    # SKU within the type, Zipf popularity
+    sku_rank = np.minimum(rng.zipf(1.5, size=n_rows) - 1, scale.skus_per_type - 1)
+    row_sku = row_type * scale.skus_per_type + sku_rank
+
+    # Some SKUs are also catalogued under the next product type
+    n_skus = n_types * scale.skus_per_type
+    multi = rng.random(n_skus) < scale.multi_type_sku_fraction
+    remap = multi[row_sku] & (rng.random(n_rows) < 0.5)
+    row_type = np.where(remap, (row_type + 1) % n_types, row_type)
+
+    # Drawn last so the other columns do not depend on the date range
+    trans_day = rng.integers(0, scale.n_days, size=len(trans_customer))
+
+    trans_hist = pd.DataFrame({
+        'customer_id': row_customer.astype(np.int64) + 1,
+        'transaction_guid': row_trans.astype(np.int64) + 1,
+        'item_sku_num': row_sku.astype(np.int64) + first_sku,
+        'pdm_prod_type_id': row_type.astype(np.int64) + first_prod_type_id,
+        'transaction_booked_date': np.datetime64(first_date, 'D') + trans_day[row_trans],
+    })
+
+    # Focus -> recomm: the focus type itself plus its nearest neighbours
+    steps = np.arange(1, scale.recs_per_type + 1)
+    steps = ((steps + 1) // 2) * np.where(steps % 2 == 1, 1, -1)
+    focus = np.repeat(np.arange(n_types), len(steps) + 1)
+    recomm = (focus + np.tile(np.r_[0, steps], n_types)) % n_types
+    prod_type_recs = pd.DataFrame({
+        'focus_pdm_prod_type_id': focus + first_prod_type_id,
+        'recomm_pdm_prod_type_id': recomm + first_prod_type_id,
+    }).drop_duplicates(ignore_index=True)
+
+    return trans_hist, prod_type_recs
+
+
+# State codes by region, as listed in the multi_trans CASE of query.sql,
+# plus codes that fall through to UNKNOWN
+TERRITORIES = {
+    'Midwest': ['IA', 'IL', 'IN', 'KS', 'MI', 'MN', 'MO', 'ND', 'NE', 'OH', 'SD', 'WI'],
+    'Northeast': ['ME', 'NH', 'NJ', 'NY', 'PA', 'RI', 'VT'],
+    'South': ['AL', 'AR', 'DC', 'DE', 'FL', 'GA', 'KY', 'LA', 'MD', 'MS', 'NC', 'OK', 'SC',
+              'TN', 'TX', 'VA', 'WV'],
+    'West': ['AK', 'AZ', 'CA', 'CO', 'HI', 'ID', 'MT', 'NM', 'NV', 'OR', 'UT', 'WA', 'WY'],
+    'UNKNOWN': ['PR', 'GU', None],
+}
+
+
+def generate_customer_states(
+    trans_hist: pd.DataFrame,
+    seed: int = 42,
+    weights: Tuple[float, ...] = (0.25, 0.15, 0.35, 0.2, 0.05)
+) -> pd.DataFrame:
+    """
+    Assign each customer a preferred-address territory code.
+
+    Args:
+        trans_hist: Transaction history whose customers get a state
+        seed: Random seed
+        weights: Share of customers per region, in ``TERRITORIES`` order
+
+    Returns:
+        DataFrame with customer_id and TERRITORY_CD (None for missing
+        addresses), with some codes in lower case or padded, as they arrive
+        from CUSTOMER_ADDRESS
+    """
+    rng = np.random.default_rng(seed)
+    customers = np.unique(trans_hist['customer_id'].to_numpy())
+
+    region = rng.choice(len(TERRITORIES), size=len(customers), p=np.asarray(weights) / sum(weights))
+    codes = np.empty(len(customers), dtype=object)
+    for i, states in enumerate(TERRITORIES.values()):
+        at = np.flatnonzero(region == i)
+        codes[at] = np.asarray(states, dtype=object)[rng.integers(0, len(states), size=len(at))]
+
+    messy = rng.random(len(customers)) < 0.05
+    codes[messy] = [f" {c.lower()}" if c is not None else None for c in codes[messy]]
+    return pd.DataFrame({'customer_id': customers, 'TERRITORY_CD': codes})
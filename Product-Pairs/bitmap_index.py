@@ -0,0 +1,493 @@
+"""
+Compressed bitmap index of the customers (or transactions) per product type and SKU.
+
+The index maps each value of one or more dimensions (``pdm_prod_type_id``,
+``item_sku_num``) to the set of units (customers or transactions) whose rows
+carry it. Units are coded as positions in the sorted unit IDs. As in roaring
+bitmaps, each set is stored in whichever container is smaller: a packed
+bitset of uint64 words over all units when the value covers more than 1/32 of
+them, otherwise the sorted array of its int32 positions. Intersection counts
+AND dense bitsets and popcount the result, and test sparse positions against
+the other sets' bits, so "customers who bought A and B" never touches
+``trans_hist``.
+
+An index is persisted as a directory of ``.npy`` arrays plus ``meta.json``,
+written to a temporary directory and renamed into place, and reopened with
+``np.load(mmap_mode='r')``.
+"""
+
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from pair_mining import CUSTOMER, FOCUS, PROD_TYPE, RECOMM, SKU
+
+# Bits set per byte value, for NumPy versions without np.bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+UNIVERSE_FILE = "universe.npy"
+META_FILE = "meta.json"
+_ARRAYS = ('values', 'cardinality', 'offsets', 'positions', 'dense_rows', 'words')
+
+
+def popcount_rows(words: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits of each row of a uint64 matrix.
+
+    Args:
+        words: 2-D uint64 array
+
+    Returns:
+        int64 array with one count per row
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    as_bytes = words.view(np.uint8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int64)
+
+
+def pack_bitsets(
+    positions: np.ndarray,
+    rows: np.ndarray,
+    n_rows: int,
+    n_words: int
+) -> np.ndarray:
+    """
+    Pack (row, position) pairs into one row of uint64 words per row.
+
+    Bit ``p`` of a row is bit ``p % 64`` of word ``p // 64`` (least
+    significant first). The pairs must be distinct; bits of the same word are
+    combined with a bitwise OR over the sorted word positions.
+
+    Args:
+        positions: Bit positions (0 <= position < 64 * n_words)
+        rows: Row of each position
+        n_rows: Rows of the output
+        n_words: Words per row
+
+    Returns:
+        (n_rows, n_words) uint64 array
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    word = np.asarray(rows, dtype=np.int64) * n_words + (positions >> 6)
+    bit = np.left_shift(np.uint64(1), (positions & 63).astype(np.uint64))
+
+    order = np.argsort(word, kind='stable')
+    word, bit = word[order], bit[order]
+    starts = np.flatnonzero(np.r_[True, word[1:] != word[:-1]])
+
+    packed = np.zeros(n_rows * n_words, dtype=np.uint64)
+    if len(word):
+        packed[word[starts]] = np.bitwise_or.reduceat(bit, starts)
+    return packed.reshape(n_rows, n_words)
+
+
+def _test_bits(words: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Whether each position is set in a bitset (or each row of a bitset matrix)."""
+    shift = (positions & 63).astype(np.uint64)
+    return ((words[..., positions >> 6] >> shift) & np.uint64(1)).astype(bool)
+
+
+def _segments(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenated ranges start..start + length - 1, as one index array."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    shift = np.asarray(starts, dtype=np.int64) - (ends - lengths)
+    return np.repeat(shift, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def _word_positions(word_index: np.ndarray, words: np.ndarray) -> np.ndarray:
+    """Positions of the set bits of the given words of a bitset."""
+    bits = np.unpackbits(words.view(np.uint8), bitorder='little').reshape(len(words), 64)
+    rows, offsets = np.nonzero(bits)
+    return word_index[rows] * 64 + offsets
+
+
+@dataclass
+class _Dimension:
+    """
+    Bitmaps of one key column.
+
+    ``values`` holds the sorted keys and ``cardinality`` the units per key.
+    Key ``k`` is dense when ``dense_rows[k] >= 0`` (its bitset is
+    ``words[dense_rows[k]]``), otherwise its sorted positions are
+    ``positions[offsets[k]:offsets[k + 1]]``.
+    """
+
+    values: np.ndarray
+    cardinality: np.ndarray
+    offsets: np.ndarray
+    positions: np.ndarray
+    dense_rows: np.ndarray
+    words: np.ndarray
+
+    def codes(self, keys: Any) -> np.ndarray:
+        """
+        Map key values to their codes.
+
+        Raises:
+            KeyError: If a key is not in the dimension
+        """
+        keys = np.atleast_1d(np.asarray(keys, dtype=self.values.dtype))
+        if len(self.values) == 0:
+            codes, missing = np.zeros(len(keys), dtype=np.int64), np.ones(len(keys), dtype=bool)
+        else:
+            codes = np.minimum(np.searchsorted(self.values, keys), len(self.values) - 1)
+            missing = self.values[codes] != keys
+        if missing.any():
+            raise KeyError(f"Keys not in index: {keys[missing].tolist()[:10]}")
+        return codes
+
+    def sparse_positions(self, code: int) -> np.ndarray:
+        """Positions of a sparse key."""
+        return self.positions[self.offsets[code]:self.offsets[code + 1]]
+
+    def contains(self, code: int, positions: np.ndarray) -> np.ndarray:
+        """Whether a key's set contains each position."""
+        row = self.dense_rows[code]
+        if row >= 0:
+            return _test_bits(self.words[row], positions)
+
+        members = self.sparse_positions(code)
+        if len(members) == 0:
+            return np.zeros(len(positions), dtype=bool)
+        at = np.minimum(np.searchsorted(members, positions), len(members) - 1)
+        return members[at] == positions
+
+
+class BitmapIndex:
+    """Per-key unit sets of one or more dimensions, over one universe of units."""
+
+    def __init__(self, unit: str, universe: np.ndarray, dimensions: Dict[str, _Dimension]):
+        """
+        Initialize the index from its arrays (see ``build`` and ``load``).
+
+        Args:
+            unit: Unit column the sets hold (customer_id or transaction_guid)
+            universe: Sorted unit IDs; set members are positions into it
+            dimensions: Bitmaps per key column
+        """
+        self.unit = unit
+        self.universe = universe
+        self.dimensions = dimensions
+        self.n_words = max(1, -(-len(universe) // 64))
+
+    @classmethod
+    def build(
+        cls,
+        trans_hist: pd.DataFrame,
+        unit: str = CUSTOMER,
+        dimensions: Sequence[str] = (PROD_TYPE, SKU),
+        dense_fraction: float = 1 / 32
+    ) -> 'BitmapIndex':
+        """
+        Index transaction rows.
+
+        Args:
+            trans_hist: Transaction rows (e.g. ``layer2_<Region>``)
+            unit: Column whose values form the sets
+            dimensions: Key columns to index
+            dense_fraction: Fraction of units above which a key is stored as a
+                bitset (1/32 is where a bitset becomes smaller than int32
+                positions)
+
+        Returns:
+            The index
+        """
+        universe, positions = np.unique(trans_hist[unit].to_numpy(), return_inverse=True)
+        universe = universe.astype(np.int64)
+        n_units = len(universe)
+        n_words = max(1, -(-n_units // 64))
+        index_dtype = np.int32 if n_units < 2 ** 31 else np.int64
+
+        built = {}
+        for dimension in dimensions:
+            values, codes = np.unique(trans_hist[dimension].to_numpy(), return_inverse=True)
+            key = np.unique(codes.astype(np.int64) * n_units + positions.ravel())
+            codes, members = np.divmod(key, n_units)
+
+            cardinality = np.bincount(codes, minlength=len(values)).astype(np.int64)
+            dense = cardinality > dense_fraction * n_units
+            dense_rows = np.full(len(values), -1, dtype=np.int32)
+            dense_rows[dense] = np.arange(dense.sum())
+
+            is_dense = dense[codes]
+            words = pack_bitsets(members[is_dense], dense_rows[codes[is_dense]], int(dense.sum()), n_words)
+            sparse_counts = np.where(dense, 0, cardinality)
+
+            built[dimension] = _Dimension(
+                values=values.astype(np.int64),
+                cardinality=cardinality,
+                offsets=np.r_[0, np.cumsum(sparse_counts)].astype(np.int64),
+                positions=members[~is_dense].astype(index_dtype),
+                dense_rows=dense_rows,
+                words=words,
+            )
+
+        return cls(unit, universe, built)
+
+    def keys(self, dimension: str) -> np.ndarray:
+        """Sorted key values of a dimension."""
+        return self.dimensions[dimension].values
+
+    def nbytes(self) -> int:
+        """Size of the index arrays in bytes."""
+        return int(self.universe.nbytes + sum(
+            getattr(dim, name).nbytes for dim in self.dimensions.values() for name in _ARRAYS
+        ))
+
+    def _terms(self, terms: Iterable[Tuple[str, Any]]) -> list:
+        """Resolve (dimension, key) terms to (dimension, code), smallest set first."""
+        resolved = []
+        for dimension, key in terms:
+            dim = self.dimensions[dimension]
+            code = int(dim.codes(key)[0])
+            resolved.append((dim, code))
+        return sorted(resolved, key=lambda t: t[0].cardinality[t[1]])
+
+    def _intersect(self, terms: list) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Intersect resolved terms.
+
+        Returns:
+            (positions, None) when the smallest set is sparse, else
+            (word indices, ANDed words) restricted to non-zero words
+        """
+        dim, code = terms[0]
+        if dim.dense_rows[code] < 0:
+            positions = dim.sparse_positions(code)
+            for other, other_code in terms[1:]:
+                positions = positions[other.contains(other_code, positions)]
+            return positions, None
+
+        anded = dim.words[dim.dense_rows[code]]
+        word_index = np.flatnonzero(anded)
+        anded = anded[word_index]
+        for other, other_code in terms[1:]:
+            anded = anded & other.words[other.dense_rows[other_code], word_index]
+            keep = anded != 0
+            word_index, anded = word_index[keep], anded[keep]
+        return word_index, anded
+
+    def count(self, *terms: Tuple[str, Any]) -> int:
+        """
+        Count the units in every one of the given sets.
+
+        Args:
+            *terms: (dimension, key) pairs, e.g. (PROD_TYPE, a), (PROD_TYPE, b)
+
+        Returns:
+            Size of the intersection
+
+        Raises:
+            KeyError: If a key is not in the index
+        """
+        positions, anded = self._intersect(self._terms(terms))
+        if anded is None:
+            return len(positions)
+        return int(popcount_rows(anded[None, :])[0])
+
+    def members(self, *terms: Tuple[str, Any]) -> np.ndarray:
+        """
+        Get the unit IDs in every one of the given sets.
+
+        Returns:
+            Sorted unit IDs of the intersection
+        """
+        positions, anded = self._intersect(self._terms(terms))
+        if anded is not None:
+            positions = _word_positions(positions, anded)
+        return self.universe[positions]
+
+    def cardinality(self, dimension: str, keys: Optional[Any] = None) -> pd.Series:
+        """Number of units per key (all keys by default)."""
+        dim = self.dimensions[dimension]
+        if keys is None:
+            return pd.Series(dim.cardinality, index=dim.values)
+        return pd.Series(dim.cardinality[dim.codes(keys)], index=np.atleast_1d(keys))
+
+    def pair_counts(
+        self,
+        dimension_a: str,
+        keys_a: Optional[Any] = None,
+        dimension_b: Optional[str] = None,
+        keys_b: Optional[Any] = None
+    ) -> pd.DataFrame:
+        """
+        Count the units in each pair of sets, for every combination of keys.
+
+        Each key of ``keys_a`` is intersected with all of ``keys_b`` at once.
+        Dense columns are ANDed with a dense row and popcounted over the
+        words where the row is non-empty, or have a sparse row's positions
+        tested. Sparse columns are inverted once into per-unit key lists, so
+        a row only visits the keys of its own units.
+
+        Args:
+            dimension_a: Row dimension
+            keys_a: Row keys (default: all keys of dimension_a)
+            dimension_b: Column dimension (default: dimension_a)
+            keys_b: Column keys (default: all keys of dimension_b)
+
+        Returns:
+            int64 DataFrame indexed by keys_a with one column per key of keys_b
+        """
+        dim_a = self.dimensions[dimension_a]
+        dim_b = self.dimensions[dimension_b or dimension_a]
+        codes_a = np.arange(len(dim_a.values)) if keys_a is None else dim_a.codes(keys_a)
+        codes_b = np.arange(len(dim_b.values)) if keys_b is None else dim_b.codes(keys_b)
+
+        rows_b = dim_b.dense_rows[codes_b]
+        dense_b = np.flatnonzero(rows_b >= 0)
+        dense_words = dim_b.words[rows_b[dense_b]]
+
+        # Unit -> sparse column keys, as CSR over unit positions
+        sparse_b = np.flatnonzero(rows_b < 0)
+        starts = dim_b.offsets[codes_b[sparse_b]]
+        lengths = dim_b.offsets[codes_b[sparse_b] + 1] - starts
+        unit_positions = dim_b.positions[_segments(starts, lengths)]
+        order = np.argsort(unit_positions, kind='stable')
+        unit_keys = np.repeat(np.arange(len(sparse_b)), lengths)[order]
+        unit_ptr = np.searchsorted(unit_positions[order], np.arange(len(self.universe) + 1))
+
+        counts = np.zeros((len(codes_a), len(codes_b)), dtype=np.int64)
+        for i, code in enumerate(codes_a):
+            row = dim_a.dense_rows[code]
+            if row >= 0:
+                word_index = np.flatnonzero(dim_a.words[row])
+                if len(dense_b):
+                    counts[i, dense_b] = popcount_rows(
+                        dense_words[:, word_index] & dim_a.words[row, word_index]
+                    )
+                positions = _word_positions(word_index, dim_a.words[row, word_index])
+            else:
+                positions = dim_a.sparse_positions(code)
+                if len(dense_b):
+                    counts[i, dense_b] = _test_bits(dense_words, positions).sum(axis=1)
+
+            if len(sparse_b):
+                first = unit_ptr[positions]
+                keys = unit_keys[_segments(first, unit_ptr[positions + 1] - first)]
+                counts[i, sparse_b] = np.bincount(keys, minlength=len(sparse_b))
+
+        return pd.DataFrame(counts, index=dim_a.values[codes_a], columns=dim_b.values[codes_b])
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Write the index to a directory, replacing any existing one.
+
+        Args:
+            path: Target directory
+        """
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.parent / f".{target.name}.{os.getpid()}.tmp"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir()
+
+        np.save(tmp / UNIVERSE_FILE, self.universe)
+        for name, dim in self.dimensions.items():
+            for array in _ARRAYS:
+                np.save(tmp / f"{name}.{array}.npy", getattr(dim, array))
+
+        with open(tmp / META_FILE, 'w') as f:
+            json.dump({
+                'unit': self.unit,
+                'units': len(self.universe),
+                'dimensions': {
+                    name: {'keys': len(dim.values), 'dense_keys': len(dim.words)}
+                    for name, dim in self.dimensions.items()
+                },
+                'created_at': datetime.now(timezone.utc).isoformat(),
+            }, f, indent=2)
+
+        # A directory cannot be renamed over a non-empty one; move the old
+        # index aside first
+        if target.exists():
+            old = target.parent / f".{target.name}.{os.getpid()}.old"
+            os.replace(target, old)
+            os.replace(tmp, target)
+            shutil.rmtree(old)
+        else:
+            os.replace(tmp, target)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> 'BitmapIndex':
+        """
+        Open a saved index.
+
+        Args:
+            path: Index directory
+            mmap: Memory-map the arrays instead of reading them
+
+        Returns:
+            The index
+
+        Raises:
+            FileNotFoundError: If the directory holds no index
+        """
+        path = Path(path)
+        with open(path / META_FILE) as f:
+            meta = json.load(f)
+
+        mode = 'r' if mmap else None
+        dimensions = {
+            name: _Dimension(**{
+                array: np.load(path / f"{name}.{array}.npy", mmap_mode=mode) for array in _ARRAYS
+            })
+            for name in meta['dimensions']
+        }
+        return cls(meta['unit'], np.load(path / UNIVERSE_FILE, mmap_mode=mode), dimensions)
+
+
+def prod_type_ref(
+    index: BitmapIndex,
+    top_n: int = 50,
+    min_count: int = 1,
+    include_focus: bool = True
+) -> pd.DataFrame:
+    """
+    Build a focus -> recommended product type table from co-purchase counts.
+
+    Ranks, per focus type, the other product types by the number of units
+    (customers or transactions) that have both, in the layout of the
+    ``prod_type_ref`` table of ``query.sql`` that the pair mining reads as
+    ``prod_type_recs``.
+
+    Args:
+        index: Index with a pdm_prod_type_id dimension
+        top_n: Recommended types kept per focus type
+        min_count: Minimum shared units for a recommendation
+        include_focus: Also list each focus type as its own recommendation
+            (rank 0), which ``pair_mining.focus_slice`` needs to see the
+            focus rows
+
+    Returns:
+        DataFrame with focus/recomm product type columns, the shared unit
+        count and product_type_rank (1 = most shared)
+    """
+    counts = index.pair_counts(PROD_TYPE)
+    types = counts.index.to_numpy()
+
+    matrix = counts.to_numpy()
+    focus = np.repeat(types, len(types))
+    recomm = np.tile(types, len(types))
+    ref = pd.DataFrame({FOCUS: focus, RECOMM: recomm, 'count': matrix.ravel()})
+    ref = ref[(ref[FOCUS] != ref[RECOMM]) & (ref['count'] >= min_count)]
+
+    ref = ref.sort_values([FOCUS, 'count', RECOMM], ascending=[True, False, True])
+    ref['product_type_rank'] = ref.groupby(FOCUS).cumcount() + 1
+    ref = ref[ref['product_type_rank'] <= top_n]
+
+    if include_focus:
+        self_rows = pd.DataFrame({FOCUS: types, RECOMM: types, 'count': np.diag(matrix), 'product_type_rank': 0})
+        ref = pd.concat([self_rows, ref]).sort_values([FOCUS, 'product_type_rank'])
+
+    return ref.reset_index(drop=True)
@@ -0,0 +1,429 @@
+"""
+Rolling-window co-purchase counts kept as per-day delta partitions.
+
+``query.sql`` rebuilds ``customer_base_table`` from six months of transaction
+lines on every refresh. All of its counts are sums over days. Those are the
+transactions per (customer, product type), the transactions per product type
+and the transactions holding each product type pair. So the store keeps one
+partition of counts per booking date (``<root_dir>/days/<YYYY-MM-DD>/``) and
+a window total (``<root_dir>/window/``). A refresh adds the partitions of the
+days that entered the window and subtracts those of the days that left it,
+processing days of data instead of half a year.
+
+Partitions are Parquet files written to a temporary directory and renamed into
+place. Re-adding a day already in the window applies the difference between
+its old and new partitions to the total.
+"""
+
+import json
+import os
+import shutil
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from itemsets import BASKET, FrequentItemsets
+from pair_mining import CUSTOMER, PROD_TYPE
+
+DATE = 'transaction_booked_date'
+META_FILE = "meta.json"
+STATE_FILE = "state.json"
+
+# Count tables of a partition (and of the window total): key columns, count column
+TABLES = {
+    'customer_types': ([CUSTOMER, PROD_TYPE], 'trans_count'),
+    'types': ([PROD_TYPE], 'transactions'),
+    'pairs': (['item_a', 'item_b'], 'transactions'),
+}
+
+
+def day_counts(rows: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Count one day's transaction lines.
+
+    Args:
+        rows: base_table rows (customer_id, transaction_guid, pdm_prod_type_id)
+
+    Returns:
+        Dict with the 'customer_types', 'types' and 'pairs' count tables and
+        the number of 'baskets' (transactions)
+    """
+    customer_types = rows.groupby([CUSTOMER, PROD_TYPE]).size().rename('trans_count').reset_index()
+
+    baskets = rows[[BASKET, PROD_TYPE]].drop_duplicates()
+    types = baskets.groupby(PROD_TYPE).size().rename('transactions').reset_index()
+
+    joined = baskets.merge(baskets, on=BASKET, suffixes=('_a', '_b'))
+    joined = joined[joined[f'{PROD_TYPE}_a'] < joined[f'{PROD_TYPE}_b']]
+    pairs = (
+        joined.groupby([f'{PROD_TYPE}_a', f'{PROD_TYPE}_b']).size()
+        .rename('transactions').reset_index()
+        .rename(columns={f'{PROD_TYPE}_a': 'item_a', f'{PROD_TYPE}_b': 'item_b'})
+    )
+
+    return {
+        'customer_types': customer_types,
+        'types': types,
+        'pairs': pairs,
+        'baskets': int(baskets[BASKET].nunique()),
+    }
+
+
+def _combine(parts: List[pd.DataFrame], keys: List[str], count: str) -> pd.DataFrame:
+    """Sum signed count tables by key, dropping keys whose count reaches zero."""
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.DataFrame({c: pd.Series(dtype=np.int64) for c in keys + [count]})
+
+    total = pd.concat(parts, ignore_index=True).groupby(keys, sort=True)[count].sum()
+    return total[total != 0].astype(np.int64).reset_index()
+
+
+def _packed_keys(tables: List[pd.DataFrame], keys: List[str]) -> Optional[List[np.ndarray]]:
+    """
+    Pack each table's key columns into one int64 per row, ordered like the keys.
+
+    Returns None if a key is negative or the packed keys would overflow.
+    """
+    widths = []
+    for key in keys[1:]:
+        high = max((int(t[key].max()) for t in tables if len(t)), default=0)
+        widths.append(high + 1)
+    lows = [int(t[key].min()) for t in tables if len(t) for key in keys]
+    first = max((int(t[keys[0]].max()) for t in tables if len(t)), default=0)
+    if min(lows, default=0) < 0 or first * int(np.prod(widths, dtype=object)) >= 2 ** 62:
+        return None
+
+    packed = []
+    for t in tables:
+        codes = t[keys[0]].to_numpy(dtype=np.int64)
+        for key, width in zip(keys[1:], widths):
+            codes = codes * width + t[key].to_numpy(dtype=np.int64)
+        packed.append(codes)
+    return packed
+
+
+def _apply_delta(total: pd.DataFrame, delta: pd.DataFrame, keys: List[str], count: str) -> pd.DataFrame:
+    """
+    Add a key-unique delta to a key-sorted total, touching only the delta's keys.
+
+    Each delta key is located in the total by binary search: existing keys
+    have their counts updated (and are dropped if they reach zero), new keys
+    are inserted at their sorted position. The result stays key-sorted.
+    """
+    if not len(delta):
+        return total
+    packed = _packed_keys([total, delta], keys)
+    if packed is None:
+        return _combine([total, delta], keys, count)
+    total_keys, delta_keys = packed
+
+    pos = np.searchsorted(total_keys, delta_keys)
+    found = pos < len(total_keys)
+    found[found] = total_keys[pos[found]] == delta_keys[found]
+
+    counts = total[count].to_numpy(dtype=np.int64, copy=True)
+    changes = delta[count].to_numpy(dtype=np.int64)
+    counts[pos[found]] += changes[found]
+
+    # Keys that reached zero leave; new keys go in at their sorted position
+    # (shifted left by the removed keys before them)
+    removed = pos[found][counts[pos[found]] == 0]
+    removed.sort()
+    insert_at = pos[~found]
+    insert_at = insert_at - np.searchsorted(removed, insert_at)
+    new_rows = delta[~found]
+
+    columns = {}
+    for key in keys:
+        values = np.delete(total[key].to_numpy(dtype=np.int64), removed)
+        columns[key] = np.insert(values, insert_at, new_rows[key].to_numpy(dtype=np.int64))
+    columns[count] = np.insert(np.delete(counts, removed), insert_at, changes[~found])
+    return pd.DataFrame(columns)
+
+
+def _day(value: Union[str, date, pd.Timestamp]) -> str:
+    """Normalize a date to its partition name (YYYY-MM-DD)."""
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+class CoPurchaseStore:
+    """Per-day count partitions and their total over a rolling window."""
+
+    def __init__(self, root_dir: str, window_months: int = 6):
+        """
+        Initialize the store.
+
+        Args:
+            root_dir: Directory holding the partitions and the window total
+            window_months: Window length; a refresh as of day D covers
+                D - window_months through D, like ``query.sql``
+        """
+        self.root_dir = Path(root_dir)
+        self.window_months = window_months
+        self.days_dir = self.root_dir / "days"
+        self.window_dir = self.root_dir / "window"
+
+    def days(self) -> List[str]:
+        """List the stored day partitions, oldest first."""
+        if not self.days_dir.is_dir():
+            return []
+        return sorted(p.name for p in self.days_dir.iterdir() if (p / META_FILE).exists())
+
+    def state(self) -> Dict[str, Any]:
+        """Window state: as_of, start, included days, baskets and rows (empty before a refresh)."""
+        path = self.window_dir / STATE_FILE
+        if not path.exists():
+            return {'as_of': None, 'start': None, 'days': [], 'baskets': 0, 'rows': 0}
+        with open(path) as f:
+            return json.load(f)
+
+    def window_bounds(self, as_of: Union[str, date, pd.Timestamp]) -> tuple:
+        """First and last day (inclusive) of the window ending on as_of."""
+        end = pd.Timestamp(as_of).normalize()
+        start = end - pd.DateOffset(months=self.window_months)
+        return _day(start), _day(end)
+
+    def _read(self, directory: Path, table: str) -> pd.DataFrame:
+        """Read one count table of a partition or of the window total."""
+        return pd.read_parquet(directory / f"{table}.parquet")
+
+    def _read_partition(self, day: str) -> Dict[str, Any]:
+        """Read all count tables of a day partition."""
+        directory = self.days_dir / day
+        with open(directory / META_FILE) as f:
+            meta = json.load(f)
+        tables = {table: self._read(directory, table) for table in TABLES}
+        return {**tables, 'baskets': meta['baskets'], 'rows': meta['rows']}
+
+    def _write_dir(
+        self,
+        target: Path,
+        tables: Dict[str, Any],
+        meta_file: str,
+        meta: Dict[str, Any]
+    ) -> None:
+        """Write count tables and metadata to a temporary directory and rename it into place."""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.parent / f".{target.name}.{os.getpid()}.tmp"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir()
+
+        for table in TABLES:
+            tables[table].to_parquet(tmp / f"{table}.parquet", index=False)
+        with open(tmp / meta_file, 'w') as f:
+            json.dump({**meta, 'written_at': datetime.now(timezone.utc).isoformat()}, f, indent=2)
+
+        # A directory cannot be renamed over a non-empty one; move the old
+        # one aside first
+        if target.exists():
+            old = target.parent / f".{target.name}.{os.getpid()}.old"
+            os.replace(target, old)
+            os.replace(tmp, target)
+            shutil.rmtree(old)
+        else:
+            os.replace(tmp, target)
+
+    def _apply(
+        self,
+        state: Dict[str, Any],
+        add: Iterable[Dict[str, Any]],
+        subtract: Iterable[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Add and subtract partitions to and from the current window total.
+
+        The partitions are first summed into one delta (a few days of keys);
+        the delta is then merged into the key-sorted total without
+        re-grouping the whole window.
+        """
+        add, subtract = list(add), list(subtract)
+        total = {}
+        for table, (keys, count) in TABLES.items():
+            parts = [p[table] for p in add]
+            for p in subtract:
+                negated = p[table].copy()
+                negated[count] = -negated[count]
+                parts.append(negated)
+            delta = _combine(parts, keys, count)
+            if state['as_of']:
+                total[table] = _apply_delta(self._read(self.window_dir, table), delta, keys, count)
+            else:
+                total[table] = delta
+
+        for counter in ('baskets', 'rows'):
+            total[counter] = (
+                state.get(counter, 0)
+                + sum(p[counter] for p in add)
+                - sum(p[counter] for p in subtract)
+            )
+        return total
+
+    def add_days(self, rows: pd.DataFrame) -> List[str]:
+        """
+        Write (or replace) one partition per booking date in the rows.
+
+        Each date must be complete in ``rows``: a date's partition is replaced,
+        not merged. Replacing a day inside the current window corrects the
+        window total by the difference of the two partitions.
+
+        Args:
+            rows: base_table rows with transaction_booked_date
+
+        Returns:
+            The days written
+        """
+        state = self.state()
+        written = []
+        corrections = ([], [])
+
+        for value, day_rows in rows.groupby(rows[DATE].dt.normalize(), sort=True):
+            day = _day(value)
+            counts = {**day_counts(day_rows), 'rows': len(day_rows)}
+
+            if day in state['days']:
+                corrections[1].append(self._read_partition(day))
+                corrections[0].append(counts)
+
+            self._write_dir(self.days_dir / day, counts, META_FILE, {
+                'day': day,
+                'rows': counts['rows'],
+                'baskets': counts['baskets'],
+            })
+            written.append(day)
+
+        if corrections[0]:
+            total = self._apply(state, *corrections)
+            state.update(baskets=total['baskets'], rows=total['rows'])
+            self._write_dir(self.window_dir, total, STATE_FILE, state)
+
+        return written
+
+    def refresh(self, as_of: Union[str, date, pd.Timestamp]) -> Dict[str, Any]:
+        """
+        Move the window to end on as_of.
+
+        Only the partitions of days entering or leaving the window are read.
+        When those outnumber the days of the new window, the total is rebuilt
+        from the window's partitions instead.
+
+        Args:
+            as_of: Last day of the window
+
+        Returns:
+            Refresh summary: the window bounds, the days added and removed,
+            and the transaction lines in the window and in the days read
+        """
+        start, end = self.window_bounds(as_of)
+        state = self.state()
+        current = set(state['days'])
+        target = {day for day in self.days() if start <= day <= end}
+
+        entering = sorted(target - current)
+        leaving = sorted(current - target)
+        rebuild = not state['as_of'] or len(entering) + len(leaving) >= len(target)
+
+        if rebuild:
+            add = [self._read_partition(d) for d in sorted(target)]
+            subtract = []
+            total = self._apply({'as_of': None}, add, subtract)
+        else:
+            add = [self._read_partition(d) for d in entering]
+            subtract = [self._read_partition(d) for d in leaving]
+            total = self._apply(state, add, subtract)
+
+        self._write_dir(self.window_dir, total, STATE_FILE, {
+            'as_of': end,
+            'start': start,
+            'days': sorted(target),
+            'baskets': total['baskets'],
+            'rows': total['rows'],
+        })
+
+        return {
+            'as_of': end,
+            'start': start,
+            'days': len(target),
+            'added': len(add),
+            'removed': len(subtract),
+            'rebuilt': rebuild,
+            'window_rows': total['rows'],
+            'rows_processed': sum(p['rows'] for p in add + subtract),
+        }
+
+    def prune(self, before: Optional[Union[str, date, pd.Timestamp]] = None) -> List[str]:
+        """
+        Delete day partitions older than a date.
+
+        Args:
+            before: Oldest day to keep (default: the current window start).
+                Days inside the current window are never deleted.
+
+        Returns:
+            The days deleted
+        """
+        state = self.state()
+        cutoff = _day(before) if before is not None else state['start']
+        if cutoff is None:
+            return []
+        if state['start'] is not None:
+            cutoff = min(cutoff, state['start'])
+
+        deleted = [day for day in self.days() if day < cutoff]
+        for day in deleted:
+            shutil.rmtree(self.days_dir / day)
+        return deleted
+
+    def _window_table(self, table: str) -> pd.DataFrame:
+        """Read a count table of the window total."""
+        if self.state()['as_of'] is None:
+            raise FileNotFoundError(f"Co-purchase store {self.root_dir} has not been refreshed")
+        return self._read(self.window_dir, table)
+
+    def customer_base_table(self) -> pd.DataFrame:
+        """Transactions per (customer_id, pdm_prod_type_id) over the window, as in query.sql."""
+        return self._window_table('customer_types')
+
+    def type_counts(self) -> pd.DataFrame:
+        """Transactions per pdm_prod_type_id over the window."""
+        return self._window_table('types')
+
+    def pair_counts(self) -> pd.DataFrame:
+        """Transactions holding each product type pair (item_a < item_b) over the window."""
+        return self._window_table('pairs')
+
+    def itemsets(self, min_support: float = 0.0) -> FrequentItemsets:
+        """
+        Frequent product types and pairs of the window, for ``itemsets.pair_rules``.
+
+        Args:
+            min_support: Minimum fraction of the window's transactions
+
+        Returns:
+            FrequentItemsets over transactions (no triples)
+        """
+        n_baskets = self.state()['baskets']
+        min_count = max(1, int(np.ceil(min_support * n_baskets - 1e-9)))
+
+        items = self.type_counts().rename(columns={PROD_TYPE: 'item', 'transactions': 'count'})
+        pairs = self.pair_counts().rename(columns={'transactions': 'count'})
+        items = items[items['count'] >= min_count].reset_index(drop=True)
+        pairs = pairs[pairs['count'] >= min_count].reset_index(drop=True)
+
+        triples = pd.DataFrame({c: pd.Series(dtype=np.int64)
+                                for c in ['item_a', 'item_b', 'item_c', 'count']})
+        for df in (items, pairs, triples):
+            df['support'] = df['count'] / max(n_baskets, 1)
+
+        return FrequentItemsets(
+            n_baskets=n_baskets,
+            min_count=min_count,
+            items=items,
+            pairs=pairs,
+            triples=triples,
+            stats={'frequent_items': len(items), 'frequent_pairs': len(pairs)}
+        )
@@ -0,0 +1,393 @@
+"""
+Frequent itemset and association rule mining over transaction baskets.
+
+Baskets (transactions or customers) and items (product types or SKUs) from
+``base_table``-style rows are integer coded, and each item whose support
+reaches ``min_support`` gets a vertical bitset: one bit per basket, packed
+into uint64 words. Items below the threshold are dropped before any pair is
+formed. Following Eclat, the support of a pair is the popcount of the AND of
+its two bitsets, restricted to the words where the rarer item has any bit
+set, and candidate triples extend frequent pairs whose other two subsets are
+frequent as well. Counts below the threshold are discarded block by block, so
+low-support pairs are never materialized.
+
+The candidate pairs are partitioned by the product type of their first item
+and the partitions are mined in a process pool. ``pair_rules`` and
+``triple_rules`` turn the frequent itemsets into rules with support,
+confidence and lift, and ``top_recommendations`` ranks them per focus item
+like the ``layer2_recommendations_<Region>`` tables.
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bitmap_index import pack_bitsets, popcount_rows
+from pair_mining import FOCUS, PROD_TYPE, RECOMM
+
+BASKET = 'transaction_guid'
+
+# Worker-process state, populated once per process by _init_worker
+_WORKER_DATA: Dict[str, Any] = {}
+
+
+@dataclass
+class FrequentItemsets:
+    """
+    Frequent items, pairs and triples with their basket counts.
+
+    Items in ``pairs`` and ``triples`` are ordered by ascending support (ties
+    by item), so each itemset appears once.
+    """
+
+    n_baskets: int
+    min_count: int
+    items: pd.DataFrame
+    pairs: pd.DataFrame
+    triples: pd.DataFrame
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+def _init_worker(bits: np.ndarray, min_count: int, pair_keys: Optional[np.ndarray]) -> None:
+    """Store the shared bitsets in the worker process."""
+    _WORKER_DATA['bits'] = bits
+    _WORKER_DATA['min_count'] = min_count
+    _WORKER_DATA['pair_keys'] = pair_keys
+
+
+def _mine_pairs(first_items: np.ndarray, block_words: int) -> np.ndarray:
+    """
+    Count the frequent pairs (i, j > i) of a partition's first items.
+
+    Only the words where item i has a bit set are gathered from the later
+    items, in row blocks of about ``block_words`` words.
+
+    Returns:
+        int64 array of (i, j, count) rows
+    """
+    bits = _WORKER_DATA['bits']
+    min_count = _WORKER_DATA['min_count']
+    n_items = len(bits)
+    found = []
+
+    for i in first_items:
+        words = np.flatnonzero(bits[i])
+        if len(words) == 0:
+            continue
+        tidset = bits[i, words]
+        step = max(1, block_words // len(words))
+
+        for start in range(i + 1, n_items, step):
+            stop = min(start + step, n_items)
+            counts = popcount_rows(bits[start:stop][:, words] & tidset)
+            keep = np.flatnonzero(counts >= min_count)
+            if len(keep):
+                found.append(np.column_stack([
+                    np.full(len(keep), i), start + keep, counts[keep]
+                ]))
+
+    return np.concatenate(found) if found else np.empty((0, 3), dtype=np.int64)
+
+
+def _mine_triples(pairs: np.ndarray) -> np.ndarray:
+    """
+    Count the frequent triples (i, j, k > j) extending a partition's pairs.
+
+    A candidate k must form frequent pairs with both i and j (every subset of
+    a frequent itemset is frequent), checked against the sorted pair keys.
+
+    Returns:
+        int64 array of (i, j, k, count) rows
+    """
+    bits = _WORKER_DATA['bits']
+    min_count = _WORKER_DATA['min_count']
+    pair_keys = _WORKER_DATA['pair_keys']
+    n_items = len(bits)
+    found = []
+
+    def frequent_with(a: int, candidates: np.ndarray) -> np.ndarray:
+        keys = a * n_items + candidates
+        positions = np.minimum(np.searchsorted(pair_keys, keys), len(pair_keys) - 1)
+        return pair_keys[positions] == keys
+
+    for i in np.unique(pairs[:, 0]):
+        partners = pairs[pairs[:, 0] == i, 1]
+        words_i = np.flatnonzero(bits[i])
+        for j in partners:
+            ks = partners[partners > j]
+            ks = ks[frequent_with(j, ks)] if len(ks) else ks
+            if len(ks) == 0:
+                continue
+
+            both = bits[i, words_i] & bits[j, words_i]
+            words = words_i[both != 0]
+            tidset = both[both != 0]
+            counts = popcount_rows(bits[ks][:, words] & tidset)
+            keep = counts >= min_count
+            if keep.any():
+                found.append(np.column_stack([
+                    np.full(keep.sum(), i), np.full(keep.sum(), j), ks[keep], counts[keep]
+                ]))
+
+    return np.concatenate(found) if found else np.empty((0, 4), dtype=np.int64)
+
+
+def _run_partitions(
+    func,
+    tasks: List[Tuple],
+    n_jobs: int,
+    initargs: Tuple,
+    width: int
+) -> np.ndarray:
+    """Run partition tasks in-process (n_jobs == 1) or across a process pool."""
+    if not tasks:
+        return np.empty((0, width), dtype=np.int64)
+
+    if n_jobs == 1:
+        _init_worker(*initargs)
+        try:
+            results = [func(*task) for task in tasks]
+        finally:
+            _WORKER_DATA.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=initargs
+        ) as pool:
+            results = list(pool.map(func, *zip(*tasks)))
+
+    return np.concatenate(results).astype(np.int64)
+
+
+def frequent_itemsets(
+    rows: pd.DataFrame,
+    min_support: float = 0.001,
+    basket_col: str = BASKET,
+    item_col: str = PROD_TYPE,
+    partition_col: Optional[str] = PROD_TYPE,
+    max_size: int = 2,
+    n_jobs: int = 1,
+    block_words: int = 1 << 22
+) -> FrequentItemsets:
+    """
+    Mine the items, pairs and (optionally) triples reaching a minimum support.
+
+    Args:
+        rows: Transaction rows, e.g. ``base_table`` or ``layer2_<Region>``
+        min_support: Minimum fraction of baskets an itemset must appear in
+        basket_col: Column identifying a basket (transaction_guid, or
+            customer_id for customer-level co-purchases)
+        item_col: Item column (pdm_prod_type_id or item_sku_num)
+        partition_col: Column whose values partition the candidate pairs
+            across workers (an item's first value is used; None or the
+            item column = one partition per item)
+        max_size: Largest itemset size, 2 (pairs) or 3 (pairs and triples)
+        n_jobs: Worker processes (-1 = all CPUs)
+        block_words: Bitset words ANDed per block, which bounds the
+            temporary memory per worker (8 bytes per word)
+
+    Returns:
+        FrequentItemsets with basket counts and supports
+
+    Raises:
+        ValueError: If min_support is not in (0, 1] or max_size is not 2 or 3
+    """
+    if not 0 < min_support <= 1:
+        raise ValueError(f"min_support must be in (0, 1], got {min_support}")
+    if max_size not in (2, 3):
+        raise ValueError(f"max_size must be 2 or 3, got {max_size}")
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+
+    basket_codes, baskets = pd.factorize(rows[basket_col])
+    item_codes, item_labels = pd.factorize(rows[item_col])
+    valid = (basket_codes >= 0) & (item_codes >= 0)
+    basket_codes, item_codes = basket_codes[valid], item_codes[valid]
+    n_baskets = len(baskets)
+    min_count = max(1, math.ceil(min_support * n_baskets - 1e-9))
+
+    # One entry per (basket, item): repeated purchases count once
+    key = np.unique(item_codes.astype(np.int64) * max(n_baskets, 1) + basket_codes)
+    item_codes, basket_codes = np.divmod(key, max(n_baskets, 1))
+    item_counts = np.bincount(item_codes, minlength=len(item_labels))
+
+    # Prune infrequent items, then order the rest by ascending support
+    frequent = np.flatnonzero(item_counts >= min_count)
+    frequent = frequent[np.lexsort((np.asarray(item_labels)[frequent], item_counts[frequent]))]
+    rank = np.full(len(item_labels), -1, dtype=np.int64)
+    rank[frequent] = np.arange(len(frequent))
+
+    kept = rank[item_codes] >= 0
+    n_words = max(1, -(-n_baskets // 64))
+    bits = pack_bitsets(basket_codes[kept], rank[item_codes[kept]], len(frequent), n_words)
+
+    labels = np.asarray(item_labels)[frequent]
+    counts = item_counts[frequent]
+
+    # Partition the first items of the candidate pairs
+    if partition_col is None or partition_col == item_col:
+        partition = np.arange(len(frequent))
+    else:
+        first = rows.drop_duplicates(item_col).set_index(item_col)[partition_col]
+        partition = pd.factorize(first.reindex(labels).to_numpy())[0]
+    order = np.argsort(partition, kind='stable')
+    bounds = np.flatnonzero(np.r_[True, np.diff(partition[order]) != 0, True])
+    partitions = [order[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    # Largest partitions first, so stragglers are small
+    partitions.sort(key=lambda p: -np.sum(len(frequent) - 1 - p))
+    pairs = _run_partitions(
+        _mine_pairs,
+        [(p, block_words) for p in partitions if len(p)],
+        n_jobs,
+        (bits, min_count, None),
+        width=3
+    )
+
+    triples = np.empty((0, 4), dtype=np.int64)
+    if max_size == 3 and len(pairs):
+        pair_keys = np.sort(pairs[:, 0] * len(frequent) + pairs[:, 1])
+        groups = [pairs[np.isin(pairs[:, 0], p)] for p in partitions]
+        triples = _run_partitions(
+            _mine_triples,
+            [(g,) for g in groups if len(g)],
+            n_jobs,
+            (bits, min_count, pair_keys),
+            width=4
+        )
+
+    items = pd.DataFrame({'item': labels, 'count': counts.astype(np.int64)})
+    pair_df = pd.DataFrame({
+        'item_a': labels[pairs[:, 0]],
+        'item_b': labels[pairs[:, 1]],
+        'count': pairs[:, 2],
+    })
+    triple_df = pd.DataFrame({
+        'item_a': labels[triples[:, 0]],
+        'item_b': labels[triples[:, 1]],
+        'item_c': labels[triples[:, 2]],
+        'count': triples[:, 3],
+    })
+    for df in (items, pair_df, triple_df):
+        df['support'] = df['count'] / n_baskets
+
+    return FrequentItemsets(
+        n_baskets=n_baskets,
+        min_count=min_count,
+        items=items,
+        pairs=pair_df.sort_values(['item_a', 'item_b'], ignore_index=True),
+        triples=triple_df.sort_values(['item_a', 'item_b', 'item_c'], ignore_index=True),
+        stats={
+            'items': len(item_labels),
+            'frequent_items': len(frequent),
+            'candidate_pairs': len(frequent) * (len(frequent) - 1) // 2,
+            'frequent_pairs': len(pairs),
+            'frequent_triples': len(triples),
+            'partitions': len(partitions),
+            'bitset_bytes': int(bits.nbytes),
+        }
+    )
+
+
+def _filter_rules(rules: pd.DataFrame, min_confidence: float, min_lift: float) -> pd.DataFrame:
+    """Keep rules meeting the confidence and lift thresholds."""
+    keep = (rules['confidence'] >= min_confidence) & (rules['lift'] >= min_lift)
+    return rules[keep].reset_index(drop=True)
+
+
+def pair_rules(
+    itemsets: FrequentItemsets,
+    min_confidence: float = 0.0,
+    min_lift: float = 0.0
+) -> pd.DataFrame:
+    """
+    Derive the rules antecedent -> consequent of the frequent pairs.
+
+    Each pair {a, b} yields a -> b and b -> a, with
+    confidence = count(a, b) / count(a) and
+    lift = confidence / support(b).
+
+    Returns:
+        DataFrame with antecedent, consequent, count, support, confidence
+        and lift
+    """
+    counts = itemsets.items.set_index('item')['count']
+    pairs = itemsets.pairs
+    rules = pd.DataFrame({
+        'antecedent': np.r_[pairs['item_a'].to_numpy(), pairs['item_b'].to_numpy()],
+        'consequent': np.r_[pairs['item_b'].to_numpy(), pairs['item_a'].to_numpy()],
+        'count': np.r_[pairs['count'].to_numpy(), pairs['count'].to_numpy()],
+    })
+    rules['support'] = rules['count'] / itemsets.n_baskets
+    rules['confidence'] = rules['count'] / counts.reindex(rules['antecedent']).to_numpy()
+    consequent_support = counts.reindex(rules['consequent']).to_numpy() / itemsets.n_baskets
+    rules['lift'] = rules['confidence'] / consequent_support
+    return _filter_rules(rules, min_confidence, min_lift)
+
+
+def triple_rules(
+    itemsets: FrequentItemsets,
+    min_confidence: float = 0.0,
+    min_lift: float = 0.0
+) -> pd.DataFrame:
+    """
+    Derive the rules {antecedent_1, antecedent_2} -> consequent of the frequent triples.
+
+    Each triple yields one rule per consequent; the antecedent pair is
+    frequent by construction, so its count is always known.
+
+    Returns:
+        DataFrame with antecedent_1, antecedent_2, consequent, count,
+        support, confidence and lift
+    """
+    counts = itemsets.items.set_index('item')['count']
+    pair_counts = itemsets.pairs.set_index(['item_a', 'item_b'])['count']
+    triples = itemsets.triples
+    a, b, c = (triples[col].to_numpy() for col in ('item_a', 'item_b', 'item_c'))
+    count = triples['count'].to_numpy()
+
+    # Pair columns keep the triple's item order, which is the pair table's order
+    rules = pd.DataFrame({
+        'antecedent_1': np.r_[a, a, b],
+        'antecedent_2': np.r_[b, c, c],
+        'consequent': np.r_[c, b, a],
+        'count': np.r_[count, count, count],
+    })
+    antecedent = pd.MultiIndex.from_arrays([rules['antecedent_1'], rules['antecedent_2']])
+    rules['support'] = rules['count'] / itemsets.n_baskets
+    rules['confidence'] = rules['count'] / pair_counts.reindex(antecedent).to_numpy()
+    consequent_support = counts.reindex(rules['consequent']).to_numpy() / itemsets.n_baskets
+    rules['lift'] = rules['confidence'] / consequent_support
+    return _filter_rules(rules, min_confidence, min_lift)
+
+
+def top_recommendations(
+    rules: pd.DataFrame,
+    top_n: int = 50,
+    metric: str = 'lift'
+) -> pd.DataFrame:
+    """
+    Rank pair rules per antecedent, like ``layer2_recommendations_<Region>``.
+
+    Args:
+        rules: Output of ``pair_rules``
+        top_n: Recommendations kept per focus item
+        metric: Rule column to rank by (ties broken by count)
+
+    Returns:
+        DataFrame with focus/recomm product type columns, the rule metrics
+        and rank rn (1 = best)
+    """
+    ranked = rules.sort_values(
+        ['antecedent', metric, 'count', 'consequent'],
+        ascending=[True, False, False, True]
+    )
+    ranked = ranked.rename(columns={'antecedent': FOCUS, 'consequent': RECOMM})
+    ranked['rn'] = ranked.groupby(FOCUS).cumcount() + 1
+    return ranked[ranked['rn'] <= top_n].reset_index(drop=True)
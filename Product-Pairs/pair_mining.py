@@ -0,0 +1,209 @@
+"""
+SKU pair mining over regional transaction histories.
+
+Implements the pair counting from ``sku_pair.ipynb``: for each focus product
+type, take the transaction rows whose product type is among the focus type's
+recommended types (``prod_type_recs``), keep customers who bought the focus
+type and have at least two such rows, and emit every ordered pair of distinct
+rows (focus SKU, other-type SKU) per customer. The result is the number of
+such pairs per (Focus, Recomm) SKU combination.
+
+``reference_pair_rows`` reproduces the notebook loop row by row and is the
+parity baseline; ``count_pairs`` computes the same counts without
+materializing the pairs, optionally split by a per-customer column such as
+the region.
+"""
+
+from typing import Iterable, Optional, Set, Union
+
+import numpy as np
+import pandas as pd
+
+CUSTOMER = 'customer_id'
+SKU = 'item_sku_num'
+PROD_TYPE = 'pdm_prod_type_id'
+FOCUS = 'focus_pdm_prod_type_id'
+RECOMM = 'recomm_pdm_prod_type_id'
+
+
+def sku_types(trans_hist: pd.DataFrame, by: Optional[str] = None) -> pd.DataFrame:
+    """Return the distinct (item_sku_num, pdm_prod_type_id) mappings (per ``by`` value)."""
+    return trans_hist[([by] if by else []) + [SKU, PROD_TYPE]].drop_duplicates()
+
+
+def focus_slice(
+    trans_hist: pd.DataFrame,
+    prod_type_recs: pd.DataFrame,
+    prod_type: int,
+    by: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Select the rows the notebook pairs up for one focus product type.
+
+    Args:
+        trans_hist: Transaction rows (customer_id, item_sku_num, pdm_prod_type_id)
+        prod_type_recs: Focus -> recommended product type table
+        prod_type: Focus product type
+        by: Per-customer column to keep (e.g. the region)
+
+    Returns:
+        customer_id/item_sku_num (and ``by``) rows of customers who bought
+        the focus type and have at least two rows among the recommended types
+    """
+    rec_set = prod_type_recs.loc[prod_type_recs[FOCUS] == prod_type, RECOMM]
+    rec_trans = trans_hist[trans_hist[PROD_TYPE].isin(rec_set)]
+    customers = rec_trans.loc[rec_trans[PROD_TYPE] == prod_type, CUSTOMER].unique()
+
+    columns = [CUSTOMER, SKU] + ([by] if by else [])
+    rows = rec_trans.loc[rec_trans[CUSTOMER].isin(customers), columns]
+    counts = rows[CUSTOMER].value_counts()
+    return rows[rows[CUSTOMER].isin(counts[counts >= 2].index)]
+
+
+def _sku_sets(sku: pd.DataFrame, prod_type: int, by: Optional[str] = None) -> tuple:
+    """
+    Return (SKUs of the focus type, SKUs of any other type).
+
+    With ``by`` the mappings are per ``by`` value, as if each value's rows
+    were mined separately, and the sets hold (``by``, SKU) pairs.
+    """
+    is_focus = sku[PROD_TYPE] == prod_type
+    if by is None:
+        return set(sku.loc[is_focus, SKU]), set(sku.loc[~is_focus, SKU])
+    return (
+        pd.MultiIndex.from_frame(sku.loc[is_focus, [by, SKU]]),
+        pd.MultiIndex.from_frame(sku.loc[~is_focus, [by, SKU]]),
+    )
+
+
+def reference_pair_rows(
+    trans_hist: pd.DataFrame,
+    prod_type_recs: pd.DataFrame,
+    prod_types: Optional[Iterable[int]] = None
+) -> pd.DataFrame:
+    """
+    Emit one row per customer pair exactly as the notebook loop does.
+
+    Args:
+        trans_hist: Transaction rows
+        prod_type_recs: Focus -> recommended product type table
+        prod_types: Focus types to process (default: all focus types)
+
+    Returns:
+        DataFrame with customer_id, Focus and Recomm SKU columns
+    """
+    sku = sku_types(trans_hist)
+    if prod_types is None:
+        prod_types = prod_type_recs[FOCUS].unique()
+
+    customers, focus, recomm = [], [], []
+    for prod_type in prod_types:
+        focus_skus, other_skus = _sku_sets(sku, prod_type)
+        df = focus_slice(trans_hist, prod_type_recs, prod_type)
+
+        for customer_id, group in df.groupby(CUSTOMER, sort=False):
+            items = group[SKU].tolist()
+            for i in range(len(items)):
+                for j in range(len(items)):
+                    if i != j and items[i] in focus_skus and items[j] in other_skus:
+                        customers.append(customer_id)
+                        focus.append(items[i])
+                        recomm.append(items[j])
+
+    return pd.DataFrame({CUSTOMER: customers, 'Focus': focus, 'Recomm': recomm})
+
+
+def aggregate_pair_rows(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Count pair rows per (Focus, Recomm), the notebook's final groupby.
+
+    Returns:
+        DataFrame with Focus, Recomm and pair_count, sorted by Focus, Recomm
+    """
+    counts = rows.groupby(['Focus', 'Recomm']).size().rename('pair_count')
+    return counts.reset_index().astype({'pair_count': np.int64})
+
+
+def _count_focus_pairs(
+    df: pd.DataFrame,
+    focus_skus: Union[Set, pd.MultiIndex],
+    other_skus: Union[Set, pd.MultiIndex],
+    by: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Count ordered distinct-row pairs for one focus type without expanding them.
+
+    For a customer with n_s rows of SKU s, a focus SKU s and another-type SKU
+    t contribute n_s * n_t pairs, less the n_s same-row pairs when s == t (a
+    SKU mapped to both the focus type and another type).
+    """
+    keys = ([by] if by else []) + [CUSTOMER]
+    per_sku = df.groupby(keys + [SKU], sort=False).size().rename('n').reset_index()
+
+    if by is None:
+        focus = per_sku[per_sku[SKU].isin(focus_skus)]
+        other = per_sku[per_sku[SKU].isin(other_skus)]
+    else:
+        mapped = pd.MultiIndex.from_frame(per_sku[[by, SKU]])
+        focus = per_sku[mapped.isin(focus_skus)]
+        other = per_sku[mapped.isin(other_skus)]
+    if focus.empty or other.empty:
+        return pd.DataFrame(columns=keys[:-1] + ['Focus', 'Recomm', 'pair_count'])
+
+    pairs = focus.merge(other, on=keys, suffixes=('_f', '_r'))
+    n_pairs = pairs['n_f'].to_numpy() * pairs['n_r'].to_numpy()
+    same = (pairs[f'{SKU}_f'] == pairs[f'{SKU}_r']).to_numpy()
+    n_pairs[same] -= pairs['n_f'].to_numpy()[same]
+
+    return pd.DataFrame({
+        **{key: pairs[key].to_numpy() for key in keys[:-1]},
+        'Focus': pairs[f'{SKU}_f'].to_numpy(),
+        'Recomm': pairs[f'{SKU}_r'].to_numpy(),
+        'pair_count': n_pairs,
+    })
+
+
+def count_pairs(
+    trans_hist: pd.DataFrame,
+    prod_type_recs: pd.DataFrame,
+    prod_types: Optional[Iterable[int]] = None,
+    by: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Count (Focus, Recomm) SKU pairs across all focus product types.
+
+    Produces the same counts as ``aggregate_pair_rows(reference_pair_rows(...))``.
+    With ``by``, a column holding one value per customer (such as the
+    region), the counts are split by that value in the same pass; each
+    split equals ``count_pairs`` over that value's rows.
+
+    Args:
+        trans_hist: Transaction rows
+        prod_type_recs: Focus -> recommended product type table
+        prod_types: Focus types to process (default: all focus types)
+        by: Per-customer column to split the counts by
+
+    Returns:
+        DataFrame with (``by``,) Focus, Recomm and pair_count, sorted by
+        those keys
+    """
+    sku = sku_types(trans_hist, by=by)
+    if prod_types is None:
+        prod_types = prod_type_recs[FOCUS].unique()
+    keys = ([by] if by else []) + ['Focus', 'Recomm']
+
+    parts = []
+    for prod_type in prod_types:
+        focus_skus, other_skus = _sku_sets(sku, prod_type, by=by)
+        df = focus_slice(trans_hist, prod_type_recs, prod_type, by=by)
+        part = _count_focus_pairs(df, focus_skus, other_skus, by=by)
+        if len(part):
+            parts.append(part)
+
+    if not parts:
+        return pd.DataFrame(columns=keys + ['pair_count'])
+
+    counts = pd.concat(parts, ignore_index=True).groupby(keys)['pair_count'].sum()
+    counts = counts[counts > 0].astype(np.int64)
+    return counts.reset_index()
+
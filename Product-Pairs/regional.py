@@ -0,0 +1,210 @@
+"""
+Single-pass regional affinity tables.
+
+``query.sql`` builds each ``layer2_<Region>`` table with its own scan of
+``customer_base_table``, filtered by ``customer_id in (select ... from
+multi_trans where State_Division = <Region>)``: five full passes. Here every
+customer's region is looked up once, as a small integer code. The rows are
+then split by code (``layer2_tables``) or carry the code as an extra key in
+one accumulation (``regional_co_purchase``, ``regional_pair_counts``), so all
+regions come out of a single pass over the data.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from pair_mining import CUSTOMER, PROD_TYPE, count_pairs
+
+REGION = 'State_Division'
+TERRITORY = 'TERRITORY_CD'
+
+# State codes per region, as in the multi_trans CASE of query.sql
+STATE_DIVISIONS = {
+    'Midwest': ('IA', 'IL', 'IN', 'KS', 'MI', 'MN', 'MO', 'ND', 'NE', 'OH', 'SD', 'WI'),
+    'Northeast': ('ME', 'NH', 'NJ', 'NY', 'PA', 'RI', 'VT'),
+    'South': ('AL', 'AR', 'DC', 'DE', 'FL', 'GA', 'KY', 'LA', 'MD', 'MS', 'NC', 'OK', 'SC',
+              'TN', 'TX', 'VA', 'WV'),
+    'West': ('AK', 'AZ', 'CA', 'CO', 'HI', 'ID', 'MT', 'NM', 'NV', 'OR', 'UT', 'WA', 'WY'),
+}
+UNKNOWN = 'UNKNOWN'
+REGIONS = tuple(STATE_DIVISIONS) + (UNKNOWN,)
+
+
+def state_division(territory_cd: pd.Series) -> pd.Categorical:
+    """
+    Map territory codes to regions like the multi_trans CASE expression.
+
+    Codes are trimmed and upper-cased; missing or unlisted codes are UNKNOWN.
+
+    Returns:
+        Categorical with categories ``REGIONS``
+    """
+    codes = territory_cd.astype('string').str.strip().str.upper()
+    lookup = {state: region for region, states in STATE_DIVISIONS.items() for state in states}
+    regions = codes.map(lookup).fillna(UNKNOWN)
+    return pd.Categorical(regions, categories=list(REGIONS))
+
+
+def customer_base_table(trans_hist: pd.DataFrame) -> pd.DataFrame:
+    """Transaction lines per (customer_id, pdm_prod_type_id), as in query.sql."""
+    return trans_hist.groupby([CUSTOMER, PROD_TYPE]).size().rename('trans_count').reset_index()
+
+
+def multi_trans(base: pd.DataFrame, customer_states: pd.DataFrame) -> pd.DataFrame:
+    """
+    Customers with more than one product type, with their region.
+
+    Args:
+        base: customer_base_table rows
+        customer_states: customer_id and TERRITORY_CD of the preferred
+            address (customers without one are UNKNOWN)
+
+    Returns:
+        DataFrame with customer_id and a categorical State_Division
+    """
+    types = base.groupby(CUSTOMER).size()
+    customers = types.index[types.to_numpy() > 1]
+
+    states = customer_states.drop_duplicates(CUSTOMER).set_index(CUSTOMER)[TERRITORY]
+    return pd.DataFrame({
+        CUSTOMER: customers.to_numpy(),
+        REGION: state_division(states.reindex(customers)),
+    })
+
+
+def region_codes(customer_ids: pd.Series, regions: pd.DataFrame) -> np.ndarray:
+    """
+    Look up each row's region code (index into ``REGIONS``) in one pass.
+
+    Args:
+        customer_ids: Customer ID per row
+        regions: multi_trans rows (customer_id, State_Division)
+
+    Returns:
+        int8 codes, -1 for customers not in ``regions``
+    """
+    division = pd.Categorical(regions[REGION], categories=list(REGIONS)).codes
+    at = pd.Index(regions[CUSTOMER].to_numpy()).get_indexer(customer_ids.to_numpy())
+    return np.where(at >= 0, division[at], -1).astype(np.int8)
+
+
+def _split(codes: np.ndarray) -> Dict[str, np.ndarray]:
+    """Row positions per region, from one stable sort of the codes."""
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(REGIONS) + 1))
+    return {region: order[bounds[i]:bounds[i + 1]] for i, region in enumerate(REGIONS)}
+
+
+def layer2_tables(base: pd.DataFrame, regions: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Build every ``layer2_<Region>`` table from one pass over customer_base_table.
+
+    Each table holds the region's customer_base_table rows followed by one
+    row per product type with customer_id = its rank (1, 2, ...) and
+    trans_count 1, the rows query.sql appends so every product type reaches
+    the matrix factorization model.
+
+    Args:
+        base: customer_base_table rows
+        regions: multi_trans rows
+
+    Returns:
+        Table per region name
+    """
+    base = base.dropna(subset=['trans_count'])
+    base = base.drop_duplicates([CUSTOMER, PROD_TYPE, 'trans_count'])
+    types = np.sort(base[PROD_TYPE].unique())
+    appended = pd.DataFrame({
+        CUSTOMER: np.arange(1, len(types) + 1, dtype=base[CUSTOMER].dtype),
+        PROD_TYPE: types,
+        'trans_count': np.ones(len(types), dtype=base['trans_count'].dtype),
+    })
+
+    columns = [CUSTOMER, PROD_TYPE, 'trans_count']
+    codes = region_codes(base[CUSTOMER], regions)
+    return {
+        region: pd.concat([base[columns].take(rows), appended], ignore_index=True)
+        for region, rows in _split(codes).items()
+    }
+
+
+def regional_co_purchase(
+    base: pd.DataFrame,
+    regions: pd.DataFrame,
+    min_customers: int = 1
+) -> pd.DataFrame:
+    """
+    Count, per region, the customers who bought each pair of product types.
+
+    One self-join of customer_base_table on customer_id serves all regions:
+    the region code is part of the accumulation key, so the five
+    product type x product type matrices are filled at once.
+
+    Args:
+        base: customer_base_table rows
+        regions: multi_trans rows
+        min_customers: Drop pairs with fewer customers
+
+    Returns:
+        Long DataFrame with State_Division, item_a < item_b and customers;
+        ``pivot(index='item_a', columns='item_b')`` of one region gives its
+        matrix
+    """
+    rows = base[[CUSTOMER, PROD_TYPE]].drop_duplicates()
+    codes = region_codes(rows[CUSTOMER], regions)
+    rows = rows[codes >= 0]
+    codes = codes[codes >= 0]
+
+    type_codes, types = pd.factorize(rows[PROD_TYPE], sort=True)
+    n_types = len(types)
+    coded = pd.DataFrame({
+        CUSTOMER: rows[CUSTOMER].to_numpy(),
+        'region': codes,
+        'type': type_codes,
+    })
+
+    joined = coded.merge(coded[[CUSTOMER, 'type']], on=CUSTOMER, suffixes=('_a', '_b'))
+    joined = joined[joined['type_a'] < joined['type_b']]
+    key = (
+        joined['region'].to_numpy(np.int64) * n_types * n_types
+        + joined['type_a'].to_numpy(np.int64) * n_types
+        + joined['type_b'].to_numpy(np.int64)
+    )
+    counts = np.bincount(key, minlength=len(REGIONS) * n_types * n_types)
+
+    found = np.flatnonzero(counts >= max(min_customers, 1))
+    region, rest = np.divmod(found, n_types * n_types)
+    type_a, type_b = np.divmod(rest, n_types)
+    types = np.asarray(types)
+    return pd.DataFrame({
+        REGION: pd.Categorical.from_codes(region, categories=list(REGIONS)),
+        'item_a': types[type_a],
+        'item_b': types[type_b],
+        'customers': counts[found],
+    })
+
+
+def regional_pair_counts(
+    trans_hist: pd.DataFrame,
+    regions: pd.DataFrame,
+    prod_type_recs: pd.DataFrame,
+    prod_types: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """
+    Count the notebook's (Focus, Recomm) SKU pairs for every region in one pass.
+
+    Equivalent to running ``count_pairs`` on each region's transaction rows
+    (customers outside multi_trans are dropped, as in the layer2 tables),
+    with SKU to product type mappings taken per region.
+
+    Returns:
+        DataFrame with State_Division, Focus, Recomm and pair_count
+    """
+    codes = region_codes(trans_hist[CUSTOMER], regions)
+    rows = trans_hist[codes >= 0].assign(**{REGION: codes[codes >= 0]})
+    counts = count_pairs(rows, prod_type_recs, prod_types, by=REGION)
+    region = counts[REGION].astype(np.int8)
+    counts[REGION] = pd.Categorical.from_codes(region, categories=list(REGIONS))
+    return counts
@@ -0,0 +1,16 @@
+"""
+Shared test setup.
+
+The pipelines import their sibling modules by name (``from config import ...``),
+so both module directories are put on the import path, as the entry points do.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+for module_dir in ('Inactive_Customers', 'Product-Pairs'):
+    path = str(ROOT / module_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,92 @@
+"""Tests for the co-purchase store's delta merge and incremental window refresh."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from copurchase_store import CoPurchaseStore, _apply_delta, _combine
+
+KEYS = ['item_a', 'item_b']
+COUNT = 'transactions'
+
+
+def pairs(rows):
+    """Pair count table from (item_a, item_b, transactions) tuples."""
+    return pd.DataFrame(rows, columns=KEYS + [COUNT]).astype(np.int64)
+
+
+def test_apply_delta_drops_zeroed_keys_and_inserts_in_order():
+    total = pairs([(1, 2, 5), (1, 3, 2), (2, 3, 4), (2, 5, 1), (4, 5, 7)])
+    delta = pairs([
+        (1, 1, 3),   # new, before every key
+        (1, 3, -2),  # reaches zero: dropped
+        (2, 4, 6),   # new, between a kept key and a dropped one
+        (2, 5, -1),  # reaches zero: dropped, directly before an insert
+        (3, 1, 1),   # new, right after a dropped key
+        (4, 5, 3),   # updated
+        (9, 9, 1),   # new, after every key
+    ])
+
+    merged = _apply_delta(total, delta, KEYS, COUNT)
+
+    expected = pairs([(1, 1, 3), (1, 2, 5), (2, 3, 4), (2, 4, 6), (3, 1, 1), (4, 5, 10), (9, 9, 1)])
+    pd.testing.assert_frame_equal(merged, expected)
+    pd.testing.assert_frame_equal(merged, _combine([total, delta], KEYS, COUNT))
+
+
+def test_apply_delta_can_empty_the_total():
+    total = pairs([(1, 2, 5), (3, 4, 1)])
+    delta = pairs([(1, 2, -5), (3, 4, -1)])
+
+    merged = _apply_delta(total, delta, KEYS, COUNT)
+
+    assert len(merged) == 0
+    assert list(merged.columns) == KEYS + [COUNT]
+
+
+def test_apply_delta_into_empty_total():
+    total = pairs([])
+    delta = pairs([(3, 4, 1), (5, 6, 2)])
+
+    pd.testing.assert_frame_equal(_apply_delta(total, delta, KEYS, COUNT), delta)
+
+
+def test_apply_delta_falls_back_for_unpackable_keys():
+    total = pairs([(-1, 2, 5), (1, 3, 2)])
+    delta = pairs([(-1, 2, -5), (0, 1, 4)])
+
+    merged = _apply_delta(total, delta, KEYS, COUNT)
+
+    pd.testing.assert_frame_equal(merged, pairs([(0, 1, 4), (1, 3, 2)]))
+
+
+@pytest.fixture
+def transactions():
+    """Baskets every third day from January to August 2024."""
+    rng = np.random.default_rng(7)
+    days = pd.date_range('2024-01-01', '2024-08-31', freq='3D')
+    rows = []
+    for day_index, day in enumerate(days):
+        for basket in range(4):
+            customer = int(rng.integers(1, 20))
+            for prod_type in rng.choice(8, size=int(rng.integers(1, 4)), replace=False):
+                rows.append((customer, f"{day_index}-{basket}", int(prod_type) + 100, day))
+    return pd.DataFrame(
+        rows, columns=['customer_id', 'transaction_guid', 'pdm_prod_type_id', 'transaction_booked_date']
+    )
+
+
+def test_incremental_refresh_matches_rebuild(tmp_path, transactions):
+    store = CoPurchaseStore(str(tmp_path / 'incremental'))
+    store.add_days(transactions)
+    store.refresh('2024-06-30')
+    summary = store.refresh('2024-07-15')
+
+    rebuilt = CoPurchaseStore(str(tmp_path / 'rebuilt'))
+    rebuilt.add_days(transactions)
+    rebuilt.refresh('2024-07-15')
+
+    assert not summary['rebuilt']
+    assert summary['added'] > 0 and summary['removed'] > 0
+    for table in ('customer_base_table', 'type_counts', 'pair_counts'):
+        pd.testing.assert_frame_equal(getattr(store, table)(), getattr(rebuilt, table)())
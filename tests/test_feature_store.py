@@ -0,0 +1,111 @@
+"""Tests for the memory-mapped feature store's snapshot writes and upserts."""
+
+import numpy as np
+import pytest
+
+from feature_store import FeatureStore
+
+FEATURES = ['recency', 'frequency', 'monetary']
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Store with one snapshot of customers 10, 20 and 30, copied in blocks of 2 rows."""
+    store = FeatureStore(str(tmp_path / 'features'), FEATURES, block_rows=2)
+    store.write_snapshot(
+        '2024-06-01',
+        [30, 10, 20],
+        np.array([[3, 3, 3], [1, 1, 1], [2, np.nan, 2]], dtype=np.float32)
+    )
+    return store
+
+
+def test_write_snapshot_sorts_by_customer(store):
+    snapshot = store.open('2024-06-01')
+
+    np.testing.assert_array_equal(snapshot.ids, [10, 20, 30])
+    np.testing.assert_array_equal(snapshot.matrix[:, 0], [1, 2, 3])
+
+
+def test_upsert_into_new_snapshot_merges_inserts_and_updates(store):
+    stats = store.upsert(
+        '2024-06-02',
+        [25, 20, 10, 5],
+        np.array([
+            [25, 25, 25],      # inserted between existing customers
+            [2, np.nan, 2],    # unchanged, NaN included
+            [1, 1, 9],         # updated
+            [5, 5, 5],         # inserted before every existing customer
+        ], dtype=np.float32),
+        base='2024-06-01'
+    )
+
+    assert stats == {'inserted': 2, 'updated': 1, 'unchanged': 1}
+    snapshot = store.open('2024-06-02')
+    np.testing.assert_array_equal(snapshot.ids, [5, 10, 20, 25, 30])
+    np.testing.assert_array_equal(
+        snapshot.matrix,
+        np.array([
+            [5, 5, 5],
+            [1, 1, 9],
+            [2, np.nan, 2],
+            [25, 25, 25],
+            [3, 3, 3],
+        ], dtype=np.float32)
+    )
+    # The base snapshot is left as it was
+    np.testing.assert_array_equal(store.open('2024-06-01').matrix[0], [1, 1, 1])
+
+
+def test_upsert_nan_changes_count_as_updates(store):
+    stats = store.upsert(
+        '2024-06-02',
+        [10, 20],
+        np.array([[1, np.nan, 1], [2, 7, 2]], dtype=np.float32),
+        base='2024-06-01'
+    )
+
+    assert stats == {'inserted': 0, 'updated': 2, 'unchanged': 0}
+    matrix = store.open('2024-06-02').matrix
+    assert np.isnan(matrix[0, 1])
+    assert matrix[1, 1] == 7
+
+
+def test_upsert_in_place_rewrites_only_changed_rows(store):
+    reader = store.open('2024-06-01')
+
+    stats = store.upsert(
+        '2024-06-01',
+        [30, 10],
+        np.array([[3, 3, 3], [1, 8, 1]], dtype=np.float32)
+    )
+
+    assert stats == {'inserted': 0, 'updated': 1, 'unchanged': 1}
+    # Updated in place: a reader that mapped the snapshot before sees the change
+    np.testing.assert_array_equal(reader.matrix[0], [1, 8, 1])
+    np.testing.assert_array_equal(store.open('2024-06-01').matrix[0], [1, 8, 1])
+    np.testing.assert_array_equal(reader.ids, [10, 20, 30])
+
+
+def test_upsert_with_new_customer_rewrites_same_snapshot(store):
+    stats = store.upsert('2024-06-01', [15], np.array([[15, 15, 15]], dtype=np.float32))
+
+    assert stats == {'inserted': 1, 'updated': 0, 'unchanged': 0}
+    snapshot = store.open('2024-06-01')
+    np.testing.assert_array_equal(snapshot.ids, [10, 15, 20, 30])
+    np.testing.assert_array_equal(snapshot.matrix[1], [15, 15, 15])
+    assert store.snapshots() == ['2024-06-01']
+
+
+def test_upsert_into_empty_store_writes_snapshot(tmp_path):
+    store = FeatureStore(str(tmp_path / 'features'), FEATURES)
+
+    stats = store.upsert('2024-06-01', [2, 1], np.ones((2, 3), dtype=np.float32))
+
+    assert stats == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+    np.testing.assert_array_equal(store.open().ids, [1, 2])
+
+
+def test_upsert_rejects_duplicate_customers(store):
+    with pytest.raises(ValueError, match="Duplicate customer IDs"):
+        store.upsert('2024-06-02', [10, 10], np.ones((2, 3), dtype=np.float32))
@@ -0,0 +1,88 @@
+"""Tests for the quantized probability table codecs."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantization import (
+    CODECS,
+    dequantize,
+    dequantize_frame,
+    is_quantized,
+    max_error,
+    quantize,
+    quantize_frame,
+)
+
+
+def probabilities(rows=5000, columns=4, seed=0):
+    """Skewed probabilities with NaNs and each column's own range."""
+    rng = np.random.default_rng(seed)
+    values = rng.beta(0.5, 8.0, size=(rows, columns)).astype(np.float32)
+    values[:, 1] = values[:, 1] * 0.1 + 0.3
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return values
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip_within_max_error(codec):
+    values = probabilities()
+
+    codes, params = quantize(values, codec)
+    restored = dequantize(codes, params)
+
+    assert restored.dtype == np.float32
+    np.testing.assert_array_equal(np.isnan(restored), np.isnan(values))
+    error = np.nanmax(np.abs(restored.astype(np.float64) - values), axis=0)
+    assert (error <= np.array([p['max_error'] for p in params])).all()
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip_keeps_column_extremes_and_constants(codec):
+    values = np.array([[0.0, 0.25, np.nan], [1.0, 0.25, np.nan], [0.5, 0.25, np.nan]], dtype=np.float32)
+
+    codes, params = quantize(values, codec)
+    restored = dequantize(codes, params)
+
+    np.testing.assert_allclose(restored[:, 0], values[:, 0], atol=params[0]['max_error'])
+    np.testing.assert_allclose(restored[:, 1], values[:, 1], atol=params[1]['max_error'])
+    assert np.isnan(restored[:, 2]).all()
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_frame_round_trip_through_parquet(tmp_path, codec):
+    values = probabilities(rows=1000, columns=3)
+    df = pd.DataFrame(values, columns=['p101', 'p102', 'p103'])
+    df['customer_id'] = np.arange(1000, dtype=np.int64)
+
+    quantized = quantize_frame(df, codec)
+    quantized.to_parquet(tmp_path / 'table.parquet', index=False)
+    restored = dequantize_frame(pd.read_parquet(tmp_path / 'table.parquet'))
+
+    assert is_quantized(quantized) and not is_quantized(restored)
+    assert list(restored.columns) == list(df.columns)
+    np.testing.assert_array_equal(restored['customer_id'], df['customer_id'])
+    for column, bound in max_error(quantized).items():
+        assert restored[column].dtype == np.float32
+        assert np.nanmax(np.abs(restored[column].to_numpy(np.float64) - df[column])) <= bound
+
+
+def test_documented_bounds_for_unit_range():
+    values = np.linspace(0.0, 1.0, 10_001, dtype=np.float32)
+    below_one = values[values <= 0.999]
+
+    assert quantize(values, 'uint8')[1][0]['max_error'] <= 1 / 508 + 1e-7
+    assert quantize(values, 'uint16')[1][0]['max_error'] <= 1 / 131068 + 1e-7
+    assert quantize(below_one, 'float16')[1][0]['max_error'] <= 2.5e-4
+
+
+def test_rejects_infinite_values():
+    with pytest.raises(ValueError, match="infinite"):
+        quantize(np.array([0.5, np.inf], dtype=np.float32), 'uint8')
+
+
+def test_rejects_quantizing_twice():
+    df = quantize_frame(pd.DataFrame({'p1': [0.1, 0.2]}, dtype=np.float32), 'uint8')
+
+    with pytest.raises(ValueError, match="already quantized"):
+        quantize_frame(df, 'uint8')
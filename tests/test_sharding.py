@@ -0,0 +1,115 @@
+"""Tests for customer-hash sharding and the shard merge."""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sharding import (
+    ShardSpec,
+    merge_shards,
+    shard_mask,
+    shard_of,
+    write_shard_outputs,
+)
+
+RUN_ID = '2024-06-01'
+COUNT = 3
+
+
+def clustering_table(customer_ids):
+    """Wide clustering table for some customers."""
+    ids = np.asarray(customer_ids, dtype=np.int64)
+    return pd.DataFrame({
+        'p101': (ids % 7 / 7).astype(np.float32),
+        'p102': (ids % 5 / 5).astype(np.float32),
+        'customer_id': ids,
+    })
+
+
+@pytest.fixture
+def customers():
+    """Customer IDs, sequential and scattered."""
+    return np.concatenate([np.arange(1, 400), np.arange(10_000_000, 10_000_200, 7)])
+
+
+@pytest.fixture
+def run_dir(tmp_path, customers):
+    """Directory with all shards of RUN_ID written, highest shard first."""
+    run_dir = tmp_path / RUN_ID
+    shards = shard_of(customers, COUNT)
+    for index in reversed(range(COUNT)):
+        mine = customers[shards == index]
+        top_n = pd.DataFrame({
+            'customer_id': np.repeat(mine, 2),
+            'rank': np.tile([1, 2], len(mine)),
+        })
+        write_shard_outputs(
+            str(run_dir), RUN_ID, ShardSpec(index, COUNT), clustering_table(mine), top_n
+        )
+    return run_dir
+
+
+def test_shards_partition_customers(customers):
+    masks = [shard_mask(customers, ShardSpec(i, COUNT)) for i in range(COUNT)]
+
+    np.testing.assert_array_equal(np.sum(masks, axis=0), 1)
+    assert all(mask.any() for mask in masks)
+
+
+def test_merge_restores_customer_order(run_dir, customers):
+    clustering, top_n = merge_shards(str(run_dir), RUN_ID, expected_count=COUNT)
+
+    pd.testing.assert_frame_equal(clustering, clustering_table(np.sort(customers)))
+    assert top_n['customer_id'].is_monotonic_increasing
+    assert len(top_n) == 2 * len(customers)
+
+
+def test_merge_rejects_missing_shard(run_dir):
+    (run_dir / f"{ShardSpec(1, COUNT).name}.json").unlink()
+
+    with pytest.raises(ValueError, match=r"Missing shards \[1\]"):
+        merge_shards(str(run_dir), RUN_ID)
+
+
+def test_merge_rejects_unexpected_shard_count(run_dir):
+    with pytest.raises(ValueError, match="expected 4"):
+        merge_shards(str(run_dir), RUN_ID, expected_count=4)
+
+
+def test_merge_rejects_corrupted_shard(run_dir):
+    path = run_dir / f"{ShardSpec(2, COUNT).name}.clustering.parquet"
+    clustering_table([1, 2, 3]).to_parquet(path, index=False)
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        merge_shards(str(run_dir), RUN_ID)
+
+
+def test_merge_rejects_shard_from_another_run(run_dir, customers):
+    # Yesterday's output for shard 0 left behind after today's shard 0 failed
+    manifest_path = run_dir / f"{ShardSpec(0, COUNT).name}.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest['run_id'] = '2024-05-31'
+    manifest_path.write_text(json.dumps(manifest))
+
+    with pytest.raises(ValueError, match=r"Shards \[0\] .* not written by run 2024-06-01"):
+        merge_shards(str(run_dir), RUN_ID)
+
+
+def test_merge_restores_quantized_shards(tmp_path, customers):
+    run_dir = tmp_path / RUN_ID
+    shards = shard_of(customers, 2)
+    for index in range(2):
+        write_shard_outputs(
+            str(run_dir), RUN_ID, ShardSpec(index, 2),
+            clustering_table(customers[shards == index]), codec='uint16'
+        )
+
+    clustering, top_n = merge_shards(str(run_dir), RUN_ID)
+
+    expected = clustering_table(np.sort(customers))
+    assert top_n is None
+    assert clustering['p101'].dtype == np.float32
+    np.testing.assert_allclose(clustering['p101'], expected['p101'], atol=1e-5)
+    np.testing.assert_array_equal(clustering['customer_id'], expected['customer_id'])